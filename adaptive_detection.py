@@ -0,0 +1,204 @@
+"""
+Adaptive, coarse-to-fine face detection scale.
+
+A fixed downscale either misses distant faces or wastes time on close-up
+cameras. ``AdaptiveScale`` learns each camera's typical face size from its
+recent detections and runs the full-frame pass at the smallest scale that
+still leaves those faces ``DETECT_MIN_FACE_PX`` tall for the detector.
+
+Two cheaper passes keep it honest:
+
+- Refinement: faces seen in the last ``HOT_REGION_TTL`` seconds that are too
+  small for the current scale are searched again in a crop around their last
+  position, upsampled as much as they need (up to ``REFINE_MAX_SCALE``).
+- Probing: every ``SCALE_PROBE_EVERY`` frames the full frame is searched one
+  step finer (further on each fruitless probe) to discover faces smaller than
+  any seen so far.
+
+The detector itself is passed in, so the same cascade drives the watcher and
+``benchmark_detection.py``. Given a ``MetricsScope``, each pass records its
+"resize" and "detect" time.
+"""
+
+import os
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+Box = Tuple[int, int, int, int]  # top, right, bottom, left
+
+ADAPTIVE_SCALE = os.getenv("ADAPTIVE_SCALE", "1") == "1"  # 0 keeps the fixed analysis scale
+DETECT_MIN_FACE_PX = float(os.getenv("DETECT_MIN_FACE_PX", "40"))  # smallest face HOG finds with one upsample
+DETECT_SCALES = (0.25, 0.35, 0.5, 0.7, 1.0)  # steps keep resizes stable as estimates wobble
+REFINE_MAX_SCALE = 2.0
+SCALE_PROBE_EVERY = int(os.getenv("SCALE_PROBE_EVERY", "30"))  # processed frames between probes
+SCALE_WINDOW = 200  # recent face heights the scale is learned from
+SCALE_MIN_SAMPLES = 5
+SCALE_FACE_PERCENTILE = 25  # the scale keeps this share of recent faces detectable at worst
+HOT_REGION_TTL = 2.0  # seconds a face's last position is refined after it was seen
+HOT_REGIONS_MAX = 8
+SIZE_MARGIN = 1.2  # aim this much above the detector's minimum
+
+
+class DetectionPass(NamedTuple):
+    """Faces found in ``image``: ``locations`` in its pixels, ``boxes`` in the analysed view's."""
+    image: np.ndarray
+    locations: List[Box]
+    boxes: List[Box]
+
+
+def box_center(box: Box) -> Tuple[float, float]:
+    top, right, bottom, left = box
+    return (left + right) / 2.0, (top + bottom) / 2.0
+
+
+def contains(box: Box, point: Tuple[float, float]) -> bool:
+    top, right, bottom, left = box
+    return left <= point[0] <= right and top <= point[1] <= bottom
+
+
+def to_rgb(view: np.ndarray, scale: float) -> np.ndarray:
+    """``view`` resized by ``scale`` and converted to the contiguous RGB dlib expects."""
+    if scale != 1.0:
+        interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR
+        view = cv2.resize(view, (0, 0), fx=scale, fy=scale, interpolation=interpolation)
+    return cv2.cvtColor(view, cv2.COLOR_BGR2RGB)
+
+
+class AdaptiveScale:
+    """Per-camera detection scale learned from recent face sizes."""
+
+    def __init__(self, default_scale: float, scales: Sequence[float] = DETECT_SCALES,
+                 min_face_px: float = DETECT_MIN_FACE_PX, probe_every: int = SCALE_PROBE_EVERY,
+                 window: int = SCALE_WINDOW, refine: bool = True, clock: Callable[[], float] = time.monotonic):
+        self.default_scale = default_scale
+        self.scales = sorted(scales)
+        self.min_face_px = min_face_px
+        self.probe_every = probe_every
+        self.refine = refine
+        self._clock = clock
+        self._heights: Deque[float] = deque(maxlen=window)
+        self._hot: List[Tuple[Box, float]] = []  # recent faces and when they were seen
+        self._probe_step = 1
+        self.scale = default_scale
+        self.frames = 0
+        self.probes = 0
+        self.probe_hits = 0
+        self.refines = 0
+        self.refine_hits = 0
+        self.pixels = 0  # detector input pixels, the bulk of detection cost
+
+    @classmethod
+    def fixed(cls, scale: float) -> "AdaptiveScale":
+        """The old behaviour: one scale, no probes, no refinement."""
+        return cls(scale, scales=(scale,), probe_every=0, refine=False)
+
+    def observe(self, boxes: Sequence[Box]) -> None:
+        """Learn from faces found this frame and pick the scale for the next one."""
+        self._heights.extend(bottom - top for top, _, bottom, _ in boxes)
+        if len(self._heights) < SCALE_MIN_SAMPLES:
+            return
+        typical = float(np.percentile(self._heights, SCALE_FACE_PERCENTILE))
+        needed = self.min_face_px * SIZE_MARGIN / max(typical, 1.0)
+        self.scale = next((s for s in self.scales if s >= needed), self.scales[-1])
+
+    def detect(self, view: np.ndarray, detector: Callable[[np.ndarray], List[Box]],
+               allow: Optional[Callable[[Box], bool]] = None, workspace: Optional[Any] = None,
+               metrics: Optional[Any] = None) -> List[DetectionPass]:
+        """Run the cascade over ``view`` (BGR); ``allow`` drops faces by their view box.
+
+        With a ``FrameWorkspace`` the pass images live in its buffers and stay
+        valid until the next call.
+        """
+        self.frames += 1
+        now = self._clock()
+        scale = self.scale
+        probing = self._probe_due()
+        if probing:
+            finer = [s for s in self.scales if s > scale]
+            scale = finer[min(self._probe_step, len(finer)) - 1]
+            self.probes += 1
+        passes = [self._pass(view, scale, (0, 0), detector, allow, workspace, "detect", metrics)]
+        found = list(passes[0].boxes)
+        if probing:
+            if any((b[2] - b[0]) * self.scale < self.min_face_px for b in found):
+                self.probe_hits += 1  # faces the regular pass would have missed
+                self._probe_step = 1
+            else:
+                self._probe_step += 1
+
+        height, width = view.shape[:2]
+        for n, (box, _) in enumerate(self._hot if self.refine else ()):
+            face_height = box[2] - box[0]
+            fine = min(REFINE_MAX_SCALE, self.min_face_px * SIZE_MARGIN / max(face_height, 1))
+            x0, y0, x1, y1 = self._around(box, width, height)
+            if fine <= scale or any(contains((y0, x1, y1, x0), box_center(f)) for f in found):
+                continue  # big enough for the full pass, or already found this frame
+            refined = self._pass(view[y0:y1, x0:x1], fine, (x0, y0), detector, allow, workspace, f"refine{n}",
+                                 metrics)
+            self.refines += 1
+            if refined.boxes:
+                self.refine_hits += 1
+                passes.append(refined)
+                found.extend(refined.boxes)
+
+        self._remember(found, now)
+        self.observe(found)
+        return passes
+
+    def _probe_due(self) -> bool:
+        return bool(self.probe_every) and self.frames % self.probe_every == 0 and self.scale < self.scales[-1]
+
+    def _pass(self, view: np.ndarray, scale: float, offset: Tuple[int, int],
+              detector: Callable[[np.ndarray], List[Box]], allow: Optional[Callable[[Box], bool]],
+              workspace: Optional[Any] = None, slot: str = "detect",
+              metrics: Optional[Any] = None) -> DetectionPass:
+        started = time.perf_counter()
+        image = to_rgb(view, scale) if workspace is None else workspace.resize_rgb(view, scale, slot)
+        resized = time.perf_counter()
+        found = detector(image)
+        if metrics is not None:
+            metrics.observe("resize", resized - started)
+            metrics.observe("detect", time.perf_counter() - resized)
+        self.pixels += image.shape[0] * image.shape[1]
+        x0, y0 = offset
+        locations, boxes = [], []
+        for location in found:
+            top, right, bottom, left = location
+            box = (int(top / scale) + y0, int(right / scale) + x0, int(bottom / scale) + y0, int(left / scale) + x0)
+            if allow is None or allow(box):
+                locations.append(location)
+                boxes.append(box)
+        return DetectionPass(image, locations, boxes)
+
+    @staticmethod
+    def _around(box: Box, width: int, height: int) -> Tuple[int, int, int, int]:
+        """``(x0, y0, x1, y1)``: the box grown by its own size on every side, clipped to the view."""
+        top, right, bottom, left = box
+        w, h = right - left, bottom - top
+        return max(0, left - w), max(0, top - h), min(width, right + w), min(height, bottom + h)
+
+    def _remember(self, found: List[Box], now: float) -> None:
+        """Faces found now, plus earlier ones not seen again that are still within the TTL."""
+        hot = [(box, now) for box in found]
+        for box, seen in self._hot:
+            if now - seen <= HOT_REGION_TTL and not any(contains(box, box_center(f)) for f in found):
+                hot.append((box, seen))
+        self._hot = hot[:HOT_REGIONS_MAX]
+
+    def stats(self) -> Dict[str, Any]:
+        heights = list(self._heights)
+        return {
+            "scale": self.scale,
+            "face_px_median": round(float(np.median(heights)), 1) if heights else None,
+            "face_px_p25": round(float(np.percentile(heights, SCALE_FACE_PERCENTILE)), 1) if heights else None,
+            "samples": len(heights),
+            "probes": self.probes,
+            "probe_hits": self.probe_hits,
+            "refines": self.refines,
+            "refine_hits": self.refine_hits,
+            "kpixels_per_frame": round(self.pixels / 1000.0 / max(self.frames, 1), 1),
+        }
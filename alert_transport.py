@@ -0,0 +1,438 @@
+"""
+Local alert transport between the watcher and the alert server.
+
+The watcher and server normally share a host, so alerts travel over a Unix
+domain socket (``ALERT_SOCKET``) on one long-lived connection instead of a
+fresh loopback HTTP request each. Frames are a 4-byte big-endian length, a
+one-byte codec tag and the body: msgpack when it is installed, compact JSON
+otherwise. Both ends accept either codec.
+
+Every alert carries a client-generated ``id`` and the server acknowledges it
+once it is stored, so delivery is at-least-once. Alerts that cannot be
+delivered are appended to an on-disk spool (``ALERT_SPOOL``) and replayed, in
+order, as soon as the server is reachable again. ``ALERT_TRANSPORT`` selects
+``ipc``, ``http`` (remote watchers, ``ALERT_SERVER_URL``) or ``auto``, which
+tries the socket first and falls back to HTTP. Given a ``MetricsRegistry``,
+the sender records each delivery round trip as the "alert_post" stage.
+"""
+
+import asyncio
+import fcntl
+import json
+import os
+import socket
+import struct
+import threading
+import time
+import uuid
+import logging
+from queue import Empty, Queue
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from metrics import MetricsRegistry
+
+try:
+    import msgpack
+except ImportError:  # optional; JSON framing is used instead
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+ALERT_SOCKET = os.getenv("ALERT_SOCKET", "alerts.sock")
+ALERT_SERVER_URL = os.getenv("ALERT_SERVER_URL", "http://127.0.0.1:8000")
+ALERT_TRANSPORT = os.getenv("ALERT_TRANSPORT", "auto")  # auto | ipc | http
+ALERT_SPOOL = os.getenv("ALERT_SPOOL", "alert_spool.jsonl")
+ALERT_ACK_TIMEOUT = float(os.getenv("ALERT_ACK_TIMEOUT", "2"))
+ALERT_RETRY_MAX = float(os.getenv("ALERT_RETRY_MAX", "30"))  # seconds between reconnect attempts, at most
+
+MAX_FRAME = 1 << 20
+_HEADER = struct.Struct(">IB")
+_MSGPACK, _JSON = ord("M"), ord("J")
+
+
+class FrameError(Exception):
+    """Malformed or oversized frame."""
+
+
+def encode_frame(message: Dict[str, Any]) -> bytes:
+    if msgpack is not None:
+        body, codec = msgpack.packb(message, use_bin_type=True), _MSGPACK
+    else:
+        body, codec = json.dumps(message, separators=(",", ":")).encode("utf-8"), _JSON
+    return _HEADER.pack(len(body), codec) + body
+
+
+def decode_body(codec: int, body: bytes) -> Dict[str, Any]:
+    if codec == _MSGPACK:
+        if msgpack is None:
+            raise FrameError("msgpack frame received but msgpack is not installed")
+        return msgpack.unpackb(body, raw=False)
+    if codec == _JSON:
+        return json.loads(body)
+    raise FrameError(f"Unknown codec {codec!r}")
+
+
+def _check_header(length: int) -> None:
+    if length > MAX_FRAME:
+        raise FrameError(f"Frame of {length} bytes exceeds {MAX_FRAME}")
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[Dict[str, Any]]:
+    """Next message, or None on a clean EOF."""
+    try:
+        header = await reader.readexactly(_HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise FrameError("Truncated frame header") from e
+        return None
+    length, codec = _HEADER.unpack(header)
+    _check_header(length)
+    return decode_body(codec, await reader.readexactly(length))
+
+
+def _recv_exactly(sock: socket.socket, n: int) -> bytes:
+    chunks = []
+    while n:
+        chunk = sock.recv(n)
+        if not chunk:
+            raise ConnectionError("Connection closed by server")
+        chunks.append(chunk)
+        n -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_frame(sock: socket.socket) -> Dict[str, Any]:
+    length, codec = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    _check_header(length)
+    return decode_body(codec, _recv_exactly(sock, length))
+
+
+# ---------------------------------------------------------------------------
+# Server side
+# ---------------------------------------------------------------------------
+
+class AlertIngestServer:
+    """Accepts framed alerts on a Unix socket and acknowledges each one.
+
+    ``handler`` stores the alert and returns its entry (with ``seq``). A
+    ``ValueError`` from it is acknowledged as rejected so the client drops
+    the alert rather than retrying it forever; any other error is left
+    unacknowledged and the client spools and retries.
+
+    With several workers only one holds the socket; the rest serve HTTP and
+    see the alerts through the shared store and bus.
+    """
+
+    def __init__(self, handler: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+                 path: str = ALERT_SOCKET):
+        self.handler = handler
+        self.path = path
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.connections = 0
+        self.received = 0
+        self.rejected = 0
+        self.errors = 0
+
+    def _socket_in_use(self) -> bool:
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.path)
+            return True
+        except OSError:
+            return False
+        finally:
+            probe.close()
+
+    async def start(self) -> bool:
+        """Bind the socket unless another live worker already owns it."""
+        with open(f"{self.path}.lock", "a+") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if os.path.exists(self.path):
+                if self._socket_in_use():
+                    return False
+                os.unlink(self.path)  # stale socket from a previous run
+            self._server = await asyncio.start_unix_server(self._serve, path=self.path)
+            os.chmod(self.path, 0o600)
+        logger.info(f"Alert ingest listening on {self.path}")
+        return True
+
+    async def stop(self) -> None:
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        try:
+            while True:
+                message = await read_frame(reader)
+                if message is None:
+                    break
+                writer.write(encode_frame(await self._ack(message)))
+                await writer.drain()
+        except (FrameError, ConnectionError, asyncio.IncompleteReadError) as e:
+            logger.warning(f"Alert ingest connection dropped: {e}")
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def _ack(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        message_id = message.get("id")
+        try:
+            entry = await self.handler(message["alert"])
+        except (KeyError, TypeError, ValueError) as e:
+            self.rejected += 1
+            return {"id": message_id, "ok": False, "retry": False, "error": str(e)}
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Alert ingest failed: {e}")
+            return {"id": message_id, "ok": False, "retry": True, "error": str(e)}
+        self.received += 1
+        return {"id": message_id, "ok": True, "seq": entry.get("seq")}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "listening": self._server is not None,
+            "codec": "msgpack" if msgpack is not None else "json",
+            "connections": self.connections,
+            "received": self.received,
+            "rejected": self.rejected,
+            "errors": self.errors,
+        }
+
+
+# ---------------------------------------------------------------------------
+# Client side (watcher)
+# ---------------------------------------------------------------------------
+
+class AlertRejected(Exception):
+    """The server refused the alert; retrying will not help."""
+
+
+class AlertSender:
+    """Background alert delivery with acknowledgements, spooling and replay.
+
+    ``send`` never blocks the caller. A single thread delivers alerts in
+    order; while anything is spooled new alerts queue behind it so the
+    server always sees them in capture order.
+    """
+
+    def __init__(self, socket_path: str = ALERT_SOCKET, url: str = ALERT_SERVER_URL,
+                 spool_path: str = ALERT_SPOOL, mode: str = ALERT_TRANSPORT,
+                 ack_timeout: float = ALERT_ACK_TIMEOUT, retry_max: float = ALERT_RETRY_MAX,
+                 batch_size: int = 1, metrics: Optional[MetricsRegistry] = None):
+        self.socket_path = socket_path
+        self.url = url.rstrip("/")
+        self.spool_path = spool_path
+        self.mode = mode
+        self.ack_timeout = ack_timeout
+        self.retry_max = retry_max
+        self.batch_size = batch_size
+        self._queue: Queue = Queue()
+        self._sock: Optional[socket.socket] = None
+        self._http = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._retry_at = 0.0
+        self._backoff = 0.5
+        self.sent_ipc = 0
+        self.sent_http = 0
+        self.spooled = 0
+        self.replayed = 0
+        self.rejected = 0
+        self.post_latency = metrics.histogram("alert_post") if metrics is not None else None
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="alert-sender", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Deliver (or spool) whatever is queued, then stop."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._close()
+
+    def send(self, alert: Dict[str, Any]) -> None:
+        self._queue.put({"id": uuid.uuid4().hex, "alert": alert})
+
+    def _next_batch(self) -> List[Dict[str, Any]]:
+        try:
+            messages = [self._queue.get(timeout=0.5)]
+        except Empty:
+            return []
+        while len(messages) < self.batch_size:
+            try:
+                messages.append(self._queue.get_nowait())
+            except Empty:
+                break
+        return messages
+
+    def _run(self) -> None:
+        while True:
+            messages = self._next_batch()
+            if not messages and self._stopping.is_set():
+                break
+            if self._spool_pending() and time.monotonic() >= self._retry_at:
+                self._replay()
+            if not messages:
+                continue
+            done = 0 if self._spool_pending() else self._try_deliver(messages)
+            if done < len(messages):
+                self._spool(messages[done:])
+
+    # Delivery ---------------------------------------------------------------
+
+    def _try_deliver(self, messages: List[Dict[str, Any]]) -> int:
+        """Deliver in order; returns how many were consumed (delivered or rejected)."""
+        if time.monotonic() < self._retry_at:
+            return 0
+        done = 0
+        while done < len(messages):
+            try:
+                started = time.perf_counter()
+                done += self._deliver_batch(messages[done:done + self.batch_size])
+                if self.post_latency is not None:
+                    self.post_latency.observe(time.perf_counter() - started)
+            except Exception as e:
+                self._backoff = min(self._backoff * 2, self.retry_max)
+                self._retry_at = time.monotonic() + self._backoff
+                logger.warning(f"Alert server unreachable ({e}); spooling, retry in {self._backoff:.1f}s")
+                return done
+        self._backoff = 0.5
+        return done
+
+    def _deliver_batch(self, messages: List[Dict[str, Any]]) -> int:
+        """Deliver a prefix of ``messages`` and return its length; raise if none went through."""
+        message = messages[0]
+        try:
+            self._deliver(message)
+        except AlertRejected as e:
+            self.rejected += 1
+            logger.error(f"Alert {message['id']} rejected by server: {e}")
+        return 1
+
+    def _deliver(self, message: Dict[str, Any]) -> None:
+        if self.mode in ("auto", "ipc"):
+            try:
+                self._deliver_ipc(message)
+                self.sent_ipc += 1
+                return
+            except AlertRejected:
+                raise
+            except Exception:
+                self._close_socket()
+                if self.mode == "ipc":
+                    raise
+        self._deliver_http(message)
+        self.sent_http += 1
+
+    def _deliver_ipc(self, message: Dict[str, Any]) -> None:
+        if self._sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.ack_timeout)
+            try:
+                sock.connect(self.socket_path)
+            except OSError:
+                sock.close()
+                raise
+            self._sock = sock
+        self._sock.sendall(encode_frame(message))
+        ack = recv_frame(self._sock)
+        if ack.get("id") != message["id"]:
+            raise ConnectionError("Acknowledgement out of order")
+        if not ack.get("ok"):
+            if ack.get("retry", True):
+                raise ConnectionError(ack.get("error", "server error"))
+            raise AlertRejected(ack.get("error", "rejected"))
+
+    def _deliver_http(self, message: Dict[str, Any]) -> None:
+        import httpx
+
+        if self._http is None:
+            # One keep-alive connection instead of a handshake per alert
+            self._http = httpx.Client(base_url=self.url, timeout=self.ack_timeout)
+        response = self._http.post("/alerts", json=message["alert"], headers={"X-Alert-Id": message["id"]})
+        if 400 <= response.status_code < 500:
+            raise AlertRejected(f"HTTP {response.status_code}: {response.text[:200]}")
+        response.raise_for_status()
+
+    def _close_socket(self) -> None:
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+
+    def _close(self) -> None:
+        self._close_socket()
+        if self._http is not None:
+            self._http.close()
+            self._http = None
+
+    # Spool ------------------------------------------------------------------
+
+    def _spool_pending(self) -> bool:
+        try:
+            return os.path.getsize(self.spool_path) > 0
+        except OSError:
+            return False
+
+    def _spool(self, messages: List[Dict[str, Any]]) -> None:
+        with open(self.spool_path, "a", encoding="utf-8") as f:
+            for message in messages:
+                f.write(json.dumps(message, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.spooled += len(messages)
+
+    def _read_spool(self) -> List[Dict[str, Any]]:
+        messages = []
+        try:
+            with open(self.spool_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        messages.append(json.loads(line))
+                    except ValueError:
+                        logger.warning("Skipping corrupt line in alert spool")
+        except OSError:
+            pass
+        return messages
+
+    def _replay(self) -> None:
+        """Deliver spooled alerts in order; keep whatever still fails."""
+        pending = self._read_spool()
+        delivered = self._try_deliver(pending)
+        if not delivered:
+            return
+        self.replayed += delivered
+        remaining = pending[delivered:]
+        tmp = f"{self.spool_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for message in remaining:
+                f.write(json.dumps(message, separators=(",", ":")) + "\n")
+        os.replace(tmp, self.spool_path)
+        logger.info(f"Replayed {delivered} spooled alerts ({len(remaining)} still pending)")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "queued": self._queue.qsize(),
+            "sent_ipc": self.sent_ipc,
+            "sent_http": self.sent_http,
+            "spooled": self.spooled,
+            "replayed": self.replayed,
+            "rejected": self.rejected,
+            "spool_pending": self._spool_pending(),
+        }
@@ -1,48 +1,71 @@
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Depends, status, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Depends, status, UploadFile, File, Form, BackgroundTasks, Header
 import os
 import sys
 from dotenv import load_dotenv
 load_dotenv()
 from fastapi.middleware.cors import CORSMiddleware
 from typing import Set
-
-# Set to store connected websocket clients
-connected_clients: Set[WebSocket] = set()
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse, Response
+from fastapi import Request
 from pydantic import BaseModel
 import uvicorn
 import os
+import base64
 import json
+import logging
 from typing import List, Set, Optional
 from datetime import datetime, timedelta
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from api.auth import (
     User, create_access_token, authenticate_user,
-    get_current_active_user, ACCESS_TOKEN_EXPIRE_MINUTES, get_password_hash
+    get_current_active_user, ACCESS_TOKEN_EXPIRE_MINUTES, get_password_hash,
+    invalidate_user, auth_cache_stats
 )
 from analytics import get_alert_stats, get_person_history
-from api.database import get_db, engine, Base
+from api.database import get_db, init_db, bootstrap_lock, pool_stats, SessionLocal
 import crud, models, schemas
-from notifications import process_alert_notification
-import subprocess
+from notification_dispatcher import dispatcher
+from blocking import run_cpu, run_io
+from loop_monitor import loop_monitor
 import pathlib
 import shutil
-
-# Create database tables and seed default admin if missing
-Base.metadata.create_all(bind=engine)
+import mimetypes
+import incident_store
+from broadcast import hub
+from rule_index import rule_index
+import state_backends
+from anyio import from_thread
+from watch_control import watch_control, WatcherUnavailable, WATCH_RELOAD_TIMEOUT
+from camera_telemetry import read_heartbeat
+from watch_supervisor import COST_HINTS, WATCH_SHARDS, camera_streams, shard_count
+import worker_registry
+from watchlist import Watchlist
+from alert_transport import AlertIngestServer, ALERT_SOCKET
+from regions import camera_regions, parse_polygons
+from face_backends import camera_backend
+from metrics import MetricsRegistry, PROMETHEUS_CONTENT_TYPE, render_prometheus, timed
+
+logger = logging.getLogger(__name__)
+
+# Create/upgrade database tables and seed default admin if missing. This runs
+# once per worker at import on the synchronous engine (serialised across
+# workers); requests use the async pool.
 try:
-    from api.database import SessionLocal
-    with SessionLocal() as db:
-        admin = db.query(User).filter(User.username == "admin").first()
-        if not admin:
-            # Seed default admin (dev only)
-            hashed = get_password_hash("changeme123")
-            admin = User(username="admin", hashed_password=hashed, is_active=True)
-            db.add(admin)
-            db.commit()
+    with bootstrap_lock():
+        init_db()
+        with SessionLocal() as db:
+            admin = db.query(User).filter(User.username == "admin").first()
+            if not admin:
+                # Seed default admin (dev only)
+                hashed = get_password_hash("changeme123")
+                admin = User(username="admin", hashed_password=hashed)
+                db.add(admin)
+                db.commit()
+            # Compile enabled alert rules for O(1) evaluation at ingest
+            rule_index.rebuild(db.query(models.AlertRule).all())
 except Exception as _seed_err:
     # Non-fatal; continue without seed
     pass
@@ -53,10 +76,6 @@ FACES_DB = os.getenv("FACES_DB", "faces_db")
 
 app = FastAPI(title="Face Watchlist Alerts API")
 
-# Import camera routes
-from api.routers import cameras
-app.include_router(cameras.router)
-
 # Allow the dashboard (and other local UIs) to fetch alerts from the browser.
 # In production you may want to restrict `allow_origins` to your dashboard host.
 app.add_middleware(
@@ -67,39 +86,32 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def start_background_services():
+    loop_monitor.start()
+    # Resume the WebSocket sequence from persisted alerts so reconnecting
+    # dashboards can replay across a server restart instead of refetching.
+    hub.seed({"type": "new_alert", "alert": a, "seq": a["seq"]}
+             for a in await alert_store.tail(hub.replay_size) if a.get("seq") is not None)
+    await bus.start()
+    # Resume delivery of anything left in the notification outbox
+    await dispatcher.start()
+    # Local watchers deliver alerts over a Unix socket; HTTP stays for remote ones
+    if ALERT_SOCKET:
+        await alert_ingest.start()
+
+@app.on_event("shutdown")
+async def stop_background_services():
+    await alert_ingest.stop()
+    await dispatcher.stop()
+    await bus.stop()
+    await alert_store.flush()
+    await loop_monitor.stop()
+
 # Ensure incidents folder exists
 os.makedirs(INCIDENTS_FOLDER, exist_ok=True)
 os.makedirs(FACES_DB, exist_ok=True)
 
-# Create database tables on startup
-from api.database import engine
-Base.metadata.create_all(bind=engine)
-
-# WebSocket connection manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Set[WebSocket] = set()
-    
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.add(websocket)
-    
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-    
-    async def broadcast(self, message: dict):
-        dead_connections = set()
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except:
-                dead_connections.add(connection)
-        # Clean up dead connections
-        for dead in dead_connections:
-            self.active_connections.remove(dead)
-
-manager = ConnectionManager()
-
 def _sanitize_alert(a: dict) -> dict:
     """Ensure minimum keys exist for an alert to prevent response_model validation errors."""
     return {
@@ -108,31 +120,47 @@ def _sanitize_alert(a: dict) -> dict:
         "timestamp": a.get("timestamp", datetime.utcnow().isoformat()),
         "filename": a.get("filename", "unknown.jpg"),
         "suspicious": bool(a.get("suspicious", a.get("name", "Unknown") == "Unknown")),
-        "camera_name": a.get("camera_name")
+        "camera_name": a.get("camera_name"),
+        "seq": a.get("seq")
     }
 
-# Load persisted alerts if present with sanitation
-if os.path.exists(ALERTS_FILE):
-    try:
-        with open(ALERTS_FILE, "r", encoding="utf-8") as f:
-            raw_alerts = json.load(f)
-            if isinstance(raw_alerts, list):
-                alerts_store = [_sanitize_alert(a) for a in raw_alerts]
-            else:
-                alerts_store = []
-    except Exception:
-        alerts_store = []
-else:
-    alerts_store = []
+# State shared between uvicorn workers lives behind STATE_BACKEND: the alert
+# log, the pub/sub bus that fans broadcasts out to every worker's WebSocket
+# clients, rule cooldowns, alert idempotency keys and the watcher process handle.
+alert_store = state_backends.create_alert_store(ALERTS_FILE, _sanitize_alert)
+alert_dedup = state_backends.create_dedup()
+bus = state_backends.create_bus()
+watch_state = state_backends.create_watch_state()
+rule_index.use_cooldowns(state_backends.create_cooldowns())
+
+def _on_bus_alert(message: dict) -> None:
+    hub.publish({"type": message["type"], "alert": message["alert"]}, seq=message["seq"])
+
+async def _on_bus_rule(message: dict) -> None:
+    # Another worker changed a rule; refresh our copy of the index
+    if message["op"] == "remove":
+        await rule_index.remove(message["id"])
+        return
+    rule = await run_io(_load_rule, message["id"])
+    if rule is not None:
+        rule_index.upsert(rule)
+
+def _load_rule(rule_id: int):
+    with SessionLocal() as db:
+        return db.get(models.AlertRule, rule_id)
+
+bus.subscribe("alerts", _on_bus_alert)
+bus.subscribe("rules", _on_bus_rule)
+bus.subscribe("users", lambda message: invalidate_user(message["username"]))
 
 class Token(BaseModel):
     access_token: str
     token_type: str
 
 @app.post("/token", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     print(f"Login attempt - username: {form_data.username}, password length: {len(form_data.password)}")
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     print(f"Authentication result: {'success' if user else 'failed'}")
     if not user:
         raise HTTPException(
@@ -155,24 +183,73 @@ class Alert(BaseModel):
     filename: str
     suspicious: bool = False  # Flag for unknown/suspicious persons
     camera_name: Optional[str] = None  # Optional camera name for better notifications
+    seq: Optional[int] = None  # Assigned by the server on ingest
+    key: Optional[str] = None  # Idempotency key: watcher:camera:frame:person
+    quality: Optional[dict] = None  # Face quality scores from the watcher (size, sharpness, yaw, score...)
+    evidence_offset_ms: Optional[float] = None  # Main-stream snapshot taken this long after the analysed frame
 
 @app.post("/alerts", status_code=201)
 async def receive_alert(alert: Alert):
     """Receive a new alert from the watchlist system and persist it."""
-    entry = alert.dict()
-    alerts_store.append(entry)
-    # persist to disk
+    return await _ingest_alert(alert)
+
+async def _ingest_ipc(payload: dict) -> dict:
+    # pydantic's ValidationError is a ValueError: acknowledged as rejected
+    return await _ingest_alert(Alert(**payload))
+
+# Per-stage latency of the alert path, exposed on /metrics
+alert_metrics = MetricsRegistry()
+alert_stages = alert_metrics.scope()
+
+async def _ingest_alert(alert: Alert) -> dict:
+    with timed(alert_stages.histogram("ingest")):
+        return await _store_alert(alert)
+
+async def _store_alert(alert: Alert) -> dict:
+    # Retries and spool replays redeliver alerts: a key seen within the dedup
+    # window is acknowledged with its original seq but not stored or broadcast
+    if alert.key:
+        new, seq = await alert_dedup.claim(alert.key)
+        if not new:
+            if seq is None:
+                raise HTTPException(status_code=409, detail="Alert with this key is still being stored; retry")
+            return {"status": "duplicate", "seq": seq, "rules_fired": []}
+    # The store assigns the sequence number (global across workers)
     try:
-        with open(ALERTS_FILE, "w", encoding="utf-8") as f:
-            json.dump(alerts_store, f, indent=2)
-        # Broadcast to WebSocket clients with alert data
-        await manager.broadcast({
+        # Quality scores and evidence offsets are stored only when the watcher sent them
+        exclude = {"key"}
+        if not alert.quality:
+            exclude.add("quality")
+        if alert.evidence_offset_ms is None:
+            exclude.add("evidence_offset_ms")
+        with timed(alert_stages.histogram("persist")):
+            entry = await alert_store.append(alert.dict(exclude=exclude))
+    except BaseException:
+        if alert.key:
+            await alert_dedup.release(alert.key)
+        raise
+    if alert.key:
+        await alert_dedup.record(alert.key, entry["seq"])
+    # Fan out to WebSocket clients on every worker; per-client writers send
+    # after we return
+    with timed(alert_stages.histogram("broadcast")):
+        await bus.publish("alerts", {
             "type": "new_alert",
-            "alert": entry  # Changed from "data" to "alert" for clarity
+            "alert": entry,  # Changed from "data" to "alert" for clarity
+            "seq": entry["seq"],
         })
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to save alert: {e}")
-    return {"status": "ok", "saved": entry}
+    # Evaluate alert rules from the in-memory index; email/webhook delivery is
+    # queued in the outbox and handled by the dispatcher's workers
+    with timed(alert_stages.histogram("notify")):
+        fired = await rule_index.evaluate(entry)
+        for rule in fired:
+            try:
+                await dispatcher.submit(rule, dict(entry))
+            except Exception:
+                logger.exception(f"Failed to queue notification for rule {rule.id}")
+    return {"status": "ok", "seq": entry["seq"], "saved": entry, "rules_fired": [rule.id for rule in fired]}
+
+alert_ingest = AlertIngestServer(_ingest_ipc)
 
 # Persons (faces_db) management
 @app.get("/persons")
@@ -210,26 +287,31 @@ def list_person_images(name: str, current_user: User = Depends(get_current_activ
     return {"images": files}
 
 @app.post("/persons/{name}/images")
-async def upload_person_image(name: str, file: UploadFile = File(...), current_user: User = Depends(get_current_active_user)):
+async def upload_person_image(name: str, background_tasks: BackgroundTasks, file: UploadFile = File(...),
+                              current_user: User = Depends(get_current_active_user)):
     safe = name.strip().replace("..", "").replace("/", "_")
     folder = pathlib.Path(FACES_DB) / safe
-    if not folder.exists():
-        folder.mkdir(parents=True, exist_ok=True)
     # Build filename with timestamp to avoid collisions
     ts = datetime.utcnow().strftime("%Y%m%d_%H%M%S_%f")
     ext = pathlib.Path(file.filename).suffix or ".jpg"
     dest = folder / f"{ts}{ext}"
     try:
-        with dest.open("wb") as out:
-            content = await file.read()
-            out.write(content)
+        content = await file.read()
+        await run_io(_write_upload, folder, dest, content)
+        background_tasks.add_task(watch_control.watchlist_changed)
+        edge_watchlist.mark_dirty()
         return {"saved": dest.name}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _write_upload(folder: pathlib.Path, dest: pathlib.Path, content: bytes) -> None:
+    folder.mkdir(parents=True, exist_ok=True)
+    dest.write_bytes(content)
+
 @app.delete("/persons/{name}")
 def delete_person(
     name: str,
+    background_tasks: BackgroundTasks,
     purge_alerts: bool = False,
     purge_incidents: bool = False,
     current_user: User = Depends(get_current_active_user)
@@ -252,19 +334,16 @@ def delete_person(
         shutil.rmtree(folder)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to remove person folder: {e}")
+    background_tasks.add_task(watch_control.watchlist_changed)
+    edge_watchlist.mark_dirty()
 
     removed_alerts = 0
     removed_incidents = 0
 
-    global alerts_store
     if purge_alerts:
-        before = len(alerts_store)
-        alerts_store = [a for a in alerts_store if a.get("name") != safe]
-        removed_alerts = before - len(alerts_store)
-        # persist updated alerts_store
         try:
-            with open(ALERTS_FILE, "w", encoding="utf-8") as f:
-                json.dump(alerts_store, f, indent=2)
+            # Sync endpoint (threadpool); hop back to the loop for the store
+            removed_alerts = from_thread.run(alert_store.purge_name, safe)
         except Exception as e:
             # Not fatal; continue
             pass
@@ -282,6 +361,14 @@ def delete_person(
                                 removed_incidents += 1
                             except Exception:
                                 pass
+            # Packed snapshots are only dropped from the index; segment
+            # retention reclaims the bytes.
+            store = incident_store.get_packed_store(INCIDENTS_FOLDER)
+            if store is not None:
+                for entry in store.list():
+                    if any(entry["filename"].endswith(f"_{safe}{ext}") for ext in incident_store.IMAGE_EXTENSIONS):
+                        if store.delete(entry["filename"]):
+                            removed_incidents += 1
         except Exception:
             # Ignore failures removing incidents
             pass
@@ -300,7 +387,7 @@ async def list_alerts(
     current_user: User = Depends(get_current_active_user)
 ):
     """Return recent alerts (most recent first)."""
-    return list(reversed(alerts_store))[:limit]
+    return await alert_store.recent(limit)
 
 @app.get("/alerts/{name}", response_model=List[Alert])
 async def alerts_for_name(
@@ -309,8 +396,7 @@ async def alerts_for_name(
     current_user: User = Depends(get_current_active_user)
 ):
     """Get alerts for a specific person."""
-    matches = [a for a in reversed(alerts_store) if a.get("name") == name]
-    return matches[:limit]
+    return await alert_store.recent(limit, name=name)
 
 @app.get("/stats")
 async def get_statistics(
@@ -318,7 +404,7 @@ async def get_statistics(
     current_user: User = Depends(get_current_active_user)
 ):
     """Get alert statistics and trends."""
-    return get_alert_stats(alerts_store, days)
+    return await run_cpu(get_alert_stats, await alert_store.snapshot(), days)
 
 @app.get("/stats/{name}")
 async def get_person_stats(
@@ -327,13 +413,26 @@ async def get_person_stats(
     current_user: User = Depends(get_current_active_user)
 ):
     """Get detailed statistics for a specific person."""
-    return get_person_history(alerts_store, name, days)
+    return await run_cpu(get_person_history, await alert_store.snapshot(), name, days)
 
 # Camera Management Routes
+def _check_camera_config(config: Optional[dict]) -> None:
+    try:
+        camera_regions(config)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid regions: {e}")
+    try:
+        camera_backend(config)
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid detector/encoder: {e}")
+
 @app.post("/cameras/")
-def create_camera(camera: schemas.CameraCreate, db: Session = Depends(get_db),
+async def create_camera(camera: schemas.CameraCreate, db: AsyncSession = Depends(get_db),
                  current_user: User = Depends(get_current_active_user)):
-    result = crud.create_camera(db=db, camera=camera)
+    _check_camera_config(camera.config)
+    result = await crud.create_camera(db=db, camera=camera)
+    await watch_control.camera_changed(_watch_camera(result.id, result.source, result.name,
+                                                     result.enabled, result.config))
     # Transform to dict for response
     return {
         'id': result.id,
@@ -349,17 +448,20 @@ def create_camera(camera: schemas.CameraCreate, db: Session = Depends(get_db),
     }
 
 @app.get("/cameras/")
-def list_cameras(skip: int = 0, limit: int = 100, db: Session = Depends(get_db),
+async def list_cameras(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db),
                 current_user: User = Depends(get_current_active_user)):
-    return crud.get_cameras(db, skip=skip, limit=limit)
+    return await crud.get_cameras(db, skip=skip, limit=limit)
 
 @app.put("/cameras/{camera_id}")
-def update_camera(camera_id: int, camera: schemas.CameraUpdate, db: Session = Depends(get_db),
+async def update_camera(camera_id: int, camera: schemas.CameraUpdate, db: AsyncSession = Depends(get_db),
                  current_user: User = Depends(get_current_active_user)):
-    db_camera = crud.get_camera(db, camera_id=camera_id)
+    db_camera = await crud.get_camera(db, camera_id=camera_id)
     if db_camera is None:
         raise HTTPException(status_code=404, detail="Camera not found")
-    result = crud.update_camera(db=db, camera_id=camera_id, camera=camera)
+    _check_camera_config({**(db_camera.config or {}), **(camera.config or {})})
+    result = await crud.update_camera(db=db, camera_id=camera_id, camera=camera)
+    await watch_control.camera_changed(_watch_camera(result.id, result.source, result.name,
+                                                     result.enabled, result.config))
     # Transform to dict for response
     return {
         'id': result.id,
@@ -375,149 +477,419 @@ def update_camera(camera_id: int, camera: schemas.CameraUpdate, db: Session = De
     }
 
 @app.delete("/cameras/{camera_id}")
-def delete_camera(camera_id: int, db: Session = Depends(get_db),
+async def delete_camera(camera_id: int, db: AsyncSession = Depends(get_db),
                  current_user: User = Depends(get_current_active_user)):
-    db_camera = crud.get_camera(db, camera_id=camera_id)
+    db_camera = await crud.get_camera(db, camera_id=camera_id)
     if db_camera is None:
         raise HTTPException(status_code=404, detail="Camera not found")
-    crud.delete_camera(db=db, camera_id=camera_id)
+    await crud.delete_camera(db=db, camera_id=camera_id)
+    await watch_control.camera_removed(camera_id)
     return {"message": "Camera deleted successfully"}
 
+class CameraRegions(BaseModel):
+    roi: List[List[List[float]]] = []  # polygons of [x, y] points, fractions of the frame
+    masks: List[List[List[float]]] = []
+
+@app.get("/cameras/{camera_id}/regions")
+async def get_camera_regions(camera_id: int, db: AsyncSession = Depends(get_db),
+                             current_user: User = Depends(get_current_active_user)):
+    db_camera = await crud.get_camera(db, camera_id=camera_id)
+    if db_camera is None:
+        raise HTTPException(status_code=404, detail="Camera not found")
+    config = db_camera.config or {}
+    return {"id": camera_id, "roi": config.get("roi") or [], "masks": config.get("masks") or []}
+
+@app.put("/cameras/{camera_id}/regions")
+async def set_camera_regions(camera_id: int, regions: CameraRegions, db: AsyncSession = Depends(get_db),
+                             current_user: User = Depends(get_current_active_user)):
+    """Replace the camera's regions of interest and exclusion masks; empty lists clear them."""
+    try:
+        roi, masks = parse_polygons(regions.roi), parse_polygons(regions.masks)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid regions: {e}")
+    result = await crud.update_camera_config(db, camera_id, {
+        "roi": [[list(point) for point in polygon] for polygon in roi] or None,
+        "masks": [[list(point) for point in polygon] for polygon in masks] or None,
+    })
+    if result is None:
+        raise HTTPException(status_code=404, detail="Camera not found")
+    await watch_control.camera_changed(_watch_camera(result.id, result.source, result.name,
+                                                     result.enabled, result.config))
+    return {"id": camera_id, "roi": result.config.get("roi") or [], "masks": result.config.get("masks") or []}
+
 # Alert Rules Routes
 @app.post("/alert-rules/", response_model=schemas.AlertRule)
-def create_alert_rule(alert_rule: schemas.AlertRuleCreate, db: Session = Depends(get_db),
+async def create_alert_rule(alert_rule: schemas.AlertRuleCreate, db: AsyncSession = Depends(get_db),
                      current_user: User = Depends(get_current_active_user)):
-    return crud.create_alert_rule(db=db, alert_rule=alert_rule)
+    result = await crud.create_alert_rule(db=db, rule=alert_rule, user_id=current_user.id)
+    rule_index.upsert(result)
+    await bus.publish("rules", {"op": "upsert", "id": result.id}, local=False)
+    return result
 
 @app.get("/alert-rules/", response_model=List[schemas.AlertRule])
-def list_alert_rules(skip: int = 0, limit: int = 100, db: Session = Depends(get_db),
+async def list_alert_rules(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db),
                     current_user: User = Depends(get_current_active_user)):
-    return crud.get_alert_rules(db, skip=skip, limit=limit)
+    return await crud.get_alert_rules(db, skip=skip, limit=limit)
 
 @app.put("/alert-rules/{rule_id}", response_model=schemas.AlertRule)
-def update_alert_rule(rule_id: int, alert_rule: schemas.AlertRuleUpdate, db: Session = Depends(get_db),
+async def update_alert_rule(rule_id: int, alert_rule: schemas.AlertRuleUpdate, db: AsyncSession = Depends(get_db),
                      current_user: User = Depends(get_current_active_user)):
-    db_rule = crud.get_alert_rule(db, rule_id=rule_id)
+    db_rule = await crud.get_alert_rule(db, rule_id=rule_id)
     if db_rule is None:
         raise HTTPException(status_code=404, detail="Alert rule not found")
-    return crud.update_alert_rule(db=db, rule_id=rule_id, alert_rule=alert_rule)
+    result = await crud.update_alert_rule(db=db, rule_id=rule_id, rule=alert_rule)
+    rule_index.upsert(result)
+    await bus.publish("rules", {"op": "upsert", "id": rule_id}, local=False)
+    return result
 
 @app.delete("/alert-rules/{rule_id}")
-def delete_alert_rule(rule_id: int, db: Session = Depends(get_db),
+async def delete_alert_rule(rule_id: int, db: AsyncSession = Depends(get_db),
                      current_user: User = Depends(get_current_active_user)):
-    db_rule = crud.get_alert_rule(db, rule_id=rule_id)
+    db_rule = await crud.get_alert_rule(db, rule_id=rule_id)
     if db_rule is None:
         raise HTTPException(status_code=404, detail="Alert rule not found")
-    crud.delete_alert_rule(db=db, rule_id=rule_id)
+    await crud.delete_alert_rule(db=db, rule_id=rule_id)
+    await rule_index.remove(rule_id)
+    await bus.publish("rules", {"op": "remove", "id": rule_id}, local=False)
     return {"message": "Alert rule deleted successfully"}
 
 # User Management Routes
 @app.post("/users/", response_model=schemas.User)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db),
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_db),
                 current_user: User = Depends(get_current_active_user)):
-    db_user = crud.get_user_by_email(db, email=user.email)
+    db_user = await crud.get_user_by_email(db, email=user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    return crud.create_user(db=db, user=user)
+    return await crud.create_user(db=db, user=user)
 
 @app.get("/users/", response_model=List[schemas.User])
-def list_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db),
+async def list_users(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db),
                current_user: User = Depends(get_current_active_user)):
-    return crud.get_users(db, skip=skip, limit=limit)
+    return await crud.get_users(db, skip=skip, limit=limit)
 
 @app.get("/users/{user_id}", response_model=schemas.User)
-def get_user(user_id: int, db: Session = Depends(get_db),
+async def get_user(user_id: int, db: AsyncSession = Depends(get_db),
              current_user: User = Depends(get_current_active_user)):
-    db_user = crud.get_user(db, user_id=user_id)
+    db_user = await crud.get_user(db, user_id=user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
 
 @app.put("/users/{user_id}", response_model=schemas.User)
-def update_user(user_id: int, user: schemas.UserUpdate, db: Session = Depends(get_db),
+async def update_user(user_id: int, user: schemas.UserUpdate, db: AsyncSession = Depends(get_db),
                 current_user: User = Depends(get_current_active_user)):
-    db_user = crud.get_user(db, user_id=user_id)
+    db_user = await crud.get_user(db, user_id=user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
-    return crud.update_user(db=db, user_id=user_id, user=user)
+    old_username = db_user.username
+    result = await crud.update_user(db=db, user_id=user_id, user=user)
+    # Renames, password changes and disabling must not be served from cache
+    for username in {old_username, result.username}:
+        invalidate_user(username)
+        await bus.publish("users", {"username": username}, local=False)
+    return result
 
 @app.delete("/users/{user_id}")
-def delete_user(user_id: int, db: Session = Depends(get_db),
+async def delete_user(user_id: int, db: AsyncSession = Depends(get_db),
                 current_user: User = Depends(get_current_active_user)):
-    db_user = crud.get_user(db, user_id=user_id)
+    db_user = await crud.get_user(db, user_id=user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
-    crud.delete_user(db=db, user_id=user_id)
+    username = db_user.username
+    await crud.delete_user(db=db, user_id=user_id)
+    invalidate_user(username)
+    await bus.publish("users", {"username": username}, local=False)
     return {"message": "User deleted successfully"}
 
 # WebSocket endpoint for real-time updates
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
-    connected_clients.add(websocket)
+async def websocket_endpoint(websocket: WebSocket, last_seq: Optional[int] = None):
+    """Stream alerts; pass ``?last_seq=N`` on reconnect to replay missed ones."""
+    await hub.connect(websocket, last_seq=last_seq)
     try:
         while True:
             data = await websocket.receive_text()
             # Process received data if needed
-    except WebSocketDisconnect:
-        connected_clients.remove(websocket)
+    except (WebSocketDisconnect, RuntimeError):
+        # RuntimeError: the hub already closed a slow client's socket
+        pass
+    finally:
+        hub.disconnect(websocket)
 
 # Alias path for WebSocket to match dashboard expectation
 @app.websocket("/ws/alerts")
-async def websocket_alerts(websocket: WebSocket):
-    await websocket_endpoint(websocket)
+async def websocket_alerts(websocket: WebSocket, last_seq: Optional[int] = None):
+    await websocket_endpoint(websocket, last_seq)
+
+@app.get("/debug/runtime")
+def runtime_stats(current_user: User = Depends(get_current_active_user)):
+    """Internal counters for the server's background machinery."""
+    return {
+        "websocket": hub.stats(),
+        "alert_rules": rule_index.stats(),
+        "notifications": dispatcher.stats(),
+        "event_loop": loop_monitor.stats(),
+        "alert_store": alert_store.stats(),
+        "alert_dedup": alert_dedup.stats(),
+        "bus": bus.stats(),
+        "auth_cache": auth_cache_stats(),
+        "db_pool": pool_stats(),
+        "alert_ingest": alert_ingest.stats(),
+        "stage_latency": alert_metrics.stats(),
+    }
 
-# Watch process management (start/stop)
-WATCH_PROC: Optional[subprocess.Popen] = None
+@app.get("/metrics")
+async def prometheus_metrics(db: AsyncSession = Depends(get_db)):
+    """Per-stage latency histograms in Prometheus text format.
+
+    Unauthenticated for scrapers, like /healthz; labels carry camera ids,
+    never sources. Covers this worker's alert path, the local watcher (from
+    its heartbeat) and active edge workers (from their last heartbeat).
+    """
+    sources = [({"component": "server"}, alert_metrics.export())]
+    beat = await run_io(read_heartbeat)
+    if beat is not None and beat["fresh"]:
+        sources.append(({"component": "watcher"}, beat.get("metrics", [])))
+    for worker in await worker_registry.list_workers(db):
+        if worker["status"] == "active" and worker["telemetry"]:
+            sources.append(({"component": "watcher", "worker": worker["name"]},
+                            worker["telemetry"].get("metrics", [])))
+    return Response(render_prometheus(sources), media_type=PROMETHEUS_CONTENT_TYPE)
+
+# Watcher daemon management. The daemon (watch_daemon.py) keeps models and
+# encodings loaded between runs; these endpoints talk to it over its control
+# socket and only spawn a process when none is listening. The process handle
+# lives in watch_state so any worker can report on or stop it.
+WATCH_DAEMON_SCRIPT = pathlib.Path(__file__).resolve().parent / "watch_daemon.py"
+WATCH_SUPERVISOR_SCRIPT = pathlib.Path(__file__).resolve().parent / "watch_supervisor.py"
+
+def _watch_camera(camera_id: int, source: str, name: Optional[str], enabled: bool = True,
+                  config: Optional[dict] = None) -> dict:
+    """Camera as the watcher takes it: streams, ROIs/masks, face backends and decode-cost hints."""
+    hints = {k: v for k, v in (config or {}).items() if k in COST_HINTS and v is not None}
+    # Cameras assigned to a site are served by that site's edge workers, not the local watcher
+    local = enabled and not (config or {}).get("site")
+    analysis, evidence = camera_streams(source, config)
+    return {"id": camera_id, "source": analysis, "name": name, "evidence_source": evidence,
+            "regions": camera_regions(config), "backend": camera_backend(config), "enabled": local, **hints}
+
+async def _ensure_watcher() -> dict:
+    status = await watch_control.status()
+    if status is not None:
+        return status
+    if watch_state.status()["status"] != "running":
+        # More than one shard: a supervisor fans cameras out over several daemons
+        if shard_count(WATCH_SHARDS) > 1:
+            cmd = [sys.executable, str(WATCH_SUPERVISOR_SCRIPT), "--socket", watch_control.socket_path]
+        else:
+            cmd = [sys.executable, str(WATCH_DAEMON_SCRIPT), "--socket", watch_control.socket_path]
+        await run_io(watch_state.start, cmd, str(WATCH_DAEMON_SCRIPT.parent))
+    status = await watch_control.wait_ready()
+    if status is None:
+        raise HTTPException(status_code=503, detail="Watcher daemon did not become ready")
+    return status
+
+async def _watch_command(path: str) -> dict:
+    try:
+        return await watch_control.request("POST", path)
+    except WatcherUnavailable:
+        raise HTTPException(status_code=409, detail="Watcher is not running")
 
 @app.post("/watch/start")
-def start_watch(db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
-    global WATCH_PROC
-    if WATCH_PROC and WATCH_PROC.poll() is None:
-        return {"status": "already_running", "pid": WATCH_PROC.pid}
+async def start_watch(db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+    current = await _ensure_watcher()
+    if current["status"] in ("running", "paused"):
+        cameras = [cam["source"] for cam in current.get("cameras", {}).values()]
+        return {"status": "already_running", "pid": current["pid"], "cameras": cameras}
+    cameras = [
+        _watch_camera(cam["id"], cam["url"], cam["name"], config=cam.get("config"))
+        for cam in await crud.get_cameras(db, skip=0, limit=1000)
+        if cam.get("url") and cam.get("enabled", True) and not (cam.get("config") or {}).get("site")
+    ]
+    # Default to webcam if no cameras configured
+    if not cameras:
+        cameras = [{"id": 0, "source": "0", "name": "Default webcam"}]
     try:
-        # Get active cameras from database
-        cameras = crud.get_cameras(db, skip=0, limit=100)
-        # cameras is now a list of dicts, access 'url' key
-        camera_urls = [cam['url'] for cam in cameras if cam.get('url')]
-        
-        # Default to webcam if no cameras configured
-        if not camera_urls:
-            camera_urls = ["0"]
-        
-        # Launch face recognition script with camera sources
-        python_path = sys.executable
-        script_path = pathlib.Path(__file__).resolve().parent / "realtime_face_watchlist.py"
-        
-        # Pass camera URLs as arguments
-        cmd = [python_path, str(script_path)] + camera_urls
-        WATCH_PROC = subprocess.Popen(cmd, cwd=str(pathlib.Path(__file__).resolve().parent))
-        return {"status": "started", "pid": WATCH_PROC.pid, "cameras": camera_urls}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        result = await watch_control.request("POST", "/start", json={"cameras": cameras})
+    except WatcherUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"status": "started", "pid": result["pid"], "cameras": [cam["source"] for cam in cameras]}
 
 @app.post("/watch/stop")
-def stop_watch(current_user: User = Depends(get_current_active_user)):
-    global WATCH_PROC
-    if not WATCH_PROC or WATCH_PROC.poll() is not None:
-        return {"status": "not_running"}
+async def stop_watch(shutdown: bool = False, current_user: User = Depends(get_current_active_user)):
+    """Release all cameras. The daemon stays warm unless ``shutdown`` is set."""
     try:
-        WATCH_PROC.terminate()
-        try:
-            WATCH_PROC.wait(timeout=5)
-        except Exception:
-            WATCH_PROC.kill()
+        result = await watch_control.request("POST", "/stop")
+        if not shutdown:
+            return result
+        await watch_control.request("POST", "/shutdown")
+    except WatcherUnavailable:
+        if not shutdown:
+            return {"status": "not_running"}
+    return await run_io(watch_state.stop)
+
+@app.post("/watch/pause")
+async def pause_watch(current_user: User = Depends(get_current_active_user)):
+    """Keep cameras open but skip recognition."""
+    return await _watch_command("/pause")
+
+@app.post("/watch/resume")
+async def resume_watch(current_user: User = Depends(get_current_active_user)):
+    return await _watch_command("/resume")
+
+@app.post("/watch/reload")
+async def reload_watchlist(current_user: User = Depends(get_current_active_user)):
+    """Re-scan faces_db in the running watcher, encoding only new or changed images."""
+    try:
+        return await watch_control.request("POST", "/reload", timeout=WATCH_RELOAD_TIMEOUT)
+    except WatcherUnavailable:
+        raise HTTPException(status_code=409, detail="Watcher is not running")
+
+def _watcher_status() -> dict:
+    """Watcher status from its heartbeat file, falling back to the process handle."""
+    beat = read_heartbeat()
+    if beat is not None and beat["fresh"]:
+        return beat
+    process = watch_state.status()
+    if process["status"] != "running":
         return {"status": "stopped"}
-    finally:
-        WATCH_PROC = None
+    if beat is None or beat.get("pid") != process["pid"]:
+        # Process exists but has not published yet (loading models)
+        return {"status": "starting", "pid": process["pid"]}
+    return {**beat, "status": "unresponsive"}
 
 @app.get("/watch/status")
-def watch_status(current_user: User = Depends(get_current_active_user)):
-    """Get current watch process status"""
-    global WATCH_PROC
-    if WATCH_PROC and WATCH_PROC.poll() is None:
-        return {"status": "running", "pid": WATCH_PROC.pid}
-    return {"status": "stopped"}
+async def watch_status(current_user: User = Depends(get_current_active_user)):
+    """Get current watcher status with per-camera telemetry"""
+    return await run_io(_watcher_status)
+
+@app.get("/healthz")
+async def healthz():
+    """Unauthenticated liveness probe: server up, plus a watcher summary.
+
+    Touches neither the database nor the watcher; camera sources are not exposed.
+    """
+    watcher = await run_io(_watcher_status)
+    cameras = watcher.get("cameras", {})
+    stalled = sorted(int(cid) for cid, cam in cameras.items() if cam.get("stalled"))
+    degraded = watcher["status"] == "unresponsive" or bool(stalled)
+    return {
+        "status": "degraded" if degraded else "ok",
+        "watcher": {
+            "status": watcher["status"],
+            "heartbeat_age": watcher.get("heartbeat_age"),
+            "cameras": len(cameras),
+            "stalled_cameras": stalled,
+        },
+    }
+
+# Edge workers (edge_worker.py) on remote sites register, lease cameras with
+# heartbeats, pull the watchlist snapshot and push alerts in batches. They
+# authenticate with the shared WORKER_TOKEN rather than a user login.
+edge_watchlist = worker_registry.WatchlistPublisher(Watchlist(FACES_DB))
+
+class WorkerRegistration(BaseModel):
+    name: str
+    site: str = "default"
+    host: Optional[str] = None
+
+class WorkerHeartbeat(BaseModel):
+    status: Optional[dict] = None  # the worker's watcher status/telemetry
+    watchlist_version: Optional[str] = None
+
+class AlertBatch(BaseModel):
+    alerts: List[dict]  # [{"id": ..., "alert": {...}, "snapshot": base64 JPEG (optional)}]
+
+def _store_worker_snapshot(filename: str, snapshot: str) -> None:
+    """Keep an edge worker's snapshot in the server's incident store (once per filename)."""
+    if pathlib.Path(filename).name != filename or not filename.lower().endswith(incident_store.IMAGE_EXTENSIONS):
+        raise ValueError(f"Invalid snapshot filename: {filename!r}")
+    if incident_store.locate_incident(filename, INCIDENTS_FOLDER) is not None:
+        return
+    os.makedirs(INCIDENTS_FOLDER, exist_ok=True)
+    incident_store.save_incident(filename, base64.b64decode(snapshot, validate=True), INCIDENTS_FOLDER)
+
+def require_worker(authorization: Optional[str] = Header(None)) -> None:
+    if not worker_registry.WORKER_TOKEN:
+        raise HTTPException(status_code=503, detail="Edge workers are disabled; set WORKER_TOKEN")
+    token = (authorization or "").removeprefix("Bearer ").strip()
+    if not worker_registry.check_token(token):
+        raise HTTPException(status_code=401, detail="Invalid worker token")
+
+@app.post("/workers/register")
+async def register_worker(body: WorkerRegistration, db: AsyncSession = Depends(get_db),
+                          _: None = Depends(require_worker)):
+    worker = await worker_registry.register(db, body.name, body.site, body.host)
+    ttl = worker_registry.WORKER_LEASE_TTL
+    return {"worker_id": worker.id, "lease_ttl": ttl, "heartbeat_interval": ttl / 3}
+
+@app.post("/workers/{worker_id}/heartbeat")
+async def worker_heartbeat(worker_id: str, body: WorkerHeartbeat, db: AsyncSession = Depends(get_db),
+                           _: None = Depends(require_worker)):
+    cameras = await worker_registry.heartbeat(db, worker_id, body.status, body.watchlist_version)
+    if cameras is None:
+        raise HTTPException(status_code=410, detail="Lease expired; register again")
+    return {
+        "cameras": cameras,
+        "watchlist_version": await run_io(edge_watchlist.current),
+        "lease_ttl": worker_registry.WORKER_LEASE_TTL,
+    }
+
+@app.post("/workers/{worker_id}/alerts")
+async def worker_alerts(worker_id: str, body: AlertBatch, db: AsyncSession = Depends(get_db),
+                        _: None = Depends(require_worker)):
+    """Ingest a batch of alerts; each is acknowledged or rejected individually.
+
+    As on the alert socket, malformed alerts are rejected for good, while any
+    other failure (a key still being stored, a store error) asks the worker
+    to retry that alert. A snapshot sent along is stored before the alert is
+    broadcast, so dashboards can load it from ``/incidents`` right away.
+    """
+    if not await worker_registry.is_active(db, worker_id):
+        raise HTTPException(status_code=410, detail="Lease expired; register again")
+    if len(body.alerts) > worker_registry.WORKER_ALERT_BATCH_MAX:
+        raise HTTPException(status_code=413, detail="Alert batch too large")
+    results = []
+    for item in body.alerts:
+        try:
+            if item.get("snapshot"):
+                try:
+                    await run_io(_store_worker_snapshot, item["alert"]["filename"], item["snapshot"])
+                except (KeyError, TypeError, ValueError) as e:
+                    # A bad snapshot costs only the image, never the alert
+                    logger.warning(f"Dropped snapshot of alert {item.get('id')} from worker {worker_id}: {e}")
+            entry = await _ingest_ipc(item["alert"])
+        except (KeyError, TypeError, ValueError) as e:
+            results.append({"id": item.get("id"), "ok": False, "retry": False, "error": str(e)})
+            continue
+        except HTTPException as e:
+            results.append({"id": item.get("id"), "ok": False, "retry": True, "error": e.detail})
+            continue
+        except Exception as e:
+            logger.exception(f"Failed to ingest alert {item.get('id')} from worker {worker_id}")
+            results.append({"id": item.get("id"), "ok": False, "retry": True, "error": str(e)})
+            continue
+        results.append({"id": item.get("id"), "ok": True, "seq": entry["seq"]})
+    return {"results": results}
+
+@app.delete("/workers/{worker_id}")
+async def worker_leave(worker_id: str, db: AsyncSession = Depends(get_db), _: None = Depends(require_worker)):
+    if not await worker_registry.leave(db, worker_id):
+        raise HTTPException(status_code=404, detail="Worker not found")
+    return {"status": "left"}
+
+@app.get("/workers/watchlist")
+async def worker_watchlist(if_none_match: Optional[str] = Header(None), _: None = Depends(require_worker)):
+    """Known-face encodings as an npz snapshot, versioned by content fingerprint."""
+    fingerprint, data = await run_io(edge_watchlist.export)
+    etag = f'"{fingerprint}"'
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=data, media_type="application/octet-stream", headers={"ETag": etag})
+
+@app.get("/workers")
+async def list_workers(db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+    return await worker_registry.list_workers(db)
 
 @app.get("/incidents")
 def list_incidents(current_user: User = Depends(get_current_active_user)):
@@ -538,6 +910,18 @@ def list_incidents(current_user: User = Depends(get_current_active_user)):
                     "url": f"/incidents/{file.name}"
                 })
         
+        store = incident_store.get_packed_store(INCIDENTS_FOLDER)
+        if store is not None:
+            for entry in store.list():
+                if not entry["filename"].lower().endswith(incident_store.IMAGE_EXTENSIONS):
+                    continue  # packed clips are served by name but are not listed as images
+                files.append({
+                    "filename": entry["filename"],
+                    "size": entry["size"],
+                    "created": datetime.fromtimestamp(entry["created"]).isoformat(),
+                    "url": f"/incidents/{entry['filename']}"
+                })
+
         # Sort by creation time, newest first
         files.sort(key=lambda x: x["created"], reverse=True)
         return {"incidents": files}
@@ -547,18 +931,51 @@ def list_incidents(current_user: User = Depends(get_current_active_user)):
 if __name__ == "__main__":
     uvicorn.run("alerts_server:app", host="0.0.0.0", port=8000, reload=True)
 
-# Serve incident images statically under /incidents
-app.mount("/incidents", StaticFiles(directory=INCIDENTS_FOLDER), name="incidents")
+def _serve_incident(filename: str, request: Request):
+    """Serve a loose or packed incident snapshot, honouring single byte ranges."""
+    location = incident_store.locate_incident(filename, INCIDENTS_FOLDER)
+    if location is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    path, offset, length = location
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    if offset == 0 and os.path.basename(path) == filename:
+        # Loose file: Starlette streams it from disk and handles ranges itself.
+        return FileResponse(path, media_type=media_type)
+    byte_range = incident_store.parse_range(request.headers.get("range"), length)
+    if byte_range is None:
+        return StreamingResponse(
+            incident_store.iter_range(path, offset, length),
+            media_type=media_type,
+            headers={"Content-Length": str(length), "Accept-Ranges": "bytes"},
+        )
+    start, end = byte_range
+    return StreamingResponse(
+        incident_store.iter_range(path, offset + start, end - start + 1),
+        status_code=206,
+        media_type=media_type,
+        headers={
+            "Content-Length": str(end - start + 1),
+            "Content-Range": f"bytes {start}-{end}/{length}",
+            "Accept-Ranges": "bytes",
+        },
+    )
+
+# Serve incident images under /incidents (loose files and packed segments)
+@app.get("/incidents/{filename}")
+def get_incident_image(filename: str, request: Request):
+    return _serve_incident(filename, request)
 
 # Serve face database images statically under /faces_db
 app.mount("/faces_db", StaticFiles(directory=FACES_DB), name="faces_db")
 
 @app.get("/incident/{filename}")
-async def get_incident(filename: str):
-    path = os.path.join(INCIDENTS_FOLDER, filename)
-    if not os.path.exists(path):
-        raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(path)
+def get_incident(filename: str, request: Request):
+    return _serve_incident(filename, request)
+
+# Legacy camera routes, registered last so the handlers above (which keep
+# config and notify the watcher) win for PUT/DELETE /cameras/{id}
+from api.routers import cameras
+app.include_router(cameras.router)
 
 if __name__ == "__main__":
     uvicorn.run(app, host="127.0.0.1", port=8000)
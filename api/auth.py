@@ -1,14 +1,19 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Dict, Optional
+from collections import OrderedDict
+import threading
+import time
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from pydantic import BaseModel
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from api.database import get_db, Base
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.database import get_db
+from models import User
 import os
+from blocking import run_cpu
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -17,19 +22,14 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")  # Change this in produc
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Verified-token and user caches for authenticated endpoints
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))  # seconds
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "1024"))
+
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-# Models
-class User(Base):
-    __tablename__ = "users"
-
-    id = Column(Integer, primary_key=True, index=True)
-    username = Column(String, unique=True, index=True)
-    hashed_password = Column(String)
-    is_active = Column(String, default=True)
-
 # Schemas
 class Token(BaseModel):
     access_token: str
@@ -52,6 +52,69 @@ class UserInDB(UserBase):
     class Config:
         from_attributes = True
 
+class TTLCache:
+    """Bounded LRU mapping whose entries also expire at a fixed time."""
+
+    def __init__(self, maxsize: int = AUTH_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Any, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Any) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[1] <= time.time():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key: Any, value: Any, expires_at: float) -> None:
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Any) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+# token -> username, valid until min(JWT exp, now + TTL)
+_token_cache = TTLCache()
+# username -> User row, detached from its session
+_user_cache = TTLCache()
+
+def invalidate_user(username: Optional[str]) -> None:
+    """Drop a cached user after it is updated, disabled or deleted.
+
+    Cached tokens only map to a username, so the next request re-reads the
+    user and fails if it no longer exists or is inactive.
+    """
+    if username:
+        _user_cache.pop(username)
+
+def auth_cache_stats() -> Dict[str, Dict[str, float]]:
+    return {"tokens": _token_cache.stats(), "users": _user_cache.stats()}
+
 # Helper functions
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -59,14 +122,16 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
-def get_user(db: Session, username: str):
-    return db.query(User).filter(User.username == username).first()
+async def get_user(db: AsyncSession, username: str):
+    result = await db.execute(select(User).where(User.username == username))
+    return result.scalars().first()
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = get_user(db, username)
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    user = await get_user(db, username)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    # bcrypt takes ~100s of ms; keep it off the event loop
+    if not await run_cpu(verify_password, password, user.hashed_password):
         return False
     return user
 
@@ -81,23 +146,32 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None, s
     encoded_jwt = jwt.encode(to_encode, key, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
+    username = _token_cache.get(token)
+    if username is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            username = payload.get("sub")
+            if username is None:
+                raise credentials_exception
+            token_data = TokenData(username=username)
+        except JWTError:
             raise credentials_exception
-        token_data = TokenData(username=username)
-    except JWTError:
-        raise credentials_exception
-    user = get_user(db, username=token_data.username)
+        expires_at = min(float(payload.get("exp", 0)) or time.time(), time.time() + AUTH_CACHE_TTL)
+        _token_cache.set(token, token_data.username, expires_at)
+    user = _user_cache.get(username)
     if user is None:
-        raise credentials_exception
+        user = await get_user(db, username)
+        if user is None:
+            raise credentials_exception
+        # Detach so the cached row can outlive this request's session
+        db.expunge(user)
+        _user_cache.set(username, user, time.time() + AUTH_CACHE_TTL)
     return user
 
 async def get_current_active_user(current_user: User = Depends(get_current_user)):
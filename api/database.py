@@ -1,20 +1,131 @@
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+"""
+Shared SQLAlchemy data layer.
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./alerts.db"
+Request handlers use the async engine (aiosqlite) through ``get_db``.
+``init_db`` and scripts that run without an event loop use a small synchronous
+engine on the same database. Both apply the same SQLite pragmas: WAL lets
+readers proceed while a writer commits, so list endpoints served from the
+connection pool no longer queue behind each other or behind alert rule edits.
+"""
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+import fcntl
+import os
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import DateTime, create_engine, event, inspect, make_url, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./alerts.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "8"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # safe with WAL
+SQLITE_CACHE_KB = int(os.getenv("SQLITE_CACHE_KB", "16384"))  # per connection
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+_url = make_url(DATABASE_URL)
+_is_sqlite = _url.get_backend_name() == "sqlite"
+SYNC_DATABASE_URL = _url.set(drivername=_url.get_backend_name())
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+engine = create_async_engine(
+    DATABASE_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_pre_ping=True,
 )
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# Synchronous engine for schema setup, seeding and standalone scripts
+sync_engine = create_engine(
+    SYNC_DATABASE_URL, connect_args={"check_same_thread": False} if _is_sqlite else {}
+)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=sync_engine)
+
+if _is_sqlite:
+    event.listen(engine.sync_engine, "connect", _set_sqlite_pragmas)
+    event.listen(sync_engine, "connect", _set_sqlite_pragmas)
 
 Base = declarative_base()
 
 # Dependency
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
+
+
+@contextmanager
+def bootstrap_lock():
+    """Serialise schema setup and seeding when several workers start at once."""
+    if not _is_sqlite or not _url.database or _url.database == ":memory:":
+        yield
+        return
+    with open(f"{_url.database}.init.lock", "a+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def init_db() -> None:
+    """Create missing tables and add columns introduced since the file was created."""
+    import models  # noqa: F401  (registers the tables on Base)
+
+    Base.metadata.create_all(bind=sync_engine)
+    with sync_engine.begin() as conn:
+        _add_missing_columns(conn)
+
+
+def _add_missing_columns(conn) -> None:
+    # create_all never alters existing tables, and older alerts.db files were
+    # created with a narrower users table (id, username, hashed_password,
+    # is_active). Columns are only ever added here, never dropped or retyped.
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        added = []
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(conn.dialect)}"
+            default = column.default.arg if column.default is not None and column.default.is_scalar else None
+            if isinstance(default, bool):
+                ddl += f" DEFAULT {int(default)}"
+            elif isinstance(default, (int, float)):
+                ddl += f" DEFAULT {default}"
+            conn.execute(text(ddl))
+            if isinstance(column.type, DateTime) and column.default is not None:
+                conn.execute(table.update().values({column.name: datetime.utcnow()}))
+            added.append(column.name)
+        if added:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+        if table.name == "users" and "disabled" in added and "is_active" in existing:
+            # Carry over the legacy free-text is_active flag
+            conn.execute(text(
+                "UPDATE users SET disabled = 1 "
+                "WHERE lower(CAST(is_active AS TEXT)) IN ('0', 'false', 'no', '')"
+            ))
+
+
+def pool_stats() -> dict:
+    pool = engine.pool
+    stats = {"size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW}
+    for name in ("checkedin", "checkedout", "overflow"):
+        if hasattr(pool, name):
+            stats[name] = getattr(pool, name)()
+    return stats
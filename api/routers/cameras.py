@@ -1,7 +1,8 @@
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from api.database import get_db
 import sys
 import os
@@ -29,50 +30,50 @@ class CameraResponse(CameraBase):
         orm_mode = True
 
 @router.get("/cameras", response_model=List[CameraResponse])
-async def list_cameras(db: Session = Depends(get_db), current_user = Depends(get_current_user)):
-    cameras = db.query(Camera).all()
-    return cameras
+async def list_cameras(db: AsyncSession = Depends(get_db), current_user = Depends(get_current_user)):
+    result = await db.execute(select(Camera))
+    return result.scalars().all()
 
 @router.post("/cameras", response_model=CameraResponse)
 async def create_camera(
     camera: CameraCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
     db_camera = Camera(**camera.dict())
     db.add(db_camera)
-    db.commit()
-    db.refresh(db_camera)
+    await db.commit()
+    await db.refresh(db_camera)
     return db_camera
 
 @router.put("/cameras/{camera_id}", response_model=CameraResponse)
 async def update_camera(
     camera_id: int,
     camera: CameraUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    db_camera = db.query(Camera).filter(Camera.id == camera_id).first()
+    db_camera = await db.get(Camera, camera_id)
     if not db_camera:
         raise HTTPException(status_code=404, detail="Camera not found")
     
     for key, value in camera.dict().items():
         setattr(db_camera, key, value)
     
-    db.commit()
-    db.refresh(db_camera)
+    await db.commit()
+    await db.refresh(db_camera)
     return db_camera
 
 @router.delete("/cameras/{camera_id}")
 async def delete_camera(
     camera_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    db_camera = db.query(Camera).filter(Camera.id == camera_id).first()
+    db_camera = await db.get(Camera, camera_id)
     if not db_camera:
         raise HTTPException(status_code=404, detail="Camera not found")
     
-    db.delete(db_camera)
-    db.commit()
+    await db.delete(db_camera)
+    await db.commit()
     return {"message": "Camera deleted successfully"}
\ No newline at end of file
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Compare detection scales and detector backends on recorded footage: recall
+against a full-resolution reference pass, throughput and detector CPU per
+frame.
+
+Usage:
+  ./benchmark_detection.py lobby.mp4
+  ./benchmark_detection.py gate.mkv --frames 300 --every 5 --scales 0.25,0.5,1.0
+  ./benchmark_detection.py gate.mkv --backends hog,dnn,haar,haar+hog --reference cnn
+
+Every sampled frame is first searched at full resolution with the reference
+detector (recorded footage has no labels). Each fixed scale, the adaptive
+cascade and each backend (on the adaptive cascade) then run over the same
+frames in order, so the cascade learns the footage's face sizes as it would
+live. A face counts as found when a box's centre falls inside the reference
+box.
+"""
+import argparse
+import time
+
+import cv2
+
+from adaptive_detection import AdaptiveScale, box_center, contains, to_rgb
+from face_backends import FACE_DETECTOR, create_detector
+from realtime_face_watchlist import ANALYSIS_SCALE, FRAME_WIDTH
+
+parser = argparse.ArgumentParser()
+parser.add_argument("video", help="recorded footage (any file OpenCV can read)")
+parser.add_argument("--frames", type=int, default=200, help="frames to sample")
+parser.add_argument("--every", type=int, default=2, help="sample every Nth frame, like PROCESS_EVERY_N_FRAMES")
+parser.add_argument("--width", type=int, default=FRAME_WIDTH, help="resize frames to this width first (0 keeps)")
+parser.add_argument("--scales", default="0.25,0.5,1.0", help="fixed scales to compare")
+parser.add_argument("--backends", default="", help="detectors to compare on the adaptive cascade, e.g. hog,dnn,haar+hog")
+parser.add_argument("--reference", default=FACE_DETECTOR, help="detector producing the reference faces")
+args = parser.parse_args()
+
+
+def load_frames():
+    cap = cv2.VideoCapture(args.video)
+    frames, index = [], 0
+    while len(frames) < args.frames:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        index += 1
+        if index % args.every:
+            continue
+        if args.width and frame.shape[1] != args.width:
+            frame = cv2.resize(frame, (args.width, int(frame.shape[0] * args.width / frame.shape[1])))
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def run(scale, detect, frames):
+    found, cpu = [], 0.0
+    started = time.perf_counter()
+    for frame in frames:
+        cpu_started = time.process_time()
+        passes = scale.detect(frame, detect)
+        cpu += time.process_time() - cpu_started
+        found.append([box for p in passes for box in p.boxes])
+    return found, cpu, time.perf_counter() - started
+
+
+frames = load_frames()
+if not frames:
+    raise SystemExit(f"Could not read frames from {args.video}")
+print(f"{len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]} from {args.video}")
+
+started = time.process_time()
+reference_detector = create_detector(args.reference)
+reference = [reference_detector(to_rgb(frame, 1.0)) for frame in frames]
+faces = sum(len(boxes) for boxes in reference)
+print(f"reference ({args.reference} at 1.0): {faces} faces, "
+      f"{(time.process_time() - started) * 1000 / len(frames):.1f} ms CPU/frame\n")
+
+default_detector = create_detector(FACE_DETECTOR)
+modes = [(f"fixed {s}", AdaptiveScale.fixed(float(s)), default_detector) for s in args.scales.split(",")]
+modes.append((f"adaptive {FACE_DETECTOR}", AdaptiveScale(ANALYSIS_SCALE), default_detector))
+for name in filter(None, args.backends.split(",")):
+    modes.append((f"adaptive {name}", AdaptiveScale(ANALYSIS_SCALE), create_detector(name)))
+print(f"{'mode':<24}{'recall':>8}{'extra':>8}{'fps':>8}{'ms CPU/frame':>14}{'kpx/frame':>11}")
+for label, scale, detect in modes:
+    found, cpu, elapsed = run(scale, detect, frames)
+    hits = sum(any(contains(ref, box_center(box)) for box in boxes)
+               for refs, boxes in zip(reference, found) for ref in refs)
+    extra = sum(len(boxes) for boxes in found) - hits
+    recall = hits / faces if faces else 1.0
+    print(f"{label:<24}{recall:>8.1%}{extra:>8}{len(frames) / elapsed:>8.1f}{cpu * 1000 / len(frames):>14.1f}"
+          f"{scale.stats()['kpixels_per_frame']:>11.1f}")
+    if label.startswith("adaptive"):
+        print(f"  final scale {scale.scale}, {scale.stats()}")
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Per-frame memory allocated by the frame pipeline, before and after buffer reuse.
+
+Usage:
+  ./benchmark_pipeline.py                  # synthetic 1280x720 MJPEG clip
+  ./benchmark_pipeline.py lobby.mp4 --frames 300 --scale 0.5
+
+Both paths decode, resize to the detection scale, convert to RGB and draw
+two face boxes for display; detection itself is left out. "legacy" is what
+the watcher did before (fresh decode, fx/fy resize, slice-and-copy to RGB,
+drawing on the frame); "pooled" decodes into a FramePool and uses a
+FrameWorkspace. Allocation is the tracemalloc peak above the steady state
+during each frame, i.e. the NumPy/OpenCV arrays a frame needed.
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from frame_pipeline import Annotation, FramePool, FrameWorkspace, draw_face
+
+parser = argparse.ArgumentParser()
+parser.add_argument("video", nargs="?", help="footage to decode (default: a generated clip)")
+parser.add_argument("--frames", type=int, default=200)
+parser.add_argument("--scale", type=float, default=0.25, help="detection scale")
+args = parser.parse_args()
+
+ANNOTATIONS = [Annotation((100, 300, 300, 100), "alice"), Annotation((120, 700, 320, 500), "Unknown")]
+
+
+def synthetic_clip(path, frames, size=(1280, 720)):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 25, size)
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 255, (size[1], size[0], 3), dtype=np.uint8)
+    for i in range(frames):
+        writer.write(np.roll(base, i * 4, axis=1))
+    writer.release()
+
+
+def legacy(cap, _pool, _workspace):
+    ok, frame = cap.read()
+    if not ok:
+        return False
+    small = cv2.resize(frame, (0, 0), fx=args.scale, fy=args.scale)
+    rgb = np.ascontiguousarray(small[:, :, ::-1])
+    for annotation in ANNOTATIONS:
+        draw_face(frame, annotation.box, annotation.name)
+    return rgb is not None
+
+
+def pooled(cap, pool, workspace):
+    out = pool.acquire()
+    ok, frame = cap.read() if out is None else cap.read(out)
+    if not ok:
+        return False
+    frame.flags.writeable = False
+    workspace.resize_rgb(frame, args.scale)
+    workspace.compose(frame, ANNOTATIONS)
+    pool.release(frame)
+    return True
+
+
+def measure(step, source):
+    cap = cv2.VideoCapture(source)
+    pool, workspace = FramePool(), FrameWorkspace()
+    step(cap, pool, workspace)  # warm up: first buffers are allocated here
+    tracemalloc.start()
+    peaks, frames = [], 0
+    started = time.perf_counter()
+    while frames < args.frames:
+        base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        if not step(cap, pool, workspace):
+            break
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+        frames += 1
+    elapsed = time.perf_counter() - started
+    tracemalloc.stop()
+    cap.release()
+    return frames, np.mean(peaks) if peaks else 0.0, elapsed * 1000 / max(frames, 1), pool.stats()
+
+
+with tempfile.TemporaryDirectory() as tmp:
+    source = args.video
+    if source is None:
+        source = os.path.join(tmp, "synthetic.avi")
+        synthetic_clip(source, args.frames + 2)
+    print(f"{'path':<8}{'frames':>8}{'KB allocated/frame':>20}{'ms/frame':>10}")
+    for label, step in (("legacy", legacy), ("pooled", pooled)):
+        frames, allocated, ms, pool_stats = measure(step, source)
+        print(f"{label:<8}{frames:>8}{allocated / 1024:>20.1f}{ms:>10.2f}")
+    print(f"pool: {pool_stats}")
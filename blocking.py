@@ -0,0 +1,95 @@
+"""
+Bounded thread pools for work that must not run on the event loop.
+
+``run_cpu`` is for short CPU-heavy calls that release the GIL (bcrypt) or
+would otherwise monopolise the loop (stats over the whole alert history);
+``run_io`` is for disk and synchronous database access. Keeping them separate
+means a burst of logins cannot starve file writes, and vice versa.
+"""
+
+import asyncio
+import functools
+import json
+import os
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CPU_POOL_SIZE = int(os.getenv("CPU_POOL_SIZE", str(min(4, os.cpu_count() or 1))))
+IO_POOL_SIZE = int(os.getenv("IO_POOL_SIZE", "8"))
+
+_cpu_executor = ThreadPoolExecutor(max_workers=CPU_POOL_SIZE, thread_name_prefix="cpu")
+_io_executor = ThreadPoolExecutor(max_workers=IO_POOL_SIZE, thread_name_prefix="io")
+
+
+async def run_cpu(fn: Callable, *args: Any, **kwargs: Any) -> Any:
+    return await asyncio.get_running_loop().run_in_executor(
+        _cpu_executor, functools.partial(fn, *args, **kwargs)
+    )
+
+
+async def run_io(fn: Callable, *args: Any, **kwargs: Any) -> Any:
+    return await asyncio.get_running_loop().run_in_executor(
+        _io_executor, functools.partial(fn, *args, **kwargs)
+    )
+
+
+def write_json_atomic(path: str, data: Any) -> None:
+    """Write JSON to a temp file and rename it over ``path``."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+class JsonFileWriter:
+    """Coalescing background writer for a JSON document.
+
+    ``schedule`` returns immediately. At most one write is in flight; requests
+    that arrive meanwhile collapse into a single follow-up write of the latest
+    data, so a burst of N alerts costs a couple of dumps instead of N.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Optional[Tuple[str, List[Any]]] = None
+        self._task: Optional[asyncio.Task] = None
+        self.writes = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def schedule(self, path: str, data: List[Any]) -> None:
+        if self._pending is not None:
+            self.coalesced += 1
+        self._pending = (path, data)
+        if (self._task is None or self._task.done()
+                or self._task.get_loop() is not asyncio.get_running_loop()):
+            self._task = asyncio.create_task(self._drain())
+
+    async def _drain(self) -> None:
+        while self._pending is not None:
+            path, data = self._pending
+            self._pending = None
+            # Shallow copy on the loop so the list can keep growing meanwhile
+            snapshot = list(data)
+            try:
+                await run_io(self.write_now, path, snapshot)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Failed to persist {path}: {e}")
+
+    def write_now(self, path: str, data: List[Any]) -> None:
+        """Synchronous write, serialised with background writes."""
+        with self._lock:
+            write_json_atomic(path, data)
+            self.writes += 1
+
+    async def flush(self) -> None:
+        if self._task is not None:
+            await self._task
+
+    def stats(self) -> dict:
+        return {"writes": self.writes, "coalesced": self.coalesced, "errors": self.errors}
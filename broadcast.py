@@ -0,0 +1,183 @@
+"""
+WebSocket broadcast hub.
+
+Every connected socket gets a bounded send queue drained by its own writer
+task. ``publish`` serialises a message once and only enqueues it, so the
+caller (e.g. alert ingest) never waits on a slow browser. A client whose
+queue overflows is dropped instead of holding up everyone else.
+
+Messages published with a sequence number are also kept in a bounded replay
+ring, so a client reconnecting with ``last_seq`` receives only what it
+missed, or a ``resync`` message when the gap no longer fits in the ring.
+With a shared bus, alerts stored by other workers can arrive out of seq
+order, so the ring is kept sorted by seq rather than by arrival.
+"""
+
+import asyncio
+import bisect
+import json
+import os
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Optional, Tuple
+
+from fastapi import WebSocket
+
+logger = logging.getLogger(__name__)
+
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "64"))
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+WS_REPLAY_SIZE = int(os.getenv("WS_REPLAY_SIZE", "1000"))
+WS_OVERFLOW_CLOSE_CODE = 1013  # "Try again later"
+
+
+class _Client:
+    __slots__ = ("websocket", "queue", "task")
+
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.task: Optional[asyncio.Task] = None
+
+
+class BroadcastHub:
+    """Single registry of WebSocket clients with per-client backpressure."""
+
+    def __init__(self, queue_size: int = WS_SEND_QUEUE_SIZE, send_timeout: float = WS_SEND_TIMEOUT,
+                 replay_size: int = WS_REPLAY_SIZE):
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.replay_size = replay_size
+        self._clients: Dict[WebSocket, _Client] = {}
+        self._replay: Deque[Tuple[int, str]] = deque(maxlen=replay_size)
+        self.seq = 0
+        self.messages_published = 0
+        self.clients_dropped = 0
+        self.replays = 0
+        self.resyncs = 0
+
+    def next_seq(self) -> int:
+        """Reserve the next sequence number for a replayable message."""
+        self.seq += 1
+        return self.seq
+
+    def seed(self, messages: Iterable[Dict[str, Any]]) -> None:
+        """Prime the replay ring with already-sequenced messages (e.g. after a restart)."""
+        for message in messages:
+            seq = message.get("seq")
+            if seq is None:
+                continue
+            self._remember(seq, json.dumps(message, default=str))
+            self.seq = max(self.seq, seq)
+
+    def _remember(self, seq: int, text: str) -> None:
+        """Keep a message in the replay ring, in seq order; the lowest seqs are evicted first."""
+        replay = self._replay
+        if not replay or seq > replay[-1][0]:
+            replay.append((seq, text))
+            return
+        index = bisect.bisect_left(replay, (seq,))  # (seq,) sorts before any (seq, text)
+        if index < len(replay) and replay[index][0] == seq:
+            return  # already kept
+        if len(replay) == replay.maxlen:
+            if index == 0:
+                return  # older than everything kept; it would be evicted at once
+            replay.popleft()
+            index -= 1
+        replay.insert(index, (seq, text))
+
+    async def connect(self, websocket: WebSocket, last_seq: Optional[int] = None) -> None:
+        await websocket.accept()
+        client = _Client(websocket, self.queue_size)
+        client.queue.put_nowait(json.dumps({"type": "hello", "seq": self.seq}))
+        if last_seq is not None:
+            self._catch_up(client, last_seq)
+        client.task = asyncio.create_task(self._writer(client))
+        self._clients[websocket] = client
+
+    def _catch_up(self, client: _Client, last_seq: int) -> None:
+        if last_seq == self.seq:
+            return
+        oldest = self._replay[0][0] if self._replay else None
+        missed = [text for seq, text in self._replay if seq > last_seq]
+        # Resync when the client is ahead of us (server state was lost), the
+        # gap predates the ring, or the backlog would not fit the send queue.
+        if (last_seq > self.seq or oldest is None or oldest > last_seq + 1
+                or len(missed) >= self.queue_size - 1):
+            self.resyncs += 1
+            client.queue.put_nowait(json.dumps({"type": "resync", "seq": self.seq}))
+            return
+        self.replays += 1
+        for text in missed:
+            client.queue.put_nowait(text)
+
+    def disconnect(self, websocket: WebSocket) -> None:
+        client = self._clients.pop(websocket, None)
+        if client is not None and client.task is not None:
+            client.task.cancel()
+
+    def publish(self, message: Dict[str, Any], seq: Optional[int] = None) -> int:
+        """Serialise ``message`` once and enqueue it for every client.
+
+        When ``seq`` is given the message carries it and is kept for replay.
+        Returns the number of clients it was queued for.
+        """
+        if seq is not None:
+            message = {**message, "seq": seq}
+        text = json.dumps(message, default=str)
+        if seq is not None:
+            self._remember(seq, text)
+            # Sequence numbers may be assigned elsewhere (shared alert store)
+            self.seq = max(self.seq, seq)
+        self.messages_published += 1
+        queued = 0
+        for client in list(self._clients.values()):
+            try:
+                client.queue.put_nowait(text)
+                queued += 1
+            except asyncio.QueueFull:
+                self._drop(client, "send queue full")
+        return queued
+
+    def _drop(self, client: _Client, reason: str) -> None:
+        if self._clients.pop(client.websocket, None) is None:
+            return
+        self.clients_dropped += 1
+        logger.warning(f"Dropping slow WebSocket client: {reason}")
+        if client.task is not None:
+            client.task.cancel()
+        asyncio.create_task(self._close(client.websocket))
+
+    async def _close(self, websocket: WebSocket) -> None:
+        try:
+            await websocket.close(code=WS_OVERFLOW_CLOSE_CODE)
+        except Exception:
+            pass
+
+    async def _writer(self, client: _Client) -> None:
+        try:
+            while True:
+                text = await client.queue.get()
+                await asyncio.wait_for(client.websocket.send_text(text), timeout=self.send_timeout)
+        except asyncio.CancelledError:
+            pass
+        except asyncio.TimeoutError:
+            self._drop(client, "send timed out")
+        except Exception:
+            # Socket went away; the receive loop will also notice.
+            self._clients.pop(client.websocket, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "clients": len(self._clients),
+            "queued": sum(c.queue.qsize() for c in self._clients.values()),
+            "messages_published": self.messages_published,
+            "clients_dropped": self.clients_dropped,
+            "seq": self.seq,
+            "replay_buffered": len(self._replay),
+            "replays": self.replays,
+            "resyncs": self.resyncs,
+        }
+
+
+hub = BroadcastHub()
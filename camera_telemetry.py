@@ -0,0 +1,172 @@
+"""
+Per-camera telemetry and the watcher heartbeat.
+
+Capture and recognition threads update a ``CameraStats`` per camera. The
+watcher daemon writes a heartbeat (daemon status plus every camera's stats)
+to ``WATCH_HEARTBEAT_FILE`` once per ``WATCH_HEARTBEAT_INTERVAL``; the server
+reads that file for ``/watch/status`` and ``/healthz``, so polling status
+never has to wake the watcher. A camera that delivers no frame for
+``CAMERA_STALL_SECONDS`` while connected is reported as stalled and
+restarted; one that lost its stream is reconnected by its capture thread.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+from blocking import write_json_atomic
+
+WATCH_HEARTBEAT_FILE = os.getenv("WATCH_HEARTBEAT_FILE", "watch_heartbeat.json")
+WATCH_HEARTBEAT_INTERVAL = float(os.getenv("WATCH_HEARTBEAT_INTERVAL", "1"))
+CAMERA_STALL_SECONDS = float(os.getenv("CAMERA_STALL_SECONDS", "10"))
+FPS_WINDOW_SECONDS = 5.0
+LATENCY_ALPHA = 0.2  # EWMA weight of the newest recognition latency
+
+
+class CameraStats:
+    """Thread-safe counters for one camera."""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._frame_times: Deque[float] = deque()
+        self.started_at = clock()
+        self.last_frame_at: Optional[float] = None
+        self.frames = 0
+        self.decode_failures = 0
+        self.dropped = 0
+        self.recognitions = 0
+        self.latency_avg = 0.0
+        self.latency_max = 0.0
+        self.capture_cpu = 0.0
+        self.recognition_cpu = 0.0
+        self.restarts = 0
+        self.reconnects = 0
+        self.connected = False
+        self.drained_frames = 0
+        self.frame_age_avg = 0.0
+        self.frame_age_max = 0.0
+
+    def frame(self, thread_cpu: Optional[float] = None) -> None:
+        """A frame was read; ``thread_cpu`` is the capture thread's CPU time so far."""
+        now = self._clock()
+        with self._lock:
+            self.frames += 1
+            self.last_frame_at = now
+            self._frame_times.append(now)
+            while self._frame_times and now - self._frame_times[0] > FPS_WINDOW_SECONDS:
+                self._frame_times.popleft()
+            if thread_cpu is not None:
+                self.capture_cpu = thread_cpu
+
+    def decode_failure(self) -> None:
+        with self._lock:
+            self.decode_failures += 1
+
+    def drop(self) -> None:
+        with self._lock:
+            self.dropped += 1
+
+    def recognized(self, seconds: float, cpu_seconds: float = 0.0, frame_age: Optional[float] = None) -> None:
+        """One frame was recognised; ``frame_age`` is capture-to-recognition time in seconds."""
+        with self._lock:
+            self.recognitions += 1
+            if self.recognitions == 1:
+                self.latency_avg = seconds
+                self.frame_age_avg = frame_age or 0.0
+            else:
+                self.latency_avg += LATENCY_ALPHA * (seconds - self.latency_avg)
+                if frame_age is not None:
+                    self.frame_age_avg += LATENCY_ALPHA * (frame_age - self.frame_age_avg)
+            self.latency_max = max(self.latency_max, seconds)
+            self.frame_age_max = max(self.frame_age_max, frame_age or 0.0)
+            self.recognition_cpu += cpu_seconds
+
+    def drained(self, frames: int) -> None:
+        """Buffered frames were skipped to read the live one."""
+        with self._lock:
+            self.drained_frames += frames
+
+    def connection(self, connected: bool) -> None:
+        with self._lock:
+            self.connected = connected
+
+    def reconnected(self) -> None:
+        with self._lock:
+            self.reconnects += 1
+
+    def restarted(self) -> None:
+        """The capture thread was replaced; give it a fresh stall window."""
+        with self._lock:
+            self.restarts += 1
+            self.started_at = self._clock()
+            self.last_frame_at = None
+            self._frame_times.clear()
+
+    def fps(self) -> float:
+        now = self._clock()
+        with self._lock:
+            recent = [t for t in self._frame_times if now - t <= FPS_WINDOW_SECONDS]
+        if len(recent) < 2:
+            return 0.0
+        return (len(recent) - 1) / max(recent[-1] - recent[0], 1e-6)
+
+    def idle_seconds(self) -> float:
+        """Seconds since the last frame (or since the camera started)."""
+        return self._clock() - (self.last_frame_at or self.started_at)
+
+    def is_stalled(self, threshold: float = CAMERA_STALL_SECONDS) -> bool:
+        return self.idle_seconds() > threshold
+
+    def snapshot(self, queue_depth: int = 0, stall_threshold: float = CAMERA_STALL_SECONDS) -> Dict[str, Any]:
+        fps = self.fps()
+        idle = self.idle_seconds()
+        with self._lock:
+            return {
+                "fps": round(fps, 2),
+                "frames": self.frames,
+                "decode_failures": self.decode_failures,
+                "dropped": self.dropped,
+                "queue_depth": queue_depth,
+                "recognitions": self.recognitions,
+                "latency_ms_avg": round(self.latency_avg * 1000, 1),
+                "latency_ms_max": round(self.latency_max * 1000, 1),
+                "capture_cpu_seconds": round(self.capture_cpu, 3),
+                "recognition_cpu_seconds": round(self.recognition_cpu, 3),
+                "idle_seconds": round(idle, 2),
+                "stalled": idle > stall_threshold,
+                "restarts": self.restarts,
+                "connected": self.connected,
+                "reconnects": self.reconnects,
+                "drained": self.drained_frames,
+                "frame_age_ms_avg": round(self.frame_age_avg * 1000, 1),
+                "frame_age_ms_max": round(self.frame_age_max * 1000, 1),
+            }
+
+
+def write_heartbeat(payload: Dict[str, Any], path: str = WATCH_HEARTBEAT_FILE) -> None:
+    write_json_atomic(path, {**payload, "heartbeat_at": time.time(), "interval": WATCH_HEARTBEAT_INTERVAL})
+
+
+def read_heartbeat(path: str = WATCH_HEARTBEAT_FILE) -> Optional[Dict[str, Any]]:
+    """Last heartbeat with its age in seconds and a ``fresh`` flag, or None."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            beat = json.load(f)
+    except (OSError, ValueError):
+        return None
+    age = max(0.0, time.time() - float(beat.get("heartbeat_at", 0)))
+    beat["heartbeat_age"] = round(age, 2)
+    # Three missed beats before the watcher counts as unresponsive
+    beat["fresh"] = age <= 3 * float(beat.get("interval", WATCH_HEARTBEAT_INTERVAL))
+    return beat
+
+
+def clear_heartbeat(path: str = WATCH_HEARTBEAT_FILE) -> None:
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
@@ -0,0 +1,414 @@
+"""
+Camera capture with automatic reconnects and stale-frame draining.
+
+``CameraCapture.frames`` yields frames from one source for as long as the
+camera is wanted. When the stream drops or a read fails it releases the
+capture and reopens it after an exponential backoff with jitter, so network
+blips heal on their own and a camera that is down does not spin.
+
+Network streams are read with ``grab()``: frames the decoder has already
+buffered come back almost instantly, so they are skipped until a grab has
+to wait for the network, and only that freshest frame is decoded to BGR.
+Each frame carries the wall-clock time it was captured at, estimated from
+the stream's timestamps, so recognisers can tell how far behind live they
+are. With a ``FramePool`` frames are decoded into recycled buffers; with a
+``MetricsScope`` the time each read takes is recorded as the "capture" stage.
+
+Cameras with a cheap substream are analysed on it. ``EvidenceGrabber``
+keeps each one's full-resolution main stream open as an ``EvidenceStream``.
+An incident's snapshot is the main-stream frame captured nearest the
+analysed frame, and ``scale_box`` maps face boxes between the two
+resolutions.
+"""
+
+import os
+import random
+import threading
+import time
+import logging
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from camera_telemetry import CameraStats
+from frame_pipeline import FramePool
+from metrics import MetricsScope
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_BACKOFF_BASE = float(os.getenv("CAPTURE_BACKOFF_BASE", "0.5"))  # first reconnect delay, seconds
+CAPTURE_BACKOFF_MAX = float(os.getenv("CAPTURE_BACKOFF_MAX", "30"))
+CAPTURE_TIMEOUT_MS = int(os.getenv("CAPTURE_TIMEOUT_MS", "5000"))  # open/read timeout for network streams
+CAPTURE_MAX_DRAIN = int(os.getenv("CAPTURE_MAX_DRAIN", "30"))  # buffered frames skipped per read at most
+EVIDENCE_BUFFER_FPS = float(os.getenv("EVIDENCE_BUFFER_FPS", "5"))  # main-stream frames decoded and kept per second
+EVIDENCE_BUFFER_SECONDS = float(os.getenv("EVIDENCE_BUFFER_SECONDS", "2"))
+EVIDENCE_MAX_OFFSET_MS = float(os.getenv("EVIDENCE_MAX_OFFSET_MS", "250"))  # farther frames do not count as matching
+EVIDENCE_DEADLINE = float(os.getenv("EVIDENCE_DEADLINE", "1.5"))  # seconds an incident waits for its frame
+DEFAULT_STREAM_FPS = 25.0
+NETWORK_SCHEMES = ("rtsp://", "rtmp://", "http://", "https://")
+
+
+def is_network_source(source: Any) -> bool:
+    return isinstance(source, str) and source.lower().startswith(NETWORK_SCHEMES)
+
+
+def open_capture(source: Any, width: Optional[int] = None) -> cv2.VideoCapture:
+    """Open ``source``; network streams get bounded open/read timeouts so a dead host cannot hang the thread."""
+    if is_network_source(source):
+        cap = cv2.VideoCapture(source, cv2.CAP_ANY, [
+            cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, CAPTURE_TIMEOUT_MS,
+            cv2.CAP_PROP_READ_TIMEOUT_MSEC, CAPTURE_TIMEOUT_MS,
+        ])
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 2)  # Minimize latency
+    else:
+        cap = cv2.VideoCapture(source)
+    if width and cap.isOpened():
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    return cap
+
+
+def reconnect_delay(attempt: int, base: float = CAPTURE_BACKOFF_BASE, cap: float = CAPTURE_BACKOFF_MAX,
+                    rng: Callable[[], float] = random.random) -> float:
+    """Exponential backoff with equal jitter: half the step is fixed, half random."""
+    step = min(cap, base * (2 ** min(attempt, 30)))
+    return step / 2 + rng() * step / 2
+
+
+class CameraCapture:
+    """Reconnecting, drain-to-latest reader for one camera source."""
+
+    def __init__(self, source: Any, stats: Optional[CameraStats] = None, name: str = "camera",
+                 opener: Callable[[Any], Any] = open_capture, drain: Optional[bool] = None,
+                 max_drain: int = CAPTURE_MAX_DRAIN, backoff_base: float = CAPTURE_BACKOFF_BASE,
+                 backoff_max: float = CAPTURE_BACKOFF_MAX, clock: Callable[[], float] = time.monotonic,
+                 wall: Callable[[], float] = time.time, rng: Callable[[], float] = random.random,
+                 pool: Optional[FramePool] = None, metrics: Optional[MetricsScope] = None):
+        self.source = source
+        self.stats = stats or CameraStats()
+        self.name = name
+        self.opener = opener
+        # Local devices and files deliver frames on demand; only streams buffer ahead of us
+        self.drain = is_network_source(source) if drain is None else drain
+        self.max_drain = max_drain
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._clock = clock
+        self._wall = wall
+        self._rng = rng
+        self.pool = pool
+        self.read_latency = metrics.histogram("capture") if metrics is not None else None
+        self._origin: Optional[float] = None  # wall time of stream position 0
+
+    def frames(self, stop: threading.Event) -> Iterator[Tuple[np.ndarray, float]]:
+        """Yield ``(frame, captured_at)`` until ``stop`` is set, reconnecting as needed."""
+        attempt = 0
+        connected_before = False
+        while not stop.is_set():
+            cap = self.opener(self.source)
+            if cap is not None and cap.isOpened():
+                if connected_before:
+                    self.stats.reconnected()
+                connected_before = True
+                self.stats.connection(True)
+                self._origin = None
+                interval = self._frame_interval(cap)
+                try:
+                    while not stop.is_set():
+                        out = self.pool.acquire() if self.pool is not None else None
+                        started = time.perf_counter()
+                        frame = self._read_latest(cap, interval, out)
+                        if frame is None:
+                            if self.pool is not None:
+                                self.pool.release(out)
+                            self.stats.decode_failure()
+                            break
+                        if self.read_latency is not None:
+                            self.read_latency.observe(time.perf_counter() - started)
+                        attempt = 0
+                        yield frame, self._captured_at(cap)
+                finally:
+                    cap.release()
+                    self.stats.connection(False)
+                if stop.is_set():
+                    return
+                logger.warning(f"Lost {self.name} (source: {self.source}); reconnecting")
+            elif cap is not None:
+                cap.release()
+            delay = reconnect_delay(attempt, self.backoff_base, self.backoff_max, self._rng)
+            attempt += 1
+            logger.warning(f"Could not read {self.name}; retrying in {delay:.1f}s (attempt {attempt})")
+            stop.wait(delay)
+
+    @staticmethod
+    def _frame_interval(cap: Any) -> float:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        return 1.0 / (fps if 1.0 <= fps <= 240.0 else DEFAULT_STREAM_FPS)
+
+    def _read_latest(self, cap: Any, interval: float, out: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """The freshest frame, decoded into ``out`` when given one of the right size."""
+        if not self.drain:
+            ok, frame = cap.read() if out is None else cap.read(out)
+            return frame if ok else None
+        # A grab that returns well inside one frame interval came from the
+        # decoder's backlog; keep grabbing until one has to wait for the wire.
+        grabs = 0
+        while True:
+            started = self._clock()
+            if not cap.grab():
+                return None
+            grabs += 1
+            if grabs > self.max_drain or self._clock() - started >= interval / 2:
+                break
+        if grabs > 1:
+            self.stats.drained(grabs - 1)
+        ok, frame = cap.retrieve() if out is None else cap.retrieve(out)
+        return frame if ok else None
+
+    def _captured_at(self, cap: Any) -> float:
+        """Wall-clock capture time from the stream position, anchored at the most live frame seen."""
+        now = self._wall()
+        position = cap.get(cv2.CAP_PROP_POS_MSEC) or 0.0
+        if position <= 0:
+            return now
+        origin = now - position / 1000.0
+        if self._origin is None or origin < self._origin:
+            # Re-anchor whenever the stream is closer to live than before
+            self._origin = origin
+        return self._origin + position / 1000.0
+
+
+def scale_box(box: Tuple[int, int, int, int], from_shape: Sequence[int],
+              to_shape: Sequence[int]) -> Tuple[int, int, int, int]:
+    """Map a ``(top, right, bottom, left)`` box between frames of different resolution."""
+    sy, sx = to_shape[0] / from_shape[0], to_shape[1] / from_shape[1]
+    top, right, bottom, left = box
+    return (int(round(top * sy)), int(round(right * sx)), int(round(bottom * sy)), int(round(left * sx)))
+
+
+class _EvidenceRequest:
+    __slots__ = ("captured_at", "done", "timer")
+
+    def __init__(self, captured_at: float, done: Callable[[Optional[np.ndarray], Optional[float]], None]):
+        self.captured_at = captured_at
+        self.done = done
+        self.timer: Optional[threading.Timer] = None
+
+
+class EvidenceStream(CameraCapture):
+    """One camera's main stream, kept open with its last few seconds at hand.
+
+    Every packet is grabbed so the decoder stays at live, but only about
+    ``fps`` frames a second are converted to BGR. Those go into a ring of
+    pooled buffers covering ``seconds``. A frame that a waiting request
+    needs is also converted. ``request`` answers with a copy of the kept
+    frame nearest a capture time. It waits for the stream to reach that
+    time, but at most ``deadline`` seconds. It answers None when nothing
+    kept lies within ``max_offset`` of it.
+    """
+
+    def __init__(self, source: Any, name: str = "evidence", opener: Callable[[Any], Any] = open_capture,
+                 fps: float = EVIDENCE_BUFFER_FPS, seconds: float = EVIDENCE_BUFFER_SECONDS,
+                 max_offset: float = EVIDENCE_MAX_OFFSET_MS / 1000.0, deadline: float = EVIDENCE_DEADLINE,
+                 **kwargs: Any):
+        super().__init__(source, name=name, opener=opener, **kwargs)
+        self.min_interval = 1.0 / fps if fps > 0 else 0.0
+        self.max_frames = max(2, int(seconds * fps) + 1)
+        self.max_offset = max_offset
+        self.deadline = deadline
+        self.pool = FramePool(self.max_frames + 1)
+        self._frames: Deque[Tuple[float, np.ndarray]] = deque()
+        self._waiting: List[_EvidenceRequest] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.matched = 0
+        self.unmatched = 0
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=f"evidence-{self.name}", daemon=True)
+            self._thread.start()
+
+    def stop(self, wait: bool = True) -> None:
+        """Stop reading; waiting requests are answered from what is kept.
+
+        With ``wait=False`` the reader thread is left to notice the stop on
+        its own, so callers holding locks are not held up by a stalled read.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            if wait:
+                self._thread.join(timeout=CAPTURE_TIMEOUT_MS / 1000.0 + 1)
+            self._thread = None
+        with self._lock:
+            waiting, self._waiting = self._waiting, []
+        for request in waiting:
+            self._answer(request)
+        with self._lock:
+            while self._frames:
+                self.pool.release(self._frames.popleft()[1])
+
+    def request(self, captured_at: float,
+                done: Callable[[Optional[np.ndarray], Optional[float]], None]) -> None:
+        """Call ``done(frame, offset_ms)`` with the kept frame nearest ``captured_at``, or ``(None, None)``."""
+        request = _EvidenceRequest(captured_at, done)
+        with self._lock:
+            reached = bool(self._frames) and self._frames[-1][0] >= captured_at
+            if not reached:
+                self._waiting.append(request)
+        if reached:
+            self._answer(request)
+            return
+        request.timer = threading.Timer(self.deadline, self._expire, (request,))
+        request.timer.daemon = True
+        request.timer.start()
+
+    def _run(self) -> None:
+        attempt = 0
+        while not self._stop.is_set():
+            cap = self.opener(self.source)
+            if cap is not None and cap.isOpened():
+                self.stats.connection(True)
+                self._origin = None
+                try:
+                    while not self._stop.is_set() and cap.grab():
+                        attempt = 0
+                        self._keep(cap, self._captured_at(cap))
+                finally:
+                    cap.release()
+                    self.stats.connection(False)
+                if self._stop.is_set():
+                    return
+                logger.warning(f"Lost {self.name} (source: {self.source}); reconnecting")
+            elif cap is not None:
+                cap.release()
+            delay = reconnect_delay(attempt, self.backoff_base, self.backoff_max, self._rng)
+            attempt += 1
+            self._stop.wait(delay)
+
+    def _keep(self, cap: Any, captured_at: float) -> None:
+        """Convert and keep the grabbed frame when it is due or a request waits for it."""
+        with self._lock:
+            last = self._frames[-1][0] if self._frames else None
+            wanted = any(last is None or last < r.captured_at <= captured_at for r in self._waiting)
+        if not wanted and last is not None and captured_at - last < self.min_interval:
+            return
+        out = self.pool.acquire()
+        ok, frame = cap.retrieve() if out is None else cap.retrieve(out)
+        if not ok:
+            self.pool.release(out)
+            return
+        with self._lock:
+            self._frames.append((captured_at, frame))
+            while len(self._frames) > self.max_frames:
+                self.pool.release(self._frames.popleft()[1])
+            ready = [r for r in self._waiting if r.captured_at <= captured_at]
+            self._waiting = [r for r in self._waiting if r.captured_at > captured_at]
+        for request in ready:
+            self._answer(request)
+
+    def _expire(self, request: _EvidenceRequest) -> None:
+        with self._lock:
+            if request not in self._waiting:
+                return  # already answered
+            self._waiting.remove(request)
+        self._answer(request)
+
+    def _answer(self, request: _EvidenceRequest) -> None:
+        if request.timer is not None:
+            request.timer.cancel()
+        frame, offset_ms = None, None
+        with self._lock:
+            if self._frames:
+                ts, nearest = min(self._frames, key=lambda kept: abs(kept[0] - request.captured_at))
+                if abs(ts - request.captured_at) <= self.max_offset:
+                    # A copy: the kept buffer goes back to the pool when the ring moves on
+                    frame, offset_ms = nearest.copy(), round((ts - request.captured_at) * 1000.0, 1)
+            if frame is None:
+                self.unmatched += 1
+            else:
+                self.matched += 1
+        try:
+            request.done(frame, offset_ms)
+        except Exception as e:
+            logger.error(f"Evidence callback failed: {e}")
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            kept = len(self._frames)
+            span = self._frames[-1][0] - self._frames[0][0] if kept > 1 else 0.0
+            waiting = len(self._waiting)
+        return {"connected": self.stats.connected, "frames": kept, "seconds": round(span, 2),
+                "waiting": waiting, "matched": self.matched, "unmatched": self.unmatched}
+
+
+class EvidenceGrabber:
+    """Main-stream snapshots for every camera analysed on a substream.
+
+    Each camera has its own ``EvidenceStream`` and thread. A camera whose
+    main stream is unreachable only delays its own incidents, and only
+    until their deadline. After that they fall back to the analysis frame.
+    """
+
+    def __init__(self, opener: Callable[[Any], Any] = open_capture, **stream_options: Any):
+        self.opener = opener
+        self.stream_options = stream_options
+        self._streams: Dict[Any, EvidenceStream] = {}
+        self._lock = threading.Lock()
+        self.running = False
+
+    def watch(self, camera_id: Any, source: Any) -> None:
+        """Keep ``source`` open as the evidence stream of ``camera_id``."""
+        with self._lock:
+            current = self._streams.get(camera_id)
+            if current is not None and current.source == source:
+                return
+            stream = self._streams[camera_id] = EvidenceStream(
+                source, name=f"camera {camera_id} main stream", opener=self.opener, **self.stream_options)
+            if self.running:
+                stream.start()
+        if current is not None:
+            current.stop(wait=False)
+
+    def forget(self, camera_id: Any) -> None:
+        with self._lock:
+            stream = self._streams.pop(camera_id, None)
+        if stream is not None:
+            stream.stop(wait=False)
+
+    def start(self) -> None:
+        with self._lock:
+            self.running = True
+            for stream in self._streams.values():
+                stream.start()
+
+    def stop(self) -> None:
+        """Stop every stream, answering the incidents still waiting for a frame."""
+        with self._lock:
+            self.running = False
+            streams = list(self._streams.values())
+        for stream in streams:
+            stream.stop()
+
+    def request(self, camera_id: Any, captured_at: float,
+                done: Callable[[Optional[np.ndarray], Optional[float]], None]) -> None:
+        """``done(frame, offset_ms)`` with the main-stream frame nearest ``captured_at``, or ``(None, None)``."""
+        with self._lock:
+            stream = self._streams.get(camera_id)
+        if stream is None:
+            done(None, None)
+            return
+        stream.request(captured_at, done)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            streams = dict(self._streams)
+        per_camera = {camera_id: stream.summary() for camera_id, stream in streams.items()}
+        return {
+            "matched": sum(s["matched"] for s in per_camera.values()),
+            "unmatched": sum(s["unmatched"] for s in per_camera.values()),
+            "streams": per_camera,
+        }
@@ -0,0 +1,62 @@
+"""
+Keep test runs away from the working copy's data.
+
+alerts_server creates and seeds its database and faces_db when it is
+imported, so both point into a scratch directory before any test module
+loads; it is removed when the session ends. Tests that log in or change
+users use ``app_db`` for a database of their own.
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+_scratch = tempfile.mkdtemp(prefix="face-watchlist-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{os.path.join(_scratch, 'alerts.db')}")
+os.environ.setdefault("FACES_DB", os.path.join(_scratch, "faces_db"))
+
+ADMIN_PASSWORD = "changeme123"
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_scratch, ignore_errors=True)
+
+
+@pytest.fixture
+def app_db(tmp_path, monkeypatch):
+    """A fresh application database, seeded with the default admin, for one test."""
+    import alerts_server
+    from api import auth, database
+
+    path = tmp_path / "alerts.db"
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    sync_engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    event.listen(engine.sync_engine, "connect", database._set_sqlite_pragmas)
+    event.listen(sync_engine, "connect", database._set_sqlite_pragmas)
+    session_local = sessionmaker(autocommit=False, autoflush=False, bind=sync_engine)
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setattr(database, "sync_engine", sync_engine)
+    monkeypatch.setattr(database, "SessionLocal", session_local)
+    monkeypatch.setattr(database, "AsyncSessionLocal",
+                        async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False))
+    monkeypatch.setattr(alerts_server, "SessionLocal", session_local)
+
+    database.init_db()
+    with session_local() as db:
+        db.add(auth.User(username="admin", hashed_password=auth.get_password_hash(ADMIN_PASSWORD)))
+        db.commit()
+    # Users cached from another database must not answer for this one
+    auth._token_cache.clear()
+    auth._user_cache.clear()
+    yield session_local
+    auth._token_cache.clear()
+    auth._user_cache.clear()
+    asyncio.run(engine.dispose())
+    sync_engine.dispose()
+
@@ -1,27 +1,31 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 import models, schemas
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from passlib.context import CryptContext
+from blocking import run_cpu
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 # User operations
-def get_user(db: Session, user_id: int):
-    return db.query(models.User).filter(models.User.id == user_id).first()
+async def get_user(db: AsyncSession, user_id: int):
+    return await db.get(models.User, user_id)
 
-def get_user_by_email(db: Session, email: str):
-    return db.query(models.User).filter(models.User.email == email).first()
+async def get_user_by_email(db: AsyncSession, email: str):
+    result = await db.execute(select(models.User).where(models.User.email == email))
+    return result.scalars().first()
 
-def get_user_by_username(db: Session, username: str):
-    return db.query(models.User).filter(models.User.username == username).first()
+async def get_user_by_username(db: AsyncSession, username: str):
+    result = await db.execute(select(models.User).where(models.User.username == username))
+    return result.scalars().first()
 
-def get_users(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.User).offset(skip).limit(limit).all()
+async def get_users(db: AsyncSession, skip: int = 0, limit: int = 100):
+    result = await db.execute(select(models.User).offset(skip).limit(limit))
+    return result.scalars().all()
 
-def create_user(db: Session, user: schemas.UserCreate, is_admin: bool = False):
-    hashed_password = pwd_context.hash(user.password)
+async def create_user(db: AsyncSession, user: schemas.UserCreate, is_admin: bool = False):
+    hashed_password = await run_cpu(pwd_context.hash, user.password)
     db_user = models.User(
         username=user.username,
         email=user.email,
@@ -30,16 +34,39 @@ def create_user(db: Session, user: schemas.UserCreate, is_admin: bool = False):
         is_admin=is_admin
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
+async def update_user(db: AsyncSession, user_id: int, user: schemas.UserUpdate):
+    db_user = await get_user(db, user_id)
+    if db_user:
+        user_data = user.dict(exclude_unset=True)
+        password = user_data.pop("password", None)
+        if password:
+            db_user.hashed_password = await run_cpu(pwd_context.hash, password)
+        for key, value in user_data.items():
+            if value is not None:
+                setattr(db_user, key, value)
+        await db.commit()
+        await db.refresh(db_user)
+    return db_user
+
+async def delete_user(db: AsyncSession, user_id: int):
+    db_user = await get_user(db, user_id)
+    if db_user:
+        await db.delete(db_user)
+        await db.commit()
+        return True
+    return False
+
 # Camera operations
-def get_camera(db: Session, camera_id: int):
-    return db.query(models.Camera).filter(models.Camera.id == camera_id).first()
+async def get_camera(db: AsyncSession, camera_id: int):
+    return await db.get(models.Camera, camera_id)
 
-def get_cameras(db: Session, skip: int = 0, limit: int = 100):
-    cameras = db.query(models.Camera).offset(skip).limit(limit).all()
+async def get_cameras(db: AsyncSession, skip: int = 0, limit: int = 100):
+    result = await db.execute(select(models.Camera).offset(skip).limit(limit))
+    cameras = result.scalars().all()
     # Transform database fields back to frontend format
     result = []
     for cam in cameras:
@@ -58,7 +85,7 @@ def get_cameras(db: Session, skip: int = 0, limit: int = 100):
         result.append(camera_dict)
     return result
 
-def create_camera(db: Session, camera: schemas.CameraCreate):
+async def create_camera(db: AsyncSession, camera: schemas.CameraCreate):
     # Transform frontend fields (url/location) to database fields (source/type)
     camera_data = camera.dict()
     
@@ -88,12 +115,12 @@ def create_camera(db: Session, camera: schemas.CameraCreate):
         config=camera_data.get('config')
     )
     db.add(db_camera)
-    db.commit()
-    db.refresh(db_camera)
+    await db.commit()
+    await db.refresh(db_camera)
     return db_camera
 
-def update_camera(db: Session, camera_id: int, camera: schemas.CameraCreate):
-    db_camera = get_camera(db, camera_id)
+async def update_camera(db: AsyncSession, camera_id: int, camera: schemas.CameraCreate):
+    db_camera = await get_camera(db, camera_id)
     if db_camera:
         camera_data = camera.dict()
         
@@ -116,73 +143,94 @@ def update_camera(db: Session, camera_id: int, camera: schemas.CameraCreate):
         if 'enabled' in camera_data:
             db_camera.enabled = camera_data['enabled']
         
-        # Store location in config
+        # Merge config keys (e.g. analysis_source) and location into the stored config;
+        # reassign so the JSON column is flagged as changed
+        config = dict(db_camera.config or {})
+        if camera_data.get('config'):
+            config.update(camera_data['config'])
         if camera_data.get('location'):
-            if db_camera.config is None:
-                db_camera.config = {}
-            db_camera.config['location'] = camera_data['location']
+            config['location'] = camera_data['location']
+        if config != (db_camera.config or {}):
+            db_camera.config = config
         
-        db.commit()
-        db.refresh(db_camera)
+        await db.commit()
+        await db.refresh(db_camera)
     return db_camera
 
-def delete_camera(db: Session, camera_id: int):
-    db_camera = get_camera(db, camera_id)
+async def update_camera_config(db: AsyncSession, camera_id: int, updates: Dict[str, Any]):
+    """Merge ``updates`` into the camera's config; None values remove keys."""
+    db_camera = await get_camera(db, camera_id)
     if db_camera:
-        db.delete(db_camera)
-        db.commit()
+        config = {**(db_camera.config or {}), **updates}
+        # Reassign so the JSON column is flagged as changed
+        db_camera.config = {k: v for k, v in config.items() if v is not None}
+        await db.commit()
+        await db.refresh(db_camera)
+    return db_camera
+
+async def delete_camera(db: AsyncSession, camera_id: int):
+    db_camera = await get_camera(db, camera_id)
+    if db_camera:
+        await db.delete(db_camera)
+        await db.commit()
         return True
     return False
 
 # Alert rule operations
-def get_alert_rule(db: Session, rule_id: int):
-    return db.query(models.AlertRule).filter(models.AlertRule.id == rule_id).first()
+async def get_alert_rule(db: AsyncSession, rule_id: int):
+    return await db.get(models.AlertRule, rule_id)
 
-def get_alert_rules(
-    db: Session,
+async def get_alert_rules(
+    db: AsyncSession,
     user_id: Optional[int] = None,
     camera_id: Optional[int] = None,
     skip: int = 0,
     limit: int = 100
 ):
-    query = db.query(models.AlertRule)
+    query = select(models.AlertRule)
     if user_id:
-        query = query.filter(models.AlertRule.user_id == user_id)
+        query = query.where(models.AlertRule.user_id == user_id)
     if camera_id:
-        query = query.filter(models.AlertRule.camera_id == camera_id)
-    return query.offset(skip).limit(limit).all()
+        query = query.where(models.AlertRule.camera_id == camera_id)
+    result = await db.execute(query.offset(skip).limit(limit))
+    return result.scalars().all()
 
-def create_alert_rule(db: Session, rule: schemas.AlertRuleCreate, user_id: int):
+async def create_alert_rule(db: AsyncSession, rule: schemas.AlertRuleCreate, user_id: int):
     db_rule = models.AlertRule(**rule.dict(), user_id=user_id)
     db.add(db_rule)
-    db.commit()
-    db.refresh(db_rule)
+    await db.commit()
+    await db.refresh(db_rule)
     return db_rule
 
-def update_alert_rule(db: Session, rule_id: int, rule: schemas.AlertRuleCreate):
-    db_rule = get_alert_rule(db, rule_id)
+async def update_alert_rule(db: AsyncSession, rule_id: int, rule: schemas.AlertRuleCreate):
+    db_rule = await get_alert_rule(db, rule_id)
     if db_rule:
         for key, value in rule.dict().items():
             setattr(db_rule, key, value)
-        db.commit()
-        db.refresh(db_rule)
+        await db.commit()
+        await db.refresh(db_rule)
     return db_rule
 
-def delete_alert_rule(db: Session, rule_id: int):
-    db_rule = get_alert_rule(db, rule_id)
+async def delete_alert_rule(db: AsyncSession, rule_id: int):
+    db_rule = await get_alert_rule(db, rule_id)
     if db_rule:
-        db.delete(db_rule)
-        db.commit()
+        await db.delete(db_rule)
+        await db.commit()
         return True
     return False
 
 # Helper functions
-def get_matching_rules(db: Session, camera_id: int, person_name: str) -> List[models.AlertRule]:
-    """Get alert rules that match a detection."""
-    return db.query(models.AlertRule).filter(
+async def get_matching_rules(db: AsyncSession, camera_id: int, person_name: str) -> List[models.AlertRule]:
+    """Get alert rules that match a detection.
+
+    Ingest uses the in-memory ``rule_index`` instead; this query is kept for
+    ad-hoc lookups and for rebuilding state outside the server.
+    """
+    result = await db.execute(select(models.AlertRule).where(
         and_(
             models.AlertRule.camera_id == camera_id,
             models.AlertRule.enabled == True,
             (models.AlertRule.person_name == person_name) | (models.AlertRule.person_name == "*")
         )
-    ).all()
\ No newline at end of file
+    ))
+    return result.scalars().all()
\ No newline at end of file
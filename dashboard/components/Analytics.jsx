@@ -60,7 +60,7 @@ export default function Analytics() {
 
   // Revalidate stats on new alerts from WebSocket
   useWebSocket('/ws/alerts', (msg) => {
-    if (msg && msg.type === 'new_alert') {
+    if (msg && (msg.type === 'new_alert' || msg.type === 'resync')) {
       mutate()
     }
   })
@@ -8,10 +8,20 @@ const ENV_WS_BASE =
     ? process.env.NEXT_PUBLIC_API_BASE.replace(/^http/i, 'ws')
     : 'ws://127.0.0.1:8000')
 
+// Last sequence number seen per path, kept across reconnects so the server
+// can replay only the alerts we missed (or tell us to resync).
+const lastSeqByPath = {}
+
 export function useWebSocket(path, onMessage) {
   const handleMessage = useCallback((event) => {
     try {
       const data = JSON.parse(event.data)
+      if (typeof data.seq === 'number' && data.type !== 'hello') {
+        lastSeqByPath[path] = data.seq
+      }
+      if (data.type === 'resync' || (data.type === 'hello' && lastSeqByPath[path] === undefined)) {
+        lastSeqByPath[path] = data.seq
+      }
       if (onMessage) {
         onMessage(data)
       }
@@ -23,25 +33,33 @@ export function useWebSocket(path, onMessage) {
     } catch (e) {
       console.error('WebSocket message error:', e)
     }
-  }, [onMessage])
+  }, [onMessage, path])
 
   useEffect(() => {
     // Connect to backend WebSocket using configured base
     const base = ENV_WS_BASE.replace(/\/$/, '')
     const wsPath = path.startsWith('/') ? path : `/${path}`
-    const ws = new WebSocket(`${base}${wsPath}`)
+    let ws = null
+    let timer = null
+    let closed = false
 
-    ws.onmessage = handleMessage
-    ws.onclose = () => {
-      // Try to reconnect in 5 seconds
-      setTimeout(() => {
-        const newWs = new WebSocket(`${base}${wsPath}`)
-        newWs.onmessage = handleMessage
-      }, 5000)
+    const connect = () => {
+      const seq = lastSeqByPath[path]
+      const query = seq === undefined ? '' : `?last_seq=${seq}`
+      ws = new WebSocket(`${base}${wsPath}${query}`)
+      ws.onmessage = handleMessage
+      ws.onclose = () => {
+        if (closed) return
+        // Reconnect with jitter so a server restart does not get every tab at once
+        timer = setTimeout(connect, 3000 + Math.random() * 4000)
+      }
     }
+    connect()
 
     return () => {
-      ws.close()
+      closed = true
+      clearTimeout(timer)
+      if (ws) ws.close()
     }
   }, [handleMessage, path])
-}
\ No newline at end of file
+}
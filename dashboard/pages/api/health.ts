@@ -6,13 +6,15 @@ export default async function handler(req: NextApiRequest, res: NextApiResponse)
   if (req.method !== 'GET') return res.status(405).json({ error: 'Method not allowed' })
   const start = Date.now()
   try {
-    const ping = await fetch(`${API_BASE}/alerts`, { method: 'GET' })
+    // /healthz is cheap and unauthenticated; it also summarises watcher health
+    const ping = await fetch(`${API_BASE}/healthz`, { method: 'GET' })
     const ms = Date.now() - start
     if (!ping.ok) {
       return res.status(502).json({ status: 'degraded', apiBase: API_BASE, latencyMs: ms, upstreamStatus: ping.status })
     }
-    return res.status(200).json({ status: 'ok', apiBase: API_BASE, latencyMs: ms })
+    const body = await ping.json()
+    return res.status(200).json({ status: body.status, apiBase: API_BASE, latencyMs: ms, watcher: body.watcher })
   } catch (e: any) {
     return res.status(502).json({ status: 'unreachable', apiBase: API_BASE, error: String(e?.message || e) })
   }
-}
\ No newline at end of file
+}
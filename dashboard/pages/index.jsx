@@ -92,10 +92,13 @@ function Home() {
   useWebSocket('/ws/alerts', (data) => {
     if (!shouldFetch) return // Skip notifications until authenticated
     console.log('WebSocket alert received:', data)
-    if (data.alert) {
+    if (data.type === 'new_alert' && data.alert) {
       try { showNotification(data.alert) } catch (e) { console.warn('Notification failed', e) }
     }
-    mutate()
+    // 'hello' only reports the current sequence; replayed alerts arrive as new_alert
+    if (data.type === 'new_alert' || data.type === 'resync') {
+      mutate()
+    }
   })
 
   // Filter and sort alerts
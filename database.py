@@ -1,22 +1,15 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.ext.declarative import declarative_base
-
-SQLALCHEMY_DATABASE_URL = "sqlite:///./face_watchlist.db"
-
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+"""Compatibility shim: the application uses a single data layer in ``api.database``.
+
+This module used to open a separate ``face_watchlist.db``; nothing read from
+it, so it now re-exports the shared engine and session factories.
+"""
+
+from api.database import (  # noqa: F401
+    AsyncSessionLocal,
+    Base,
+    SessionLocal,
+    engine,
+    get_db,
+    init_db,
+    sync_engine,
 )
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-# Dependency to get DB sessions
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-# Create all tables
-from models import Base
-Base.metadata.create_all(bind=engine)
\ No newline at end of file
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Edge worker: a watcher on a remote site's compute box, driven by a central
+alerts_server instead of argv.
+
+The worker registers with the server (``WORKER_TOKEN``), then heartbeats
+every ``lease_ttl / 3`` seconds with its watcher telemetry. Each heartbeat
+renews its camera lease and returns the cameras it should watch; the
+worker starts and stops cameras to match. Known-face encodings are pulled
+as a versioned snapshot whenever the server's version changes, so the site
+needs no copy of faces_db. Detections are queued, batched and pushed over
+HTTP, spooled to disk while the server is unreachable. Each alert's
+snapshot is read from the local incident store when its batch is sent and
+travels with it, so the server can serve it under ``/incidents``.
+
+If the server stops answering for a whole lease the worker releases its
+cameras, since the server will have handed them to another worker.
+
+Run several against one server to spread a site's cameras:
+
+    WORKER_TOKEN=... python edge_worker.py --server http://central:8000 --site warehouse --name box-1
+"""
+
+import argparse
+import base64
+import os
+import signal
+import socket
+import threading
+import time
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+import incident_store
+from alert_transport import ALERT_SERVER_URL, ALERT_SPOOL, AlertSender
+
+logger = logging.getLogger(__name__)
+
+WORKER_TOKEN = os.getenv("WORKER_TOKEN", "")
+WORKER_SITE = os.getenv("WORKER_SITE", "default")
+WORKER_ALERT_BATCH = int(os.getenv("WORKER_ALERT_BATCH", "50"))
+WORKER_PUSH_SNAPSHOTS = os.getenv("WORKER_PUSH_SNAPSHOTS", "1") != "0"
+
+
+class EdgeAlertSender(AlertSender):
+    """Pushes alerts to the server in batches on behalf of an ``EdgeWorker``."""
+
+    def __init__(self, worker: "EdgeWorker", spool_path: str = ALERT_SPOOL, batch_size: int = WORKER_ALERT_BATCH,
+                 incidents_root: str = incident_store.INCIDENTS_FOLDER, push_snapshots: bool = WORKER_PUSH_SNAPSHOTS):
+        super().__init__(url=worker.server_url, spool_path=spool_path, mode="http", batch_size=batch_size,
+                         metrics=getattr(worker.system, "metrics", None))
+        self.worker = worker
+        self.incidents_root = incidents_root
+        self.push_snapshots = push_snapshots
+
+    def _with_snapshot(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Attach the alert's snapshot (base64) when it is still stored on this box."""
+        filename = message.get("alert", {}).get("filename")
+        if not self.push_snapshots or not filename:
+            return message
+        try:
+            data = incident_store.read_incident(filename, self.incidents_root)
+        except OSError as e:
+            logger.warning(f"Could not read snapshot {filename}: {e}")
+            return message
+        if data is None:
+            return message
+        return {**message, "snapshot": base64.b64encode(data).decode("ascii")}
+
+    def _deliver_batch(self, messages: List[Dict[str, Any]]) -> int:
+        worker_id = self.worker.worker_id
+        if worker_id is None:
+            raise ConnectionError("not registered with the server")
+        items = [self._with_snapshot(message) for message in messages]
+        response = self.worker.client.post(f"/workers/{worker_id}/alerts", json={"alerts": items})
+        if response.status_code == 410:
+            self.worker.lease_lost()
+            raise ConnectionError("lease expired")
+        response.raise_for_status()
+        # Consume the prefix up to the first alert the server wants again; the
+        # ones after it are resent too and acknowledged as duplicates
+        for done, result in enumerate(response.json()["results"]):
+            if result["ok"]:
+                self.sent_http += 1
+            elif result.get("retry"):
+                if done == 0:
+                    raise ConnectionError(f"server asked to retry alert {result.get('id')}: {result.get('error')}")
+                return done
+            else:
+                self.rejected += 1
+                logger.error(f"Alert {result.get('id')} rejected by server: {result.get('error')}")
+        return len(messages)
+
+
+class EdgeWorker:
+    def __init__(self, system: Any, client: httpx.Client, name: str, site: str = WORKER_SITE,
+                 host: Optional[str] = None, spool_path: str = ALERT_SPOOL,
+                 batch_size: int = WORKER_ALERT_BATCH, clock=time.monotonic,
+                 incidents_root: str = incident_store.INCIDENTS_FOLDER):
+        self.system = system
+        self.client = client
+        self.server_url = str(client.base_url)
+        self.name = name
+        self.site = site
+        self.host = host or socket.gethostname()
+        self.clock = clock
+        self.worker_id: Optional[str] = None
+        self.lease_ttl = 15.0
+        self.heartbeat_interval = 5.0
+        self.last_contact: Optional[float] = None
+        self.cameras: Dict[int, Tuple[Any, ...]] = {}
+        self.watchlist_version: Optional[str] = None
+        self._cameras_lock = threading.Lock()  # the alert sender may release cameras too
+        self.alert_sender = EdgeAlertSender(self, spool_path, batch_size, incidents_root)
+        # The recogniser posts through our batching sender instead of its own
+        self.system.alert_sender = self.alert_sender
+
+    def register(self) -> None:
+        response = self.client.post("/workers/register", json={"name": self.name, "site": self.site, "host": self.host})
+        response.raise_for_status()
+        data = response.json()
+        self.worker_id = data["worker_id"]
+        self.lease_ttl = data["lease_ttl"]
+        self.heartbeat_interval = data["heartbeat_interval"]
+        logger.info(f"Registered as edge worker {self.worker_id} for site {self.site!r}")
+
+    def lease_lost(self) -> None:
+        logger.warning("Camera lease expired; releasing cameras and registering again")
+        self.worker_id = None
+        self._apply([])
+
+    def tick(self) -> None:
+        """One heartbeat: renew the lease, sync cameras and the watchlist."""
+        try:
+            if self.worker_id is None:
+                self.register()
+            response = self.client.post(f"/workers/{self.worker_id}/heartbeat", json={
+                "status": self.system.status(),
+                "watchlist_version": self.watchlist_version,
+            })
+            if response.status_code == 410:
+                self.lease_lost()
+                return
+            response.raise_for_status()
+            data = response.json()
+            self.last_contact = self.clock()
+            if data["watchlist_version"] != self.watchlist_version:
+                self._pull_watchlist()
+            self._apply(data["cameras"])
+        except httpx.HTTPError as e:
+            logger.warning(f"Heartbeat to {self.server_url} failed: {e}")
+            if self.cameras and (self.last_contact is None or self.clock() - self.last_contact > self.lease_ttl):
+                logger.warning("No contact with the server for a whole lease; releasing cameras")
+                self._apply([])
+
+    def _pull_watchlist(self) -> None:
+        headers = {"If-None-Match": f'"{self.watchlist_version}"'} if self.watchlist_version else {}
+        response = self.client.get("/workers/watchlist", headers=headers)
+        if response.status_code == 304:
+            return
+        response.raise_for_status()
+        self.watchlist_version = self.system.watchlist.load_exported(response.content)
+
+    def _apply(self, cameras: List[Dict[str, Any]]) -> None:
+        desired = {
+            int(c["id"]): (c["source"], c.get("name"), c.get("evidence_source"), c.get("regions"), c.get("backend"))
+            for c in cameras
+        }
+        with self._cameras_lock:
+            if desired != self.cameras:
+                logger.info(f"Watching cameras {sorted(desired)}")
+                self.system.set_cameras(desired)
+                self.cameras = desired
+
+    def run(self, stop: threading.Event) -> None:
+        while not stop.is_set():
+            self.tick()
+            stop.wait(self.heartbeat_interval)
+
+    def leave(self) -> None:
+        if self.worker_id is None:
+            return
+        try:
+            self.client.delete(f"/workers/{self.worker_id}")
+        except httpx.HTTPError as e:
+            logger.warning(f"Could not deregister: {e}")
+        self.worker_id = None
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Edge watcher leasing cameras from a central alerts_server")
+    parser.add_argument("--server", default=ALERT_SERVER_URL, help="alerts_server base URL")
+    parser.add_argument("--token", default=WORKER_TOKEN, help="shared WORKER_TOKEN (default from env)")
+    parser.add_argument("--site", default=WORKER_SITE, help="serve cameras whose config has this site")
+    parser.add_argument("--name", default=socket.gethostname(), help="name shown in GET /workers")
+    parser.add_argument("--spool", default=ALERT_SPOOL, help="file for alerts the server has not acknowledged")
+    args = parser.parse_args(argv)
+    if not args.token:
+        parser.error("WORKER_TOKEN (or --token) is required")
+
+    from realtime_face_watchlist import INCIDENTS_PATH, FaceRecognitionSystem
+
+    system = FaceRecognitionSystem(camera_sources=[])
+    client = httpx.Client(base_url=args.server, headers={"Authorization": f"Bearer {args.token}"}, timeout=10)
+    worker = EdgeWorker(system, client, args.name, args.site, spool_path=args.spool, incidents_root=INCIDENTS_PATH)
+    system.start_workers()
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    worker.run(stop)
+    # Flush queued alerts while the lease is still valid, then hand the cameras back
+    system.stop(display=False)
+    worker.leave()
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+Face detector and encoder backends.
+
+A camera's config may pick its backends:
+
+    {"detector": "haar+hog", "encoder": {"jitters": 1, "landmarks": "small"}}
+
+``detector`` is a model name, or a dict with ``model`` and its options:
+
+- ``hog`` / ``cnn``: dlib through face_recognition (``upsample``: times the
+  image is upsampled first, finding smaller faces at ~4x the cost each).
+  ``cnn`` is far more accurate on angled faces but needs a GPU to be live.
+- ``dnn``: OpenCV's YuNet CNN face detector (``cv2.FaceDetectorYN``), several
+  times faster than HOG on a CPU and better with angled faces
+  (``confidence``: score threshold). Its ONNX model is read from
+  ``FACE_MODELS_DIR``.
+- ``haar``: OpenCV's frontal-face Haar cascade, cheapest and least accurate.
+
+``"prefilter": "haar"`` (shorthand ``"haar+hog"``) runs the Haar cascade
+first and skips the main detector on frames where it finds nothing, which
+is most frames on a quiet camera.
+
+Encoders are dlib's: ``jitters`` re-samples each face that many times
+(slower, slightly steadier), ``landmarks`` picks the 5-point (``small``) or
+68-point (``large``) alignment model. Either way the 128-d encodings stay
+comparable with the watchlist's.
+
+OpenCV and dlib are imported on first use so the server can validate
+configs without loading them.
+"""
+
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+Box = Tuple[int, int, int, int]  # top, right, bottom, left
+
+FACE_DETECTOR = os.getenv("FACE_DETECTOR", "hog")  # default for cameras without a "detector"
+FACE_MODELS_DIR = os.getenv("FACE_MODELS_DIR", "models")
+DNN_MODEL = "face_detection_yunet_2023mar.onnx"
+DNN_CONFIDENCE = 0.6
+DNN_NMS_THRESHOLD = 0.3
+HAAR_CASCADE = "haarcascade_frontalface_default.xml"
+HAAR_MIN_FACE_PX = 20
+DETECTOR_MODELS = ("hog", "cnn", "dnn", "haar")
+PREFILTERS = ("haar",)
+LANDMARK_MODELS = ("small", "large")
+
+
+def parse_detector(value: Any) -> Dict[str, Any]:
+    """Normalise a detector spec (name, ``"prefilter+model"`` or dict); raises ValueError."""
+    if value is None:
+        value = FACE_DETECTOR
+    if isinstance(value, str):
+        prefilter, _, model = value.rpartition("+")
+        value = {"model": model, "prefilter": prefilter or None}
+    if not isinstance(value, dict):
+        raise ValueError("detector must be a model name or an object")
+    spec = {"model": value.get("model", "hog"), "prefilter": value.get("prefilter")}
+    if spec["model"] not in DETECTOR_MODELS:
+        raise ValueError(f"detector model must be one of {', '.join(DETECTOR_MODELS)}")
+    if spec["prefilter"] not in (None,) + PREFILTERS:
+        raise ValueError(f"prefilter must be one of {', '.join(PREFILTERS)}")
+    if spec["model"] in ("hog", "cnn"):
+        spec["upsample"] = int(value.get("upsample", 1))
+        if not 0 <= spec["upsample"] <= 3:
+            raise ValueError("upsample must be between 0 and 3")
+    if spec["model"] == "dnn":
+        spec["confidence"] = float(value.get("confidence", DNN_CONFIDENCE))
+        if not 0.0 < spec["confidence"] < 1.0:
+            raise ValueError("confidence must be between 0 and 1")
+    return spec
+
+
+def parse_encoder(value: Any) -> Dict[str, Any]:
+    """Normalise an encoder spec; raises ValueError."""
+    value = value or {}
+    if not isinstance(value, dict):
+        raise ValueError("encoder must be an object")
+    spec = {"jitters": int(value.get("jitters", 1)), "landmarks": value.get("landmarks", "small")}
+    if not 1 <= spec["jitters"] <= 100:
+        raise ValueError("jitters must be between 1 and 100")
+    if spec["landmarks"] not in LANDMARK_MODELS:
+        raise ValueError(f"landmarks must be one of {', '.join(LANDMARK_MODELS)}")
+    return spec
+
+
+def camera_backend(config: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """``{"detector": {...}, "encoder": {...}}`` from a camera config, or None when it sets neither."""
+    config = config or {}
+    if config.get("detector") is None and config.get("encoder") is None:
+        return None
+    return {"detector": parse_detector(config.get("detector")), "encoder": parse_encoder(config.get("encoder"))}
+
+
+def _model_file(name: str, model_dir: str) -> str:
+    path = os.path.join(model_dir, name)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Face model file {path} not found; see README (Detector backends)")
+    return path
+
+
+class DlibDetector:
+    def __init__(self, model: str = "hog", upsample: int = 1):
+        import face_recognition
+
+        self._locate = face_recognition.face_locations
+        self.model = model
+        self.upsample = upsample
+
+    def __call__(self, rgb: np.ndarray) -> List[Box]:
+        return self._locate(rgb, number_of_times_to_upsample=self.upsample, model=self.model)
+
+
+class DnnDetector:
+    """OpenCV YuNet. The detector holds per-size state and is not thread-safe; calls are serialised."""
+
+    def __init__(self, confidence: float = DNN_CONFIDENCE, model_dir: str = FACE_MODELS_DIR):
+        import cv2
+
+        self._cv2 = cv2
+        self._net = cv2.FaceDetectorYN.create(_model_file(DNN_MODEL, model_dir), "", (320, 320),
+                                              confidence, DNN_NMS_THRESHOLD)
+        self._lock = threading.Lock()
+        self.confidence = confidence
+
+    def __call__(self, rgb: np.ndarray) -> List[Box]:
+        height, width = rgb.shape[:2]
+        bgr = self._cv2.cvtColor(rgb, self._cv2.COLOR_RGB2BGR)  # trained on BGR
+        with self._lock:
+            self._net.setInputSize((width, height))
+            _, faces = self._net.detect(bgr)
+        boxes = []
+        for face in faces if faces is not None else ():
+            x, y, w, h = face[:4]
+            left, top = max(0, int(x)), max(0, int(y))
+            right, bottom = min(width, int(x + w)), min(height, int(y + h))
+            if right > left and bottom > top:
+                boxes.append((top, right, bottom, left))
+        return boxes
+
+
+class HaarDetector:
+    def __init__(self, model_dir: str = FACE_MODELS_DIR, min_face_px: int = HAAR_MIN_FACE_PX):
+        import cv2
+
+        self._cv2 = cv2
+        path = os.path.join(model_dir, HAAR_CASCADE)
+        if not os.path.exists(path) and hasattr(cv2, "data"):
+            path = os.path.join(cv2.data.haarcascades, HAAR_CASCADE)  # bundled with opencv-python
+        self._path = _model_file(os.path.basename(path), os.path.dirname(path))
+        self._local = threading.local()  # CascadeClassifier is not thread-safe either
+        self.min_face_px = min_face_px
+
+    def __call__(self, rgb: np.ndarray) -> List[Box]:
+        cascade = getattr(self._local, "cascade", None)
+        if cascade is None:
+            cascade = self._local.cascade = self._cv2.CascadeClassifier(self._path)
+        gray = self._cv2.cvtColor(rgb, self._cv2.COLOR_RGB2GRAY)
+        faces = cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=4,
+                                         minSize=(self.min_face_px, self.min_face_px))
+        return [(int(y), int(x + w), int(y + h), int(x)) for x, y, w, h in faces]
+
+
+class PrefilteredDetector:
+    """Runs ``detector`` only on images where the cheap ``prefilter`` finds a face."""
+
+    def __init__(self, prefilter: Callable[[np.ndarray], List[Box]], detector: Callable[[np.ndarray], List[Box]]):
+        self.prefilter = prefilter
+        self.detector = detector
+        self.skipped = 0
+
+    def __call__(self, rgb: np.ndarray) -> List[Box]:
+        if not self.prefilter(rgb):
+            self.skipped += 1
+            return []
+        return self.detector(rgb)
+
+
+class DlibLandmarks:
+    """5-point landmarks for the quality gate's pose check (~1 ms a face)."""
+
+    def __init__(self):
+        import face_recognition
+
+        self._landmarks = face_recognition.face_landmarks
+
+    def __call__(self, rgb: np.ndarray, locations: List[Box]) -> List[Dict[str, List[Tuple[int, int]]]]:
+        return self._landmarks(rgb, locations, model="small")
+
+
+class DlibEncoder:
+    def __init__(self, jitters: int = 1, landmarks: str = "small"):
+        import face_recognition
+
+        self._encode = face_recognition.face_encodings
+        self.jitters = jitters
+        self.landmarks = landmarks
+
+    def __call__(self, rgb: np.ndarray, locations: List[Box]) -> List[np.ndarray]:
+        return self._encode(rgb, locations, num_jitters=self.jitters, model=self.landmarks)
+
+
+def create_detector(spec: Optional[Dict[str, Any]] = None, model_dir: str = FACE_MODELS_DIR) -> Callable[[np.ndarray], List[Box]]:
+    spec = parse_detector(spec)
+    model = spec["model"]
+    if model in ("hog", "cnn"):
+        detector = DlibDetector(model, spec["upsample"])
+    elif model == "dnn":
+        detector = DnnDetector(spec["confidence"], model_dir)
+    else:
+        detector = HaarDetector(model_dir)
+    if spec["prefilter"] == "haar":
+        detector = PrefilteredDetector(HaarDetector(model_dir), detector)
+    return detector
+
+
+class FaceBackend:
+    """A camera's detector and encoder, built from its ``camera_backend`` spec."""
+
+    def __init__(self, spec: Optional[Dict[str, Any]] = None, model_dir: str = FACE_MODELS_DIR):
+        self.spec = spec
+        spec = spec or {}
+        self.detector_spec = parse_detector(spec.get("detector"))
+        self.encoder_spec = parse_encoder(spec.get("encoder"))
+        self.detect = create_detector(self.detector_spec, model_dir)
+        self.encode = DlibEncoder(**self.encoder_spec)
+        self.landmarks = DlibLandmarks()
+
+    @property
+    def name(self) -> str:
+        prefilter = self.detector_spec["prefilter"]
+        return f"{prefilter}+{self.detector_spec['model']}" if prefilter else self.detector_spec["model"]
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {"detector": self.name, **self.encoder_spec}
+        if isinstance(self.detect, PrefilteredDetector):
+            stats["prefilter_skipped"] = self.detect.skipped
+        return stats
@@ -0,0 +1,159 @@
+"""
+Cheap face quality checks run before the expensive encoding.
+
+A 128-d encoding costs far more than detection's share per face, and tiny,
+blurred, badly lit or profile faces rarely match reliably anyway.
+``QualityGate`` scores each detected face on the image it was found in and
+lets only faces above the thresholds through to the encoder. Checks run
+cheapest first; the pose check needs landmarks, so they are computed only
+for faces that passed the pixel checks.
+
+- size: the box's shorter side in pixels of the image that gets encoded
+- sharpness: variance of the Laplacian of the face resized to 64x64
+- brightness: mean grey level of the face
+- yaw: horizontal offset of the nose from between the eyes, relative to
+  the eye distance (0 frontal, ~0.5 at 45 degrees)
+
+``score`` folds all four into 0..1 for alerts and dashboards.
+"""
+
+import os
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+Box = Tuple[int, int, int, int]  # top, right, bottom, left
+Landmarks = Dict[str, List[Tuple[int, int]]]
+
+QUALITY_GATE = os.getenv("QUALITY_GATE", "1") == "1"
+QUALITY_MIN_FACE_PX = int(os.getenv("QUALITY_MIN_FACE_PX", "30"))
+QUALITY_MIN_SHARPNESS = float(os.getenv("QUALITY_MIN_SHARPNESS", "25"))
+QUALITY_MIN_BRIGHTNESS = float(os.getenv("QUALITY_MIN_BRIGHTNESS", "35"))
+QUALITY_MAX_BRIGHTNESS = float(os.getenv("QUALITY_MAX_BRIGHTNESS", "225"))
+QUALITY_MAX_YAW = float(os.getenv("QUALITY_MAX_YAW", "0.6"))
+SHARPNESS_SIZE = 64  # faces are compared at one size so sharpness does not track resolution
+
+
+class FaceQuality(NamedTuple):
+    size: int
+    sharpness: float
+    brightness: float
+    yaw: Optional[float] = None
+    score: float = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "sharpness": round(self.sharpness, 1),
+            "brightness": round(self.brightness, 1),
+            "yaw": None if self.yaw is None else round(self.yaw, 2),
+            "score": round(self.score, 3),
+        }
+
+
+def measure(rgb: np.ndarray, location: Box) -> FaceQuality:
+    """Size, sharpness and brightness of the face at ``location`` in ``rgb``."""
+    top, right, bottom, left = location
+    height, width = rgb.shape[:2]
+    crop = rgb[max(0, top):min(height, bottom), max(0, left):min(width, right)]
+    size = min(bottom - top, right - left)
+    if crop.size == 0:
+        return FaceQuality(size, 0.0, 0.0)
+    gray = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY)
+    brightness = float(gray.mean())
+    gray = cv2.resize(gray, (SHARPNESS_SIZE, SHARPNESS_SIZE), interpolation=cv2.INTER_AREA)
+    sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+    return FaceQuality(size, sharpness, brightness)
+
+
+def estimate_yaw(landmarks: Landmarks) -> Optional[float]:
+    """Signed nose offset from the eye midpoint in eye distances, from 5- or 68-point landmarks."""
+    try:
+        left_eye = np.mean(landmarks["left_eye"], axis=0)
+        right_eye = np.mean(landmarks["right_eye"], axis=0)
+        nose = np.mean(landmarks["nose_tip"], axis=0)
+    except (KeyError, ValueError):
+        return None
+    eye_distance = float(np.linalg.norm(right_eye - left_eye))
+    if eye_distance < 1.0:
+        return None
+    return float(nose[0] - (left_eye[0] + right_eye[0]) / 2.0) / eye_distance
+
+
+class QualityGate:
+    """Decides which faces are worth encoding and counts the encodings it saved."""
+
+    REASONS = ("small", "blurry", "dark", "bright", "pose")
+
+    def __init__(self, min_size: int = QUALITY_MIN_FACE_PX, min_sharpness: float = QUALITY_MIN_SHARPNESS,
+                 min_brightness: float = QUALITY_MIN_BRIGHTNESS, max_brightness: float = QUALITY_MAX_BRIGHTNESS,
+                 max_yaw: float = QUALITY_MAX_YAW, enabled: bool = QUALITY_GATE):
+        self.min_size = min_size
+        self.min_sharpness = min_sharpness
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.max_yaw = max_yaw
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.passed = 0
+        self.skipped = {reason: 0 for reason in self.REASONS}
+
+    def _reject_reason(self, quality: FaceQuality) -> Optional[str]:
+        if quality.size < self.min_size:
+            return "small"
+        if quality.sharpness < self.min_sharpness:
+            return "blurry"
+        if quality.brightness < self.min_brightness:
+            return "dark"
+        if quality.brightness > self.max_brightness:
+            return "bright"
+        if quality.yaw is not None and abs(quality.yaw) > self.max_yaw:
+            return "pose"
+        return None
+
+    def score(self, quality: FaceQuality) -> float:
+        size = min(1.0, quality.size / (2.0 * self.min_size))
+        sharpness = min(1.0, quality.sharpness / (4.0 * self.min_sharpness))
+        brightness = max(0.0, 1.0 - abs(quality.brightness - 128.0) / 128.0)
+        pose = 1.0 if quality.yaw is None else max(0.0, 1.0 - abs(quality.yaw) / (2.0 * self.max_yaw))
+        return size * sharpness * (0.5 + 0.5 * brightness) * pose
+
+    def filter(self, rgb: np.ndarray, locations: Sequence[Box],
+               landmarks: Optional[Callable[[np.ndarray, List[Box]], List[Landmarks]]] = None
+               ) -> List[Tuple[int, FaceQuality]]:
+        """``(index, quality)`` of the faces in ``locations`` that should be encoded."""
+        measured = [measure(rgb, location) for location in locations]
+        reasons = [self._reject_reason(q) if self.enabled else None for q in measured]
+        if landmarks is not None:
+            # Landmarks only for faces that survived the pixel checks
+            candidates = [i for i, reason in enumerate(reasons) if reason is None]
+            if candidates:
+                for i, points in zip(candidates, landmarks(rgb, [locations[i] for i in candidates])):
+                    measured[i] = measured[i]._replace(yaw=estimate_yaw(points))
+                    if self.enabled:
+                        reasons[i] = self._reject_reason(measured[i])
+        kept = []
+        with self._lock:
+            self.checked += len(locations)
+            for i, (quality, reason) in enumerate(zip(measured, reasons)):
+                if reason is None:
+                    self.passed += 1
+                    kept.append((i, quality._replace(score=self.score(quality))))
+                else:
+                    self.skipped[reason] += 1
+        return kept
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            saved = sum(self.skipped.values())
+            return {
+                "enabled": self.enabled,
+                "checked": self.checked,
+                "encoded": self.passed,
+                "encodings_saved": saved,
+                "saved_ratio": round(saved / self.checked, 3) if self.checked else 0.0,
+                "skipped": dict(self.skipped),
+            }
@@ -0,0 +1,166 @@
+"""
+Pre-event frame buffering and background clip encoding.
+
+Each camera keeps a bounded ring of recent frames stored as JPEG bytes. When
+an incident is logged, a clip job is queued; the encoder thread waits for the
+post-event window to fill, then encodes the pre/post frames as a video and
+stores it through ``incident_store`` next to the snapshot (a loose file or a
+packed segment, per ``INCIDENT_STORAGE``), so capture and recognition never
+wait on video encoding.
+"""
+
+import os
+import threading
+import time
+import logging
+from collections import deque
+from queue import Queue, Empty
+from typing import Deque, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+import incident_store
+
+logger = logging.getLogger(__name__)
+
+CLIP_BUFFER_MB = float(os.getenv("CLIP_BUFFER_MB", "16"))  # per camera
+CLIP_BUFFER_FPS = float(os.getenv("CLIP_BUFFER_FPS", "10"))
+CLIP_PRE_SECONDS = float(os.getenv("CLIP_PRE_SECONDS", "5"))
+CLIP_POST_SECONDS = float(os.getenv("CLIP_POST_SECONDS", "5"))
+CLIP_JPEG_QUALITY = int(os.getenv("CLIP_JPEG_QUALITY", "70"))
+CLIP_FOURCC = os.getenv("CLIP_FOURCC", "mp4v")
+
+
+class FrameRingBuffer:
+    """Memory-capped ring of (timestamp, jpeg bytes) for one camera."""
+
+    def __init__(self, max_bytes: int, max_seconds: float, fps: float = CLIP_BUFFER_FPS,
+                 jpeg_quality: int = CLIP_JPEG_QUALITY):
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.min_interval = 1.0 / fps if fps > 0 else 0.0
+        self.encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_quality]
+        self._frames: Deque[Tuple[float, bytes]] = deque()
+        self._bytes = 0
+        self._last_ts = 0.0
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def add(self, frame: np.ndarray, ts: Optional[float] = None) -> bool:
+        """Compress and store ``frame``; frames above the buffer FPS are skipped."""
+        ts = time.time() if ts is None else ts
+        if ts - self._last_ts < self.min_interval:
+            return False
+        ok, encoded = cv2.imencode(".jpg", frame, self.encode_params)
+        if not ok:
+            return False
+        data = encoded.tobytes()
+        with self._lock:
+            self._last_ts = ts
+            self._frames.append((ts, data))
+            self._bytes += len(data)
+            cutoff = ts - self.max_seconds
+            while self._frames and (self._bytes > self.max_bytes or self._frames[0][0] < cutoff):
+                _, old = self._frames.popleft()
+                self._bytes -= len(old)
+                self.evicted += 1
+        return True
+
+    def window(self, start: float, end: float) -> List[Tuple[float, bytes]]:
+        with self._lock:
+            return [(ts, data) for ts, data in self._frames if start <= ts <= end]
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            span = self._frames[-1][0] - self._frames[0][0] if len(self._frames) > 1 else 0.0
+            return {
+                "frames": len(self._frames),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "seconds": round(span, 2),
+                "evicted": self.evicted,
+            }
+
+
+class ClipEncoder:
+    """Background worker that turns buffered frames into short incident clips."""
+
+    def __init__(self, output_dir: str, pre_seconds: float = CLIP_PRE_SECONDS,
+                 post_seconds: float = CLIP_POST_SECONDS, fourcc: str = CLIP_FOURCC):
+        self.output_dir = output_dir
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.fourcc = fourcc
+        self._jobs: Queue = Queue()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="clip-encoder", daemon=True)
+        self.clips_written = 0
+        self.clips_failed = 0
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=self.post_seconds + 5)
+
+    def submit(self, buffer: FrameRingBuffer, snapshot_filename: str, trigger_ts: float) -> None:
+        """Queue a clip around ``trigger_ts``; never blocks the caller."""
+        self._jobs.put((buffer, snapshot_filename, trigger_ts))
+
+    def pending(self) -> int:
+        return self._jobs.qsize()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                buffer, snapshot_filename, trigger_ts = self._jobs.get(timeout=0.5)
+            except Empty:
+                continue
+            # Wait for the post-event frames to land in the ring buffer.
+            wait = trigger_ts + self.post_seconds - time.time()
+            if wait > 0 and self._stop.wait(wait):
+                break
+            try:
+                self._encode(buffer, snapshot_filename, trigger_ts)
+            except Exception as e:
+                self.clips_failed += 1
+                logger.error(f"Failed to encode clip for {snapshot_filename}: {e}")
+
+    def _encode(self, buffer: FrameRingBuffer, snapshot_filename: str, trigger_ts: float) -> Optional[str]:
+        """Encode and store the clip; returns its incident filename."""
+        frames = buffer.window(trigger_ts - self.pre_seconds, trigger_ts + self.post_seconds)
+        if len(frames) < 2:
+            logger.debug(f"Not enough buffered frames for clip {snapshot_filename}")
+            return None
+        duration = frames[-1][0] - frames[0][0]
+        fps = max(1.0, (len(frames) - 1) / duration) if duration > 0 else 1.0
+        clip_name = os.path.splitext(snapshot_filename)[0] + ".mp4"
+        # VideoWriter needs a real file; it is handed to the incident store once complete
+        scratch_path = os.path.join(self.output_dir, f".{clip_name}.encoding.mp4")
+        writer = None
+        try:
+            for _, data in frames:
+                image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+                if image is None:
+                    continue
+                if writer is None:
+                    height, width = image.shape[:2]
+                    writer = cv2.VideoWriter(scratch_path, cv2.VideoWriter_fourcc(*self.fourcc),
+                                             fps, (width, height))
+                writer.write(image)
+            if writer is None:
+                return None
+            writer.release()
+            writer = None
+            with open(scratch_path, "rb") as f:
+                incident_store.save_incident(clip_name, f.read(), self.output_dir)
+        finally:
+            if writer is not None:
+                writer.release()
+            if os.path.exists(scratch_path):
+                os.unlink(scratch_path)
+        self.clips_written += 1
+        logger.info(f"Incident clip written: {clip_name} ({len(frames)} frames)")
+        return clip_name
@@ -0,0 +1,126 @@
+"""
+Reusable frame memory for the capture -> recognition -> display pipeline.
+
+Every processed frame used to allocate several full-size arrays: the
+captured frame, the resized copy, an RGB copy, and copies wherever boxes
+had to be drawn without touching the frame. Here:
+
+- ``FramePool`` hands capture buffers back to the decoder once recognition
+  (and display) are done with them, so ``cap.read(out)`` writes into memory
+  that already exists. While a frame is in flight it is read-only; drawing
+  on it raises instead of corrupting the clip buffer or a snapshot.
+- ``FrameWorkspace`` keeps per-camera destination buffers: detection resizes
+  and converts into them (``dst=``), and snapshots and the display compose
+  the frame with its annotations into them.
+- Boxes and labels live in a separate annotation list next to the frame and
+  are drawn only into composed copies.
+
+Buffers are reallocated only when a stream changes resolution or a refine
+crop changes size.
+"""
+
+import os
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+FRAME_POOL_SIZE = int(os.getenv("FRAME_POOL_SIZE", "6"))  # queued + processing + displayed + capturing, with slack
+
+
+class Annotation(NamedTuple):
+    box: Tuple[int, int, int, int]  # top, right, bottom, left
+    name: str
+
+
+def draw_face(frame: np.ndarray, box: Tuple[int, int, int, int], name: str) -> None:
+    """Draw box and label"""
+    top, right, bottom, left = box
+    color = (0, 0, 255) if name != "Unknown" else (255, 0, 0)
+    cv2.rectangle(frame, (left, top), (right, bottom), color, 2)
+    cv2.rectangle(frame, (left, bottom - 35), (right, bottom), color, cv2.FILLED)
+    cv2.putText(frame, name, (left + 6, bottom - 6), cv2.FONT_HERSHEY_DUPLEX, 0.6, (255, 255, 255), 1)
+
+
+class FramePool:
+    """Capture buffers of one camera, recycled once every consumer has released them."""
+
+    def __init__(self, size: int = FRAME_POOL_SIZE):
+        self.size = size
+        self.shape: Optional[Tuple[int, ...]] = None
+        self._free: List[np.ndarray] = []
+        self._lock = threading.Lock()
+        self.reused = 0
+        self.allocated = 0
+
+    def acquire(self) -> Optional[np.ndarray]:
+        """A free buffer to read into, or None when the decoder has to allocate one."""
+        with self._lock:
+            if self._free:
+                self.reused += 1
+                return self._free.pop()
+            self.allocated += 1
+            return None
+
+    def release(self, frame: Optional[np.ndarray]) -> None:
+        if frame is None:
+            return
+        with self._lock:
+            if frame.shape != self.shape:
+                # The stream changed resolution; buffers of the old size are dropped
+                self.shape = frame.shape
+                self._free.clear()
+            if len(self._free) < self.size and not any(frame is free for free in self._free):
+                frame.flags.writeable = True
+                self._free.append(frame)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"pooled": len(self._free), "reused": self.reused, "allocated": self.allocated}
+
+
+class FrameWorkspace:
+    """Per-camera scratch buffers, reused from frame to frame."""
+
+    def __init__(self):
+        self._buffers: Dict[str, np.ndarray] = {}
+        self.allocations = 0
+
+    def buffer(self, slot: str, shape: Sequence[int], dtype: Any = np.uint8) -> np.ndarray:
+        shape = tuple(shape)
+        buf = self._buffers.get(slot)
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = self._buffers[slot] = np.empty(shape, dtype)
+            self.allocations += 1
+        return buf
+
+    def resize_rgb(self, view: np.ndarray, scale: float, slot: str = "detect") -> np.ndarray:
+        """``view`` (BGR) resized by ``scale`` and converted to RGB in one reused buffer.
+
+        The result stays valid until ``slot`` is used again.
+        """
+        height, width = view.shape[:2]
+        if scale == 1.0:
+            rgb = self.buffer(slot, view.shape)
+            return cv2.cvtColor(view, cv2.COLOR_BGR2RGB, dst=rgb)
+        size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+        rgb = self.buffer(slot, (size[1], size[0]) + view.shape[2:])
+        interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR
+        cv2.resize(view, size, dst=rgb, interpolation=interpolation)
+        return cv2.cvtColor(rgb, cv2.COLOR_BGR2RGB, dst=rgb)  # in place
+
+    def compose(self, frame: np.ndarray, annotations: Sequence[Annotation], slot: str = "display",
+                text: Optional[str] = None) -> np.ndarray:
+        """The frame with its annotations (and an optional status line) drawn on, in a reused buffer."""
+        out = self.buffer(slot, frame.shape, frame.dtype)
+        np.copyto(out, frame)
+        for annotation in annotations:
+            draw_face(out, annotation.box, annotation.name)
+        if text:
+            cv2.putText(out, text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        buffers = list(self._buffers.values())
+        return {"buffers": len(buffers), "bytes": sum(b.nbytes for b in buffers), "allocations": self.allocations}
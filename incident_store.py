@@ -0,0 +1,293 @@
+"""
+Incident snapshot storage.
+
+Snapshots are written either as loose JPEG files in ``incidents/`` (the
+default) or, with ``INCIDENT_STORAGE=packed``, appended to large segment
+files with a small SQLite offset index. Loose files written before the
+switch stay readable: lookups always check the folder first.
+"""
+
+import fcntl
+import mmap
+import os
+import sqlite3
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+INCIDENTS_FOLDER = os.getenv("INCIDENTS_FOLDER", "incidents")
+INCIDENT_STORAGE = os.getenv("INCIDENT_STORAGE", "files")  # 'files' or 'packed'
+SEGMENT_MAX_BYTES = int(os.getenv("INCIDENT_SEGMENT_MAX_BYTES", str(256 * 1024 * 1024)))
+INCIDENT_RETENTION_DAYS = float(os.getenv("INCIDENT_RETENTION_DAYS", "0"))  # 0 keeps everything
+
+SEGMENTS_DIRNAME = "segments"
+INDEX_FILENAME = "index.db"
+LOCK_FILENAME = "append.lock"
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+class PackedIncidentStore:
+    """Append-only segment files plus an SQLite index of (segment, offset, length).
+
+    Writers append the image bytes to the active segment, flush, and only then
+    commit the index row, so readers in other processes never see an entry
+    pointing at bytes that are not on disk yet. Retention removes whole
+    segments: the index rows go first, then the file is unlinked.
+
+    Several processes (watcher shards, daemons, edge workers on one box) may
+    share a segment directory. Appends, roll-overs and retention all hold an
+    exclusive ``flock`` on ``append.lock``. Under it the active segment is
+    always the newest one and offsets come from its real size, so writers
+    never index stale offsets. Retention never drops the newest segment.
+    """
+
+    def __init__(self, root: str = INCIDENTS_FOLDER, segment_max_bytes: int = SEGMENT_MAX_BYTES):
+        self.segment_dir = os.path.join(root, SEGMENTS_DIRNAME)
+        self.segment_max_bytes = segment_max_bytes
+        os.makedirs(self.segment_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._lock_path = os.path.join(self.segment_dir, LOCK_FILENAME)
+        self._local = threading.local()
+        self._active_id: Optional[int] = None
+        self._active_file = None
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS incidents ("
+                " filename TEXT PRIMARY KEY,"
+                " segment INTEGER NOT NULL,"
+                " offset INTEGER NOT NULL,"
+                " length INTEGER NOT NULL,"
+                " created REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_incidents_segment ON incidents(segment)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread; the watcher writes from its processing
+        # thread while the API reads from the threadpool.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.segment_dir, INDEX_FILENAME), timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def segment_path(self, segment_id: int) -> str:
+        return os.path.join(self.segment_dir, f"seg_{segment_id:06d}.pack")
+
+    def _segment_ids(self) -> List[int]:
+        ids = []
+        for name in os.listdir(self.segment_dir):
+            if name.startswith("seg_") and name.endswith(".pack"):
+                try:
+                    ids.append(int(name[4:-5]))
+                except ValueError:
+                    continue
+        return sorted(ids)
+
+    @contextmanager
+    def _exclusive(self) -> Iterator[None]:
+        """Hold the segment directory against every other thread and process."""
+        with self._lock, open(self._lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _switch_to(self, segment_id: int) -> None:
+        if self._active_file is not None:
+            self._active_file.close()
+        self._active_id = segment_id
+        self._active_file = open(self.segment_path(segment_id), "ab")
+
+    def _open_segment(self, size_needed: int) -> Tuple[object, int]:
+        """The newest segment and its size, rolling over when it would overflow. Needs the lock."""
+        ids = self._segment_ids()
+        newest = ids[-1] if ids else 1
+        if self._active_file is None or self._active_id != newest:
+            self._switch_to(newest)  # another process may have rolled over
+        size = os.fstat(self._active_file.fileno()).st_size
+        if size > 0 and size + size_needed > self.segment_max_bytes:
+            self._switch_to(newest + 1)
+            size = 0
+            self._drop_expired(INCIDENT_RETENTION_DAYS)
+        return self._active_file, size
+
+    def append(self, filename: str, data: bytes) -> None:
+        """Append one snapshot and index it under ``filename``."""
+        with self._exclusive():
+            f, offset = self._open_segment(len(data))
+            f.write(data)
+            f.flush()
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO incidents (filename, segment, offset, length, created)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (filename, self._active_id, offset, len(data), time.time()),
+                )
+
+    def lookup(self, filename: str) -> Optional[Tuple[str, int, int]]:
+        """Return (segment path, offset, length) for a packed snapshot."""
+        row = self._connect().execute(
+            "SELECT segment, offset, length FROM incidents WHERE filename = ?", (filename,)
+        ).fetchone()
+        if row is None:
+            return None
+        return self.segment_path(row[0]), row[1], row[2]
+
+    def read(self, filename: str) -> Optional[bytes]:
+        loc = self.lookup(filename)
+        if loc is None:
+            return None
+        path, offset, length = loc
+        with open(path, "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def list(self) -> List[Dict]:
+        rows = self._connect().execute(
+            "SELECT filename, length, created FROM incidents ORDER BY created DESC"
+        ).fetchall()
+        return [{"filename": r[0], "size": r[1], "created": r[2]} for r in rows]
+
+    def delete(self, filename: str) -> bool:
+        """Forget a snapshot. Its bytes are reclaimed when the segment is dropped."""
+        conn = self._connect()
+        with conn:
+            cur = conn.execute("DELETE FROM incidents WHERE filename = ?", (filename,))
+        return cur.rowcount > 0
+
+    def enforce_retention(self, retention_days: float = INCIDENT_RETENTION_DAYS) -> int:
+        """Drop every closed segment whose newest snapshot is older than the window.
+
+        Returns the number of segments removed.
+        """
+        with self._exclusive():
+            return self._drop_expired(retention_days)
+
+    def _drop_expired(self, retention_days: float) -> int:
+        if retention_days <= 0:
+            return 0
+        cutoff = time.time() - retention_days * 86400
+        conn = self._connect()
+        removed = 0
+        ids = self._segment_ids()
+        for segment_id in ids[:-1]:  # the newest segment is the one every writer appends to
+            newest = conn.execute(
+                "SELECT MAX(created) FROM incidents WHERE segment = ?", (segment_id,)
+            ).fetchone()[0]
+            if newest is not None and newest >= cutoff:
+                continue
+            if newest is None and os.path.getmtime(self.segment_path(segment_id)) >= cutoff:
+                continue
+            with conn:
+                conn.execute("DELETE FROM incidents WHERE segment = ?", (segment_id,))
+            try:
+                os.remove(self.segment_path(segment_id))
+                removed += 1
+            except OSError as e:
+                logger.error(f"Failed to remove incident segment {segment_id}: {e}")
+        if removed:
+            logger.info(f"Incident retention dropped {removed} segment(s)")
+        return removed
+
+    def close(self) -> None:
+        with self._lock:
+            if self._active_file is not None:
+                self._active_file.close()
+                self._active_file = None
+
+
+# One packed store per incidents folder, keyed by absolute path
+_stores: Dict[str, PackedIncidentStore] = {}
+_store_lock = threading.Lock()
+
+
+def get_packed_store(root: str = INCIDENTS_FOLDER) -> Optional[PackedIncidentStore]:
+    """Return the shared packed store of ``root``, or None when its index does not exist yet."""
+    key = os.path.abspath(root)
+    store = _stores.get(key)
+    if store is None:
+        if INCIDENT_STORAGE != "packed" and not os.path.exists(
+            os.path.join(root, SEGMENTS_DIRNAME, INDEX_FILENAME)
+        ):
+            return None
+        with _store_lock:
+            store = _stores.get(key)
+            if store is None:
+                store = _stores[key] = PackedIncidentStore(root)
+    return store
+
+
+def save_incident(filename: str, data: bytes, root: str = INCIDENTS_FOLDER) -> None:
+    """Persist an encoded snapshot using the configured backend."""
+    if INCIDENT_STORAGE == "packed":
+        get_packed_store(root).append(filename, data)
+        return
+    with open(os.path.join(root, filename), "wb") as f:
+        f.write(data)
+
+
+def locate_incident(filename: str, root: str = INCIDENTS_FOLDER) -> Optional[Tuple[str, int, int]]:
+    """Find a snapshot as (path, offset, length); loose files take precedence."""
+    if os.path.basename(filename) != filename:
+        return None
+    path = os.path.join(root, filename)
+    if os.path.isfile(path):
+        return path, 0, os.path.getsize(path)
+    store = get_packed_store(root)
+    if store is None:
+        return None
+    return store.lookup(filename)
+
+
+def read_incident(filename: str, root: str = INCIDENTS_FOLDER) -> Optional[bytes]:
+    """The whole snapshot, loose or packed, or None if it is not stored here."""
+    location = locate_incident(filename, root)
+    if location is None:
+        return None
+    return b"".join(iter_range(*location))
+
+
+def iter_range(path: str, offset: int, length: int, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """Yield ``length`` bytes at ``offset`` through a read-only memory map."""
+    if length <= 0:
+        return
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                end = offset + length
+                pos = offset
+                while pos < end:
+                    nxt = min(pos + chunk_size, end)
+                    yield bytes(view[pos:nxt])
+                    pos = nxt
+            finally:
+                view.release()
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single ``bytes=start-end`` range into an inclusive (start, end)."""
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_s, _, end_s = header[6:].strip().partition("-")
+    try:
+        if start_s == "":
+            suffix = int(end_s)
+            if suffix <= 0:
+                return None
+            return max(size - suffix, 0), size - 1
+        start = int(start_s)
+        end = int(end_s) if end_s else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
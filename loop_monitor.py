@@ -0,0 +1,72 @@
+"""
+Event-loop lag monitor.
+
+A background task sleeps for a fixed interval and measures how late it wakes
+up. Any lateness is time the loop spent running something else without
+yielding, i.e. blocking work on the loop. Stalls above the threshold are
+logged and counted.
+"""
+
+import asyncio
+import os
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.05"))
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", "0.1"))
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, threshold: float = LOOP_LAG_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self._task: Optional[asyncio.Task] = None
+        self.samples = 0
+        self.stalls = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._total_lag = 0.0
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.record(max(0.0, loop.time() - started - self.interval))
+
+    def record(self, lag: float) -> None:
+        self.samples += 1
+        self.last_lag = lag
+        self._total_lag += lag
+        self.max_lag = max(self.max_lag, lag)
+        if lag > self.threshold:
+            self.stalls += 1
+            logger.warning(f"Event loop stalled for {lag * 1000:.0f} ms")
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "samples": self.samples,
+            "stalls": self.stalls,
+            "threshold_ms": self.threshold * 1000,
+            "last_lag_ms": round(self.last_lag * 1000, 2),
+            "max_lag_ms": round(self.max_lag * 1000, 2),
+            "avg_lag_ms": round(self._total_lag / self.samples * 1000, 2) if self.samples else 0.0,
+        }
+
+
+loop_monitor = LoopLagMonitor()
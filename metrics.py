@@ -0,0 +1,265 @@
+"""
+Per-stage latency histograms and their Prometheus text exposition.
+
+Each pipeline stage (capture, detect, encode, ... in the watcher; ingest,
+persist, broadcast, notify in the server) records its durations into a
+``LatencyHistogram``. Buckets are HDR-style: linear below
+``2 ** (SIGNIFICANT_BITS + 1)`` microseconds, then ``2 ** SIGNIFICANT_BITS``
+buckets per power of two. Every recorded value is therefore kept to within
+about 3% of itself, from microseconds up to minutes, in a few hundred
+counters. Recording takes a float multiply, a ``bit_length``, a shift and a
+counter increment under a lock: around a microsecond. The dozen stages of a
+processed frame cost well under 1% of the tens of milliseconds that
+detection takes.
+
+A ``MetricsRegistry`` holds one histogram per stage and label set. The
+watcher publishes ``export()`` in its status, so the heartbeat and edge
+worker telemetry carry it. The server merges those with its own registry
+and renders everything on ``/metrics``.
+"""
+
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+SIGNIFICANT_BITS = 5  # 32 sub-buckets per power of two: values kept within 1/32
+MAX_MICROS = 1 << 27  # ~134 s; slower values land in the last bucket
+# Exposed Prometheus buckets: powers of two from 64 us to ~67 s. Each is an
+# exact boundary of the fine buckets, so the cumulative counts are exact.
+PROMETHEUS_BOUNDS = tuple((1 << k) / 1e6 for k in range(6, 27))
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+METRIC_NAME = "face_watchlist_stage_seconds"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def bucket_index(micros: int) -> int:
+    shift = max(0, micros.bit_length() - SIGNIFICANT_BITS - 1)
+    return (shift << SIGNIFICANT_BITS) + (micros >> shift)
+
+
+def bucket_bounds(index: int) -> Tuple[int, int]:
+    """``[lower, upper)`` of a bucket, in microseconds."""
+    shift = max(0, (index >> SIGNIFICANT_BITS) - 1)
+    mantissa = index - (shift << SIGNIFICANT_BITS)
+    return mantissa << shift, (mantissa + 1) << shift
+
+
+_BUCKETS = bucket_index(MAX_MICROS - 1) + 1
+
+
+class LatencyHistogram:
+    """Thread-safe log-linear histogram of durations in seconds."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = [0] * _BUCKETS
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        micros = int(seconds * 1e6)
+        if micros < 0:
+            micros = 0
+        elif micros >= MAX_MICROS:
+            micros = MAX_MICROS - 1
+        index = bucket_index(micros)
+        with self._lock:
+            self._counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        with other._lock:
+            counts, count, total, peak = list(other._counts), other.count, other.sum, other.max
+        with self._lock:
+            self._counts = [a + b for a, b in zip(self._counts, counts)]
+            self.count += count
+            self.sum += total
+            self.max = max(self.max, peak)
+
+    def quantile(self, q: float) -> float:
+        """Value at quantile ``q`` (0..1) in seconds: the midpoint of its bucket, capped at the max seen."""
+        with self._lock:
+            if not self.count:
+                return 0.0
+            rank = max(1, int(q * self.count + 0.5))
+            seen = 0
+            for index, n in enumerate(self._counts):
+                seen += n
+                if seen >= rank:
+                    lower, upper = bucket_bounds(index)
+                    return min(self.max, (lower + upper) / 2e6)
+            return self.max
+
+    def cumulative(self, bounds: Iterable[float] = PROMETHEUS_BOUNDS) -> List[int]:
+        """Observations at or below each bound (seconds), for Prometheus ``le`` buckets."""
+        with self._lock:
+            counts = list(self._counts)
+        result, seen, index = [], 0, 0
+        for bound in bounds:
+            limit = int(round(bound * 1e6))
+            while index < len(counts) and bucket_bounds(index)[1] <= limit:
+                seen += counts[index]
+                index += 1
+            result.append(seen)
+        return result
+
+    def export(self) -> Dict[str, Any]:
+        """JSON-safe form with only the occupied buckets."""
+        with self._lock:
+            return {
+                "counts": [[i, n] for i, n in enumerate(self._counts) if n],
+                "count": self.count,
+                "sum": self.sum,
+                "max": self.max,
+            }
+
+    @classmethod
+    def from_export(cls, data: Dict[str, Any]) -> "LatencyHistogram":
+        histogram = cls()
+        for index, n in data.get("counts", []):
+            if 0 <= int(index) < _BUCKETS:
+                histogram._counts[int(index)] += int(n)
+        histogram.count = int(data.get("count", 0))
+        histogram.sum = float(data.get("sum", 0.0))
+        histogram.max = float(data.get("max", 0.0))
+        return histogram
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.sum / self.count * 1000, 3) if self.count else 0.0,
+            "p50_ms": round(self.quantile(0.5) * 1000, 3),
+            "p99_ms": round(self.quantile(0.99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+
+class MetricsScope:
+    """The histograms of one label set (e.g. one camera), looked up by stage name."""
+
+    def __init__(self, registry: "MetricsRegistry", labels: Dict[str, str]):
+        self._registry = registry
+        self._labels = labels
+        self._histograms: Dict[str, LatencyHistogram] = {}
+
+    def histogram(self, stage: str) -> LatencyHistogram:
+        histogram = self._histograms.get(stage)
+        if histogram is None:
+            histogram = self._histograms[stage] = self._registry.histogram(stage, **self._labels)
+        return histogram
+
+    def observe(self, stage: str, seconds: float) -> None:
+        self.histogram(stage).observe(seconds)
+
+
+class MetricsRegistry:
+    """Histograms keyed by stage and labels."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], LatencyHistogram] = {}
+
+    def histogram(self, stage: str, **labels: Any) -> LatencyHistogram:
+        key = (stage, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = LatencyHistogram()
+            return histogram
+
+    def scope(self, **labels: Any) -> MetricsScope:
+        return MetricsScope(self, {k: str(v) for k, v in labels.items()})
+
+    def observe(self, stage: str, seconds: float, **labels: Any) -> None:
+        self.histogram(stage, **labels).observe(seconds)
+
+    def discard(self, **labels: Any) -> None:
+        """Drop every histogram carrying these labels (e.g. of a removed camera)."""
+        wanted = {(k, str(v)) for k, v in labels.items()}
+        with self._lock:
+            for key in [key for key in self._histograms if wanted <= set(key[1])]:
+                del self._histograms[key]
+
+    def _items(self) -> List[Tuple[str, Dict[str, str], LatencyHistogram]]:
+        with self._lock:
+            return [(stage, dict(labels), h) for (stage, labels), h in sorted(self._histograms.items())]
+
+    def export(self) -> List[Dict[str, Any]]:
+        return [{"stage": stage, "labels": labels, "histogram": h.export()} for stage, labels, h in self._items()]
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Count, average, p50/p99 and max per stage, for status and debug endpoints."""
+        return {
+            ",".join([stage] + [f"{k}={v}" for k, v in labels.items()]): h.summary()
+            for stage, labels, h in self._items()
+        }
+
+
+class timed:
+    """``with timed(histogram):`` observes the block's duration; a None histogram records nothing."""
+
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram: Optional[LatencyHistogram]):
+        self.histogram = histogram
+
+    def __enter__(self) -> "timed":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        if self.histogram is not None:
+            self.histogram.observe(time.perf_counter() - self.started)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: Dict[str, str], **extra: str) -> str:
+    merged = {**labels, **extra}
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in merged.items()) + "}"
+
+
+def render_prometheus(sources: Iterable[Tuple[Dict[str, Any], Iterable[Dict[str, Any]]]],
+                      name: str = METRIC_NAME) -> str:
+    """Prometheus text exposition of exported histograms.
+
+    ``sources`` pairs extra labels (e.g. ``{"component": "watcher"}``) with a
+    registry's ``export()``. Series with identical labels are merged;
+    malformed entries (e.g. from an outdated edge worker) are skipped.
+    """
+    merged: Dict[Tuple[Tuple[str, str], ...], LatencyHistogram] = {}
+    for extra, exported in sources:
+        for entry in exported or ():
+            try:
+                labels = {**{k: str(v) for k, v in extra.items()}, "stage": str(entry["stage"]),
+                          **{k: str(v) for k, v in (entry.get("labels") or {}).items()}}
+                histogram = LatencyHistogram.from_export(entry["histogram"])
+            except (AttributeError, KeyError, TypeError, ValueError):
+                continue
+            key = tuple(sorted(labels.items()))
+            if key in merged:
+                merged[key].merge(histogram)
+            else:
+                merged[key] = histogram
+
+    lines = [f"# HELP {name} Time spent in each pipeline stage.", f"# TYPE {name} histogram"]
+    for key, histogram in sorted(merged.items()):
+        labels = dict(key)
+        for bound, count in zip(PROMETHEUS_BOUNDS, histogram.cumulative()):
+            lines.append(f"{name}_bucket{_labels(labels, le=repr(bound))} {count}")
+        lines.append(f'{name}_bucket{_labels(labels, le="+Inf")} {histogram.count}')
+        lines.append(f"{name}_sum{_labels(labels)} {histogram.sum!r}")
+        lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+    quantiles = f"{name.rsplit('_seconds', 1)[0]}_quantile_seconds"
+    lines += [f"# HELP {quantiles} Stage latency quantiles from the full-resolution histograms.",
+              f"# TYPE {quantiles} gauge"]
+    for key, histogram in sorted(merged.items()):
+        for q in QUANTILES:
+            lines.append(f"{quantiles}{_labels(dict(key), quantile=repr(q))} {histogram.quantile(q)!r}")
+    return "\n".join(lines) + "\n"
@@ -1,8 +1,8 @@
 from sqlalchemy import Boolean, Column, Integer, String, ForeignKey, DateTime, JSON
-from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy.orm import relationship
 from datetime import datetime
 
-Base = declarative_base()
+from api.database import Base
 
 class User(Base):
     __tablename__ = "users"
@@ -17,6 +17,14 @@ class User(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     alert_subscriptions = relationship("AlertRule", back_populates="user")
 
+    @property
+    def is_active(self) -> bool:
+        return not self.disabled
+
+    @is_active.setter
+    def is_active(self, value: bool) -> None:
+        self.disabled = not value
+
 class Camera(Base):
     __tablename__ = "cameras"
 
@@ -45,4 +53,19 @@ class AlertRule(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     
     camera = relationship("Camera", back_populates="alert_rules")
-    user = relationship("User", back_populates="alert_subscriptions")
\ No newline at end of file
+    user = relationship("User", back_populates="alert_subscriptions")
+
+class EdgeWorker(Base):
+    __tablename__ = "edge_workers"
+
+    id = Column(String, primary_key=True)       # Issued on registration
+    name = Column(String)
+    site = Column(String, index=True)           # Serves cameras whose config has the same "site"
+    host = Column(String)
+    status = Column(String, default="active")   # 'active', 'expired' or 'left'
+    cameras = Column(JSON, default=list)        # Camera ids currently leased to this worker
+    telemetry = Column(JSON)                    # Last heartbeat's watcher status
+    watchlist_version = Column(String)
+    registered_at = Column(DateTime, default=datetime.utcnow)
+    last_heartbeat = Column(DateTime)
+    lease_expires_at = Column(DateTime)
@@ -0,0 +1,489 @@
+"""
+Queued notification delivery.
+
+Alert ingest only renders a notification and appends it to a persistent
+SQLite outbox. Background workers own a pooled ``httpx.AsyncClient`` and
+reusable SMTP connections, deliver with a per-destination concurrency limit,
+and retry failures with exponential backoff until ``NOTIFY_MAX_ATTEMPTS``.
+Claimed rows carry their claim time. Rows a crashed worker left in 'sending'
+are requeued once the claim is older than ``NOTIFY_CLAIM_TIMEOUT``, so
+deliveries still in flight in another live worker are not sent twice.
+Delivered and failed rows are pruned after ``NOTIFY_RETENTION_DAYS``.
+
+During alert storms detections are coalesced per rule: the first one in a
+window is sent immediately, later ones are held (up to a max delay or batch
+size) and go out as a single digest email or batched webhook payload.
+"""
+
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import logging
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import aiosmtplib
+import httpx
+
+from notifications import build_email_message, render_notification, render_digest
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_OUTBOX_DB = os.getenv("NOTIFY_OUTBOX_DB", "notifications_outbox.db")
+NOTIFY_WORKERS = int(os.getenv("NOTIFY_WORKERS", "4"))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "6"))
+NOTIFY_BACKOFF_BASE = float(os.getenv("NOTIFY_BACKOFF_BASE", "2"))
+NOTIFY_BACKOFF_MAX = float(os.getenv("NOTIFY_BACKOFF_MAX", "300"))
+NOTIFY_PER_DESTINATION = int(os.getenv("NOTIFY_PER_DESTINATION", "2"))
+NOTIFY_POLL_INTERVAL = float(os.getenv("NOTIFY_POLL_INTERVAL", "1"))
+NOTIFY_HTTP_TIMEOUT = float(os.getenv("NOTIFY_HTTP_TIMEOUT", "5"))
+NOTIFY_SMTP_IDLE = int(os.getenv("NOTIFY_SMTP_IDLE", "2"))  # idle connections kept per SMTP server
+NOTIFY_COALESCE_MAX_DELAY = float(os.getenv("NOTIFY_COALESCE_MAX_DELAY", "30"))  # 0 disables digests
+NOTIFY_COALESCE_MAX_BATCH = int(os.getenv("NOTIFY_COALESCE_MAX_BATCH", "50"))
+# Longer than a claimed row can wait in the work queue and deliver
+NOTIFY_CLAIM_TIMEOUT = float(os.getenv("NOTIFY_CLAIM_TIMEOUT", "300"))
+NOTIFY_RETENTION_DAYS = float(os.getenv("NOTIFY_RETENTION_DAYS", "7"))  # 0 keeps finished rows
+NOTIFY_HOUSEKEEPING_INTERVAL = float(os.getenv("NOTIFY_HOUSEKEEPING_INTERVAL", "60"))
+
+
+class Outbox:
+    """SQLite-backed queue of rendered notifications."""
+
+    def __init__(self, path: str = NOTIFY_OUTBOX_DB):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS outbox ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " channel TEXT NOT NULL,"
+                " destination TEXT NOT NULL,"
+                " payload TEXT NOT NULL,"
+                " status TEXT NOT NULL DEFAULT 'pending',"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " next_attempt_at REAL NOT NULL,"
+                " last_error TEXT,"
+                " created_at REAL NOT NULL,"
+                " claimed_at REAL)"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(outbox)")}
+            if "claimed_at" not in columns:  # outboxes created before claims were timed
+                self._conn.execute("ALTER TABLE outbox ADD COLUMN claimed_at REAL")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, next_attempt_at)")
+
+    def add(self, channel: str, destination: str, payload: Dict[str, Any]) -> int:
+        now = time.time()
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "INSERT INTO outbox (channel, destination, payload, next_attempt_at, created_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (channel, destination, json.dumps(payload, default=str), now, now),
+            )
+            return cur.lastrowid
+
+    def claim_due(self, limit: int) -> List[Tuple[int, str, str, Dict[str, Any], int]]:
+        """Atomically mark up to ``limit`` due rows as sending and return them."""
+        now = time.time()
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT id, channel, destination, payload, attempts FROM outbox"
+                " WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            claimed = []
+            for row_id, channel, destination, payload, attempts in rows:
+                cur = self._conn.execute(
+                    "UPDATE outbox SET status = 'sending', claimed_at = ? WHERE id = ? AND status = 'pending'",
+                    (now, row_id),
+                )
+                if cur.rowcount:
+                    claimed.append((row_id, channel, destination, json.loads(payload), attempts))
+            return claimed
+
+    def mark_delivered(self, row_id: int) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE outbox SET status = 'delivered', attempts = attempts + 1, last_error = NULL"
+                " WHERE id = ?", (row_id,)
+            )
+
+    def mark_failed(self, row_id: int, error: str, retry_at: Optional[float]) -> None:
+        with self._lock, self._conn:
+            if retry_at is None:
+                self._conn.execute(
+                    "UPDATE outbox SET status = 'failed', attempts = attempts + 1, last_error = ? WHERE id = ?",
+                    (error, row_id),
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE outbox SET status = 'pending', attempts = attempts + 1, last_error = ?,"
+                    " next_attempt_at = ? WHERE id = ?",
+                    (error, retry_at, row_id),
+                )
+
+    def requeue_inflight(self, older_than: float = NOTIFY_CLAIM_TIMEOUT) -> int:
+        """Return rows claimed more than ``older_than`` seconds ago (their worker died) to the queue."""
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "UPDATE outbox SET status = 'pending', claimed_at = NULL"
+                " WHERE status = 'sending' AND (claimed_at IS NULL OR claimed_at < ?)",
+                (time.time() - older_than,),
+            ).rowcount
+
+    def prune(self, retention_days: float = NOTIFY_RETENTION_DAYS) -> int:
+        """Delete delivered and failed rows older than the retention window."""
+        if retention_days <= 0:
+            return 0
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "DELETE FROM outbox WHERE status IN ('delivered', 'failed') AND created_at < ?",
+                (time.time() - retention_days * 86400,),
+            ).rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall()
+        return dict(rows)
+
+
+class _SmtpPool:
+    """Keeps authenticated SMTP sessions open between messages, per server."""
+
+    def __init__(self, max_idle: int = NOTIFY_SMTP_IDLE):
+        self.max_idle = max_idle
+        self._idle: Dict[Tuple, List[aiosmtplib.SMTP]] = defaultdict(list)
+        self.connections_opened = 0
+
+    @staticmethod
+    def _key(config: Dict[str, Any]) -> Tuple:
+        return (config["smtp_host"], int(config["smtp_port"]), config.get("smtp_username"),
+                bool(config.get("use_tls", True)))
+
+    async def send(self, message, config: Dict[str, Any]) -> None:
+        key = self._key(config)
+        idle = self._idle[key]
+        client = None
+        while idle and client is None:
+            candidate = idle.pop()
+            if candidate.is_connected:
+                client = candidate
+        if client is None:
+            client = aiosmtplib.SMTP(hostname=key[0], port=key[1], use_tls=key[3], timeout=NOTIFY_HTTP_TIMEOUT)
+            await client.connect()
+            if config.get("smtp_password"):
+                await client.login(config["smtp_username"], config["smtp_password"])
+            self.connections_opened += 1
+        try:
+            await client.send_message(message)
+        except Exception:
+            client.close()
+            raise
+        if len(idle) < self.max_idle:
+            idle.append(client)
+        else:
+            await client.quit()
+
+    async def close(self) -> None:
+        for clients in self._idle.values():
+            for client in clients:
+                try:
+                    await client.quit()
+                except Exception:
+                    client.close()
+        self._idle.clear()
+
+
+class _Window:
+    """Open coalescing window for one rule."""
+
+    __slots__ = ("rule", "detections", "timer")
+
+    def __init__(self, rule: Any):
+        self.rule = rule
+        self.detections: List[Dict[str, Any]] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+def _coalesce_settings(rule: Any) -> Tuple[float, int]:
+    """Per-rule (max delay, max batch); rule config overrides the env defaults."""
+    config = rule.notification_config or {}
+    max_delay = float(config.get("coalesce_max_delay", NOTIFY_COALESCE_MAX_DELAY))
+    max_batch = int(config.get("coalesce_max_batch", NOTIFY_COALESCE_MAX_BATCH))
+    return max_delay, max_batch
+
+
+class NotificationDispatcher:
+    """Background delivery of outbox rows with retries and delivery metrics."""
+
+    def __init__(self, outbox_path: str = NOTIFY_OUTBOX_DB, workers: int = NOTIFY_WORKERS,
+                 max_attempts: int = NOTIFY_MAX_ATTEMPTS, backoff_base: float = NOTIFY_BACKOFF_BASE,
+                 backoff_max: float = NOTIFY_BACKOFF_MAX, per_destination: int = NOTIFY_PER_DESTINATION,
+                 poll_interval: float = NOTIFY_POLL_INTERVAL, claim_timeout: float = NOTIFY_CLAIM_TIMEOUT,
+                 retention_days: float = NOTIFY_RETENTION_DAYS):
+        self.outbox_path = outbox_path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.per_destination = per_destination
+        self.poll_interval = poll_interval
+        self.claim_timeout = claim_timeout
+        self.retention_days = retention_days
+        self.outbox: Optional[Outbox] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._limits: Dict[str, asyncio.Semaphore] = {}
+        self._http: Optional[httpx.AsyncClient] = None
+        self._smtp = _SmtpPool()
+        self._windows: Dict[int, _Window] = {}
+        self._flushes: set = set()
+        self.digests_sent = 0
+        self.suppressed = 0
+        self.metrics: Dict[str, Dict[str, float]] = defaultdict(
+            lambda: {"enqueued": 0, "delivered": 0, "retried": 0, "failed": 0,
+                     "latency_total": 0.0, "latency_max": 0.0}
+        )
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._tasks and self._loop is loop:
+            return
+        # (Re)bind to the current loop; tasks from a closed loop are gone.
+        self._loop = loop
+        self._limits = {}
+        self._smtp = _SmtpPool()
+        self._windows = {}
+        if self.outbox is None:
+            self.outbox = Outbox(self.outbox_path)
+            await self._housekeeping()
+        self._queue = asyncio.Queue(maxsize=self.workers * 4)
+        self._wake = asyncio.Event()
+        self._http = httpx.AsyncClient(
+            timeout=NOTIFY_HTTP_TIMEOUT,
+            limits=httpx.Limits(max_connections=self.workers * self.per_destination,
+                                max_keepalive_connections=self.workers * self.per_destination),
+        )
+        self._tasks = [asyncio.create_task(self._scheduler())]
+        self._tasks += [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        # Held detections go to the outbox rather than being lost
+        for rule_id in list(self._windows):
+            await self._flush(rule_id, close=True)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        await self._smtp.close()
+
+    async def submit(self, rule: Any, detection: Dict[str, Any]) -> Optional[int]:
+        """Render and persist a notification; delivery happens in the background.
+
+        Returns the outbox row id, or None when the detection was held for a
+        digest (or the rule has nothing to deliver here).
+        """
+        if rule.notification_type not in ("email", "webhook"):
+            return None
+        max_delay, max_batch = _coalesce_settings(rule)
+        if max_delay <= 0 or max_batch <= 1:
+            return await self._send_single(rule, detection)
+        await self.start()
+        window = self._windows.get(rule.id)
+        if window is None:
+            # Leading edge: send right away and hold followers for a digest
+            window = _Window(rule)
+            self._windows[rule.id] = window
+            window.timer = self._loop.call_later(max_delay, self._on_window_timer, rule.id)
+            return await self._send_single(rule, detection)
+        window.rule = rule
+        window.detections.append(detection)
+        if len(window.detections) >= max_batch:
+            await self._flush(rule.id)
+        return None
+
+    async def _send_single(self, rule: Any, detection: Dict[str, Any]) -> Optional[int]:
+        rendered = render_notification(rule, detection)
+        if rendered is None:
+            return None
+        channel, destination, payload = rendered
+        return await self.enqueue(channel, destination, payload)
+
+    def _on_window_timer(self, rule_id: int) -> None:
+        task = asyncio.create_task(self._flush(rule_id, timer=True))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, rule_id: int, timer: bool = False, close: bool = False) -> None:
+        """Send held detections as one digest.
+
+        When the window timer fires with nothing held, the window closes so
+        the next detection is sent immediately again. Otherwise it stays open
+        for another period while the storm continues.
+        """
+        window = self._windows.get(rule_id)
+        if window is None:
+            return
+        batch, window.detections = window.detections, []
+        if close or (timer and not batch):
+            if window.timer is not None:
+                window.timer.cancel()
+            del self._windows[rule_id]
+        elif timer:
+            max_delay, _ = _coalesce_settings(window.rule)
+            window.timer = self._loop.call_later(max_delay, self._on_window_timer, rule_id)
+        if not batch:
+            return
+        if len(batch) == 1:
+            await self._send_single(window.rule, batch[0])
+            return
+        rendered = render_digest(window.rule, batch)
+        if rendered is None:
+            return
+        channel, destination, payload = rendered
+        self.digests_sent += 1
+        self.suppressed += len(batch) - 1
+        await self.enqueue(channel, destination, payload)
+
+    async def enqueue(self, channel: str, destination: str, payload: Dict[str, Any]) -> int:
+        await self.start()
+        row_id = await asyncio.to_thread(self.outbox.add, channel, destination, payload)
+        self.metrics[channel]["enqueued"] += 1
+        self._wake.set()
+        return row_id
+
+    async def _housekeeping(self) -> None:
+        """Requeue abandoned claims and prune finished rows."""
+        try:
+            recovered = await asyncio.to_thread(self.outbox.requeue_inflight, self.claim_timeout)
+            pruned = await asyncio.to_thread(self.outbox.prune, self.retention_days)
+        except Exception as e:
+            logger.error(f"Notification outbox housekeeping failed: {e}")
+            return
+        if recovered:
+            logger.info(f"Re-queued {recovered} abandoned notification(s) from the outbox")
+        if pruned:
+            logger.info(f"Pruned {pruned} finished notification(s) from the outbox")
+
+    async def _scheduler(self) -> None:
+        """Move due outbox rows onto the in-memory work queue."""
+        housekeeping_at = time.monotonic() + NOTIFY_HOUSEKEEPING_INTERVAL
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if time.monotonic() >= housekeeping_at:
+                housekeeping_at = time.monotonic() + NOTIFY_HOUSEKEEPING_INTERVAL
+                await self._housekeeping()
+            free = self._queue.maxsize - self._queue.qsize()
+            if free <= 0:
+                continue
+            try:
+                rows = await asyncio.to_thread(self.outbox.claim_due, free)
+            except Exception as e:
+                logger.error(f"Failed to read notification outbox: {e}")
+                continue
+            for row in rows:
+                await self._queue.put(row)
+
+    async def _worker(self) -> None:
+        while True:
+            row = await self._queue.get()
+            try:
+                await self._process(*row)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Notification worker error: {e}")
+
+    async def _process(self, row_id: int, channel: str, destination: str,
+                       payload: Dict[str, Any], attempts: int) -> None:
+        limit = self._limits.setdefault(_destination_key(channel, destination, payload),
+                                        asyncio.Semaphore(self.per_destination))
+        started = time.perf_counter()
+        try:
+            async with limit:
+                await self._deliver(channel, destination, payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await self._on_failure(row_id, channel, attempts + 1, e)
+            return
+        await asyncio.to_thread(self.outbox.mark_delivered, row_id)
+        elapsed = time.perf_counter() - started
+        m = self.metrics[channel]
+        m["delivered"] += 1
+        m["latency_total"] += elapsed
+        m["latency_max"] = max(m["latency_max"], elapsed)
+
+    async def _on_failure(self, row_id: int, channel: str, attempts: int, error: Exception) -> None:
+        if attempts >= self.max_attempts:
+            self.metrics[channel]["failed"] += 1
+            logger.error(f"Giving up on {channel} notification {row_id} after {attempts} attempts: {error}")
+            await asyncio.to_thread(self.outbox.mark_failed, row_id, str(error), None)
+            return
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+        delay *= random.uniform(0.8, 1.2)
+        self.metrics[channel]["retried"] += 1
+        logger.warning(f"{channel} notification {row_id} failed (attempt {attempts}), retrying in {delay:.1f}s: {error}")
+        await asyncio.to_thread(self.outbox.mark_failed, row_id, str(error), time.time() + delay)
+        # Wake the scheduler when the retry becomes due
+        asyncio.get_running_loop().call_later(delay, self._wake.set)
+
+    async def _deliver(self, channel: str, destination: str, payload: Dict[str, Any]) -> None:
+        config = payload.get("config", {})
+        if channel == "webhook":
+            headers = {"Content-Type": "application/json", **config.get("headers", {})}
+            response = await self._http.post(destination, json=payload["json"], headers=headers)
+            response.raise_for_status()
+        elif channel == "email":
+            message = build_email_message(destination, payload["subject"], payload["body"], config)
+            await self._smtp.send(message, config)
+        else:
+            raise ValueError(f"Unknown notification channel: {channel}")
+
+    def stats(self) -> Dict[str, Any]:
+        channels = {}
+        for channel, m in self.metrics.items():
+            channels[channel] = {
+                **{k: v for k, v in m.items() if k != "latency_total"},
+                "latency_avg": (m["latency_total"] / m["delivered"]) if m["delivered"] else 0.0,
+            }
+        return {
+            "running": self.running,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "outbox": self.outbox.counts() if self.outbox is not None else {},
+            "smtp_connections_opened": self._smtp.connections_opened,
+            "coalescing_windows": len(self._windows),
+            "digests_sent": self.digests_sent,
+            "suppressed": self.suppressed,
+            "channels": channels,
+        }
+
+
+def _destination_key(channel: str, destination: str, payload: Dict[str, Any]) -> str:
+    """Concurrency is limited per SMTP server or per webhook host."""
+    if channel == "email":
+        config = payload.get("config", {})
+        return f"smtp://{config.get('smtp_host')}:{config.get('smtp_port')}"
+    return f"{channel}://{urlparse(destination).netloc}"
+
+
+dispatcher = NotificationDispatcher()
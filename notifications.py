@@ -3,12 +3,78 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import httpx
 import json
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 import logging
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+def build_email_message(to_email: str, subject: str, body: str, config: Dict[str, str]) -> MIMEMultipart:
+    """Build the MIME message for an email notification."""
+    message = MIMEMultipart()
+    message["From"] = config.get("from_email", config.get("smtp_username", ""))
+    message["To"] = to_email
+    message["Subject"] = subject
+    message.attach(MIMEText(body, "plain"))
+    return message
+
+def render_notification(rule: Any, detection: Dict[str, Any]) -> Optional[Tuple[str, str, Dict[str, Any]]]:
+    """Render a rule/detection pair into (channel, destination, payload).
+
+    Returns None for notification types delivered elsewhere (browser).
+    """
+    config = rule.notification_config or {}
+    if rule.notification_type == "email":
+        subject = f"Alert: {detection['name']} detected on camera {detection['camera_id']}"
+        body = f"""
+Face Detection Alert
+
+Person: {detection['name']}
+Camera: {detection['camera_id']}
+Time: {detection['timestamp']}
+Image: {detection['filename']}
+            """
+        return "email", config["to_email"], {"subject": subject, "body": body, "config": config}
+    if rule.notification_type == "webhook":
+        payload = {
+            "alert_rule": rule.name,
+            "detection": detection,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        return "webhook", config["webhook_url"], {"json": payload, "config": config}
+    # Browser notifications are handled by WebSocket
+    # in the main server code
+    return None
+
+def render_digest(rule: Any, detections: List[Dict[str, Any]]) -> Optional[Tuple[str, str, Dict[str, Any]]]:
+    """Render several detections for one rule into a single digest notification."""
+    config = rule.notification_config or {}
+    if rule.notification_type == "email":
+        people = sorted({d['name'] for d in detections})
+        subject = f"Alert digest: {len(detections)} detections ({', '.join(people[:5])}) for {rule.name}"
+        lines = [
+            f"{d['timestamp']}  {d['name']}  camera {d['camera_id']}  {d['filename']}"
+            for d in detections
+        ]
+        body = f"""
+Face Detection Alert Digest
+
+Rule: {rule.name}
+Detections: {len(detections)}
+
+""" + "\n".join(lines) + "\n"
+        return "email", config["to_email"], {"subject": subject, "body": body, "config": config}
+    if rule.notification_type == "webhook":
+        payload = {
+            "alert_rule": rule.name,
+            "digest": True,
+            "count": len(detections),
+            "detections": detections,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        return "webhook", config["webhook_url"], {"json": payload, "config": config}
+    return None
+
 async def send_email_notification(
     to_email: str,
     subject: str,
@@ -17,12 +83,7 @@ async def send_email_notification(
 ):
     """Send an email notification using SMTP."""
     try:
-        message = MIMEMultipart()
-        message["From"] = config["smtp_username"]
-        message["To"] = to_email
-        message["Subject"] = subject
-        
-        message.attach(MIMEText(body, "plain"))
+        message = build_email_message(to_email, subject, body, config)
         
         await aiosmtplib.send(
             message,
@@ -66,41 +127,29 @@ async def process_alert_notification(
     rule: Any,
     detection: Dict[str, Any]
 ):
-    """Process an alert based on its notification type."""
-    try:
-        if rule.notification_type == "email":
-            config = rule.notification_config
-            subject = f"Alert: {detection['name']} detected on camera {detection['camera_id']}"
-            body = f"""
-Face Detection Alert
+    """Process an alert based on its notification type.
 
-Person: {detection['name']}
-Camera: {detection['camera_id']}
-Time: {detection['timestamp']}
-Image: {detection['filename']}
-            """
+    Sends inline with one-off connections; the server queues through
+    ``notification_dispatcher`` instead.
+    """
+    try:
+        rendered = render_notification(rule, detection)
+        if rendered is None:
+            return
+        channel, destination, payload = rendered
+        if channel == "email":
             await send_email_notification(
-                config["to_email"],
-                subject,
-                body,
-                config
+                destination,
+                payload["subject"],
+                payload["body"],
+                payload["config"]
             )
-            
-        elif rule.notification_type == "webhook":
-            config = rule.notification_config
-            payload = {
-                "alert_rule": rule.name,
-                "detection": detection,
-                "timestamp": datetime.utcnow().isoformat()
-            }
+        elif channel == "webhook":
             await send_webhook_notification(
-                config["webhook_url"],
-                payload,
-                config
+                destination,
+                payload["json"],
+                payload["config"]
             )
             
-        # Browser notifications are handled by WebSocket
-        # in the main server code
-            
     except Exception as e:
         logger.error(f"Failed to process notification: {e}")
\ No newline at end of file
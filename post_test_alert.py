@@ -3,17 +3,17 @@
 Quick helper to post a synthetic alert to the local FastAPI server.
 Usage:
   ./post_test_alert.py --name Unknown --camera 1 --filename test.jpg --suspicious
+  ./post_test_alert.py --transport ipc --count 500   # compare ingest latency/CPU per alert
 """
 import argparse
 from datetime import datetime
 import json
+import socket
 import sys
+import time
+import uuid
 
-try:
-    import requests
-except Exception:
-    print("Please install requests: pip install requests", file=sys.stderr)
-    sys.exit(2)
+from alert_transport import ALERT_SOCKET, encode_frame, recv_frame
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--name", default="Unknown")
@@ -22,6 +22,10 @@ parser.add_argument("--filename", default="test.jpg")
 parser.add_argument("--iso", action="store_true", help="Use ISO timestamp instead of legacy format")
 parser.add_argument("--suspicious", action="store_true")
 parser.add_argument("--host", default="http://127.0.0.1:8000")
+parser.add_argument("--transport", choices=["http", "ipc"], default="http",
+                    help="http: one POST per alert (the watcher's old path); ipc: framed alerts on ALERT_SOCKET")
+parser.add_argument("--socket", default=ALERT_SOCKET)
+parser.add_argument("--count", type=int, default=1, help="send this many alerts and report latency/CPU per alert")
 args = parser.parse_args()
 
 now = datetime.utcnow()
@@ -38,6 +42,40 @@ payload = {
     "suspicious": bool(args.suspicious)
 }
 
-r = requests.post(f"{args.host}/alerts", json=payload, timeout=3)
-r.raise_for_status()
-print("Posted:", json.dumps(payload, indent=2))
+if args.transport == "http":
+    try:
+        import requests
+    except Exception:
+        print("Please install requests: pip install requests", file=sys.stderr)
+        sys.exit(2)
+
+    def send():
+        r = requests.post(f"{args.host}/alerts", json=payload, timeout=3)
+        r.raise_for_status()
+else:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(args.socket)
+
+    def send():
+        message_id = uuid.uuid4().hex
+        sock.sendall(encode_frame({"id": message_id, "alert": payload}))
+        ack = recv_frame(sock)
+        if not ack.get("ok") or ack.get("id") != message_id:
+            raise RuntimeError(f"Alert not acknowledged: {ack}")
+
+latencies = []
+cpu_start = time.process_time()
+for _ in range(args.count):
+    started = time.perf_counter()
+    send()
+    latencies.append(time.perf_counter() - started)
+cpu = time.process_time() - cpu_start
+
+if args.count == 1:
+    print("Posted:", json.dumps(payload, indent=2))
+else:
+    latencies.sort()
+    print(f"{args.transport}: {args.count} alerts, "
+          f"mean {sum(latencies) / len(latencies) * 1000:.2f} ms, "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.2f} ms, "
+          f"client CPU {cpu / args.count * 1000:.3f} ms/alert")
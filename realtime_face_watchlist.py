@@ -10,13 +10,28 @@ import cv2
 import face_recognition
 import numpy as np
 import os
+import socket
 import time
 from datetime import datetime
 import threading
-from queue import Queue
+from queue import Queue, Empty, Full
 import logging
-from typing import Dict, List, Set, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
 import imutils
+import incident_store
+from watchlist import Watchlist
+from camera_telemetry import CameraStats, CAMERA_STALL_SECONDS
+from alert_transport import AlertSender
+from capture import CameraCapture, EvidenceGrabber, open_capture, scale_box
+from regions import RegionFilter
+from adaptive_detection import ADAPTIVE_SCALE, AdaptiveScale
+from face_backends import FaceBackend
+from face_quality import QualityGate
+from frame_pipeline import Annotation, FramePool, FrameWorkspace, draw_face
+from metrics import MetricsRegistry, MetricsScope, timed
+from frame_buffer import (
+    FrameRingBuffer, ClipEncoder, CLIP_BUFFER_MB, CLIP_PRE_SECONDS, CLIP_POST_SECONDS
+)
 
 # Configure logging
 logging.basicConfig(
@@ -29,9 +44,14 @@ logger = logging.getLogger(__name__)
 FACE_DB_PATH = "faces_db"
 INCIDENTS_PATH = "incidents"
 ALERT_COOLDOWN = 10  # seconds between duplicate alerts
+# Prefix of alert idempotency keys; unique per watcher process unless pinned
+WATCHER_ID = os.getenv("WATCHER_ID") or f"{socket.gethostname()}-{os.getpid()}"
 CONFIDENCE_THRESHOLD = 0.6
+ANALYSIS_SCALE = 0.25  # full streams are shrunk 4x before detection
+SUBSTREAM_ANALYSIS_SCALE = float(os.getenv("SUBSTREAM_ANALYSIS_SCALE", "1.0"))  # substreams are already small
 FRAME_WIDTH = 640  # Adjust for performance vs quality
 PROCESS_EVERY_N_FRAMES = 2  # Skip frames for better performance
+CLIPS_ENABLED = os.getenv("CLIPS_ENABLED", "1") == "1"  # Pre/post-event clips on alert
 
 # Default camera sources - can be camera indices (0, 1) or RTSP URLs
 DEFAULT_CAMERAS = [0]  # Add more camera indices or RTSP URLs here
@@ -67,20 +87,55 @@ class FaceRecognitionSystem:
         
         Args:
             camera_sources: List of camera sources (indices or RTSP URLs).
-                          Defaults to DEFAULT_CAMERAS if None.
+                          Defaults to DEFAULT_CAMERAS if None; pass [] to start
+                          without cameras and add them later.
         """
-        self.known_face_encodings: List[np.ndarray] = []
-        self.known_face_names: List[str] = []
+        # Known faces; encodings are cached per image and reloaded incrementally
+        self.watchlist = Watchlist(FACE_DB_PATH)
         self.last_alerts: Dict[str, float] = {}
-        self.camera_queues: List[Queue] = []
-        self.camera_threads: List[threading.Thread] = []
+        # Cameras are keyed by camera id and can be added/removed while running
+        self.camera_sources: Dict[int, Any] = {}
+        self.camera_names: Dict[int, Optional[str]] = {}
+        # Main-stream sources of cameras analysed on a substream
+        self.camera_evidence: Dict[int, Any] = {}
+        # Regions of interest / exclusion masks of cameras that have them
+        self.camera_regions: Dict[int, RegionFilter] = {}
+        # Detection scale learned per camera from the faces it sees
+        self.camera_scales: Dict[int, AdaptiveScale] = {}
+        # Detector/encoder per camera; cameras without a choice use the default
+        self.default_backend = FaceBackend()
+        self.camera_backends: Dict[int, FaceBackend] = {}
+        # Skips encoding faces too small, blurred, dark or turned away to match
+        self.quality = QualityGate()
+        # Per-stage latency histograms, published in status for the server's /metrics
+        self.metrics = MetricsRegistry()
+        self.camera_metrics: Dict[int, MetricsScope] = {}
+        self.camera_queues: Dict[int, Queue] = {}
+        self.camera_threads: Dict[int, threading.Thread] = {}
+        self.camera_stops: Dict[int, threading.Event] = {}
+        self.camera_stats: Dict[int, CameraStats] = {}
+        self.cameras_lock = threading.Lock()
         self.processing_thread: threading.Thread = None
+        self.watchdog_thread: threading.Thread = None
         self.is_running = False
-        # Thread-safe store for latest processed frames to be displayed by main thread
-        self.latest_frames: Dict[int, np.ndarray] = {}
+        # Paused: cameras keep capturing (and buffering clips) but no recognition runs
+        self.paused = False
+        # Latest processed frame and its annotations per camera, displayed by the main thread
+        self.latest_frames: Dict[int, Tuple[np.ndarray, List[Annotation]]] = {}
+        # Recycled capture buffers and reused scratch buffers per camera
+        self.frame_pools: Dict[int, FramePool] = {}
+        self.camera_workspaces: Dict[int, FrameWorkspace] = {}
         self.frame_lock = threading.Lock()
-        # Store camera sources
-        self.camera_sources = [parse_camera_source(src) for src in (camera_sources or DEFAULT_CAMERAS)]
+        # Per-camera JPEG ring buffers feeding the background clip encoder
+        self.frame_buffers: Dict[int, FrameRingBuffer] = {}
+        self.clip_encoder = ClipEncoder(INCIDENTS_PATH) if CLIPS_ENABLED else None
+        # Keeps main streams open so incidents get the full-resolution frame they were seen in
+        self.evidence = EvidenceGrabber()
+        # Acknowledged alert delivery (Unix socket, HTTP fallback, disk spool)
+        self.alert_sender = AlertSender(metrics=self.metrics)
+        # Store camera sources; command-line cameras are numbered from 0
+        for i, src in enumerate(DEFAULT_CAMERAS if camera_sources is None else camera_sources):
+            self.camera_sources[i] = parse_camera_source(src)
         
         # Ensure required directories exist
         os.makedirs(INCIDENTS_PATH, exist_ok=True)
@@ -88,170 +143,220 @@ class FaceRecognitionSystem:
         # Load known faces
         self._load_known_faces()
 
-    def _load_known_faces(self) -> None:
-        """Load and encode all known faces from the faces_db directory."""
+    def _load_known_faces(self) -> Dict[str, float]:
+        """Load known faces from faces_db, re-encoding only new or changed images."""
         logger.info("Loading known faces...")
-        
-        if not os.path.exists(FACE_DB_PATH):
-            logger.error(f"Face database directory '{FACE_DB_PATH}' not found!")
-            return
-            
-        for person_name in os.listdir(FACE_DB_PATH):
-            person_dir = os.path.join(FACE_DB_PATH, person_name)
-            if not os.path.isdir(person_dir):
-                continue
-                
-            for image_name in os.listdir(person_dir):
-                if not image_name.lower().endswith(('.png', '.jpg', '.jpeg')):
-                    continue
-                    
-                image_path = os.path.join(person_dir, image_name)
-                try:
-                    # Load and encode face
-                    face_image = face_recognition.load_image_file(image_path)
-                    face_encodings = face_recognition.face_encodings(face_image)
-                    
-                    if face_encodings:
-                        self.known_face_encodings.append(face_encodings[0])
-                        self.known_face_names.append(person_name)
-                        logger.info(f"Loaded face: {person_name} ({image_name})")
-                    else:
-                        logger.warning(f"No face found in {image_path}")
-                        
-                except Exception as e:
-                    logger.error(f"Error loading {image_path}: {str(e)}")
-        
-        logger.info(f"Loaded {len(self.known_face_encodings)} faces")
+        return self.watchlist.reload()
 
-    def _process_frame(self, frame: np.ndarray, camera_id: int) -> Tuple[np.ndarray, Set[str]]:
+    def reload_watchlist(self) -> Dict[str, float]:
+        """Pick up added/removed face images without restarting."""
+        return self._load_known_faces()
+
+    def _process_frame(self, frame: np.ndarray, camera_id: int, frame_seq: Optional[int] = None,
+                       captured_at: Optional[float] = None) -> Tuple[List[Annotation], Set[str]]:
         """
         Process a single frame to detect and recognize faces.
         
         Args:
-            frame: The frame to process
+            frame: The frame to process (read-only; boxes go into the annotations)
             camera_id: ID of the camera that captured the frame
+            frame_seq: Per-camera frame number, for alert idempotency keys
+            captured_at: Wall-clock capture time, to match main-stream evidence
             
         Returns:
-            Tuple of processed frame and set of detected names
+            Tuple of face annotations and set of detected names
         """
-        # Resize frame for faster processing
-        small_frame = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
-        # Convert BGR to RGB and ensure the array is contiguous for dlib bindings
-        rgb_small_frame = np.ascontiguousarray(small_frame[:, :, ::-1])  # BGR to RGB
+        workspace = self._workspace(camera_id)
+        metrics = self._metrics(camera_id)
+        # Only the region of interest is searched; offsets map boxes back to the frame
+        region = self.camera_regions.get(camera_id)
+        view, (offset_x, offset_y) = region.crop(frame) if region is not None else (frame, (0, 0))
+        detector = self._detection_scale(camera_id)
+        backend = self.camera_backends.get(camera_id, self.default_backend)
+        allow = None
+        if region is not None:
+            # Faces outside the ROIs or inside a mask are dropped before encoding
+            height, width = frame.shape[:2]
+            allow = lambda box: region.allows(  # noqa: E731
+                (box[0] + offset_y, box[1] + offset_x, box[2] + offset_y, box[3] + offset_x), width, height)
 
-        # Find faces in frame
-        face_locations = face_recognition.face_locations(rgb_small_frame)
-        try:
-            face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
-        except Exception as e:
-            logger.error(f"Error computing face encodings: {e}")
-            face_encodings = []
+        known_encodings, known_names = self.watchlist.snapshot()
+
+        # Find faces at the camera's learned scale, refining small ones in crops
+        faces = []
+        for detection in detector.detect(view, backend.detect, allow, workspace, metrics):
+            if not detection.locations:
+                continue
+            with timed(metrics.histogram("quality")):
+                kept = self.quality.filter(detection.image, detection.locations, backend.landmarks)
+            if not kept:
+                continue
+            try:
+                with timed(metrics.histogram("encode")):
+                    encodings = backend.encode(detection.image, [detection.locations[i] for i, _ in kept])
+            except Exception as e:
+                logger.error(f"Error computing face encodings: {e}")
+                continue
+            # Scale back face locations into frame coordinates
+            for (i, quality), encoding in zip(kept, encodings):
+                top, right, bottom, left = detection.boxes[i]
+                box = (top + offset_y, right + offset_x, bottom + offset_y, left + offset_x)
+                faces.append((box, encoding, quality.as_dict()))
         
         detected_names = set()
+        annotations = []
+        matching = 0.0  # incident writes inside the loop are timed separately
         
         # Process each detected face
-        for (top, right, bottom, left), face_encoding in zip(face_locations, face_encodings):
-            # Scale back face locations
-            top *= 4
-            right *= 4
-            bottom *= 4
-            left *= 4
+        for (top, right, bottom, left), face_encoding, quality in faces:
             
             # Compare with known faces
+            started = time.perf_counter()
             matches = face_recognition.compare_faces(
-                self.known_face_encodings,
+                known_encodings,
                 face_encoding,
                 tolerance=CONFIDENCE_THRESHOLD
             )
             
             name = "Unknown"
+            best_match_index = None
             if True in matches:
                 # Find best match
                 face_distances = face_recognition.face_distance(
-                    self.known_face_encodings,
+                    known_encodings,
                     face_encoding
                 )
                 best_match_index = np.argmin(face_distances)
+            matching += time.perf_counter() - started
+            
+            if best_match_index is not None and matches[best_match_index]:
+                name = known_names[best_match_index]
+                detected_names.add(name)
+                
+                # Check alert cooldown
+                current_time = time.time()
+                last_alert_time = self.last_alerts.get(name, 0)
                 
-                if matches[best_match_index]:
-                    name = self.known_face_names[best_match_index]
-                    detected_names.add(name)
-                    
-                    # Check alert cooldown
-                    current_time = time.time()
-                    last_alert_time = self.last_alerts.get(name, 0)
-                    
-                    if current_time - last_alert_time >= ALERT_COOLDOWN:
-                        self.last_alerts[name] = current_time
-                        self._log_incident(frame, name, camera_id)
+                if current_time - last_alert_time >= ALERT_COOLDOWN:
+                    self.last_alerts[name] = current_time
+                    self._log_incident(frame, name, camera_id, frame_seq, (top, right, bottom, left), quality,
+                                       captured_at)
             
-            # Draw box and label
-            color = (0, 0, 255) if name != "Unknown" else (255, 0, 0)
-            cv2.rectangle(frame, (left, top), (right, bottom), color, 2)
-            cv2.rectangle(frame, (left, bottom - 35),
-                         (right, bottom), color, cv2.FILLED)
-            cv2.putText(frame, name, (left + 6, bottom - 6),
-                       cv2.FONT_HERSHEY_DUPLEX, 0.6, (255, 255, 255), 1)
+            annotations.append(Annotation((top, right, bottom, left), name))
         
-        return frame, detected_names
+        if faces:
+            metrics.observe("match", matching)
+        return annotations, detected_names
+
+    def _detection_scale(self, camera_id: int) -> AdaptiveScale:
+        detector = self.camera_scales.get(camera_id)
+        if detector is None:
+            # Full streams start shrunk 4x; a substream is analysed as delivered
+            scale = SUBSTREAM_ANALYSIS_SCALE if camera_id in self.camera_evidence else ANALYSIS_SCALE
+            detector = AdaptiveScale(scale) if ADAPTIVE_SCALE else AdaptiveScale.fixed(scale)
+            self.camera_scales[camera_id] = detector
+        return detector
+
+    def _workspace(self, camera_id: int) -> FrameWorkspace:
+        workspace = self.camera_workspaces.get(camera_id)
+        if workspace is None:
+            workspace = self.camera_workspaces[camera_id] = FrameWorkspace()
+        return workspace
+
+    def _metrics(self, camera_id: int) -> MetricsScope:
+        scope = self.camera_metrics.get(camera_id)
+        if scope is None:
+            scope = self.camera_metrics[camera_id] = self.metrics.scope(camera=camera_id)
+        return scope
 
-    def _log_incident(self, frame: np.ndarray, name: str, camera_id: int) -> None:
+    def _log_incident(self, frame: np.ndarray, name: str, camera_id: int,
+                      frame_seq: Optional[int] = None, box: Optional[Tuple[int, int, int, int]] = None,
+                      quality: Optional[Dict[str, Any]] = None, captured_at: Optional[float] = None) -> None:
         """Log a detection incident with snapshot.
 
         We generate two timestamp formats:
         - filename_timestamp: legacy compact format for filenames
         - iso_timestamp: full ISO8601 for API / analytics consumption
+
+        Cameras analysed on a substream take the snapshot from their main
+        stream instead: the kept main-stream frame captured nearest the
+        analysed one, with the face box rescaled onto it. Its distance in time
+        goes out with the alert as ``evidence_offset_ms``. When no main-stream
+        frame is close enough (stream down, or past the deadline), the
+        analysis frame is saved with its box instead. The alert is sent once
+        the snapshot is saved.
         """
+        trigger_ts = time.time()
         filename_timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
         iso_timestamp = datetime.utcnow().isoformat()
         filename = f"{filename_timestamp}_cam{camera_id}_{name}.jpg"
-        filepath = os.path.join(INCIDENTS_PATH, filename)
-
-        cv2.imwrite(filepath, frame)
         logger.warning(f"⚠️ Alert! {name} detected on camera {camera_id}")
+        buffer = self.frame_buffers.get(camera_id)
+        if self.clip_encoder is not None and buffer is not None:
+            self.clip_encoder.submit(buffer, filename, trigger_ts)
+        evidence_source = self.camera_evidence.get(camera_id)
+        if evidence_source is None or box is None:
+            # Composed into a reused buffer; it is encoded before this returns
+            snapshot = frame if box is None else self._workspace(camera_id).compose(
+                frame, [Annotation(box, name)], slot="snapshot")
+            self._save_incident(snapshot, name, camera_id, filename, iso_timestamp, frame_seq, quality)
+            return
+        analysis_frame = frame.copy()  # the pooled frame is recycled before the main stream answers
+
+        def snapshot_ready(main_frame: Optional[np.ndarray], offset_ms: Optional[float]) -> None:
+            if main_frame is None:
+                # The box is only known to be right on the frame it was found in
+                snapshot, box_on_snapshot = analysis_frame, box
+            else:
+                snapshot, box_on_snapshot = main_frame, scale_box(box, analysis_frame.shape, main_frame.shape)
+            draw_face(snapshot, box_on_snapshot, name)
+            self._save_incident(snapshot, name, camera_id, filename, iso_timestamp, frame_seq, quality,
+                                offset_ms)
+
+        self.evidence.request(camera_id, trigger_ts if captured_at is None else captured_at, snapshot_ready)
+
+    def _save_incident(self, snapshot: np.ndarray, name: str, camera_id: int, filename: str,
+                       iso_timestamp: str, frame_seq: Optional[int] = None,
+                       quality: Optional[Dict[str, Any]] = None, evidence_offset_ms: Optional[float] = None) -> None:
+        with timed(self._metrics(camera_id).histogram("incident_write")):
+            ok, encoded = cv2.imencode(".jpg", snapshot)
+            if ok:
+                incident_store.save_incident(filename, encoded.tobytes(), INCIDENTS_PATH)
+            else:
+                logger.error(f"Failed to encode snapshot for {filename}")
         logger.info(f"Incident logged: {filename}")
-        # Try to POST alert to local FastAPI server (non-blocking, best-effort)
+        # Hand the alert to the sender (non-blocking; spooled if the server is down)
         try:
-            self._post_alert(name, camera_id, iso_timestamp, filename)
+            self._post_alert(name, camera_id, iso_timestamp, filename, frame_seq, quality, evidence_offset_ms)
         except Exception as e:
             logger.debug(f"Failed to send alert to local server: {e}")
 
-    def _post_alert(self, name: str, camera_id: int, timestamp: str, filename: str) -> None:
-        """Best-effort POST to local FastAPI server at http://127.0.0.1:8000/alerts"""
+    def _post_alert(self, name: str, camera_id: int, timestamp: str, filename: str,
+                    frame_seq: Optional[int] = None, quality: Optional[Dict[str, Any]] = None,
+                    evidence_offset_ms: Optional[float] = None) -> None:
+        """Queue the alert for the server; delivery happens on the sender thread.
+
+        The idempotency key names this exact detection, so the server stores it
+        once however often retries and spool replays deliver it.
+        """
         payload = {
             "name": name,
             "camera_id": camera_id,
             "timestamp": timestamp,
             "filename": filename,
-            "suspicious": (name == "Unknown")  # Flag unknown persons as suspicious
+            "suspicious": (name == "Unknown"),  # Flag unknown persons as suspicious
+            "camera_name": self.camera_names.get(camera_id),
         }
-        url = "http://127.0.0.1:8000/alerts"
-        # Try requests if available, otherwise use urllib
-        try:
-            import requests
-            try:
-                requests.post(url, json=payload, timeout=0.8)
-            except Exception:
-                # swallow any network error to avoid blocking main loop
-                pass
-            return
-        except Exception:
-            pass
+        if frame_seq is not None:
+            payload["key"] = f"{WATCHER_ID}:{camera_id}:{frame_seq}:{name}"
+        if quality is not None:
+            payload["quality"] = quality
+        if evidence_offset_ms is not None:
+            # The snapshot is a main-stream frame captured this far from the analysed one
+            payload["evidence_offset_ms"] = evidence_offset_ms
+        self.alert_sender.send(payload)
 
-        # Fallback to urllib
-        try:
-            import json as _json
-            from urllib import request as _request
-            data = _json.dumps(payload).encode("utf-8")
-            req = _request.Request(url, data=data, headers={"Content-Type": "application/json"})
-            # Use a short timeout
-            with _request.urlopen(req, timeout=0.8) as resp:
-                _ = resp.read()
-        except Exception:
-            # ignore failures — server is optional
-            return
-
-    def _camera_thread(self, camera_id: int, source: str, queue: Queue) -> None:
+    def _camera_thread(self, camera_id: int, source: str, queue: Queue, stop: threading.Event) -> None:
         """
         Thread function to capture frames from a camera or RTSP stream.
         
@@ -259,102 +364,324 @@ class FaceRecognitionSystem:
             camera_id: Numeric ID for this camera thread
             source: Camera index (int) or RTSP URL (str)
             queue: Queue to put captured frames into
+            stop: Set when this camera is removed or the system stops
         """
-        # For RTSP streams, set additional options
-        cap = cv2.VideoCapture(source)
-        if isinstance(source, str) and source.startswith(('rtsp://', 'rtmp://')):
-            cap.set(cv2.CAP_PROP_BUFFERSIZE, 2)  # Minimize latency
-        
-        if not cap.isOpened():
-            logger.error(f"Failed to open camera {camera_id} (source: {source})")
-            return
-            
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, FRAME_WIDTH)
+        buffer = None
+        if self.clip_encoder is not None:
+            buffer = FrameRingBuffer(
+                max_bytes=int(CLIP_BUFFER_MB * 1024 * 1024),
+                max_seconds=CLIP_PRE_SECONDS + CLIP_POST_SECONDS + 1,
+            )
+            self.frame_buffers[camera_id] = buffer
+            logger.info(f"Camera {camera_id} clip buffer capped at {CLIP_BUFFER_MB:.1f} MB")
+        stats = self.camera_stats.get(camera_id) or CameraStats()
+        # Frames are decoded into recycled buffers; whoever drops a frame releases it
+        pool = self.frame_pools.get(camera_id) or FramePool()
+        self.frame_pools[camera_id] = pool
+        # Reconnects with backoff on its own and hands over only the freshest frame
+        capture = CameraCapture(source, stats, name=f"camera {camera_id}",
+                                opener=lambda src: open_capture(src, FRAME_WIDTH), pool=pool,
+                                metrics=self._metrics(camera_id))
         frame_count = 0
-        fps_start = time.time()
-        fps = 0
         
-        while self.is_running:
-            ret, frame = cap.read()
-            if not ret:
-                logger.error(f"Failed to read frame from camera {camera_id}")
+        for frame, captured_at in capture.frames(stop):
+            if not self.is_running:
+                pool.release(frame)
                 break
-                
             frame_count += 1
+            stats.frame(time.thread_time())
+            # The original stays untouched; overlays are drawn into composed copies
+            frame.flags.writeable = False
+            if buffer is not None:
+                buffer.add(frame)
             
-            # Calculate FPS
-            if frame_count % 30 == 0:
-                fps = 30 / (time.time() - fps_start)
-                fps_start = time.time()
-            
-            # Add FPS counter
-            cv2.putText(frame, f"FPS: {fps:.1f}", (10, 30),
-                       cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-            
-            # Only process every Nth frame
-            if frame_count % PROCESS_EVERY_N_FRAMES == 0:
-                queue.put((frame, camera_id))
-        
-        cap.release()
+            # Only process every Nth frame. When the recogniser is behind,
+            # drop the oldest queued frame so it always works on the freshest
+            # one and capture never blocks.
+            if frame_count % PROCESS_EVERY_N_FRAMES != 0:
+                pool.release(frame)
+                continue
+            item = (frame, camera_id, stats.frames, captured_at, time.perf_counter())
+            try:
+                queue.put_nowait(item)
+            except Full:
+                try:
+                    pool.release(queue.get_nowait()[0])
+                    stats.drop()
+                except Empty:
+                    pass
+                try:
+                    queue.put_nowait(item)
+                except Full:
+                    pool.release(frame)
+                    stats.drop()
+
+    def get_buffer_stats(self) -> Dict[int, Dict[str, float]]:
+        """Report ring-buffer memory usage per camera."""
+        return {camera_id: buf.stats() for camera_id, buf in self.frame_buffers.items()}
 
     def _processing_thread(self) -> None:
         """Thread function to process frames from all cameras."""
         while self.is_running:
             # Process frames from all cameras
-            for q in self.camera_queues:
-                if not q.empty():
-                    frame, camera_id = q.get()
-                    processed_frame, detected_names = self._process_frame(frame, camera_id)
-
-                    # Store the processed frame for the main thread to display.
-                    with self.frame_lock:
-                        self.latest_frames[camera_id] = processed_frame
+            for q in list(self.camera_queues.values()):
+                try:
+                    frame, camera_id, frame_seq, captured_at, enqueued = q.get_nowait()
+                except Empty:
+                    continue
+                metrics = self._metrics(camera_id)
+                metrics.observe("queue_wait", time.perf_counter() - enqueued)
+                pool = self.frame_pools.get(camera_id)
+                if self.paused:
+                    if pool is not None:
+                        pool.release(frame)
+                    continue
+                started, cpu_started = time.perf_counter(), time.thread_time()
+                annotations, detected_names = self._process_frame(frame, camera_id, frame_seq, captured_at)
+                elapsed = time.perf_counter() - started
+                metrics.observe("recognize", elapsed)
+                stats = self.camera_stats.get(camera_id)
+                if stats is not None:
+                    stats.recognized(elapsed, time.thread_time() - cpu_started, frame_age=time.time() - captured_at)
+
+                # Store the processed frame for the main thread to display;
+                # the one it replaces goes back to the pool.
+                with self.frame_lock:
+                    previous = self.latest_frames.get(camera_id)
+                    self.latest_frames[camera_id] = (frame, annotations)
+                    if previous is not None and pool is not None:
+                        pool.release(previous[0])
             # small yield to avoid busy loop
             time.sleep(0.01)
 
-    def start(self) -> None:
-        """Start the face recognition system."""
-        if not self.known_face_encodings:
-            logger.error("No known faces loaded! Add face images to faces_db/ directory.")
+    def _watchdog_thread(self) -> None:
+        """Restart cameras whose capture thread died or stopped delivering frames."""
+        while self.is_running:
+            time.sleep(1.0)
+            with self.cameras_lock:
+                for camera_id, source in list(self.camera_sources.items()):
+                    thread = self.camera_threads.get(camera_id)
+                    stats = self.camera_stats.get(camera_id)
+                    if thread is None or stats is None or not self.is_running:
+                        continue
+                    if not thread.is_alive() and stats.idle_seconds() < CAMERA_STALL_SECONDS:
+                        continue  # died recently; wait out the stall window before retrying
+                    if thread.is_alive() and (not stats.is_stalled() or not stats.connected):
+                        continue  # healthy, or its capture is already reconnecting with backoff
+                    logger.warning(f"Camera {camera_id} stalled ({stats.idle_seconds():.1f}s without a frame); restarting")
+                    # A thread stuck in cap.read() exits on its own once the read returns
+                    self.camera_stops[camera_id].set()
+                    stats.restarted()
+                    self._start_camera(camera_id, source)
+
+    def add_camera(self, camera_id: int, source: Any, name: Optional[str] = None,
+                   evidence_source: Optional[Any] = None, regions: Optional[Dict[str, Any]] = None,
+                   backend: Optional[Dict[str, Any]] = None) -> None:
+        """Start watching ``source`` as ``camera_id`` (replacing any previous source).
+
+        With ``evidence_source`` set, ``source`` is a substream used only for
+        detection and incident snapshots come from ``evidence_source``.
+        ``regions`` (``{"roi": [...], "masks": [...]}``) limits where faces count.
+        ``backend`` (``{"detector": ..., "encoder": ...}``) overrides the default face backends.
+        """
+        source = parse_camera_source(source)
+        evidence_source = parse_camera_source(evidence_source) if evidence_source is not None else None
+        with self.cameras_lock:
+            thread = self.camera_threads.get(camera_id)
+            if thread is not None and thread.is_alive() and self.camera_sources.get(camera_id) == source:
+                self.camera_names[camera_id] = name
+                self._set_evidence(camera_id, evidence_source)
+                self._set_regions(camera_id, regions)
+                self._set_backend(camera_id, backend)
+                return
+        self.remove_camera(camera_id)
+        with self.cameras_lock:
+            self.camera_sources[camera_id] = source
+            self.camera_names[camera_id] = name
+            self._set_evidence(camera_id, evidence_source)
+            self._set_regions(camera_id, regions)
+            self._set_backend(camera_id, backend)
+            if self.is_running:
+                self._start_camera(camera_id, source)
+
+    def remove_camera(self, camera_id: int) -> bool:
+        """Stop and release one camera; the rest keep running."""
+        with self.cameras_lock:
+            stop = self.camera_stops.pop(camera_id, None)
+            thread = self.camera_threads.pop(camera_id, None)
+            self.camera_queues.pop(camera_id, None)
+            self.camera_stats.pop(camera_id, None)
+            known = self.camera_sources.pop(camera_id, None) is not None
+            self.camera_names.pop(camera_id, None)
+            self.camera_evidence.pop(camera_id, None)
+            self.evidence.forget(camera_id)
+            self.camera_regions.pop(camera_id, None)
+            self.camera_scales.pop(camera_id, None)
+            self.camera_backends.pop(camera_id, None)
+            self.camera_workspaces.pop(camera_id, None)
+            self.camera_metrics.pop(camera_id, None)
+        self.metrics.discard(camera=camera_id)
+        if stop is not None:
+            stop.set()
+        if thread is not None:
+            thread.join(timeout=5)
+        self.frame_buffers.pop(camera_id, None)
+        self.frame_pools.pop(camera_id, None)
+        with self.frame_lock:
+            self.latest_frames.pop(camera_id, None)
+        return known or thread is not None
+
+    def _set_evidence(self, camera_id: int, evidence_source: Optional[Any]) -> None:
+        if (camera_id in self.camera_evidence) != (evidence_source is not None):
+            self.camera_scales.pop(camera_id, None)  # learned for the other stream's resolution
+        if evidence_source is None:
+            self.camera_evidence.pop(camera_id, None)
+            self.evidence.forget(camera_id)
+        else:
+            self.camera_evidence[camera_id] = evidence_source
+            self.evidence.watch(camera_id, evidence_source)
+
+    def _set_regions(self, camera_id: int, regions: Optional[Dict[str, Any]]) -> None:
+        region = RegionFilter.from_config(regions)
+        if region is None:
+            self.camera_regions.pop(camera_id, None)
+        else:
+            self.camera_regions[camera_id] = region
+
+    def _set_backend(self, camera_id: int, spec: Optional[Dict[str, Any]]) -> None:
+        current = self.camera_backends.get(camera_id)
+        if current is not None and current.spec == spec:
+            return
+        if spec is None:
+            self.camera_backends.pop(camera_id, None)
+            return
+        try:
+            self.camera_backends[camera_id] = FaceBackend(spec)
+        except (OSError, ValueError) as e:
+            logger.error(f"Camera {camera_id} face backend unavailable ({e}); using {self.default_backend.name}")
+            self.camera_backends.pop(camera_id, None)
+
+    def set_cameras(self, cameras: Dict[int, Tuple[Any, ...]]) -> None:
+        """Make the running camera set exactly ``{camera_id: (source, name[, evidence_source[, regions[, backend]]])}``."""
+        for camera_id in list(self.camera_sources):
+            if camera_id not in cameras:
+                self.remove_camera(camera_id)
+        for camera_id, camera in cameras.items():
+            self.add_camera(camera_id, *camera)
+
+    def _start_camera(self, camera_id: int, source: Any) -> None:
+        queue = Queue(maxsize=2)  # Limit queue size to prevent memory issues
+        stop = threading.Event()
+        thread = threading.Thread(
+            target=self._camera_thread,
+            args=(camera_id, source, queue, stop),
+            name=f"camera-{camera_id}",
+            daemon=True
+        )
+        self.camera_queues[camera_id] = queue
+        self.camera_stops[camera_id] = stop
+        self.camera_stats.setdefault(camera_id, CameraStats())
+        self.camera_threads[camera_id] = thread
+        thread.start()
+        source_desc = f"{source}" if isinstance(source, int) else f"RTSP: {source}"
+        logger.info(f"Started camera {camera_id} ({source_desc})")
+
+    def pause(self) -> None:
+        self.paused = True
+        logger.info("Recognition paused")
+
+    def resume(self) -> None:
+        self.paused = False
+        logger.info("Recognition resumed")
+
+    def status(self) -> Dict[str, Any]:
+        """Running state plus live telemetry for every camera."""
+        with self.cameras_lock:
+            cameras = {}
+            for camera_id, source in self.camera_sources.items():
+                thread = self.camera_threads.get(camera_id)
+                stats = self.camera_stats.get(camera_id)
+                queue = self.camera_queues.get(camera_id)
+                ring = self.frame_buffers.get(camera_id)
+                cameras[camera_id] = {
+                    "source": str(source),
+                    "name": self.camera_names.get(camera_id),
+                    "alive": bool(thread and thread.is_alive()),
+                    "detection_area": round(self.camera_regions[camera_id].area_fraction, 3)
+                    if camera_id in self.camera_regions else 1.0,
+                    "detection_scale": self.camera_scales[camera_id].stats()
+                    if camera_id in self.camera_scales else None,
+                    "backend": self.camera_backends.get(camera_id, self.default_backend).stats(),
+                    "frame_memory": {
+                        **(self.frame_pools[camera_id].stats() if camera_id in self.frame_pools else {}),
+                        **(self.camera_workspaces[camera_id].stats() if camera_id in self.camera_workspaces else {}),
+                    },
+                    "ring_buffer": ring.stats() if ring is not None else None,
+                    **(stats.snapshot(queue.qsize() if queue else 0) if stats else {}),
+                }
+        return {
+            "running": self.is_running,
+            "paused": self.paused,
+            "cameras": cameras,
+            "watchlist": self.watchlist.stats(),
+            "cpu_seconds": round(time.process_time(), 3),
+            "alerts": self.alert_sender.stats(),
+            "evidence": self.evidence.stats(),
+            "quality": self.quality.stats(),
+            "metrics": self.metrics.export(),
+        }
+
+    def start_workers(self) -> None:
+        """Start capture, recognition and clip threads without blocking."""
+        if self.is_running:
             return
-            
         self.is_running = True
         
         # Start camera threads
-        for i, source in enumerate(self.camera_sources):
-            queue = Queue(maxsize=2)  # Limit queue size to prevent memory issues
-            self.camera_queues.append(queue)
-            
-            thread = threading.Thread(
-                target=self._camera_thread,
-                args=(i, source, queue),
-                daemon=True
-            )
-            self.camera_threads.append(thread)
-            thread.start()
-            source_desc = f"{source}" if isinstance(source, int) else f"RTSP: {source}"
-            logger.info(f"Started camera {i} ({source_desc})")
+        with self.cameras_lock:
+            for camera_id, source in self.camera_sources.items():
+                self._start_camera(camera_id, source)
         
+        if self.clip_encoder is not None:
+            self.clip_encoder.start()
+        self.evidence.start()
+        self.alert_sender.start()
+
         # Start processing thread
         self.processing_thread = threading.Thread(
             target=self._processing_thread,
             daemon=True
         )
         self.processing_thread.start()
+        self.watchdog_thread = threading.Thread(target=self._watchdog_thread, name="camera-watchdog", daemon=True)
+        self.watchdog_thread.start()
         logger.info("Face recognition system started")
+
+    def start(self) -> None:
+        """Start the face recognition system and display camera windows."""
+        if not len(self.watchlist):
+            logger.error("No known faces loaded! Add face images to faces_db/ directory.")
+            return
+            
+        self.start_workers()
         
         try:
             # Keep main thread alive and display frames (main thread must handle GUI)
+            shown: Dict[int, Any] = {}
             while self.is_running:
-                # Display latest frames captured by processing thread
+                # Display latest frames captured by processing thread. The
+                # frame is composed with its boxes under the lock, since the
+                # processing thread recycles it once a newer one arrives.
                 with self.frame_lock:
-                    for camera_id, frame in list(self.latest_frames.items()):
-                        window_name = f"Camera {camera_id}"
+                    for camera_id, entry in list(self.latest_frames.items()):
+                        if shown.get(camera_id) is entry:
+                            continue
+                        shown[camera_id] = entry
+                        frame, annotations = entry
+                        stats = self.camera_stats.get(camera_id)
+                        fps = f"FPS: {stats.fps():.1f}" if stats is not None else None
                         try:
-                            if frame is not None and hasattr(frame, 'shape'):
-                                cv2.imshow(window_name, frame)
-                            else:
-                                logger.debug(f"No valid frame for camera {camera_id} to display")
+                            cv2.imshow(f"Camera {camera_id}", self._workspace(camera_id).compose(frame, annotations, text=fps))
                         except cv2.error as e:
                             logger.error(f"OpenCV imshow error for camera {camera_id}: {e}")
                 # Handle quit key in main thread
@@ -364,19 +691,40 @@ class FaceRecognitionSystem:
         except KeyboardInterrupt:
             self.stop()
 
-    def stop(self) -> None:
+    def stop(self, display: bool = True) -> None:
         """Stop the face recognition system."""
         self.is_running = False
         
         # Wait for threads to finish
-        for thread in self.camera_threads:
+        with self.cameras_lock:
+            threads = list(self.camera_threads.values())
+            stops = list(self.camera_stops.values())
+            self.camera_threads.clear()
+            self.camera_queues.clear()
+            self.camera_stops.clear()
+        for stop in stops:
+            stop.set()  # wakes captures waiting out a reconnect backoff
+        for thread in threads:
             thread.join()
         
         if self.processing_thread:
             self.processing_thread.join()
+            self.processing_thread = None
+
+        if self.clip_encoder is not None:
+            self.clip_encoder.stop()
+            for camera_id, stats in self.get_buffer_stats().items():
+                logger.info(f"Camera {camera_id} clip buffer: {stats['frames']} frames, "
+                            f"{stats['bytes'] / 1024 / 1024:.1f}/{stats['max_bytes'] / 1024 / 1024:.1f} MB")
         
+        # Pending main-stream snapshots still carry alerts; finish them first
+        self.evidence.stop()
+        # Deliver (or spool) alerts still queued
+        self.alert_sender.stop()
+
         # Clean up windows
-        cv2.destroyAllWindows()
+        if display:
+            cv2.destroyAllWindows()
         logger.info("Face recognition system stopped")
 
 if __name__ == "__main__":
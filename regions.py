@@ -0,0 +1,111 @@
+"""
+Per-camera regions of interest and exclusion masks.
+
+A camera's config may hold ``"roi"`` and ``"masks"``: lists of polygons,
+each a list of ``[x, y]`` points normalised to 0..1 so they hold for any
+stream resolution (substream and main stream alike). The watcher crops each
+frame to the bounding box of the ROIs before resizing and detection, which
+shrinks the detection area to that box, and discards faces whose centre
+lies outside every ROI or inside a mask.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+Polygon = List[Tuple[float, float]]
+
+CROP_MARGIN = 0.02  # fraction of the frame kept around the ROI box so edge faces are not cut
+
+
+def parse_polygons(value: Any) -> List[Polygon]:
+    """Validate a list of normalised polygons; raises ValueError."""
+    if value is None:
+        return []
+    if not isinstance(value, list):
+        raise ValueError("expected a list of polygons")
+    polygons = []
+    for polygon in value:
+        if not isinstance(polygon, list) or len(polygon) < 3:
+            raise ValueError("a polygon needs at least 3 points")
+        points = []
+        for point in polygon:
+            if not isinstance(point, (list, tuple)) or len(point) != 2:
+                raise ValueError("points are [x, y] pairs")
+            x, y = float(point[0]), float(point[1])
+            if not (0.0 <= x <= 1.0 and 0.0 <= y <= 1.0):
+                raise ValueError("point coordinates are fractions of the frame (0..1)")
+            points.append((x, y))
+        polygons.append(points)
+    return polygons
+
+
+def camera_regions(config: Optional[Dict[str, Any]]) -> Optional[Dict[str, List[Polygon]]]:
+    """``{"roi": [...], "masks": [...]}`` from a camera config, or None when it has neither."""
+    config = config or {}
+    roi, masks = parse_polygons(config.get("roi")), parse_polygons(config.get("masks"))
+    if not roi and not masks:
+        return None
+    return {"roi": roi, "masks": masks}
+
+
+def point_in_polygon(x: float, y: float, polygon: Sequence[Tuple[float, float]]) -> bool:
+    """Even-odd ray casting."""
+    inside = False
+    j = len(polygon) - 1
+    for i in range(len(polygon)):
+        xi, yi = polygon[i]
+        xj, yj = polygon[j]
+        if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+class RegionFilter:
+    """Crops frames to a camera's ROIs and filters detections by position."""
+
+    def __init__(self, roi: Sequence[Polygon] = (), masks: Sequence[Polygon] = ()):
+        self.roi = [list(p) for p in roi]
+        self.masks = [list(p) for p in masks]
+        self._boxes: Dict[Tuple[int, int], Tuple[int, int, int, int]] = {}
+        self.area_fraction = 1.0  # share of the last frame handed to detection
+
+    @classmethod
+    def from_config(cls, regions: Optional[Dict[str, Any]]) -> Optional["RegionFilter"]:
+        if not regions:
+            return None
+        return cls(parse_polygons(regions.get("roi")), parse_polygons(regions.get("masks")))
+
+    def crop_box(self, width: int, height: int) -> Tuple[int, int, int, int]:
+        """``(x0, y0, x1, y1)`` in pixels: the ROIs' bounding box plus a margin, or the whole frame."""
+        box = self._boxes.get((width, height))
+        if box is None:
+            if not self.roi:
+                box = (0, 0, width, height)
+            else:
+                xs = [x for polygon in self.roi for x, _ in polygon]
+                ys = [y for polygon in self.roi for _, y in polygon]
+                box = (
+                    max(0, int((min(xs) - CROP_MARGIN) * width)),
+                    max(0, int((min(ys) - CROP_MARGIN) * height)),
+                    min(width, int(np.ceil((max(xs) + CROP_MARGIN) * width))),
+                    min(height, int(np.ceil((max(ys) + CROP_MARGIN) * height))),
+                )
+            self._boxes[(width, height)] = box
+        return box
+
+    def crop(self, frame: np.ndarray) -> Tuple[np.ndarray, Tuple[int, int]]:
+        """A view of ``frame`` limited to the ROIs, and its ``(x, y)`` offset."""
+        height, width = frame.shape[:2]
+        x0, y0, x1, y1 = self.crop_box(width, height)
+        self.area_fraction = (x1 - x0) * (y1 - y0) / float(width * height)
+        return frame[y0:y1, x0:x1], (x0, y0)
+
+    def allows(self, box: Tuple[int, int, int, int], width: int, height: int) -> bool:
+        """Whether a ``(top, right, bottom, left)`` face box in frame pixels counts."""
+        top, right, bottom, left = box
+        x, y = (left + right) / 2.0 / width, (top + bottom) / 2.0 / height
+        if self.roi and not any(point_in_polygon(x, y, polygon) for polygon in self.roi):
+            return False
+        return not any(point_in_polygon(x, y, polygon) for polygon in self.masks)
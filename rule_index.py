@@ -0,0 +1,165 @@
+"""
+In-memory alert rule index.
+
+Enabled ``AlertRule`` rows are compiled into buckets keyed by
+(camera_id, person_name), where ``"*"`` stands for "any". Evaluating an alert
+is four dict lookups plus the per-rule cooldown check, so ingest never goes
+to the database. The rule CRUD endpoints patch the index as rules change.
+
+Cooldowns live in the index by default. With several server workers a shared
+gate (see ``state_backends.SqliteCooldowns``) is installed via
+``use_cooldowns`` so a rule fires once per cooldown across all of them; its
+checks are awaited off the event loop, and only for rules that matched.
+"""
+
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+WILDCARD = "*"
+
+BucketKey = Tuple[Any, str]
+
+
+class CompiledRule:
+    """Detached snapshot of an AlertRule with the fields notifications need."""
+
+    __slots__ = ("id", "name", "camera_id", "person_name", "cooldown",
+                 "notification_type", "notification_config", "enabled")
+
+    def __init__(self, id: int, name: str, camera_id: Optional[int], person_name: Optional[str],
+                 cooldown: Optional[int], notification_type: str,
+                 notification_config: Optional[Dict[str, Any]], enabled: bool = True):
+        self.id = id
+        self.name = name
+        self.camera_id = camera_id
+        self.person_name = person_name or WILDCARD
+        self.cooldown = cooldown or 0
+        self.notification_type = notification_type
+        self.notification_config = notification_config or {}
+        self.enabled = enabled
+
+    @classmethod
+    def from_model(cls, rule: Any) -> "CompiledRule":
+        return cls(
+            id=rule.id,
+            name=rule.name,
+            camera_id=rule.camera_id,
+            person_name=rule.person_name,
+            cooldown=rule.cooldown,
+            notification_type=rule.notification_type,
+            notification_config=rule.notification_config,
+            enabled=bool(rule.enabled),
+        )
+
+    @property
+    def key(self) -> BucketKey:
+        camera = WILDCARD if self.camera_id is None else self.camera_id
+        return camera, self.person_name
+
+
+class RuleIndex:
+    """Copy-on-write rule buckets plus per-(rule, person) cooldown state.
+
+    Mutations build new dicts under a lock and swap them in, so ``evaluate``
+    on the event loop never sees a half-updated index.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rules: Dict[int, CompiledRule] = {}
+        self._buckets: Dict[BucketKey, Tuple[CompiledRule, ...]] = {}
+        self._last_fired: Dict[Tuple[int, str], float] = {}
+        self._cooldowns: Optional[Any] = None
+        self.evaluations = 0
+        self.fired = 0
+        self.suppressed = 0
+
+    def use_cooldowns(self, cooldowns: Optional[Any]) -> None:
+        """Track cooldowns in ``cooldowns`` (async ``try_fire``/``forget``) instead of locally."""
+        self._cooldowns = cooldowns
+
+    @staticmethod
+    def _bucketize(rules: Iterable[CompiledRule]) -> Dict[BucketKey, Tuple[CompiledRule, ...]]:
+        buckets: Dict[BucketKey, List[CompiledRule]] = {}
+        for rule in rules:
+            if rule.enabled:
+                buckets.setdefault(rule.key, []).append(rule)
+        return {key: tuple(group) for key, group in buckets.items()}
+
+    def rebuild(self, rules: Iterable[Any]) -> None:
+        """Replace the whole index from ORM rows (or CompiledRules)."""
+        compiled = {r.id: (r if isinstance(r, CompiledRule) else CompiledRule.from_model(r)) for r in rules}
+        with self._lock:
+            self._rules = compiled
+            self._buckets = self._bucketize(compiled.values())
+            self._last_fired = {k: v for k, v in self._last_fired.items() if k[0] in compiled}
+
+    def upsert(self, rule: Any) -> None:
+        compiled = rule if isinstance(rule, CompiledRule) else CompiledRule.from_model(rule)
+        with self._lock:
+            rules = dict(self._rules)
+            rules[compiled.id] = compiled
+            self._rules = rules
+            self._buckets = self._bucketize(rules.values())
+
+    async def remove(self, rule_id: int) -> None:
+        with self._lock:
+            if rule_id not in self._rules:
+                return
+            rules = dict(self._rules)
+            del rules[rule_id]
+            self._rules = rules
+            self._buckets = self._bucketize(rules.values())
+            self._last_fired = {k: v for k, v in self._last_fired.items() if k[0] != rule_id}
+        if self._cooldowns is not None:
+            await self._cooldowns.forget(rule_id)
+
+    def match(self, camera_id: Any, person_name: str) -> List[CompiledRule]:
+        """All enabled rules for this camera/person, including wildcard buckets."""
+        buckets = self._buckets
+        matched: List[CompiledRule] = []
+        for key in ((camera_id, person_name), (camera_id, WILDCARD),
+                    (WILDCARD, person_name), (WILDCARD, WILDCARD)):
+            group = buckets.get(key)
+            if group:
+                matched.extend(group)
+        return matched
+
+    async def evaluate(self, alert: Dict[str, Any], now: Optional[float] = None) -> List[CompiledRule]:
+        """Return the rules that should notify for ``alert``, honouring cooldowns."""
+        cooldowns = self._cooldowns
+        if now is None:
+            # Shared cooldowns compare timestamps across processes
+            now = time.time() if cooldowns is not None else time.monotonic()
+        person = alert.get("name", "Unknown")
+        self.evaluations += 1
+        fired: List[CompiledRule] = []
+        for rule in self.match(alert.get("camera_id"), person):
+            if cooldowns is not None:
+                if await cooldowns.try_fire(rule.id, person, rule.cooldown, now):
+                    fired.append(rule)
+                else:
+                    self.suppressed += 1
+                continue
+            state_key = (rule.id, person)
+            last = self._last_fired.get(state_key)
+            if last is not None and now - last < rule.cooldown:
+                self.suppressed += 1
+                continue
+            self._last_fired[state_key] = now
+            fired.append(rule)
+        self.fired += len(fired)
+        return fired
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "rules": len(self._rules),
+            "buckets": len(self._buckets),
+            "evaluations": self.evaluations,
+            "fired": self.fired,
+            "suppressed": self.suppressed,
+        }
+
+
+rule_index = RuleIndex()
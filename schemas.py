@@ -12,8 +12,10 @@ class UserCreate(UserBase):
 
 class UserUpdate(UserBase):
     password: Optional[str] = None
+    disabled: Optional[bool] = None
 
 class User(UserBase):
+    email: Optional[EmailStr] = None  # accounts created before emails were stored
     id: int
     is_admin: bool
     disabled: bool
@@ -0,0 +1,668 @@
+"""
+Pluggable backends for state shared between server workers.
+
+``STATE_BACKEND=memory`` (default) keeps the alert log, the pub/sub bus, rule
+cooldowns, alert idempotency keys and the watcher process handle inside this
+process, which is all a
+single uvicorn worker needs. ``STATE_BACKEND=sqlite`` moves them into a local
+SQLite file (``STATE_DB``) plus a pid file, so ``uvicorn alerts_server:app
+--workers N`` behaves like one server: every worker sees every alert, sequence
+numbers are global, and WebSocket clients on any worker receive every
+broadcast.
+"""
+
+import asyncio
+import fcntl
+import json
+import os
+import signal
+import sqlite3
+import subprocess
+import threading
+import time
+import uuid
+import logging
+from collections import OrderedDict, defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from blocking import JsonFileWriter, run_io
+
+logger = logging.getLogger(__name__)
+
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")  # memory | sqlite
+STATE_DB = os.getenv("STATE_DB", "server_state.db")
+WATCH_STATE_FILE = os.getenv("WATCH_STATE_FILE", "watch_state.json")
+BUS_POLL_INTERVAL = float(os.getenv("BUS_POLL_INTERVAL", "0.05"))
+BUS_RETENTION = float(os.getenv("BUS_RETENTION", "60"))  # seconds a bus message is kept
+ALERT_DEDUP_WINDOW = float(os.getenv("ALERT_DEDUP_WINDOW", "600"))  # seconds an idempotency key is remembered
+ALERT_DEDUP_MAX = int(os.getenv("ALERT_DEDUP_MAX", "100000"))  # keys kept in memory at most
+ALERT_DEDUP_INFLIGHT = float(os.getenv("ALERT_DEDUP_INFLIGHT", "5"))  # seconds a claim may wait for its seq
+
+Handler = Callable[[Dict[str, Any]], Union[None, Awaitable[None]]]
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+# ---------------------------------------------------------------------------
+# Alert store
+# ---------------------------------------------------------------------------
+
+class MemoryAlertStore:
+    """Alerts in a list, persisted to a JSON file by a coalescing writer."""
+
+    def __init__(self, path: str, sanitize: Callable[[dict], dict] = dict):
+        self.path = path
+        self._alerts: List[dict] = []
+        self._writer = JsonFileWriter()
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    raw = json.load(f)
+                if isinstance(raw, list):
+                    self._alerts = [sanitize(a) for a in raw]
+            except Exception:
+                self._alerts = []
+        self._seq = max((a.get("seq") or 0 for a in self._alerts), default=0)
+
+    async def append(self, entry: dict) -> dict:
+        self._seq += 1
+        entry = {**entry, "seq": self._seq}
+        self._alerts.append(entry)
+        self._writer.schedule(self.path, self._alerts)
+        return entry
+
+    async def recent(self, limit: int, name: Optional[str] = None) -> List[dict]:
+        """Newest first, optionally only alerts for ``name``."""
+        matches = []
+        for alert in reversed(self._alerts):
+            if len(matches) >= limit:
+                break
+            if name is None or alert.get("name") == name:
+                matches.append(alert)
+        return matches
+
+    async def tail(self, limit: int) -> List[dict]:
+        """The last ``limit`` alerts, oldest first."""
+        return self._alerts[-limit:] if limit > 0 else []
+
+    async def snapshot(self) -> List[dict]:
+        return list(self._alerts)
+
+    async def purge_name(self, name: str) -> int:
+        before = len(self._alerts)
+        self._alerts = [a for a in self._alerts if a.get("name") != name]
+        removed = before - len(self._alerts)
+        if removed:
+            await run_io(self._writer.write_now, self.path, list(self._alerts))
+        return removed
+
+    async def flush(self) -> None:
+        await self._writer.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", "alerts": len(self._alerts), "seq": self._seq, **self._writer.stats()}
+
+
+class SqliteAlertStore:
+    """Alerts in a WAL-mode SQLite table; ``seq`` is the row id, so it is global.
+
+    Each I/O thread keeps its own connection, so concurrent reads from
+    several workers and threads do not serialise on one handle.
+    """
+
+    def __init__(self, path: str = STATE_DB, import_from: Optional[str] = None,
+                 sanitize: Callable[[dict], dict] = dict):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS alerts ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " name TEXT,"
+                " created REAL NOT NULL,"
+                " data TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_alerts_name ON alerts(name, seq)")
+        if import_from:
+            self._import_json(import_from, sanitize)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = _connect(self.path)
+        return conn
+
+    def _import_json(self, path: str, sanitize: Callable[[dict], dict]) -> None:
+        # One-off migration from the single-worker JSON log. BEGIN IMMEDIATE
+        # makes sure only the first worker to start imports it.
+        if not os.path.exists(path):
+            return
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM alerts LIMIT 1").fetchone() is None:
+                with open(path, "r", encoding="utf-8") as f:
+                    raw = json.load(f)
+                rows = [sanitize(a) for a in raw] if isinstance(raw, list) else []
+                conn.executemany(
+                    "INSERT INTO alerts (name, created, data) VALUES (?, ?, ?)",
+                    [(a.get("name"), time.time(), json.dumps({**a, "seq": None}, default=str)) for a in rows],
+                )
+                if rows:
+                    logger.info(f"Imported {len(rows)} alert(s) from {path}")
+            conn.execute("COMMIT")
+        except Exception as e:
+            conn.execute("ROLLBACK")
+            logger.error(f"Failed to import {path}: {e}")
+
+    @staticmethod
+    def _decode(seq: int, data: str) -> dict:
+        alert = json.loads(data)
+        alert["seq"] = seq
+        return alert
+
+    def _append(self, entry: dict) -> dict:
+        conn = self._conn()
+        with conn:
+            cur = conn.execute(
+                "INSERT INTO alerts (name, created, data) VALUES (?, ?, ?)",
+                (entry.get("name"), time.time(), json.dumps(entry, default=str)),
+            )
+        return {**entry, "seq": cur.lastrowid}
+
+    def _recent(self, limit: int, name: Optional[str]) -> List[dict]:
+        if name is None:
+            rows = self._conn().execute(
+                "SELECT seq, data FROM alerts ORDER BY seq DESC LIMIT ?", (limit,)
+            ).fetchall()
+        else:
+            rows = self._conn().execute(
+                "SELECT seq, data FROM alerts WHERE name = ? ORDER BY seq DESC LIMIT ?", (name, limit)
+            ).fetchall()
+        return [self._decode(seq, data) for seq, data in rows]
+
+    def _snapshot(self) -> List[dict]:
+        rows = self._conn().execute("SELECT seq, data FROM alerts ORDER BY seq").fetchall()
+        return [self._decode(seq, data) for seq, data in rows]
+
+    def _purge_name(self, name: str) -> int:
+        conn = self._conn()
+        with conn:
+            return conn.execute("DELETE FROM alerts WHERE name = ?", (name,)).rowcount
+
+    async def append(self, entry: dict) -> dict:
+        return await run_io(self._append, entry)
+
+    async def recent(self, limit: int, name: Optional[str] = None) -> List[dict]:
+        return await run_io(self._recent, limit, name)
+
+    async def tail(self, limit: int) -> List[dict]:
+        return list(reversed(await self.recent(limit)))
+
+    async def snapshot(self) -> List[dict]:
+        return await run_io(self._snapshot)
+
+    async def purge_name(self, name: str) -> int:
+        return await run_io(self._purge_name, name)
+
+    async def flush(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        seq = self._conn().execute("SELECT COALESCE(MAX(seq), 0) FROM alerts").fetchone()[0]
+        return {"backend": "sqlite", "seq": seq}
+
+
+# ---------------------------------------------------------------------------
+# Pub/sub bus
+# ---------------------------------------------------------------------------
+
+class MemoryBus:
+    """Delivers messages to handlers in this process only."""
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Handler]] = defaultdict(list)
+        self.published = 0
+        self.delivered = 0
+
+    def subscribe(self, channel: str, handler: Handler) -> None:
+        self._handlers[channel].append(handler)
+
+    async def publish(self, channel: str, message: Dict[str, Any], local: bool = True) -> None:
+        """Send ``message`` to every worker; ``local=False`` skips this one."""
+        self.published += 1
+        if local:
+            await self._dispatch(channel, message)
+
+    async def _dispatch(self, channel: str, message: Dict[str, Any]) -> None:
+        for handler in self._handlers.get(channel, ()):
+            try:
+                result = handler(message)
+                if asyncio.iscoroutine(result):
+                    await result
+                self.delivered += 1
+            except Exception as e:
+                logger.error(f"Bus handler for {channel!r} failed: {e}")
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", "published": self.published, "delivered": self.delivered}
+
+
+class SqliteBus(MemoryBus):
+    """Cross-process bus: messages are appended to a SQLite table and every
+    worker tails it. Local handlers run immediately; rows written by this
+    worker are skipped when they come back round.
+    """
+
+    def __init__(self, path: str = STATE_DB, poll_interval: float = BUS_POLL_INTERVAL,
+                 retention: float = BUS_RETENTION):
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._db = _connect(path)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS bus ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " channel TEXT NOT NULL,"
+                " origin TEXT NOT NULL,"
+                " payload TEXT NOT NULL,"
+                " created REAL NOT NULL)"
+            )
+        self._last_id = self._db.execute("SELECT COALESCE(MAX(id), 0) FROM bus").fetchone()[0]
+        self._task: Optional[asyncio.Task] = None
+        self.received = 0
+
+    def _insert(self, channel: str, message: Dict[str, Any]) -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO bus (channel, origin, payload, created) VALUES (?, ?, ?, ?)",
+                (channel, self.origin, json.dumps(message, default=str), time.time()),
+            )
+
+    def _fetch(self, after: int) -> List[tuple]:
+        with self._lock:
+            return self._db.execute(
+                "SELECT id, channel, origin, payload FROM bus WHERE id > ? ORDER BY id LIMIT 500", (after,)
+            ).fetchall()
+
+    def _prune(self) -> None:
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM bus WHERE created < ?", (time.time() - self.retention,))
+
+    async def publish(self, channel: str, message: Dict[str, Any], local: bool = True) -> None:
+        await run_io(self._insert, channel, message)
+        await super().publish(channel, message, local=local)
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self._task = asyncio.create_task(self._poll())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _poll(self) -> None:
+        last_prune = time.monotonic()
+        while True:
+            rows = []
+            try:
+                rows = await run_io(self._fetch, self._last_id)
+                for row_id, channel, origin, payload in rows:
+                    self._last_id = row_id
+                    if origin == self.origin:
+                        continue
+                    self.received += 1
+                    await self._dispatch(channel, json.loads(payload))
+                if time.monotonic() - last_prune > self.retention:
+                    last_prune = time.monotonic()
+                    await run_io(self._prune)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Bus poll failed: {e}")
+            if not rows:
+                await asyncio.sleep(self.poll_interval)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "backend": "sqlite", "received": self.received, "last_id": self._last_id}
+
+
+# ---------------------------------------------------------------------------
+# Rule cooldowns
+# ---------------------------------------------------------------------------
+
+class SqliteCooldowns:
+    """Per-(rule, person) cooldowns shared by all workers.
+
+    ``try_fire`` is a single upsert that only moves ``last_fired`` forward
+    when the cooldown has elapsed, so two workers racing on the same alert
+    cannot both fire. Like the dedup claims it runs on the I/O pool, so a
+    busy database never stalls the event loop.
+    """
+
+    def __init__(self, path: str = STATE_DB):
+        self._lock = threading.Lock()
+        self._db = _connect(path)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS rule_cooldowns ("
+                " rule_id INTEGER NOT NULL,"
+                " person TEXT NOT NULL,"
+                " last_fired REAL NOT NULL,"
+                " PRIMARY KEY (rule_id, person))"
+            )
+
+    def _try_fire(self, rule_id: int, person: str, cooldown: float, now: float) -> bool:
+        with self._lock, self._db:
+            cur = self._db.execute(
+                "INSERT INTO rule_cooldowns (rule_id, person, last_fired) VALUES (?, ?, ?)"
+                " ON CONFLICT(rule_id, person) DO UPDATE SET last_fired = excluded.last_fired"
+                " WHERE excluded.last_fired - rule_cooldowns.last_fired >= ?",
+                (rule_id, person, now, cooldown),
+            )
+            return cur.rowcount > 0
+
+    def _forget(self, rule_id: int) -> None:
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM rule_cooldowns WHERE rule_id = ?", (rule_id,))
+
+    async def try_fire(self, rule_id: int, person: str, cooldown: float, now: float) -> bool:
+        return await run_io(self._try_fire, rule_id, person, cooldown, now)
+
+    async def forget(self, rule_id: int) -> None:
+        await run_io(self._forget, rule_id)
+
+
+# ---------------------------------------------------------------------------
+# Alert deduplication
+# ---------------------------------------------------------------------------
+
+class MemoryDedup:
+    """Idempotency keys seen in the last ``window`` seconds, with their ``seq``.
+
+    Keys are kept in arrival order, so expiry and the ``max_keys`` cap only
+    ever drop from the front: every call is O(1) amortised and memory stays
+    bounded however many alerts arrive.
+
+    ``claim`` reserves a new key before the alert is stored; the caller then
+    ``record``s the assigned seq or ``release``s the key if storing failed.
+    """
+
+    def __init__(self, window: float = ALERT_DEDUP_WINDOW, max_keys: int = ALERT_DEDUP_MAX,
+                 clock: Callable[[], float] = time.monotonic):
+        self.window = window
+        self.max_keys = max_keys
+        self._clock = clock
+        self._keys: "OrderedDict[str, List[Any]]" = OrderedDict()  # key -> [first seen, seq or None]
+        self.duplicates = 0
+        self.evicted = 0
+
+    def _expire(self, now: float) -> None:
+        while self._keys and now - next(iter(self._keys.values()))[0] > self.window:
+            self._keys.popitem(last=False)
+
+    async def claim(self, key: str) -> Tuple[bool, Optional[int]]:
+        """``(True, None)`` for a new key, else ``(False, seq)``; seq is None while the first copy is stored."""
+        now = self._clock()
+        self._expire(now)
+        seen = self._keys.get(key)
+        if seen is not None:
+            self.duplicates += 1
+            return False, seen[1]
+        self._keys[key] = [now, None]
+        if len(self._keys) > self.max_keys:
+            self._keys.popitem(last=False)
+            self.evicted += 1
+        return True, None
+
+    async def record(self, key: str, seq: int) -> None:
+        seen = self._keys.get(key)
+        if seen is not None:
+            seen[1] = seq
+
+    async def release(self, key: str) -> None:
+        self._keys.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", "keys": len(self._keys), "duplicates": self.duplicates,
+                "evicted": self.evicted, "window": self.window}
+
+
+class SqliteDedup:
+    """Idempotency keys shared by all workers.
+
+    A claim is one ``INSERT OR IGNORE`` on the primary key, so two workers
+    receiving the same alert cannot both store it. Keys older than
+    ``window`` are pruned every few seconds. A claim still without a seq
+    after ``inflight_timeout`` seconds belongs to a worker that died while
+    storing; the key is free again so the sender's retry is accepted.
+    """
+
+    def __init__(self, path: str = STATE_DB, window: float = ALERT_DEDUP_WINDOW,
+                 clock: Callable[[], float] = time.time, inflight_timeout: float = ALERT_DEDUP_INFLIGHT):
+        self.window = window
+        self.inflight_timeout = inflight_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._db = _connect(path)
+        self._pruned_at = 0.0
+        self.duplicates = 0
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS alert_keys ("
+                " key TEXT PRIMARY KEY,"
+                " seq INTEGER,"
+                " seen REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_alert_keys_seen ON alert_keys(seen)")
+
+    def _claim(self, key: str) -> Tuple[bool, Optional[int]]:
+        now = self._clock()
+        with self._lock, self._db:
+            if now - self._pruned_at > min(self.window, 10.0):
+                self._db.execute("DELETE FROM alert_keys WHERE seen < ?", (now - self.window,))
+                self._pruned_at = now
+            # A key past the window counts as new even if it has not been pruned
+            # yet, and so does an abandoned claim (``seen`` is the claim time)
+            cur = self._db.execute(
+                "INSERT INTO alert_keys (key, seq, seen) VALUES (?, NULL, ?)"
+                " ON CONFLICT(key) DO UPDATE SET seq = NULL, seen = excluded.seen"
+                " WHERE alert_keys.seen < ? OR (alert_keys.seq IS NULL AND alert_keys.seen < ?)",
+                (key, now, now - self.window, now - self.inflight_timeout),
+            )
+            if cur.rowcount > 0:
+                return True, None
+            self.duplicates += 1
+            row = self._db.execute("SELECT seq FROM alert_keys WHERE key = ?", (key,)).fetchone()
+            return False, row[0] if row else None
+
+    def _record(self, key: str, seq: Optional[int]) -> None:
+        with self._lock, self._db:
+            if seq is None:
+                self._db.execute("DELETE FROM alert_keys WHERE key = ?", (key,))
+            else:
+                self._db.execute("UPDATE alert_keys SET seq = ? WHERE key = ?", (seq, key))
+
+    async def claim(self, key: str) -> Tuple[bool, Optional[int]]:
+        return await run_io(self._claim, key)
+
+    async def record(self, key: str, seq: int) -> None:
+        await run_io(self._record, key, seq)
+
+    async def release(self, key: str) -> None:
+        await run_io(self._record, key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            keys = self._db.execute("SELECT COUNT(*) FROM alert_keys").fetchone()[0]
+        return {"backend": "sqlite", "keys": keys, "duplicates": self.duplicates, "window": self.window}
+
+
+# ---------------------------------------------------------------------------
+# Watcher process state
+# ---------------------------------------------------------------------------
+
+class MemoryWatchState:
+    """Tracks the watcher subprocess started by this worker."""
+
+    def __init__(self):
+        self._proc: Optional[subprocess.Popen] = None
+
+    def status(self) -> Dict[str, Any]:
+        if self._proc and self._proc.poll() is None:
+            return {"status": "running", "pid": self._proc.pid}
+        return {"status": "stopped"}
+
+    def start(self, cmd: List[str], cwd: str) -> Dict[str, Any]:
+        current = self.status()
+        if current["status"] == "running":
+            return {"status": "already_running", "pid": current["pid"]}
+        self._proc = subprocess.Popen(cmd, cwd=cwd)
+        return {"status": "started", "pid": self._proc.pid}
+
+    def stop(self) -> Dict[str, Any]:
+        if not self._proc or self._proc.poll() is not None:
+            self._proc = None
+            return {"status": "not_running"}
+        try:
+            self._proc.terminate()
+            try:
+                self._proc.wait(timeout=5)
+            except Exception:
+                self._proc.kill()
+            return {"status": "stopped"}
+        finally:
+            self._proc = None
+
+
+class PidFileWatchState(MemoryWatchState):
+    """Watcher state in a pid file, so any worker can report or stop a
+    watcher that another worker started. Start/stop hold an exclusive lock
+    on ``<path>.lock`` so two workers cannot both launch one.
+    """
+
+    def __init__(self, path: str = WATCH_STATE_FILE):
+        super().__init__()
+        self.path = path
+
+    def _lock(self):
+        f = open(f"{self.path}.lock", "a+")
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return f
+
+    def _read(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _alive(self, pid: int) -> bool:
+        if self._proc is not None and self._proc.pid == pid:
+            return self._proc.poll() is None
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        # A child of another worker that exited is a zombie until reaped
+        try:
+            with open(f"/proc/{pid}/stat", "r") as f:
+                return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+        except OSError:
+            return True
+
+    def status(self) -> Dict[str, Any]:
+        state = self._read()
+        if state and self._alive(state["pid"]):
+            return {"status": "running", "pid": state["pid"]}
+        return {"status": "stopped"}
+
+    def start(self, cmd: List[str], cwd: str) -> Dict[str, Any]:
+        with self._lock():
+            state = self._read()
+            if state and self._alive(state["pid"]):
+                return {"status": "already_running", "pid": state["pid"]}
+            self._proc = subprocess.Popen(cmd, cwd=cwd)
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump({"pid": self._proc.pid, "cmd": cmd, "started": time.time()}, f)
+            return {"status": "started", "pid": self._proc.pid}
+
+    def stop(self) -> Dict[str, Any]:
+        with self._lock():
+            state = self._read()
+            if not state or not self._alive(state["pid"]):
+                return {"status": "not_running"}
+            pid = state["pid"]
+            try:
+                os.kill(pid, signal.SIGTERM)
+                deadline = time.monotonic() + 5
+                while self._alive(pid) and time.monotonic() < deadline:
+                    time.sleep(0.05)
+                if self._alive(pid):
+                    os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            finally:
+                try:
+                    os.unlink(self.path)
+                except OSError:
+                    pass
+                if self._proc is not None and self._proc.pid == pid:
+                    self._proc.wait(timeout=1)
+                    self._proc = None
+            return {"status": "stopped"}
+
+
+# ---------------------------------------------------------------------------
+# Factories
+# ---------------------------------------------------------------------------
+
+def _shared() -> bool:
+    if STATE_BACKEND not in ("memory", "sqlite"):
+        raise ValueError(f"Unknown STATE_BACKEND {STATE_BACKEND!r} (expected 'memory' or 'sqlite')")
+    return STATE_BACKEND == "sqlite"
+
+
+def create_alert_store(alerts_file: str, sanitize: Callable[[dict], dict] = dict):
+    if _shared():
+        return SqliteAlertStore(STATE_DB, import_from=alerts_file, sanitize=sanitize)
+    return MemoryAlertStore(alerts_file, sanitize=sanitize)
+
+
+def create_bus():
+    return SqliteBus(STATE_DB) if _shared() else MemoryBus()
+
+
+def create_cooldowns() -> Optional[SqliteCooldowns]:
+    """Shared cooldowns, or None to keep them in the rule index."""
+    return SqliteCooldowns(STATE_DB) if _shared() else None
+
+
+def create_dedup():
+    return SqliteDedup(STATE_DB) if _shared() else MemoryDedup()
+
+
+def create_watch_state():
+    return PidFileWatchState(WATCH_STATE_FILE) if _shared() else MemoryWatchState()
@@ -0,0 +1,57 @@
+import cv2
+import numpy as np
+
+from adaptive_detection import AdaptiveScale
+from metrics import MetricsRegistry
+
+
+def square_detector(rgb):
+    """Stand-in for HOG: white squares at least 40 px tall are faces."""
+    mask = (rgb[:, :, 0] > 127).astype(np.uint8)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+    return [(int(y), int(x + w), int(y + h), int(x)) for x, y, w, h, _ in stats[1:] if h >= 40]
+
+
+def scene(*faces, shape=(480, 640)):
+    frame = np.zeros(shape + (3,), np.uint8)
+    for x, y, size in faces:
+        frame[y:y + size, x:x + size] = 255
+    return frame
+
+
+def test_scale_shrinks_for_close_faces_and_probes_find_distant_ones():
+    close = AdaptiveScale(1.0)
+    for _ in range(5):
+        close.detect(scene((100, 100, 240)), square_detector)
+    assert close.scale == 0.25  # 240 px faces stay 60 px tall at a quarter size
+
+    distant = AdaptiveScale(0.25, probe_every=2)
+    frame = scene((300, 200, 70))
+    found = [sum(len(p.boxes) for p in distant.detect(frame, square_detector)) for _ in range(12)]
+    assert found[0] == 0  # 70 px faces vanish at 0.25
+    assert distant.probe_hits >= 1
+    assert distant.scale == 0.7 and found[-1] == 1
+    assert distant.stats()["face_px_p25"] == 70
+
+
+def test_small_faces_seen_before_are_refined_in_a_crop():
+    detector = AdaptiveScale(0.25, probe_every=0)
+    detector.observe([(0, 240, 240, 0)] * 10)  # learned: faces are large
+    detector._hot = [((300, 330, 330, 300), 0.0)]  # a 30 px face seen just now
+    detector._clock = lambda: 0.5
+
+    passes = detector.detect(scene((20, 20, 240), (300, 300, 30)), square_detector)
+    boxes = sorted(box for p in passes for box in p.boxes)
+    assert len(passes) == 2 and detector.refine_hits == 1
+    assert passes[1].image.shape[0] < 480  # only the crop was upsampled
+    assert abs(boxes[1][0] - 300) <= 1 and abs(boxes[1][3] - 300) <= 1
+
+
+def test_fixed_scale_and_masks():
+    detector = AdaptiveScale.fixed(0.5)
+    frame = scene((50, 50, 100), (400, 50, 100))
+    registry = MetricsRegistry()
+    passes = detector.detect(frame, square_detector, allow=lambda box: box[3] < 320, metrics=registry.scope(camera=1))
+    assert [p.boxes for p in passes] == [[(50, 150, 150, 50)]]
+    assert detector.scale == 0.5 and detector.probes == 0
+    assert [registry.histogram(stage, camera=1).count for stage in ("resize", "detect")] == [1, 1]
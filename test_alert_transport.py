@@ -0,0 +1,111 @@
+import asyncio
+import json
+import struct
+
+import pytest
+
+import alerts_server
+from alert_transport import AlertIngestServer, AlertSender, FrameError, MAX_FRAME, encode_frame, read_frame
+from state_backends import MemoryAlertStore, MemoryDedup
+
+
+def _alert(name):
+    return {"name": name, "camera_id": 1, "timestamp": "2025-01-01T00:00:00", "filename": f"{name}.jpg"}
+
+
+async def _wait_for(predicate, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.02)
+
+
+def test_frames_round_trip_and_reject_oversized():
+    async def scenario():
+        reader = asyncio.StreamReader()
+        reader.feed_data(encode_frame({"id": "a", "alert": {"name": "x"}}))
+        reader.feed_data(struct.pack(">IB", MAX_FRAME + 1, ord("J")))
+        reader.feed_eof()
+        first = await read_frame(reader)
+        with pytest.raises(FrameError):
+            await read_frame(reader)
+        return first
+
+    assert asyncio.run(scenario()) == {"id": "a", "alert": {"name": "x"}}
+
+
+def test_alerts_are_acknowledged_over_the_socket(tmp_path, monkeypatch):
+    store = MemoryAlertStore(str(tmp_path / "alerts.json"))
+    monkeypatch.setattr(alerts_server, "alert_store", store)
+    sock = str(tmp_path / "alerts.sock")
+
+    async def scenario():
+        server = AlertIngestServer(alerts_server._ingest_ipc, sock)
+        assert await server.start()
+        # A second worker finds the socket owned and leaves it alone
+        assert not await AlertIngestServer(alerts_server._ingest_ipc, sock).start()
+        sender = AlertSender(sock, spool_path=str(tmp_path / "spool.jsonl"), mode="ipc")
+        sender.start()
+        sender.send(_alert("alice"))
+        sender.send({"camera_id": "not a number"})
+        sender.send({**_alert("bob"), "quality": {"size": 52, "sharpness": 140.2, "yaw": 0.1, "score": 0.8}})
+        await _wait_for(lambda: sender.sent_ipc + sender.rejected == 3)
+        await asyncio.to_thread(sender.stop)
+        await server.stop()
+        return sender.stats(), server.stats(), await store.recent(10)
+
+    sender_stats, server_stats, recent = asyncio.run(scenario())
+    assert [a["name"] for a in recent] == ["bob", "alice"]
+    assert recent[0]["quality"]["score"] == 0.8 and "quality" not in recent[1]
+    assert (sender_stats["sent_ipc"], sender_stats["rejected"], sender_stats["spooled"]) == (2, 1, 0)
+    assert (server_stats["received"], server_stats["rejected"]) == (2, 1)
+
+
+def test_redelivered_alerts_are_acknowledged_once_and_stored_once(tmp_path, monkeypatch):
+    store = MemoryAlertStore(str(tmp_path / "alerts.json"))
+    monkeypatch.setattr(alerts_server, "alert_store", store)
+    monkeypatch.setattr(alerts_server, "alert_dedup", MemoryDedup())
+    published = []
+
+    async def publish(channel, message, **kwargs):
+        published.append(message)
+
+    monkeypatch.setattr(alerts_server.bus, "publish", publish)
+    alert = {**_alert("alice"), "key": "box-1:3:120:alice"}
+
+    async def scenario():
+        return [await alerts_server._ingest_ipc(dict(alert)) for _ in range(3)], await store.recent(10)
+
+    results, recent = asyncio.run(scenario())
+    assert [r["status"] for r in results] == ["ok", "duplicate", "duplicate"]
+    assert len({r["seq"] for r in results}) == 1
+    assert len(recent) == 1 and "key" not in recent[0]
+    assert len(published) == 1
+
+
+def test_alerts_are_spooled_while_server_is_down_and_replayed_in_order(tmp_path, monkeypatch):
+    store = MemoryAlertStore(str(tmp_path / "alerts.json"))
+    monkeypatch.setattr(alerts_server, "alert_store", store)
+    sock = str(tmp_path / "alerts.sock")
+    spool = tmp_path / "spool.jsonl"
+
+    async def scenario():
+        sender = AlertSender(sock, spool_path=str(spool), mode="ipc", retry_max=0.05)
+        sender.start()
+        for name in ("a", "b", "c"):
+            sender.send(_alert(name))
+        await _wait_for(lambda: sender.spooled == 3)
+        spooled = [json.loads(line)["alert"]["name"] for line in spool.read_text().splitlines()]
+
+        server = AlertIngestServer(alerts_server._ingest_ipc, sock)
+        await server.start()
+        sender.send(_alert("d"))
+        await _wait_for(lambda: sender.sent_ipc == 4)
+        await asyncio.to_thread(sender.stop)
+        await server.stop()
+        return spooled, sender.stats(), await store.recent(10)
+
+    spooled, stats, recent = asyncio.run(scenario())
+    assert spooled == ["a", "b", "c"]
+    assert stats["replayed"] == 4 and not stats["spool_pending"]
+    assert [a["name"] for a in reversed(recent)] == ["a", "b", "c", "d"]
@@ -0,0 +1,57 @@
+import time
+
+from fastapi.testclient import TestClient
+
+import alerts_server
+from api import auth
+
+
+def test_ttl_cache_expiry_and_bound():
+    cache = auth.TTLCache(maxsize=2)
+    cache.set("a", 1, time.time() + 60)
+    cache.set("b", 2, time.time() - 1)
+    cache.set("c", 3, time.time() + 60)
+    assert cache.get("a") is None  # evicted by the size bound
+    assert cache.get("b") is None  # expired
+    assert cache.get("c") == 3
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def _login_cachetest(session_local):
+    with session_local() as db:
+        db.add(auth.User(username="cachetest", hashed_password=auth.get_password_hash("pw")))
+        db.commit()
+    client = TestClient(alerts_server.app)
+    token = client.post("/token", data={"username": "cachetest", "password": "pw"}).json()["access_token"]
+    return client, {"Authorization": f"Bearer {token}"}
+
+
+def test_authenticated_requests_hit_cache_and_disable_invalidates(app_db):
+    client, headers = _login_cachetest(app_db)
+
+    before = auth.auth_cache_stats()["users"]["hits"]
+    for _ in range(3):
+        assert client.get("/alerts?limit=1", headers=headers).status_code == 200
+    assert auth.auth_cache_stats()["users"]["hits"] - before == 2
+
+    with app_db() as db:
+        db.query(auth.User).filter(auth.User.username == "cachetest").update({"disabled": True})
+        db.commit()
+    # Still served from cache until invalidated
+    assert client.get("/alerts?limit=1", headers=headers).status_code == 200
+    auth.invalidate_user("cachetest")
+    assert client.get("/alerts?limit=1", headers=headers).status_code == 400
+
+
+def test_deleted_user_is_refused_once_invalidated(app_db):
+    client, headers = _login_cachetest(app_db)
+    assert client.get("/alerts?limit=1", headers=headers).status_code == 200
+
+    with app_db() as db:
+        db.query(auth.User).filter(auth.User.username == "cachetest").delete()
+        db.commit()
+    # Still served from cache until invalidated
+    assert client.get("/alerts?limit=1", headers=headers).status_code == 200
+    auth.invalidate_user("cachetest")
+    assert client.get("/alerts?limit=1", headers=headers).status_code == 401
@@ -0,0 +1,104 @@
+import asyncio
+import json
+
+from broadcast import BroadcastHub
+from state_backends import MemoryAlertStore
+
+
+class FakeSocket:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.sent = []
+        self.closed_with = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        await asyncio.sleep(self.delay)
+        self.sent.append(text)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+def test_publish_serialises_once_and_drops_slow_clients():
+    async def scenario():
+        hub = BroadcastHub(queue_size=4)
+        fast, slow = FakeSocket(), FakeSocket(delay=10)
+        await hub.connect(fast)
+        await hub.connect(slow)
+        for i in range(10):
+            hub.publish({"type": "new_alert", "n": i})
+            await asyncio.sleep(0.001)
+        await asyncio.sleep(0.05)
+        return hub, fast, slow
+
+    hub, fast, slow = asyncio.run(scenario())
+    assert json.loads(fast.sent[0])["type"] == "hello"
+    assert [json.loads(t)["n"] for t in fast.sent[1:]] == list(range(10))
+    assert slow.closed_with == 1013
+    assert hub.stats()["clients"] == 1
+    assert hub.stats()["clients_dropped"] == 1
+
+
+def test_alert_ingest_reaches_websocket(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+    import alerts_server
+
+    monkeypatch.setattr(alerts_server, "alert_store", MemoryAlertStore(str(tmp_path / "alerts.json")))
+    monkeypatch.setattr(alerts_server, "hub", BroadcastHub())
+    client = TestClient(alerts_server.app)
+    alert = {"name": "alice", "camera_id": 1, "timestamp": "2025-01-01T00:00:00",
+             "filename": "a.jpg", "suspicious": False}
+    with client.websocket_connect("/ws/alerts") as ws:
+        hello = ws.receive_json()
+        assert client.post("/alerts", json=alert).status_code == 201
+        message = ws.receive_json()
+    assert hello["type"] == "hello"
+    assert message["type"] == "new_alert"
+    assert message["alert"]["name"] == "alice"
+    assert message["seq"] == message["alert"]["seq"] == hello["seq"] + 1
+
+
+def test_reconnect_with_last_seq_replays_or_resyncs():
+    async def scenario():
+        hub = BroadcastHub(queue_size=8, replay_size=5)
+        for i in range(1, 8):
+            hub.publish({"type": "new_alert", "n": i}, seq=hub.next_seq())
+        recent, stale, ahead = FakeSocket(), FakeSocket(), FakeSocket()
+        await hub.connect(recent, last_seq=5)
+        await hub.connect(stale, last_seq=1)
+        await hub.connect(ahead, last_seq=99)
+        await asyncio.sleep(0.01)
+        return recent, stale, ahead
+
+    recent, stale, ahead = asyncio.run(scenario())
+    recent_msgs = [json.loads(t) for t in recent.sent]
+    assert recent_msgs[0] == {"type": "hello", "seq": 7}
+    assert [m["seq"] for m in recent_msgs[1:]] == [6, 7]
+    assert json.loads(stale.sent[-1])["type"] == "resync"
+    assert json.loads(ahead.sent[-1])["type"] == "resync"
+
+
+def test_replay_ring_keeps_out_of_order_alerts_in_seq_order():
+    async def scenario():
+        hub = BroadcastHub(queue_size=8, replay_size=4)
+        for seq in (1, 2, 4, 5, 3, 6):  # seq 3 was stored by a slower worker
+            hub.publish({"type": "new_alert"}, seq=seq)
+        recent, stale = FakeSocket(), FakeSocket()
+        await hub.connect(recent, last_seq=2)
+        await hub.connect(stale, last_seq=1)
+        await asyncio.sleep(0.01)
+        return hub, recent, stale
+
+    hub, recent, stale = asyncio.run(scenario())
+    assert [seq for seq, _ in hub._replay] == [3, 4, 5, 6]
+    assert [json.loads(t)["seq"] for t in recent.sent[1:]] == [3, 4, 5, 6]
+    assert json.loads(stale.sent[-1])["type"] == "resync"  # seq 2 was evicted, not seq 3
+
+
+def test_seed_restores_sequence():
+    hub = BroadcastHub()
+    hub.seed([{"type": "new_alert", "alert": {}, "seq": 41}, {"type": "new_alert", "alert": {}, "seq": 42}])
+    assert hub.next_seq() == 43
@@ -0,0 +1,81 @@
+import time
+
+from fastapi.testclient import TestClient
+
+import alerts_server
+import camera_telemetry
+from camera_telemetry import CameraStats, read_heartbeat, write_heartbeat
+from state_backends import MemoryWatchState
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_camera_stats_report_fps_drops_latency_and_stalls():
+    clock = FakeClock()
+    stats = CameraStats(clock=clock)
+    for _ in range(11):
+        stats.frame(thread_cpu=0.5)
+        clock.now += 0.1
+    stats.drop()
+    stats.decode_failure()
+    stats.recognized(0.05, 0.04)
+    stats.recognized(0.15, 0.1)
+
+    snap = stats.snapshot(queue_depth=2, stall_threshold=5)
+    assert 9.5 < snap["fps"] < 10.5
+    assert (snap["frames"], snap["dropped"], snap["decode_failures"], snap["queue_depth"]) == (11, 1, 1, 2)
+    assert snap["latency_ms_max"] == 150.0 and 50 < snap["latency_ms_avg"] < 150
+    assert snap["capture_cpu_seconds"] == 0.5 and snap["recognition_cpu_seconds"] == 0.14
+    assert not snap["stalled"]
+
+    clock.now += 6
+    assert stats.is_stalled(5) and stats.fps() == 0.0
+    stats.restarted()
+    assert not stats.is_stalled(5) and stats.restarts == 1
+
+
+def test_heartbeat_freshness(tmp_path):
+    path = str(tmp_path / "beat.json")
+    assert read_heartbeat(path) is None
+    write_heartbeat({"status": "running", "pid": 1}, path)
+    beat = read_heartbeat(path)
+    assert beat["status"] == "running" and beat["fresh"]
+
+    stale_path = tmp_path / "stale.json"
+    stale_path.write_text(
+        '{"status": "running", "pid": 1, "interval": 1, "heartbeat_at": %f}' % (time.time() - 10))
+    assert not read_heartbeat(str(stale_path))["fresh"]
+
+
+def test_healthz_and_watch_status_read_the_heartbeat(tmp_path, monkeypatch):
+    path = str(tmp_path / "beat.json")
+    monkeypatch.setattr(alerts_server, "read_heartbeat", lambda: camera_telemetry.read_heartbeat(path))
+    monkeypatch.setattr(alerts_server, "watch_state", MemoryWatchState())
+    client = TestClient(alerts_server.app)
+
+    assert client.get("/healthz").json() == {
+        "status": "ok",
+        "watcher": {"status": "stopped", "heartbeat_age": None, "cameras": 0, "stalled_cameras": []},
+    }
+
+    write_heartbeat({"status": "running", "pid": 42, "cameras": {
+        "1": {"source": "rtsp://secret", "fps": 12.0, "stalled": False},
+        "2": {"source": "0", "fps": 0.0, "stalled": True},
+    }}, path)
+    health = client.get("/healthz").json()
+    assert health["status"] == "degraded"
+    assert health["watcher"]["stalled_cameras"] == [2]
+    assert "rtsp://secret" not in str(health)
+
+    alerts_server.app.dependency_overrides[alerts_server.get_current_active_user] = lambda: None
+    try:
+        status = client.get("/watch/status").json()
+    finally:
+        alerts_server.app.dependency_overrides.clear()
+    assert status["status"] == "running" and status["cameras"]["1"]["fps"] == 12.0
@@ -0,0 +1,161 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from camera_telemetry import CameraStats
+from capture import CameraCapture, EvidenceGrabber, reconnect_delay, scale_box
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeCap:
+    """A stream whose decoder holds ``backlog`` buffered frames, then one new frame per grab."""
+
+    def __init__(self, frames, clock=None, backlog=0, fps=25.0):
+        self.frames = list(frames)
+        self.clock = clock
+        self.backlog = backlog
+        self.fps = fps
+        self.current = None
+        self.released = False
+
+    def isOpened(self):
+        return True
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            return 0.0 if self.current is None else self.current * 40.0
+        return 0.0
+
+    def grab(self):
+        if not self.frames:
+            return False
+        if self.backlog:
+            self.backlog -= 1
+        elif self.clock is not None:
+            self.clock.now += 1 / self.fps  # waits for the next frame on the wire
+        self.current = self.frames.pop(0)
+        return True
+
+    def retrieve(self):
+        return True, np.full((2, 2), self.current, dtype=np.uint8)
+
+    def read(self):
+        return self.grab() and self.retrieve()[0], np.full((2, 2), self.current or 0, dtype=np.uint8)
+
+    def release(self):
+        self.released = True
+
+
+class DeadCap(FakeCap):
+    def isOpened(self):
+        return False
+
+
+def test_reconnect_delay_backs_off_exponentially_with_jitter():
+    assert [reconnect_delay(n, 1, 30, rng=lambda: 0) for n in range(7)] == [0.5, 1, 2, 4, 8, 15, 15]
+    assert [reconnect_delay(n, 1, 30, rng=lambda: 1) for n in range(6)] == [1, 2, 4, 8, 16, 30]
+
+
+def test_capture_reconnects_after_failures_and_resets_backoff():
+    caps = [DeadCap([]), FakeCap([1, 2, 3]), DeadCap([]), FakeCap([4, 5])]
+    stats = CameraStats()
+    capture = CameraCapture(0, stats, opener=lambda source: caps.pop(0), backoff_base=0.001)
+    stop = threading.Event()
+    seen = []
+    for frame, _ in capture.frames(stop):
+        seen.append(int(frame[0, 0]))
+        if len(seen) == 5:
+            stop.set()
+    assert seen == [1, 2, 3, 4, 5]
+    assert stats.reconnects == 1 and stats.decode_failures == 1
+    assert not stats.connected
+
+
+def test_network_capture_drains_buffered_frames_and_reports_capture_time():
+    clock, wall = FakeClock(), FakeClock()
+    cap = FakeCap(range(1, 20), clock=clock, backlog=5)
+    stats = CameraStats()
+    capture = CameraCapture("rtsp://cam", stats, opener=lambda source: cap, clock=clock, wall=wall)
+    frames = capture.frames(threading.Event())
+
+    frame, captured_at = next(frames)
+    assert int(frame[0, 0]) == 6  # five buffered frames skipped
+    assert stats.drained_frames == 5 and stats.connected
+    assert captured_at == wall.now
+
+    wall.now += 1.0  # the next frame arrives late: the stream is 960 ms behind live
+    frame, captured_at = next(frames)
+    assert int(frame[0, 0]) == 7
+    assert abs((wall.now - captured_at) - 0.96) < 1e-6
+    frames.close()
+    assert cap.released
+
+
+class MainStreamCap(FakeCap):
+    """A main stream decoded into recycled buffers."""
+
+    def retrieve(self, out=None):
+        frame = np.full((2, 2), self.current, dtype=np.uint8)
+        if out is not None:
+            out[...] = frame
+            return True, out
+        return True, frame
+
+
+def test_evidence_snapshot_is_the_main_stream_frame_nearest_the_analysed_one():
+    wall = FakeClock()
+    caps = {"rtsp://cam/main": [MainStreamCap(range(1, 11), clock=wall)]}
+
+    def opener(source):
+        pending = caps.get(source)
+        return pending.pop(0) if pending else DeadCap([])
+
+    grabber = EvidenceGrabber(opener, fps=50, seconds=2, max_offset=0.1, deadline=0.3,
+                              wall=wall, backoff_base=0.01)
+    grabber.watch(0, "rtsp://cam/main")
+    grabber.watch(1, "rtsp://offline")
+    results = {}
+    answered = threading.Event()
+
+    def collect(key):
+        def done(frame, offset_ms):
+            results[key] = (None if frame is None else int(frame[0, 0]), offset_ms, time.monotonic())
+            if len(results) == 3:
+                answered.set()
+        return done
+
+    # Frame n of the main stream was captured at 100 + n * 0.04
+    started = time.monotonic()
+    grabber.request(1, 100.13, collect("offline"))
+    grabber.request(0, 100.13, collect("matched"))
+    grabber.request(0, 200.0, collect("too late"))
+    grabber.start()
+    assert answered.wait(5)
+    grabber.stop()
+
+    assert results["matched"][:2] == (3, -10.0)
+    # Nothing kept lies near the capture time: no frame rather than the wrong one
+    assert results["too late"][:2] == (None, None)
+    assert results["offline"][:2] == (None, None)
+    # The unreachable camera waits for its deadline without holding up the other one
+    assert results["matched"][2] < results["offline"][2]
+    assert results["offline"][2] - started >= 0.3
+    stats = grabber.stats()
+    assert (stats["matched"], stats["unmatched"]) == (1, 2)
+    assert not stats["streams"][1]["connected"]
+
+
+def test_evidence_boxes_scale_from_substream_to_main_stream():
+    # A face found on a 640x360 substream lands on the same spot of the 1080p main frame
+    assert scale_box((36, 320, 72, 288), (360, 640, 3), (1080, 1920, 3)) == (108, 960, 216, 864)
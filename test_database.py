@@ -0,0 +1,99 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, inspect, text
+
+import alerts_server
+import models
+from api import database
+
+
+def test_legacy_users_table_gains_model_columns(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR, "
+                          "hashed_password VARCHAR, is_active VARCHAR)"))
+        conn.execute(text("INSERT INTO users (username, hashed_password, is_active) "
+                          "VALUES ('on', 'x', '1'), ('off', 'x', '0')"))
+    database.Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        database._add_missing_columns(conn)
+        columns = {c["name"] for c in inspect(conn).get_columns("users")}
+        assert {"email", "full_name", "is_admin", "disabled", "created_at"} <= columns
+        rows = dict(conn.execute(text("SELECT username, disabled FROM users")).all())
+    assert rows == {"on": 0, "off": 1}
+
+
+def test_async_engine_uses_wal_and_serves_concurrent_reads(app_db):
+    async def run():
+        async with database.engine.connect() as conn:
+            mode = (await conn.execute(text("PRAGMA journal_mode"))).scalar()
+        results = await asyncio.gather(*(_count_cameras() for _ in range(20)))
+        await database.engine.dispose()
+        return mode, results
+
+    async def _count_cameras():
+        async with database.AsyncSessionLocal() as db:
+            return len(await alerts_server.crud.get_cameras(db))
+
+    mode, results = asyncio.run(run())
+    assert mode == "wal"
+    assert len(set(results)) == 1
+
+
+def test_user_endpoints_use_the_unified_model(app_db):
+    client = TestClient(alerts_server.app)
+    token = client.post("/token", data={"username": "admin", "password": "changeme123"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get("/users/", headers=headers)
+    assert response.status_code == 200
+    assert "admin" in [u["username"] for u in response.json()]
+    assert alerts_server.User is models.User
+
+
+def test_camera_update_merges_config_and_pushes_streams_to_the_watcher(app_db, monkeypatch):
+    pushed = []
+
+    async def camera_changed(camera):
+        pushed.append(camera)
+
+    monkeypatch.setattr(alerts_server.watch_control, "camera_changed", camera_changed)
+    client = TestClient(alerts_server.app)
+    token = client.post("/token", data={"username": "admin", "password": "changeme123"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    created = client.post("/cameras/", headers=headers, json={
+        "name": "Gate", "url": "rtsp://gate/main", "location": "North",
+    }).json()
+    updated = client.put(f"/cameras/{created['id']}", headers=headers, json={
+        "name": "Gate", "config": {"analysis_source": "rtsp://gate/sub"},
+    }).json()
+    client.delete(f"/cameras/{created['id']}", headers=headers)
+    assert updated["config"] == {"location": "North", "analysis_source": "rtsp://gate/sub"}
+    assert pushed[-1]["source"] == "rtsp://gate/sub" and pushed[-1]["evidence_source"] == "rtsp://gate/main"
+
+
+def test_camera_regions_and_backends_are_validated_and_pushed_to_the_watcher(app_db, monkeypatch):
+    pushed = []
+
+    async def camera_changed(camera):
+        pushed.append(camera)
+
+    monkeypatch.setattr(alerts_server.watch_control, "camera_changed", camera_changed)
+    client = TestClient(alerts_server.app)
+    token = client.post("/token", data={"username": "admin", "password": "changeme123"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    created = client.post("/cameras/", headers=headers, json={"name": "Lobby", "url": "rtsp://lobby"}).json()
+    roi = [[[0.5, 0.0], [1.0, 0.0], [1.0, 1.0], [0.5, 1.0]]]
+    bad = client.put(f"/cameras/{created['id']}/regions", headers=headers, json={"roi": [[[0.1, 0.1], [2, 0]]]})
+    saved = client.put(f"/cameras/{created['id']}/regions", headers=headers, json={"roi": roi})
+    fetched = client.get(f"/cameras/{created['id']}/regions", headers=headers).json()
+    bad_detector = client.put(f"/cameras/{created['id']}", headers=headers, json={
+        "name": "Lobby", "config": {"detector": "yolo"},
+    })
+    client.put(f"/cameras/{created['id']}", headers=headers, json={"name": "Lobby", "config": {"detector": "haar+hog"}})
+    client.delete(f"/cameras/{created['id']}", headers=headers)
+    assert bad.status_code == 400
+    assert saved.status_code == 200 and (fetched["roi"], fetched["masks"]) == (roi, [])
+    assert bad_detector.status_code == 400
+    assert pushed[-1]["regions"] == {"roi": [[tuple(p) for p in roi[0]]], "masks": []}
+    assert pushed[-1]["backend"]["detector"] == {"model": "hog", "prefilter": "haar", "upsample": 1}
@@ -0,0 +1,163 @@
+import asyncio
+import base64
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+from fastapi.testclient import TestClient
+from sqlalchemy import delete
+
+import alerts_server
+import models
+import worker_registry
+from api import database
+from edge_worker import EdgeWorker
+from state_backends import MemoryAlertStore, MemoryDedup
+from watchlist import Watchlist
+
+TOKEN = "edge-secret"
+
+
+class FakeSystem:
+    def __init__(self, tmp_path):
+        self.watchlist = Watchlist(str(tmp_path / "empty"), cache_path=str(tmp_path / "edge.npz"))
+        self.cameras = {}
+        self.alert_sender = None
+
+    def set_cameras(self, cameras):
+        self.cameras = dict(cameras)
+
+    def status(self):
+        return {"cameras": sorted(self.cameras)}
+
+
+def _setup(monkeypatch, tmp_path):
+    monkeypatch.setattr(worker_registry, "WORKER_TOKEN", TOKEN)
+    monkeypatch.setattr(alerts_server, "alert_store", MemoryAlertStore(str(tmp_path / "alerts.json")))
+    monkeypatch.setattr(alerts_server, "INCIDENTS_FOLDER", str(tmp_path / "central"))
+    faces = tmp_path / "faces"
+    (faces / "alice").mkdir(parents=True)
+    (faces / "alice" / "1.jpg").write_bytes(b"img")
+    watchlist = Watchlist(str(faces), cache_path=str(tmp_path / "server.npz"), encoder=lambda path: np.ones(128))
+    monkeypatch.setattr(alerts_server, "edge_watchlist", worker_registry.WatchlistPublisher(watchlist))
+
+    async def seed():
+        async with database.AsyncSessionLocal() as db:
+            await db.execute(delete(models.EdgeWorker))
+            await db.execute(delete(models.Camera).where(models.Camera.name.like("edge-test-%")))
+            cameras = [models.Camera(name=f"edge-test-{i}", source=f"rtsp://cam{i}", type="rtsp",
+                                     enabled=True, config={"site": "s1"}) for i in range(6)]
+            db.add_all(cameras)
+            await db.commit()
+            ids = [c.id for c in cameras]
+        await database.engine.dispose()
+        return ids
+
+    database.init_db()
+    return asyncio.run(seed())
+
+
+def _worker(tmp_path, name):
+    client = TestClient(alerts_server.app, headers={"Authorization": f"Bearer {TOKEN}"})
+    return EdgeWorker(FakeSystem(tmp_path / name), client, name, site="s1",
+                      spool_path=str(tmp_path / f"{name}.jsonl"), incidents_root=str(tmp_path / name))
+
+
+def test_edge_workers_split_site_cameras_and_take_over_expired_leases(monkeypatch, tmp_path):
+    camera_ids = _setup(monkeypatch, tmp_path)
+    for name in ("a", "b", "c"):
+        (tmp_path / name / "empty").mkdir(parents=True)
+    workers = [_worker(tmp_path, name) for name in ("a", "b", "c")]
+    for _ in range(2):  # the second round sees every worker registered
+        for worker in workers:
+            worker.tick()
+
+    assigned = [set(w.cameras) for w in workers]
+    assert all(len(cameras) == 2 for cameras in assigned)
+    assert set.union(*assigned) == set(camera_ids)
+    version = alerts_server.edge_watchlist.watchlist.fingerprint
+    assert all(w.watchlist_version == version for w in workers)
+    assert workers[0].system.watchlist.snapshot()[1] == ["alice"]
+
+    # Worker "c" goes silent; once its lease runs out the others pick up its cameras
+    async def expire(worker_id):
+        async with database.AsyncSessionLocal() as db:
+            silent = await db.get(models.EdgeWorker, worker_id)
+            silent.lease_expires_at = datetime.utcnow() - timedelta(seconds=1)
+            await db.commit()
+        await database.engine.dispose()
+
+    asyncio.run(expire(workers[2].worker_id))
+    for worker in workers[:2]:
+        worker.tick()
+    survivors = set(workers[0].cameras) | set(workers[1].cameras)
+    assert survivors == set(camera_ids)
+    assert not set(workers[0].cameras) & set(workers[1].cameras)
+
+    # The silent worker is told its lease is gone and stops its cameras
+    assert workers[2].client.post(f"/workers/{workers[2].worker_id}/heartbeat", json={}).status_code == 410
+    workers[2].lease_lost()
+    assert workers[2].cameras == {} and workers[2].system.cameras == {}
+
+
+def test_edge_worker_pushes_alerts_in_batches(monkeypatch, tmp_path):
+    _setup(monkeypatch, tmp_path)
+    (tmp_path / "a" / "empty").mkdir(parents=True)
+    worker = _worker(tmp_path, "a")
+    worker.register()
+    alert = {"name": "alice", "camera_id": 1, "timestamp": "20240101_000000", "filename": "a.jpg"}
+    messages = [{"id": str(i), "alert": alert} for i in range(5)]
+    messages.append({"id": "bad", "alert": {"camera_id": "x"}})
+    assert worker.alert_sender._try_deliver(messages) == 6
+    assert worker.alert_sender.sent_http == 5 and worker.alert_sender.rejected == 1
+    assert len(asyncio.run(alerts_server.alert_store.recent(10))) == 5
+
+
+def test_edge_snapshots_are_served_by_the_central_server(monkeypatch, tmp_path):
+    _setup(monkeypatch, tmp_path)
+    (tmp_path / "a" / "empty").mkdir(parents=True)
+    (tmp_path / "a" / "20240101_000000_cam1_alice.jpg").write_bytes(b"jpeg bytes")
+    worker = _worker(tmp_path, "a")
+    worker.register()
+    alert = {"name": "alice", "camera_id": 1, "timestamp": "20240101_000000"}
+    messages = [{"id": "0", "alert": {**alert, "filename": "20240101_000000_cam1_alice.jpg"}}]
+    assert worker.alert_sender._try_deliver(messages) == 1
+    response = worker.client.get("/incident/20240101_000000_cam1_alice.jpg")
+    assert response.status_code == 200 and response.content == b"jpeg bytes"
+
+    # A snapshot under an unsafe name is dropped; the alert itself is still stored
+    crafted = {"id": "1", "alert": {**alert, "filename": "../escape.jpg"},
+               "snapshot": base64.b64encode(b"outside").decode()}
+    result = worker.client.post(f"/workers/{worker.worker_id}/alerts", json={"alerts": [crafted]}).json()
+    assert result["results"][0]["ok"]
+    assert not (tmp_path / "escape.jpg").exists()
+    assert sorted(os.listdir(tmp_path / "central")) == ["20240101_000000_cam1_alice.jpg"]
+
+
+def test_edge_worker_retries_alerts_the_server_could_not_store_yet(monkeypatch, tmp_path):
+    _setup(monkeypatch, tmp_path)
+    (tmp_path / "a" / "empty").mkdir(parents=True)
+    dedup = MemoryDedup()
+    monkeypatch.setattr(alerts_server, "alert_dedup", dedup)
+    worker = _worker(tmp_path, "a")
+    worker.register()
+    alert = {"name": "alice", "camera_id": 1, "timestamp": "20240101_000000", "filename": "a.jpg"}
+    messages = [{"id": key, "alert": {**alert, "key": key}} for key in ("k0", "held", "k2")]
+    asyncio.run(dedup.claim("held"))  # another worker is still storing this key
+
+    assert worker.alert_sender._try_deliver(messages) == 1
+    assert worker.alert_sender.sent_http == 1 and worker.alert_sender.rejected == 0
+
+    asyncio.run(dedup.release("held"))
+    worker.alert_sender._retry_at = 0.0
+    assert worker.alert_sender._try_deliver(messages[1:]) == 2
+    assert len(asyncio.run(alerts_server.alert_store.recent(10))) == 3  # "k2" was acknowledged as a duplicate
+
+
+def test_worker_endpoints_require_the_worker_token(monkeypatch):
+    client = TestClient(alerts_server.app)
+    monkeypatch.setattr(worker_registry, "WORKER_TOKEN", "")
+    assert client.post("/workers/register", json={"name": "x"}).status_code == 503
+    monkeypatch.setattr(worker_registry, "WORKER_TOKEN", TOKEN)
+    response = client.post("/workers/register", json={"name": "x"}, headers={"Authorization": "Bearer wrong"})
+    assert response.status_code == 401
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from face_backends import PrefilteredDetector, camera_backend, create_detector, parse_detector
+
+
+def test_camera_backend_specs_are_normalised_and_validated():
+    assert camera_backend({"location": "North"}) is None
+    assert camera_backend({"detector": "haar+hog"}) == {
+        "detector": {"model": "hog", "prefilter": "haar", "upsample": 1},
+        "encoder": {"jitters": 1, "landmarks": "small"},
+    }
+    assert parse_detector({"model": "dnn", "confidence": 0.8}) == {"model": "dnn", "prefilter": None,
+                                                                   "confidence": 0.8}
+    for bad in ({"detector": "yolo"}, {"detector": "hog+haar"}, {"detector": {"model": "hog", "upsample": 9}},
+                {"encoder": {"landmarks": "huge"}}, {"encoder": {"jitters": 0}}):
+        with pytest.raises(ValueError):
+            camera_backend(bad)
+
+
+def test_opencv_detectors_need_local_model_files(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        create_detector("dnn", model_dir=str(tmp_path))
+    with pytest.raises(FileNotFoundError):
+        create_detector({"model": "dnn", "prefilter": "haar"}, model_dir=str(tmp_path))
+
+
+def test_prefilter_skips_the_main_detector_when_it_finds_nothing():
+    calls = []
+
+    def main(rgb):
+        calls.append(rgb.shape)
+        return [(1, 2, 3, 0)]
+
+    detector = PrefilteredDetector(lambda rgb: [(0, 1, 1, 0)] if rgb.any() else [], main)
+    assert detector(np.zeros((4, 4, 3), np.uint8)) == []
+    assert detector(np.ones((4, 4, 3), np.uint8)) == [(1, 2, 3, 0)]
+    assert detector.skipped == 1 and len(calls) == 1
@@ -0,0 +1,52 @@
+import cv2
+import numpy as np
+
+from face_quality import QualityGate, estimate_yaw, measure
+
+
+def textured_face(size=80, brightness=128):
+    rng = np.random.default_rng(0)
+    face = np.clip(rng.normal(brightness, 40, (size, size, 3)), 0, 255).astype(np.uint8)
+    image = np.full((200, 200, 3), brightness, np.uint8)
+    image[50:50 + size, 50:50 + size] = face
+    return image, (50, 50 + size, 50 + size, 50)
+
+
+def test_measure_scores_size_sharpness_and_brightness():
+    image, box = textured_face()
+    sharp = measure(image, box)
+    blurred = measure(cv2.GaussianBlur(image, (0, 0), 6), box)
+    assert sharp.size == 80 and abs(sharp.brightness - 128) < 5
+    assert sharp.sharpness > 10 * blurred.sharpness
+
+
+def test_gate_skips_encoding_for_poor_faces_and_counts_savings():
+    gate = QualityGate(min_size=30, min_sharpness=25)
+    image, good = textured_face()
+    dark, dark_box = textured_face(brightness=10)
+    blurred = cv2.GaussianBlur(image, (0, 0), 6)
+    tiny = (50, 70, 70, 50)
+
+    kept = gate.filter(image, [good, tiny])
+    assert [i for i, _ in kept] == [0] and 0 < kept[0][1].score <= 1
+    assert gate.filter(blurred, [good]) == []
+    assert gate.filter(dark, [dark_box]) == []
+
+    # Landmarks are fetched only for faces that passed the pixel checks
+    asked = []
+
+    def profile_landmarks(rgb, locations):
+        asked.append(len(locations))
+        return [{"left_eye": [(60, 70)], "right_eye": [(80, 70)], "nose_tip": [(95, 90)]}] * len(locations)
+
+    assert gate.filter(image, [good, tiny], profile_landmarks) == []
+    assert asked == [1]
+    stats = gate.stats()
+    assert stats["checked"] == 6 and stats["encoded"] == 1 and stats["encodings_saved"] == 5
+    assert stats["skipped"] == {"small": 2, "blurry": 1, "dark": 1, "bright": 0, "pose": 1}
+
+
+def test_yaw_is_zero_for_a_frontal_face():
+    frontal = {"left_eye": [(40, 50), (50, 50)], "right_eye": [(70, 50), (80, 50)], "nose_tip": [(60, 70)]}
+    assert estimate_yaw(frontal) == 0.0
+    assert estimate_yaw({"chin": [(0, 0)]}) is None
@@ -0,0 +1,55 @@
+import os
+
+import numpy as np
+
+import incident_store
+from frame_buffer import FrameRingBuffer, ClipEncoder
+
+
+def _frame(value: int) -> np.ndarray:
+    rng = np.random.default_rng(value)
+    return rng.integers(0, 255, size=(120, 160, 3), dtype=np.uint8)
+
+
+def test_ring_buffer_respects_memory_cap():
+    buf = FrameRingBuffer(max_bytes=60_000, max_seconds=60, fps=0)
+    for i in range(50):
+        buf.add(_frame(i), ts=1000.0 + i)
+    stats = buf.stats()
+    assert stats["bytes"] <= 60_000
+    assert stats["evicted"] > 0
+    assert stats["frames"] < 50
+
+
+def test_ring_buffer_drops_frames_outside_time_window_and_fps():
+    buf = FrameRingBuffer(max_bytes=10_000_000, max_seconds=5, fps=2)
+    assert buf.add(_frame(0), ts=100.0)
+    assert not buf.add(_frame(1), ts=100.1)  # above buffer FPS
+    for i in range(1, 20):
+        buf.add(_frame(i), ts=100.0 + i)
+    frames = buf.window(0, 1e9)
+    assert frames[0][0] >= 119.0 - 5
+
+
+def test_clip_encoder_writes_clip(tmp_path):
+    buf = FrameRingBuffer(max_bytes=10_000_000, max_seconds=60, fps=0)
+    for i in range(10):
+        buf.add(_frame(i), ts=200.0 + i * 0.2)
+    encoder = ClipEncoder(str(tmp_path), pre_seconds=1, post_seconds=1)
+    clip = encoder._encode(buf, "20250101_000000_cam0_alice.jpg", trigger_ts=201.0)
+    assert clip == "20250101_000000_cam0_alice.mp4"
+    assert os.path.getsize(os.path.join(str(tmp_path), clip)) > 0
+    assert os.listdir(tmp_path) == [clip]  # no scratch file left behind
+    assert encoder.clips_written == 1
+
+
+def test_clip_encoder_packs_clips_with_packed_storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(incident_store, "INCIDENT_STORAGE", "packed")
+    monkeypatch.setattr(incident_store, "_stores", {})
+    buf = FrameRingBuffer(max_bytes=10_000_000, max_seconds=60, fps=0)
+    for i in range(10):
+        buf.add(_frame(i), ts=200.0 + i * 0.2)
+    clip = ClipEncoder(str(tmp_path), pre_seconds=1, post_seconds=1)._encode(
+        buf, "20250101_000000_cam0_alice.jpg", trigger_ts=201.0)
+    assert incident_store.read_incident(clip, str(tmp_path))[4:8] == b"ftyp"
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".mp4")]
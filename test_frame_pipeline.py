@@ -0,0 +1,69 @@
+import threading
+import tracemalloc
+
+import cv2
+import numpy as np
+import pytest
+
+from capture import CameraCapture
+from frame_pipeline import Annotation, FramePool, FrameWorkspace
+from metrics import MetricsRegistry
+
+
+def clip(path, frames=12, size=(320, 240)):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), 25, size)
+    for i in range(frames):
+        writer.write(np.full((size[1], size[0], 3), i * 10, np.uint8))
+    writer.release()
+    return str(path)
+
+
+def test_capture_decodes_into_recycled_buffers(tmp_path):
+    pool, registry = FramePool(size=2), MetricsRegistry()
+    capture = CameraCapture(clip(tmp_path / "clip.avi"), pool=pool, drain=False, metrics=registry.scope(camera=1))
+    stop = threading.Event()
+    buffers, levels = set(), []
+    for frame, _ in capture.frames(stop):
+        buffers.add(id(frame))
+        levels.append(int(frame[0, 0, 0]))
+        pool.release(frame)
+        if len(levels) == 10:
+            stop.set()
+    assert len(buffers) == 1 and pool.allocated == 1 and pool.reused == 9
+    assert levels == sorted(levels) and len(set(levels)) == 10  # every frame decoded afresh
+    assert registry.histogram("capture", camera=1).count == 10
+
+    # A resolution change drops the pooled buffers of the old size
+    pool.release(np.zeros((10, 10, 3), np.uint8))
+    assert pool.shape == (10, 10, 3) and pool.stats()["pooled"] == 1
+
+
+def test_workspace_resizes_and_converts_without_allocating():
+    rng = np.random.default_rng(1)
+    frame = rng.integers(0, 255, (480, 640, 3), dtype=np.uint8)
+    view = frame[40:440, 100:600]  # an ROI crop: a strided view
+    workspace = FrameWorkspace()
+    expected = cv2.cvtColor(cv2.resize(view, (125, 100), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2RGB)
+    assert np.array_equal(workspace.resize_rgb(view, 0.25), expected)
+    annotations = [Annotation((10, 60, 60, 10), "alice")]
+    workspace.compose(frame, annotations)
+
+    tracemalloc.start()
+    base, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    for _ in range(20):
+        workspace.resize_rgb(view, 0.25)
+        workspace.compose(frame, annotations)
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    assert peak < 16 * 1024
+    assert workspace.allocations == 2
+
+
+def test_annotations_are_drawn_into_a_copy_of_the_read_only_original():
+    frame = np.zeros((120, 160, 3), np.uint8)
+    frame.flags.writeable = False
+    composed = FrameWorkspace().compose(frame, [Annotation((20, 80, 90, 30), "Unknown")], text="FPS: 25.0")
+    assert composed.any() and not frame.any()
+    with pytest.raises(cv2.error):
+        cv2.rectangle(frame, (0, 0), (5, 5), (255, 255, 255))
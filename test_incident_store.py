@@ -0,0 +1,102 @@
+import os
+import time
+
+import incident_store
+from incident_store import PackedIncidentStore
+
+
+def test_append_and_read_back(tmp_path):
+    store = PackedIncidentStore(str(tmp_path), segment_max_bytes=1024)
+    store.append("a_cam0_alice.jpg", b"A" * 100)
+    store.append("b_cam0_bob.jpg", b"B" * 200)
+
+    assert store.read("a_cam0_alice.jpg") == b"A" * 100
+    path, offset, length = store.lookup("b_cam0_bob.jpg")
+    assert (offset, length) == (100, 200)
+    assert b"".join(incident_store.iter_range(path, offset + 10, 5)) == b"BBBBB"
+    assert {e["filename"] for e in store.list()} == {"a_cam0_alice.jpg", "b_cam0_bob.jpg"}
+
+
+def test_segments_roll_and_retention_drops_whole_segments(tmp_path):
+    store = PackedIncidentStore(str(tmp_path), segment_max_bytes=150)
+    store.append("old1.jpg", b"x" * 100)
+    store.append("old2.jpg", b"y" * 100)  # rolls to segment 2
+    store.append("new.jpg", b"z" * 100)   # rolls to segment 3 (active)
+    assert len(os.listdir(store.segment_dir)) >= 3
+
+    conn = store._connect()
+    with conn:
+        conn.execute("UPDATE incidents SET created = ? WHERE filename != 'new.jpg'", (time.time() - 3 * 86400,))
+
+    assert store.enforce_retention(retention_days=1) == 2
+    assert store.lookup("old1.jpg") is None
+    assert store.read("new.jpg") == b"z" * 100
+    assert not os.path.exists(store.segment_path(1))
+
+
+def test_writers_sharing_a_directory_append_at_the_real_end(tmp_path):
+    first = PackedIncidentStore(str(tmp_path), segment_max_bytes=250)
+    second = PackedIncidentStore(str(tmp_path), segment_max_bytes=250)
+    blobs = {f"{i}.jpg": bytes([65 + i]) * 100 for i in range(6)}
+    for i, (name, data) in enumerate(blobs.items()):
+        (first if i % 2 == 0 else second).append(name, data)
+
+    for name, data in blobs.items():
+        assert first.read(name) == data
+        assert second.read(name) == data
+    assert [second.lookup(f"{i}.jpg")[1] for i in range(4)] == [0, 100, 0, 100]
+
+    conn = first._connect()
+    with conn:
+        conn.execute("UPDATE incidents SET created = ?", (time.time() - 3 * 86400,))
+    assert second.enforce_retention(retention_days=1) == 2
+    assert first.read("5.jpg") == blobs["5.jpg"]  # the shared active segment survives
+
+
+def test_parse_range():
+    assert incident_store.parse_range("bytes=0-9", 100) == (0, 9)
+    assert incident_store.parse_range("bytes=90-", 100) == (90, 99)
+    assert incident_store.parse_range("bytes=-10", 100) == (90, 99)
+    assert incident_store.parse_range("bytes=200-300", 100) is None
+    assert incident_store.parse_range(None, 100) is None
+
+
+def test_locate_prefers_loose_files(tmp_path):
+    (tmp_path / "loose.jpg").write_bytes(b"loose")
+    assert incident_store.locate_incident("loose.jpg", str(tmp_path)) == (str(tmp_path / "loose.jpg"), 0, 5)
+    assert incident_store.locate_incident("../loose.jpg", str(tmp_path)) is None
+
+
+def test_incident_endpoint_serves_packed_ranges(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+    import alerts_server
+
+    store = PackedIncidentStore(str(tmp_path))
+    store.append("20250101_000000_cam0_alice.jpg", b"0123456789")
+    monkeypatch.setattr(alerts_server, "INCIDENTS_FOLDER", str(tmp_path))
+    monkeypatch.setattr(incident_store, "_stores", {os.path.abspath(str(tmp_path)): store})
+    client = TestClient(alerts_server.app)
+
+    full = client.get("/incident/20250101_000000_cam0_alice.jpg")
+    assert full.status_code == 200
+    assert full.content == b"0123456789"
+    assert full.headers["content-type"] == "image/jpeg"
+
+    part = client.get("/incidents/20250101_000000_cam0_alice.jpg", headers={"Range": "bytes=2-4"})
+    assert part.status_code == 206
+    assert part.content == b"234"
+    assert part.headers["content-range"] == "bytes 2-4/10"
+
+    assert client.get("/incident/missing.jpg").status_code == 404
+
+
+def test_packed_store_per_root(tmp_path, monkeypatch):
+    monkeypatch.setattr(incident_store, "INCIDENT_STORAGE", "packed")
+    monkeypatch.setattr(incident_store, "_stores", {})
+    first = incident_store.get_packed_store(str(tmp_path / "a"))
+    second = incident_store.get_packed_store(str(tmp_path / "b"))
+    assert first is not second
+    assert incident_store.get_packed_store(str(tmp_path / "a" / ".." / "a")) is first
+    incident_store.save_incident("1.jpg", b"one", str(tmp_path / "b"))
+    assert second.read("1.jpg") == b"one"
+    assert first.read("1.jpg") is None
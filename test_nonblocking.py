@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+import httpx
+
+import alerts_server
+from loop_monitor import LoopLagMonitor
+from state_backends import MemoryAlertStore
+
+
+def _alert(i):
+    return {"name": f"person{i}", "camera_id": 1, "timestamp": "2025-01-01T00:00:00", "filename": f"{i}.jpg"}
+
+
+def test_concurrent_logins_do_not_delay_alert_ingest(app_db, tmp_path, monkeypatch):
+    """Load test: alert POST latency stays flat while bcrypt logins run."""
+    monkeypatch.setattr(alerts_server, "alert_store", MemoryAlertStore(str(tmp_path / "alerts.json")))
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=alerts_server.app)
+        monitor = LoopLagMonitor(interval=0.01, threshold=0.1)
+        monitor.start()
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            async def ingest(i):
+                started = time.perf_counter()
+                response = await client.post("/alerts", json=_alert(i))
+                assert response.status_code == 201
+                return time.perf_counter() - started
+
+            async def login():
+                started = time.perf_counter()
+                response = await client.post("/token", data={"username": "admin", "password": "changeme123"})
+                assert response.status_code == 200
+                return time.perf_counter() - started
+
+            baseline = [await ingest(i) for i in range(10)]
+
+            logins = [asyncio.create_task(login()) for _ in range(6)]
+            under_load = []
+            while not all(t.done() for t in logins):
+                under_load.append(await ingest(len(under_load)))
+                await asyncio.sleep(0.01)
+            login_times = await asyncio.gather(*logins)
+        await monitor.stop()
+        return baseline, under_load, login_times, monitor.stats()
+
+    baseline, under_load, login_times, lag = asyncio.run(scenario())
+    single_login = min(login_times)
+    # A blocking bcrypt call would hold every ingest for a whole hash.
+    assert len(under_load) >= 5
+    assert max(under_load) < single_login / 2
+    assert lag["max_lag_ms"] < single_login * 1000 / 2
+
+
+def test_loop_lag_monitor_detects_stall():
+    async def scenario():
+        monitor = LoopLagMonitor(interval=0.01, threshold=0.05)
+        monitor.start()
+        await asyncio.sleep(0.03)
+        time.sleep(0.12)  # block the loop
+        await asyncio.sleep(0.03)
+        await monitor.stop()
+        return monitor.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["stalls"] >= 1
+    assert stats["max_lag_ms"] >= 100
@@ -0,0 +1,194 @@
+import asyncio
+import json
+
+from notification_dispatcher import NotificationDispatcher, Outbox
+from rule_index import CompiledRule
+
+
+class SmtpStandIn:
+    """Just enough SMTP to accept messages over plain TCP."""
+
+    def __init__(self):
+        self.connections = 0
+        self.messages = []
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        writer.write(b"220 standin ESMTP\r\n")
+        in_data, lines = False, []
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if in_data:
+                if line == b".\r\n":
+                    self.messages.append(b"".join(lines).decode())
+                    in_data, lines = False, []
+                    writer.write(b"250 queued\r\n")
+                else:
+                    lines.append(line)
+                continue
+            cmd = line.strip().upper()
+            if cmd.startswith(b"EHLO"):
+                writer.write(b"250-standin\r\n250 OK\r\n")
+            elif cmd.startswith(b"DATA"):
+                in_data = True
+                writer.write(b"354 go ahead\r\n")
+            elif cmd.startswith(b"QUIT"):
+                writer.write(b"221 bye\r\n")
+                await writer.drain()
+                break
+            else:
+                writer.write(b"250 OK\r\n")
+            await writer.drain()
+        writer.close()
+
+
+class HttpSink:
+    """Minimal HTTP/1.1 server that fails the first ``fail_first`` requests."""
+
+    def __init__(self, fail_first: int = 0):
+        self.fail_first = fail_first
+        self.bodies = []
+        self.requests = 0
+
+    async def handle(self, reader, writer):
+        while True:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except asyncio.IncompleteReadError:
+                break
+            length = 0
+            for line in head.decode().split("\r\n"):
+                if line.lower().startswith("content-length:"):
+                    length = int(line.split(":", 1)[1])
+            body = await reader.readexactly(length)
+            self.requests += 1
+            if self.requests <= self.fail_first:
+                writer.write(b"HTTP/1.1 503 Unavailable\r\nContent-Length: 0\r\n\r\n")
+            else:
+                self.bodies.append(json.loads(body))
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n")
+            await writer.drain()
+        writer.close()
+
+
+def _rule(rule_id, notification_type, config):
+    return CompiledRule(id=rule_id, name=f"rule{rule_id}", camera_id=1, person_name="*", cooldown=0,
+                        notification_type=notification_type, notification_config=config)
+
+
+def _detection(name):
+    return {"name": name, "camera_id": 1, "timestamp": "2025-01-01T00:00:00", "filename": f"{name}.jpg"}
+
+
+async def _wait_for(predicate, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.02)
+
+
+def test_email_reuses_smtp_connection_and_webhook_retries(tmp_path):
+    async def scenario():
+        smtp, sink = SmtpStandIn(), HttpSink(fail_first=2)
+        smtp_server = await asyncio.start_server(smtp.handle, "127.0.0.1", 0)
+        http_server = await asyncio.start_server(sink.handle, "127.0.0.1", 0)
+        smtp_port = smtp_server.sockets[0].getsockname()[1]
+        http_port = http_server.sockets[0].getsockname()[1]
+
+        dispatcher = NotificationDispatcher(outbox_path=str(tmp_path / "outbox.db"), workers=2,
+                                            per_destination=1, backoff_base=0.05, poll_interval=0.05)
+        email_rule = _rule(1, "email", {"to_email": "ops@example.com", "smtp_host": "127.0.0.1",
+                                        "smtp_port": smtp_port, "smtp_username": "alerts@example.com",
+                                        "use_tls": False, "coalesce_max_delay": 0})
+        webhook_rule = _rule(2, "webhook", {"webhook_url": f"http://127.0.0.1:{http_port}/hook",
+                                            "coalesce_max_delay": 0})
+        try:
+            for name in ("alice", "bob", "carol"):
+                await dispatcher.submit(email_rule, _detection(name))
+            await dispatcher.submit(webhook_rule, _detection("dave"))
+            await _wait_for(lambda: len(smtp.messages) == 3 and len(sink.bodies) == 1)
+            await _wait_for(lambda: dispatcher.stats()["outbox"].get("delivered") == 4)
+            return smtp, sink, dispatcher.stats()
+        finally:
+            await dispatcher.stop()
+            smtp_server.close()
+            http_server.close()
+
+    smtp, sink, stats = asyncio.run(scenario())
+    assert smtp.connections == 1
+    assert sink.requests == 3
+    assert sink.bodies[0]["detection"]["name"] == "dave"
+    assert stats["channels"]["webhook"]["retried"] == 2
+    assert stats["channels"]["email"]["delivered"] == 3
+
+
+def test_outbox_survives_restart(tmp_path):
+    outbox_path = str(tmp_path / "outbox.db")
+
+    async def enqueue_only():
+        dispatcher = NotificationDispatcher(outbox_path=outbox_path, workers=1, poll_interval=60)
+        await dispatcher.start()
+        # Simulate a crash right after a row was claimed but before delivery
+        await dispatcher.stop()
+        dispatcher.outbox.add("webhook", "http://127.0.0.1:9/hook", {"json": {}, "config": {}})
+        dispatcher.outbox.claim_due(10)
+        return dispatcher.outbox.counts()
+
+    async def restart():
+        dispatcher = NotificationDispatcher(outbox_path=outbox_path, workers=1, poll_interval=60,
+                                            claim_timeout=30)
+        await dispatcher.start()
+        counts = dispatcher.outbox.counts()
+        await dispatcher.stop()
+        return counts
+
+    assert asyncio.run(enqueue_only()) == {"sending": 1}
+    # A fresh claim may belong to another live worker and is left alone
+    assert asyncio.run(restart()) == {"sending": 1}
+    outbox = Outbox(outbox_path)
+    with outbox._conn:
+        outbox._conn.execute("UPDATE outbox SET claimed_at = claimed_at - 60")
+    assert asyncio.run(restart()).get("sending", 0) == 0
+
+
+def test_outbox_prunes_finished_rows(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"))
+    for _ in range(3):
+        outbox.add("webhook", "http://127.0.0.1:9/hook", {"json": {}, "config": {}})
+    first, second, _ = [row[0] for row in outbox.claim_due(10)]
+    outbox.mark_delivered(first)
+    outbox.mark_failed(second, "boom", None)
+    with outbox._conn:
+        outbox._conn.execute("UPDATE outbox SET created_at = created_at - 10 * 86400")
+
+    assert outbox.prune(retention_days=7) == 2
+    assert outbox.counts() == {"sending": 1}
+
+
+def test_storm_is_coalesced_into_digests(tmp_path):
+    async def scenario():
+        sink = HttpSink()
+        http_server = await asyncio.start_server(sink.handle, "127.0.0.1", 0)
+        http_port = http_server.sockets[0].getsockname()[1]
+        dispatcher = NotificationDispatcher(outbox_path=str(tmp_path / "outbox.db"), workers=2,
+                                            poll_interval=0.05)
+        rule = _rule(3, "webhook", {"webhook_url": f"http://127.0.0.1:{http_port}/hook",
+                                    "coalesce_max_delay": 0.3, "coalesce_max_batch": 50})
+        try:
+            for i in range(100):
+                await dispatcher.submit(rule, _detection(f"person{i}"))
+            await _wait_for(lambda: sum(b.get("count", 1) for b in sink.bodies) == 100)
+            return sink, dispatcher.stats()
+        finally:
+            await dispatcher.stop()
+            http_server.close()
+
+    sink, stats = asyncio.run(scenario())
+    assert len(sink.bodies) == 3
+    singles = [b for b in sink.bodies if not b.get("digest")]
+    assert [b["detection"]["name"] for b in singles] == ["person0"]
+    assert sorted(b["count"] for b in sink.bodies if b.get("digest")) == [49, 50]
+    assert stats["digests_sent"] == 2
+    assert stats["suppressed"] == 97
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from regions import RegionFilter, camera_regions, parse_polygons
+
+
+def test_polygons_must_be_normalised_and_closed():
+    assert parse_polygons([[[0, 0], [1, 0], [1, 1]]]) == [[(0.0, 0.0), (1.0, 0.0), (1.0, 1.0)]]
+    for bad in ([[[0, 0], [1, 1]]], [[[0, 0], [1, 0], [1, 1.5]]], "roi"):
+        with pytest.raises(ValueError):
+            parse_polygons(bad)
+    assert camera_regions({"location": "North"}) is None
+
+
+def test_frames_are_cropped_to_the_roi_and_masked_faces_dropped():
+    # ROI: right half of the frame; mask: its top-right quarter
+    region = RegionFilter(roi=[[(0.5, 0.0), (1.0, 0.0), (1.0, 1.0), (0.5, 1.0)]],
+                          masks=[[(0.75, 0.0), (1.0, 0.0), (1.0, 0.5), (0.75, 0.5)]])
+    frame = np.zeros((100, 200, 3), np.uint8)
+    view, (x0, y0) = region.crop(frame)
+    assert (x0, y0) == (96, 0) and view.shape[:2] == (100, 104)
+    assert region.area_fraction == pytest.approx(0.52)
+    assert view.base is frame  # a view, not a copy
+
+    width, height = 200, 100
+    assert region.allows((60, 130, 80, 110), width, height)  # inside the ROI
+    assert not region.allows((60, 40, 80, 20), width, height)  # left half
+    assert not region.allows((10, 190, 30, 170), width, height)  # masked corner
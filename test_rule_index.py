@@ -0,0 +1,104 @@
+import asyncio
+import threading
+
+from rule_index import CompiledRule, RuleIndex
+from state_backends import MemoryAlertStore, SqliteCooldowns
+
+
+def _rule(id, camera_id, person, cooldown=60, enabled=True):
+    return CompiledRule(id=id, name=f"rule{id}", camera_id=camera_id, person_name=person,
+                        cooldown=cooldown, notification_type="webhook",
+                        notification_config={"webhook_url": "http://sink"}, enabled=enabled)
+
+
+def test_match_uses_exact_and_wildcard_buckets():
+    index = RuleIndex()
+    index.rebuild([_rule(1, 1, "alice"), _rule(2, 1, "*"), _rule(3, 2, "alice"),
+                   _rule(4, None, "*"), _rule(5, 1, "alice", enabled=False)])
+    assert sorted(r.id for r in index.match(1, "alice")) == [1, 2, 4]
+    assert sorted(r.id for r in index.match(1, "bob")) == [2, 4]
+    assert sorted(r.id for r in index.match(3, "carol")) == [4]
+
+
+def test_cooldown_is_tracked_per_rule_and_person():
+    index = RuleIndex()
+    index.rebuild([_rule(1, 1, "*", cooldown=10)])
+    alice = {"name": "alice", "camera_id": 1}
+    bob = {"name": "bob", "camera_id": 1}
+    assert [r.id for r in asyncio.run(index.evaluate(alice, now=100))] == [1]
+    assert asyncio.run(index.evaluate(alice, now=105)) == []
+    assert [r.id for r in asyncio.run(index.evaluate(bob, now=105))] == [1]
+    assert [r.id for r in asyncio.run(index.evaluate(alice, now=111))] == [1]
+    assert index.stats()["suppressed"] == 1
+
+
+def test_shared_cooldowns_fire_once_across_workers_without_blocking_the_loop(tmp_path):
+    db = str(tmp_path / "state.db")
+    workers = [RuleIndex(), RuleIndex()]
+    for index in workers:
+        index.rebuild([_rule(1, 1, "*", cooldown=10), _rule(2, None, "alice", cooldown=0)])
+        index.use_cooldowns(SqliteCooldowns(db))
+    threads = []
+    gate = workers[0]._cooldowns
+    original = gate._try_fire
+
+    def recording(*args):
+        threads.append(threading.current_thread())
+        return original(*args)
+
+    gate._try_fire = recording
+    alice = {"name": "alice", "camera_id": 1}
+
+    async def scenario():
+        first = await workers[0].evaluate(alice, now=100.0)
+        second = await workers[1].evaluate(alice, now=105.0)
+        await workers[1].remove(1)
+        third = await workers[0].evaluate(alice, now=106.0)
+        return first, second, third
+
+    first, second, third = asyncio.run(scenario())
+    assert sorted(r.id for r in first) == [1, 2]
+    assert [r.id for r in second] == [2]  # rule 1 is cooling down on the other worker
+    assert sorted(r.id for r in third) == [1, 2]  # removing rule 1 cleared its shared cooldown
+    assert threads and threading.main_thread() not in threads
+
+
+def test_upsert_and_remove_patch_the_index():
+    index = RuleIndex()
+    index.upsert(_rule(1, 1, "alice"))
+    assert [r.id for r in index.match(1, "alice")] == [1]
+    index.upsert(_rule(1, 2, "alice"))
+    assert index.match(1, "alice") == []
+    asyncio.run(index.remove(1))
+    assert index.match(2, "alice") == []
+
+
+def test_rule_crud_updates_ingest_evaluation(app_db, tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+    import alerts_server
+
+    monkeypatch.setattr(alerts_server, "alert_store", MemoryAlertStore(str(tmp_path / "alerts.json")))
+    submitted = []
+
+    async def fake_submit(rule, detection):
+        submitted.append(rule.id)
+
+    monkeypatch.setattr(alerts_server.dispatcher, "submit", fake_submit)
+    client = TestClient(alerts_server.app)
+    token = client.post("/token", data={"username": "admin", "password": "changeme123"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    rule = client.post("/alert-rules/", headers=headers, json={
+        "name": "gate", "camera_id": 77, "person_name": "*", "cooldown": 300,
+        "notification_type": "webhook", "notification_config": {"webhook_url": "http://sink"},
+    })
+    assert rule.status_code == 200
+    rule_id = rule.json()["id"]
+    alert = {"name": "mallory", "camera_id": 77, "timestamp": "2025-01-01T00:00:00", "filename": "m.jpg"}
+    try:
+        assert client.post("/alerts", json=alert).json()["rules_fired"] == [rule_id]
+        assert client.post("/alerts", json=alert).json()["rules_fired"] == []
+        assert submitted == [rule_id]
+    finally:
+        client.delete(f"/alert-rules/{rule_id}", headers=headers)
+    assert alerts_server.rule_index.match(77, "mallory") == []
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import sys
+
+from state_backends import MemoryDedup, PidFileWatchState, SqliteAlertStore, SqliteBus, SqliteCooldowns, SqliteDedup
+
+
+def test_sqlite_alert_store_is_shared_between_workers(tmp_path):
+    db = str(tmp_path / "state.db")
+    legacy = tmp_path / "alerts.json"
+    legacy.write_text(json.dumps([{"name": "old", "camera_id": 1, "seq": 7}]))
+
+    async def scenario():
+        first = SqliteAlertStore(db, import_from=str(legacy))
+        second = SqliteAlertStore(db, import_from=str(legacy))  # must not import twice
+        a = await first.append({"name": "alice", "camera_id": 1})
+        b = await second.append({"name": "bob", "camera_id": 2})
+        return a, b, await second.recent(10), await first.recent(10, name="alice"), await first.purge_name("bob")
+
+    a, b, recent, alice, purged = asyncio.run(scenario())
+    assert b["seq"] == a["seq"] + 1
+    assert [x["name"] for x in recent] == ["bob", "alice", "old"]
+    assert [x["seq"] for x in alice] == [a["seq"]]
+    assert purged == 1
+
+
+def test_sqlite_bus_delivers_across_instances_once(tmp_path):
+    db = str(tmp_path / "state.db")
+
+    async def scenario():
+        worker_a, worker_b = SqliteBus(db, poll_interval=0.01), SqliteBus(db, poll_interval=0.01)
+        seen_a, seen_b = [], []
+        worker_a.subscribe("alerts", seen_a.append)
+        worker_b.subscribe("alerts", seen_b.append)
+        await worker_a.start()
+        await worker_b.start()
+        await worker_a.publish("alerts", {"n": 1})
+        await worker_b.publish("alerts", {"n": 2}, local=False)
+        await asyncio.sleep(0.2)
+        await worker_a.stop()
+        await worker_b.stop()
+        return seen_a, seen_b
+
+    seen_a, seen_b = asyncio.run(scenario())
+    assert seen_a == [{"n": 1}, {"n": 2}]
+    assert seen_b == [{"n": 1}]
+
+
+def test_sqlite_cooldowns_fire_once_across_workers(tmp_path):
+    db = str(tmp_path / "state.db")
+    first, second = SqliteCooldowns(db), SqliteCooldowns(db)
+
+    async def scenario():
+        results = [
+            await first.try_fire(1, "alice", 10, now=100.0),
+            await second.try_fire(1, "alice", 10, now=105.0),
+            await second.try_fire(1, "bob", 10, now=105.0),
+            await second.try_fire(1, "alice", 10, now=111.0),
+        ]
+        await first.forget(1)
+        return results + [await first.try_fire(1, "alice", 10, now=112.0)]
+
+    assert asyncio.run(scenario()) == [True, False, True, True, True]
+
+
+def test_dedup_keys_are_bounded_by_window_and_count(tmp_path):
+    now = [0.0]
+    memory = MemoryDedup(window=60, max_keys=3, clock=lambda: now[0])
+    first, second = (SqliteDedup(str(tmp_path / "state.db"), window=60, clock=lambda: now[0]) for _ in range(2))
+
+    async def scenario():
+        results = []
+        for dedup, other in ((memory, memory), (first, second)):
+            assert await dedup.claim("a") == (True, None)
+            assert await other.claim("a") == (False, None)  # first copy still being stored
+            await dedup.record("a", 7)
+            assert await other.claim("a") == (False, 7)
+            assert await dedup.claim("b") == (True, None)
+            await dedup.release("b")  # storing failed: the retry is accepted
+            assert await other.claim("b") == (True, None)
+        now[0] = 61.0
+        results.append(await first.claim("a"))
+        for key in "cdef":
+            await memory.claim(key)
+        return results
+
+    assert asyncio.run(scenario()) == [(True, None)]
+    assert memory.stats()["keys"] == 3 and memory.stats()["evicted"] == 1
+    assert list(memory._keys) == ["d", "e", "f"]  # "a" and "b" expired, "c" evicted
+
+
+def test_sqlite_dedup_frees_a_claim_whose_worker_died(tmp_path):
+    now = [100.0]
+    crashed, survivor = (SqliteDedup(str(tmp_path / "state.db"), window=60, clock=lambda: now[0],
+                                     inflight_timeout=5) for _ in range(2))
+
+    async def scenario():
+        assert await crashed.claim("a") == (True, None)  # never followed by record or release
+        results = [await survivor.claim("a")]
+        now[0] += 6
+        results.append(await survivor.claim("a"))
+        await survivor.record("a", 9)
+        now[0] += 6
+        results.append(await crashed.claim("a"))  # a recorded key stays a duplicate
+        return results
+
+    assert asyncio.run(scenario()) == [(False, None), (True, None), (False, 9)]
+
+
+def test_pid_file_watch_state_is_visible_to_other_workers(tmp_path):
+    path = str(tmp_path / "watch.json")
+    owner, other = PidFileWatchState(path), PidFileWatchState(path)
+    started = owner.start([sys.executable, "-c", "import time; time.sleep(30)"], str(tmp_path))
+    assert started["status"] == "started"
+    assert other.start(["true"], str(tmp_path))["status"] == "already_running"
+    assert other.status() == {"status": "running", "pid": started["pid"]}
+    assert other.stop() == {"status": "stopped"}
+    assert owner.status() == {"status": "stopped"}
@@ -0,0 +1,119 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from camera_telemetry import read_heartbeat
+from watch_control import WatchControl, WatcherUnavailable
+from watch_daemon import ControlServer, WatchDaemon
+
+
+class FakeSystem:
+    def __init__(self):
+        self.cameras = {}
+        self.paused = False
+        self.reloads = 0
+
+    def set_cameras(self, cameras):
+        self.cameras = dict(cameras)
+
+    def add_camera(self, camera_id, source, name=None, evidence_source=None, regions=None, backend=None):
+        self.cameras[camera_id] = (source, name, evidence_source, regions, backend)
+
+    def remove_camera(self, camera_id):
+        return self.cameras.pop(camera_id, None) is not None
+
+    def pause(self):
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+
+    def reload_watchlist(self):
+        self.reloads += 1
+        return {"faces": 3, "encoded": 1}
+
+    def status(self):
+        return {"cameras": {cid: {"source": str(src), "name": name} for cid, (src, name, *_) in self.cameras.items()}}
+
+
+def test_daemon_routes_commands_to_the_system():
+    system = FakeSystem()
+    daemon = WatchDaemon(system)
+    assert daemon.handle("GET", "/status", {})[1]["status"] == "stopped"
+
+    # Camera edits while stopped wait for the next /start
+    daemon.handle("PUT", "/cameras/5", {"source": "rtsp://x"})
+    assert system.cameras == {}
+
+    code, body = daemon.handle("POST", "/start", {"cameras": [{"id": 1, "source": "0", "name": "Desk"}]})
+    assert code == 200 and body["status"] == "running"
+    assert system.cameras == {1: ("0", "Desk", None, None, None)}
+    daemon.handle("PUT", "/cameras/2", {"source": "rtsp://gate/sub", "name": "Gate", "evidence_source": "rtsp://gate"})
+    daemon.handle("DELETE", "/cameras/1", {})
+    assert system.cameras == {2: ("rtsp://gate/sub", "Gate", "rtsp://gate", None, None)}
+
+    assert daemon.handle("POST", "/pause", {})[1]["status"] == "paused"
+    assert daemon.handle("POST", "/resume", {})[1]["status"] == "running"
+    assert daemon.handle("POST", "/stop", {})[1]["status"] == "stopped"
+    assert system.cameras == {}
+
+    assert daemon.handle("PUT", "/cameras/x", {})[0] == 400
+    assert daemon.handle("POST", "/start", {"cameras": [{"id": 1}]})[0] == 400
+    assert daemon.handle("GET", "/nope", {})[0] == 404
+
+
+def test_control_client_talks_to_daemon_over_unix_socket(tmp_path):
+    sock = str(tmp_path / "watcher.sock")
+    control = WatchControl(sock, timeout=2)
+
+    async def unavailable():
+        with pytest.raises(WatcherUnavailable):
+            await control.request("GET", "/status")
+        return await control.status()
+
+    assert asyncio.run(unavailable()) is None
+
+    system = FakeSystem()
+    daemon = WatchDaemon(system)
+    server = ControlServer(sock, daemon)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        async def scenario():
+            ready = await control.wait_ready(timeout=2)
+            started = await control.request("POST", "/start", json={"cameras": [{"id": 3, "source": "0"}]})
+            await control.camera_changed({"id": 4, "source": "rtsp://door", "name": "Door", "enabled": True})
+            await control.camera_changed({"id": 3, "source": "0", "enabled": False})
+            await control.watchlist_changed()
+            await control.request("POST", "/shutdown")
+            return ready, started
+
+        ready, started = asyncio.run(scenario())
+        assert ready["status"] == "stopped"
+        assert started["status"] == "running"
+        assert system.cameras == {4: ("rtsp://door", "Door", None, None, None)}
+        assert system.reloads == 1
+        assert daemon.shutdown_requested.is_set()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_heartbeat_publishes_status_until_shutdown(tmp_path):
+    path = str(tmp_path / "beat.json")
+    daemon = WatchDaemon(FakeSystem())
+    daemon.start([{"id": 1, "source": "0"}])
+    thread = threading.Thread(target=daemon.heartbeat_loop, args=(path, 0.01))
+    thread.start()
+    try:
+        deadline = time.monotonic() + 2
+        while read_heartbeat(path) is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        beat = read_heartbeat(path)
+        assert beat["status"] == "running" and beat["fresh"]
+        assert beat["cameras"]["1"]["source"] == "0"
+    finally:
+        daemon.shutdown_requested.set()
+        thread.join()
+    assert read_heartbeat(path) is None
@@ -0,0 +1,118 @@
+import httpx
+
+import watch_supervisor
+from watch_supervisor import Shard, ShardedSystem, WatchSupervisor, camera_streams, estimate_cost, plan_shards
+
+
+def test_plan_spreads_cost_evenly_and_scales_linearly():
+    costs = {i: 1.0 for i in range(40)}
+    for shards in (1, 2, 4, 8):
+        plan = plan_shards(costs, shards)
+        per_shard = [sum(1 for s in plan.values() if s == k) for k in range(shards)]
+        assert per_shard == [40 // shards] * shards
+
+    mixed = {1: 4.0, 2: 1.0, 3: 1.0, 4: 1.0, 5: 1.0}
+    plan = plan_shards(mixed, 2)
+    loads = [sum(mixed[c] for c, s in plan.items() if s == k) for k in range(2)]
+    assert sorted(loads) == [4.0, 4.0]
+
+
+def test_plan_moves_only_what_is_needed():
+    costs = {i: 1.0 for i in range(8)}
+    before = plan_shards(costs, 4)
+    after = plan_shards({**costs, 8: 1.0}, 4, before)
+    assert all(after[c] == before[c] for c in costs)
+
+    # Removing two cameras from one shard pulls exactly one camera over
+    emptied = [c for c, s in before.items() if s == 0]
+    remaining = {c: 1.0 for c in costs if c not in emptied}
+    rebalanced = plan_shards(remaining, 4, before)
+    assert sum(1 for c in remaining if rebalanced[c] != before[c]) == 1
+
+
+def test_camera_streams_split_analysis_and_evidence():
+    assert camera_streams("rtsp://cam/main") == ("rtsp://cam/main", None)
+    assert camera_streams("rtsp://cam/main", {"analysis_source": "rtsp://cam/sub"}) == ("rtsp://cam/sub", "rtsp://cam/main")
+    config = {"analysis_source": "rtsp://cam/sub", "evidence_source": "rtsp://cam/4k"}
+    assert camera_streams("rtsp://cam/main", config) == ("rtsp://cam/sub", "rtsp://cam/4k")
+    assert camera_streams("rtsp://cam/main", {"analysis_source": "rtsp://cam/main"}) == ("rtsp://cam/main", None)
+
+
+def test_estimate_cost_uses_hints():
+    assert estimate_cost({"source": "rtsp://cam"}) == 1.0
+    assert estimate_cost({"source": "rtsp://cam", "width": 1280, "height": 720, "fps": 15}) < 0.3
+    assert estimate_cost({"source": "0"}) < estimate_cost({"source": "rtsp://cam"})
+    assert estimate_cost({"source": "rtsp://cam", "decode_cost": 3}) == 3.0
+
+
+class FakeShard(Shard):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.running = False
+        self.cameras = []
+        self.calls = []
+
+    def spawn(self, cwd=None):
+        self.running = True
+        self.synced = False
+        self.started_at = watch_supervisor.time.monotonic()
+
+    def alive(self):
+        return self.running
+
+    def ready(self):
+        return self.running
+
+    @property
+    def pid(self):
+        return 1000 + self.index if self.running else None
+
+    def request(self, method, path, json=None, timeout=5.0):
+        if not self.running:
+            raise httpx.ConnectError("down")
+        self.calls.append(path)
+        if path == "/start":
+            self.cameras = sorted(c["id"] for c in json["cameras"])
+        elif path == "/stop":
+            self.cameras = []
+        return {"status": "ok", "watchlist": {"faces": 2}}
+
+    def terminate(self, timeout=10.0):
+        self.running = False
+
+
+def test_sharded_system_rebalances_and_restarts_crashed_shards(tmp_path, monkeypatch):
+    system = ShardedSystem(2, str(tmp_path / "w.sock"), str(tmp_path / "beat.json"), shard_factory=FakeShard)
+    monkeypatch.setattr(system, "_monitor_loop", lambda: None)
+    system.start_workers()
+    supervisor = WatchSupervisor(system)
+    supervisor.start([{"id": i, "source": f"rtsp://cam{i}"} for i in range(4)])
+    first, second = system.shards
+    assert (len(first.cameras), len(second.cameras)) == (2, 2)
+
+    supervisor.put_camera(9, {"source": "rtsp://big", "decode_cost": 2})
+    assert sorted(first.cameras + second.cameras) == [0, 1, 2, 3, 9]
+    supervisor.delete_camera(9)
+    supervisor.handle("POST", "/pause", {})
+    assert "/pause" in first.calls and "/pause" in second.calls
+
+    # Crash: restart is delayed by the backoff, then the cameras are pushed back
+    lost = list(second.cameras)
+    second.running = False
+    second.cameras = []
+    clock = [watch_supervisor.time.monotonic()]
+    monkeypatch.setattr(watch_supervisor.time, "monotonic", lambda: clock[0])
+    system._check(second)
+    assert not second.running and second.backoff == 1.0
+    clock[0] += 1.5
+    system._check(second)
+    assert second.running and second.restarts == 1
+    system._check(second)
+    assert second.cameras == lost and second.calls[-1] == "/pause"
+
+    status = supervisor.status()
+    assert status["status"] == "paused"
+    assert [s["cameras"] for s in status["shards"]] == [first.cameras, second.cameras]
+    assert set(status["cameras"]) == {0, 1, 2, 3}
+    system.stop()
+    assert not first.running and not second.running
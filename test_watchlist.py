@@ -0,0 +1,61 @@
+import numpy as np
+
+from watchlist import Watchlist
+
+
+def _encoder(calls):
+    def encode(path):
+        calls.append(path)
+        if "noface" in path:
+            return None
+        return np.full(128, float(len(calls)))
+    return encode
+
+
+def _add(root, person, name, data=b"img"):
+    folder = root / person
+    folder.mkdir(exist_ok=True)
+    (folder / name).write_bytes(data)
+    return folder / name
+
+
+def test_reload_only_encodes_new_and_changed_images(tmp_path):
+    root = tmp_path / "faces"
+    root.mkdir()
+    _add(root, "alice", "1.jpg")
+    _add(root, "bob", "1.png")
+    _add(root, "bob", "noface.jpg")
+    calls = []
+    watchlist = Watchlist(str(root), encoder=_encoder(calls))
+
+    first = watchlist.reload()
+    assert first["encoded"] == 3 and first["faces"] == 2 and first["people"] == 2
+    assert sorted(watchlist.snapshot()[1]) == ["alice", "bob"]
+
+    _add(root, "carol", "1.jpg")
+    _add(root, "alice", "1.jpg", b"a different photo")
+    (root / "bob" / "1.png").unlink()
+    calls.clear()
+    second = watchlist.reload()
+    assert sorted(calls) == [str(root / "alice" / "1.jpg"), str(root / "carol" / "1.jpg")]
+    assert (second["encoded"], second["reused"], second["removed"]) == (2, 1, 1)
+    assert sorted(watchlist.snapshot()[1]) == ["alice", "carol"]
+
+
+def test_encoding_cache_survives_restart(tmp_path):
+    root = tmp_path / "faces"
+    root.mkdir()
+    _add(root, "alice", "1.jpg")
+    _add(root, "bob", "noface.jpg")
+    calls = []
+    first = Watchlist(str(root), encoder=_encoder(calls))
+    first.reload()
+    encodings, names = first.snapshot()
+
+    calls.clear()
+    restarted = Watchlist(str(root), encoder=_encoder(calls))
+    stats = restarted.reload()
+    assert calls == []
+    assert stats["reused"] == 2
+    assert restarted.snapshot()[1] == names
+    assert np.array_equal(restarted.snapshot()[0], encodings)
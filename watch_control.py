@@ -0,0 +1,83 @@
+"""
+Client for the watcher daemon's control socket (see ``watch_daemon.py``).
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+WATCH_CONTROL_SOCKET = os.getenv("WATCH_CONTROL_SOCKET", "watcher.sock")
+WATCH_CONTROL_TIMEOUT = float(os.getenv("WATCH_CONTROL_TIMEOUT", "5"))
+WATCH_DAEMON_START_TIMEOUT = float(os.getenv("WATCH_DAEMON_START_TIMEOUT", "30"))
+WATCH_RELOAD_TIMEOUT = float(os.getenv("WATCH_RELOAD_TIMEOUT", "300"))
+
+
+class WatcherUnavailable(Exception):
+    """The daemon is not running or not answering on its socket."""
+
+
+class WatchControl:
+    def __init__(self, socket_path: str = WATCH_CONTROL_SOCKET, timeout: float = WATCH_CONTROL_TIMEOUT):
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    async def request(self, method: str, path: str, json: Optional[Dict[str, Any]] = None,
+                      timeout: Optional[float] = None) -> Dict[str, Any]:
+        if not os.path.exists(self.socket_path):
+            raise WatcherUnavailable(f"No control socket at {self.socket_path}")
+        transport = httpx.AsyncHTTPTransport(uds=self.socket_path)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://watcher",
+                                         timeout=timeout or self.timeout) as client:
+                response = await client.request(method, path, json=json)
+        except (httpx.ConnectError, httpx.RemoteProtocolError, httpx.TimeoutException) as e:
+            raise WatcherUnavailable(str(e)) from e
+        response.raise_for_status()
+        return response.json()
+
+    async def status(self) -> Optional[Dict[str, Any]]:
+        """Daemon status, or None when it is not reachable."""
+        try:
+            return await self.request("GET", "/status")
+        except WatcherUnavailable:
+            return None
+
+    async def wait_ready(self, timeout: float = WATCH_DAEMON_START_TIMEOUT) -> Optional[Dict[str, Any]]:
+        """Poll until a freshly spawned daemon answers (model load can take seconds)."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            status = await self.status()
+            if status is not None:
+                return status
+            await asyncio.sleep(0.1)
+        return None
+
+    async def notify(self, method: str, path: str, json: Optional[Dict[str, Any]] = None,
+                     timeout: Optional[float] = None) -> None:
+        """Best-effort push of a change; a stopped daemon picks it up on its next start."""
+        try:
+            await self.request(method, path, json=json, timeout=timeout)
+        except (WatcherUnavailable, httpx.HTTPError) as e:
+            logger.debug(f"Watcher not notified of {method} {path}: {e}")
+
+    async def camera_changed(self, camera: Dict[str, Any]) -> None:
+        if camera.get("enabled", True) and camera.get("source"):
+            body = {k: v for k, v in camera.items() if k not in ("id", "enabled")}
+            await self.notify("PUT", f"/cameras/{camera['id']}", body)
+        else:
+            await self.camera_removed(camera["id"])
+
+    async def camera_removed(self, camera_id: int) -> None:
+        await self.notify("DELETE", f"/cameras/{camera_id}")
+
+    async def watchlist_changed(self) -> None:
+        await self.notify("POST", "/reload", timeout=WATCH_RELOAD_TIMEOUT)
+
+
+watch_control = WatchControl()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Long-lived watcher daemon.
+
+Loads the recognition models and the watchlist once, then takes commands on
+a local HTTP control channel served over a Unix socket
+(``WATCH_CONTROL_SOCKET``). Starting and stopping cameras, pausing and
+reloading the watchlist are in-process operations that take milliseconds;
+``/watch/*`` in alerts_server proxies to this channel.
+
+Every ``WATCH_HEARTBEAT_INTERVAL`` seconds the daemon also writes its status,
+including per-camera telemetry, to ``WATCH_HEARTBEAT_FILE`` (see
+``camera_telemetry.py``) so the server can report on it without a round trip.
+
+Control API (JSON bodies and responses):
+
+    GET    /status
+    POST   /start            {"cameras": [{"id": 1, "source": "rtsp://...", "name": "Gate"}]}
+    POST   /stop             release all cameras; models and encodings stay loaded
+    POST   /pause            keep cameras open, skip recognition
+    POST   /resume
+    POST   /reload           re-scan faces_db, encoding only new or changed images
+    PUT    /cameras/{id}     {"source": "...", "name": "..."}
+    DELETE /cameras/{id}
+    POST   /shutdown
+"""
+
+import argparse
+import json
+import os
+import signal
+import socketserver
+import threading
+import time
+import logging
+from http.server import BaseHTTPRequestHandler
+from typing import Any, Dict, List, Optional, Tuple
+
+from camera_telemetry import WATCH_HEARTBEAT_FILE, WATCH_HEARTBEAT_INTERVAL, clear_heartbeat, write_heartbeat
+
+logger = logging.getLogger(__name__)
+
+WATCH_CONTROL_SOCKET = os.getenv("WATCH_CONTROL_SOCKET", "watcher.sock")
+
+
+class WatchDaemon:
+    """Maps control requests onto a running ``FaceRecognitionSystem``."""
+
+    def __init__(self, system: Any):
+        self.system = system
+        self.watching = False
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self.shutdown_requested = threading.Event()
+
+    def status(self) -> Dict[str, Any]:
+        state = "stopped"
+        if self.watching:
+            state = "paused" if self.system.paused else "running"
+        return {"status": state, "pid": os.getpid(), "uptime": round(time.time() - self.started_at, 1),
+                **self.system.status()}
+
+    def start(self, cameras: List[Dict[str, Any]]) -> Dict[str, Any]:
+        with self._lock:
+            self.system.set_cameras({
+                int(c["id"]): (c["source"], c.get("name"), c.get("evidence_source"), c.get("regions"),
+                               c.get("backend"))
+                for c in cameras
+            })
+            self.system.resume()
+            self.watching = True
+        return self.status()
+
+    def stop(self) -> Dict[str, Any]:
+        with self._lock:
+            self.system.set_cameras({})
+            self.watching = False
+        return self.status()
+
+    def put_camera(self, camera_id: int, body: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            # While stopped the next /start carries the full camera list
+            if self.watching:
+                self.system.add_camera(camera_id, body["source"], body.get("name"),
+                                       body.get("evidence_source"), body.get("regions"), body.get("backend"))
+        return self.status()
+
+    def delete_camera(self, camera_id: int) -> Dict[str, Any]:
+        with self._lock:
+            self.system.remove_camera(camera_id)
+        return self.status()
+
+    def handle(self, method: str, path: str, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        parts = [p for p in path.split("?")[0].split("/") if p]
+        route = (method, parts[0] if parts else "")
+        try:
+            if route == ("GET", "status"):
+                return 200, self.status()
+            if route == ("POST", "start"):
+                return 200, self.start(body.get("cameras", []))
+            if route == ("POST", "stop"):
+                return 200, self.stop()
+            if route == ("POST", "pause"):
+                self.system.pause()
+                return 200, self.status()
+            if route == ("POST", "resume"):
+                self.system.resume()
+                return 200, self.status()
+            if route == ("POST", "reload"):
+                return 200, {"watchlist": self.system.reload_watchlist()}
+            if route == ("POST", "shutdown"):
+                self.shutdown_requested.set()
+                return 200, {"status": "shutting_down"}
+            if parts[:1] == ["cameras"] and len(parts) == 2:
+                camera_id = int(parts[1])
+                if method == "PUT":
+                    return 200, self.put_camera(camera_id, body)
+                if method == "DELETE":
+                    return 200, self.delete_camera(camera_id)
+        except (KeyError, TypeError, ValueError) as e:
+            return 400, {"detail": f"Bad request: {e}"}
+        return 404, {"detail": "Not found"}
+
+    def heartbeat_loop(self, path: str = WATCH_HEARTBEAT_FILE, interval: float = WATCH_HEARTBEAT_INTERVAL) -> None:
+        """Publish status until shutdown; runs on its own thread."""
+        while not self.shutdown_requested.is_set():
+            try:
+                write_heartbeat(self.status(), path)
+            except Exception as e:
+                logger.warning(f"Heartbeat write failed: {e}")
+            self.shutdown_requested.wait(interval)
+        clear_heartbeat(path)
+
+
+class _ControlHandler(BaseHTTPRequestHandler):
+    server: "ControlServer"
+
+    def _dispatch(self, method: str) -> None:
+        body: Dict[str, Any] = {}
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            try:
+                body = json.loads(self.rfile.read(length))
+            except ValueError:
+                self._reply(400, {"detail": "Invalid JSON"})
+                return
+        code, payload = self.server.daemon.handle(method, self.path, body)
+        self._reply(code, payload)
+
+    def _reply(self, code: int, payload: Dict[str, Any]) -> None:
+        data = json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def address_string(self) -> str:
+        return "local"
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(format % args)
+
+
+class ControlServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """HTTP over a Unix socket; only local processes with file access can connect."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, daemon: WatchDaemon):
+        self.daemon = daemon
+        self.socket_path = socket_path
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)  # stale socket from a previous run
+        super().__init__(socket_path, _ControlHandler)
+        os.chmod(socket_path, 0o600)
+
+    def server_close(self) -> None:
+        super().server_close()
+        try:
+            os.unlink(self.socket_path)
+        except OSError:
+            pass
+
+
+def serve(daemon: WatchDaemon, socket_path: str, heartbeat_path: str = WATCH_HEARTBEAT_FILE) -> None:
+    """Serve the control socket and heartbeat until shutdown is requested."""
+    server = ControlServer(socket_path, daemon)
+    signal.signal(signal.SIGTERM, lambda *_: daemon.shutdown_requested.set())
+    signal.signal(signal.SIGINT, lambda *_: daemon.shutdown_requested.set())
+    threading.Thread(target=server.serve_forever, name="watch-control", daemon=True).start()
+    heartbeat = threading.Thread(target=daemon.heartbeat_loop, args=(heartbeat_path,), name="watch-heartbeat")
+    heartbeat.start()
+    logger.info(f"Watcher ready on {socket_path} (pid {os.getpid()})")
+
+    daemon.shutdown_requested.wait()
+    logger.info("Watcher shutting down")
+    server.shutdown()
+    server.server_close()
+    heartbeat.join()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Face watchlist daemon with a local control socket")
+    parser.add_argument("--socket", default=WATCH_CONTROL_SOCKET, help="Unix socket path for the control API")
+    parser.add_argument("--heartbeat", default=WATCH_HEARTBEAT_FILE, help="file the status heartbeat is written to")
+    parser.add_argument("cameras", nargs="*", help="cameras to start watching immediately")
+    args = parser.parse_args(argv)
+
+    # Importing the recogniser loads dlib's models; this happens once per daemon
+    from realtime_face_watchlist import FaceRecognitionSystem
+
+    system = FaceRecognitionSystem(camera_sources=[])
+    system.start_workers()
+    daemon = WatchDaemon(system)
+    if args.cameras:
+        daemon.start([{"id": i, "source": src} for i, src in enumerate(args.cameras)])
+
+    serve(daemon, args.socket, args.heartbeat)
+    system.stop(display=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""
+Sharded watcher supervisor for large camera fleets.
+
+One watcher process decodes every camera on a single core's worth of GIL,
+which tops out long before a 40-camera site. The supervisor runs
+``WATCH_SHARDS`` watcher daemons (``watch_daemon.py``), partitions the
+enabled cameras across them by estimated decode cost, and speaks the same
+control API and heartbeat format as a single daemon, so ``/watch/*`` in
+alerts_server works unchanged.
+
+- Cameras keep their shard across changes; a new camera goes to the least
+  loaded shard and cameras only move when that evens out the load.
+- A shard that exits is restarted with exponential backoff and gets its
+  cameras back once its control socket answers.
+- Status and heartbeat aggregate every shard's per-camera telemetry and
+  latency histograms (labelled with the shard).
+
+Decode cost is estimated from optional camera config hints
+(``decode_cost`` or ``width``/``height``/``fps``); a 1080p25 stream is 1.0.
+With a substream configured the hints describe the analysis stream, which
+is the only one decoded continuously.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from camera_telemetry import WATCH_HEARTBEAT_FILE, clear_heartbeat, read_heartbeat
+from watch_daemon import WATCH_CONTROL_SOCKET, WatchDaemon, serve
+
+logger = logging.getLogger(__name__)
+
+WATCH_SHARDS = os.getenv("WATCH_SHARDS", "1")  # number of watcher processes, or "auto" for one per core
+WATCH_SHARD_BACKOFF_MAX = float(os.getenv("WATCH_SHARD_BACKOFF_MAX", "60"))
+WATCH_SHARD_START_TIMEOUT = float(os.getenv("WATCH_DAEMON_START_TIMEOUT", "30"))
+SHARD_STABLE_SECONDS = 60.0  # a shard up this long has its restart backoff reset
+COST_HINTS = ("decode_cost", "width", "height", "fps")
+REFERENCE_PIXEL_RATE = 1920 * 1080 * 25
+
+DAEMON_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "watch_daemon.py")
+
+
+def shard_count(value: str = WATCH_SHARDS) -> int:
+    if value.strip().lower() == "auto":
+        return max(1, os.cpu_count() or 1)
+    return max(1, int(value))
+
+
+def camera_streams(source: Any, config: Optional[Dict[str, Any]] = None) -> Tuple[Any, Optional[Any]]:
+    """``(analysis, evidence)`` sources for a camera.
+
+    ``config["analysis_source"]`` is a cheap substream the watcher decodes for
+    detection; snapshots then come from ``config["evidence_source"]``, by
+    default the camera's own (main) stream. Without a substream both are the
+    camera source and evidence is None.
+    """
+    config = config or {}
+    analysis = config.get("analysis_source") or source
+    evidence = config.get("evidence_source") or (source if config.get("analysis_source") else None)
+    return analysis, (evidence if evidence and evidence != analysis else None)
+
+
+def estimate_cost(camera: Dict[str, Any]) -> float:
+    """Relative decode cost of a camera; a 1080p stream at 25 fps is 1.0."""
+    if camera.get("decode_cost") is not None:
+        return max(float(camera["decode_cost"]), 0.01)
+    source = str(camera.get("source", ""))
+    local = source.strip().isdigit()
+    # Local webcams default to VGA@30, network streams to 1080p@25
+    width = float(camera.get("width") or (640 if local else 1920))
+    height = float(camera.get("height") or (480 if local else 1080))
+    fps = float(camera.get("fps") or (30 if local else 25))
+    return max(width * height * fps / REFERENCE_PIXEL_RATE, 0.01)
+
+
+def plan_shards(costs: Dict[int, float], shards: int,
+                previous: Optional[Dict[int, int]] = None) -> Dict[int, int]:
+    """Assign camera ids to shards, moving as few cameras as possible.
+
+    Cameras keep their previous shard, new ones go largest-first to the least
+    loaded shard, then cameras move from the heaviest to the lightest shard
+    only while each move narrows the gap between them.
+    """
+    previous = previous or {}
+    loads = [0.0] * shards
+    plan: Dict[int, int] = {}
+    for camera_id in sorted(costs):
+        shard = previous.get(camera_id)
+        if shard is not None and shard < shards:
+            plan[camera_id] = shard
+            loads[shard] += costs[camera_id]
+    for camera_id in sorted((c for c in costs if c not in plan), key=lambda c: (-costs[c], c)):
+        shard = min(range(shards), key=lambda s: (loads[s], s))
+        plan[camera_id] = shard
+        loads[shard] += costs[camera_id]
+    while True:
+        heavy = max(range(shards), key=lambda s: (loads[s], -s))
+        light = min(range(shards), key=lambda s: (loads[s], s))
+        gap = loads[heavy] - loads[light]
+        movable = [c for c, s in plan.items() if s == heavy and costs[c] < gap - 1e-9]
+        if not movable:
+            return plan
+        # The camera closest to half the gap evens the pair out best
+        camera_id = min(movable, key=lambda c: (abs(gap / 2 - costs[c]), c))
+        plan[camera_id] = light
+        loads[heavy] -= costs[camera_id]
+        loads[light] += costs[camera_id]
+
+
+class Shard:
+    """One watcher daemon process and the client for its control socket."""
+
+    def __init__(self, index: int, socket_path: str, heartbeat_path: str):
+        self.index = index
+        self.socket_path = socket_path
+        self.heartbeat_path = heartbeat_path
+        self.proc: Optional[subprocess.Popen] = None
+        self.started_at = 0.0
+        self.restarts = 0
+        self.backoff = 0.0
+        self.restart_at: Optional[float] = None
+        self.synced = False  # camera set and pause state pushed since (re)start
+        self.sync_lock = threading.Lock()
+
+    def spawn(self, cwd: Optional[str] = None) -> None:
+        env = dict(os.environ)
+        # Each shard spools undelivered alerts to its own file
+        env["ALERT_SPOOL"] = f"{env.get('ALERT_SPOOL', 'alert_spool.jsonl')}.shard{self.index}"
+        cmd = [sys.executable, DAEMON_SCRIPT, "--socket", self.socket_path, "--heartbeat", self.heartbeat_path]
+        self.proc = subprocess.Popen(cmd, cwd=cwd, env=env)
+        self.started_at = time.monotonic()
+        self.synced = False
+        logger.info(f"Started watcher shard {self.index} (pid {self.proc.pid})")
+
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self.proc.pid if self.alive() else None
+
+    def request(self, method: str, path: str, json: Optional[Dict[str, Any]] = None,
+                timeout: float = 5.0) -> Dict[str, Any]:
+        transport = httpx.HTTPTransport(uds=self.socket_path)
+        with httpx.Client(transport=transport, base_url="http://watcher", timeout=timeout) as client:
+            response = client.request(method, path, json=json)
+        response.raise_for_status()
+        return response.json()
+
+    def ready(self) -> bool:
+        if not self.alive() or not os.path.exists(self.socket_path):
+            return False
+        try:
+            self.request("GET", "/status", timeout=1.0)
+            return True
+        except httpx.HTTPError:
+            return False
+
+    def terminate(self, timeout: float = 10.0) -> None:
+        if not self.alive():
+            return
+        try:
+            self.request("POST", "/shutdown", timeout=2.0)
+        except httpx.HTTPError:
+            self.proc.terminate()
+        try:
+            self.proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+
+
+# (source, name, evidence_source, regions, backend)
+CameraSpec = Tuple[Any, Optional[str], Optional[Any], Optional[Dict[str, Any]], Optional[Dict[str, Any]]]
+
+
+def _camera_spec(source: Any, name: Optional[str] = None, evidence_source: Optional[Any] = None,
+                 regions: Optional[Dict[str, Any]] = None, backend: Optional[Dict[str, Any]] = None) -> CameraSpec:
+    return source, name, evidence_source, regions, backend
+
+
+class ShardedSystem:
+    """Presents K watcher daemons as one ``FaceRecognitionSystem`` to ``WatchDaemon``."""
+
+    def __init__(self, shards: int, socket_base: str = WATCH_CONTROL_SOCKET,
+                 heartbeat_base: str = WATCH_HEARTBEAT_FILE, cwd: Optional[str] = None,
+                 shard_factory=Shard):
+        self.shards = [
+            shard_factory(i, f"{socket_base}.shard{i}", f"{heartbeat_base}.shard{i}") for i in range(shards)
+        ]
+        self.cwd = cwd
+        self.cameras: Dict[int, CameraSpec] = {}
+        self.costs: Dict[int, float] = {}
+        self.assignment: Dict[int, int] = {}
+        self.paused = False
+        self.is_running = False
+        self._lock = threading.RLock()
+        self._monitor: Optional[threading.Thread] = None
+
+    # Lifecycle -------------------------------------------------------------
+
+    def start_workers(self) -> None:
+        """Spawn the shards. The first one warms the shared encoding cache
+        before the rest start, so K processes do not all encode faces_db."""
+        if self.is_running:
+            return
+        self.is_running = True
+        first, rest = self.shards[0], self.shards[1:]
+        first.spawn(self.cwd)
+        deadline = time.monotonic() + WATCH_SHARD_START_TIMEOUT
+        while not first.ready() and first.alive() and time.monotonic() < deadline:
+            time.sleep(0.1)
+        for shard in rest:
+            shard.spawn(self.cwd)
+        self._monitor = threading.Thread(target=self._monitor_loop, name="shard-monitor", daemon=True)
+        self._monitor.start()
+
+    def stop(self, display: bool = False) -> None:
+        self.is_running = False
+        if self._monitor is not None:
+            self._monitor.join(timeout=5)
+            self._monitor = None
+        for shard in self.shards:
+            shard.terminate()
+            clear_heartbeat(shard.heartbeat_path)
+
+    def _monitor_loop(self) -> None:
+        while self.is_running:
+            for shard in self.shards:
+                self._check(shard)
+            time.sleep(0.5)
+
+    def _check(self, shard: Shard) -> None:
+        now = time.monotonic()
+        if not shard.alive():
+            if not self.is_running:
+                return
+            if shard.restart_at is None:
+                code = shard.proc.returncode if shard.proc is not None else None
+                shard.backoff = min(max(shard.backoff * 2, 1.0), WATCH_SHARD_BACKOFF_MAX)
+                shard.restart_at = now + shard.backoff
+                logger.warning(f"Watcher shard {shard.index} exited ({code}); restarting in {shard.backoff:.0f}s")
+            elif now >= shard.restart_at:
+                shard.restart_at = None
+                shard.restarts += 1
+                shard.spawn(self.cwd)
+            return
+        if not shard.synced and shard.ready():
+            self._sync(shard)
+        if shard.backoff and now - shard.started_at > SHARD_STABLE_SECONDS:
+            shard.backoff = 0.0
+
+    # Camera placement ------------------------------------------------------
+
+    def _shard_cameras(self, index: int) -> List[Dict[str, Any]]:
+        cameras = []
+        for camera_id, shard in sorted(self.assignment.items()):
+            if shard == index:
+                source, name, evidence, regions, backend = self.cameras[camera_id]
+                cameras.append({"id": camera_id, "source": source, "name": name,
+                                "evidence_source": evidence, "regions": regions, "backend": backend})
+        return cameras
+
+    def _sync(self, shard: Shard) -> None:
+        """Push this shard's camera set and pause state; retried by the monitor on failure."""
+        # Serialised per shard and read under the lock, so the last push always
+        # carries the newest camera set
+        with shard.sync_lock:
+            with self._lock:
+                cameras = self._shard_cameras(shard.index)
+                paused = self.paused
+            try:
+                if cameras:
+                    shard.request("POST", "/start", json={"cameras": cameras})
+                    if paused:
+                        shard.request("POST", "/pause")
+                else:
+                    shard.request("POST", "/stop")
+                shard.synced = True
+            except httpx.HTTPError as e:
+                shard.synced = False
+                logger.warning(f"Could not update watcher shard {shard.index}: {e}")
+
+    def _rebalance(self) -> None:
+        with self._lock:
+            costs = {camera_id: self.costs.get(camera_id, 1.0) for camera_id in self.cameras}
+            plan = plan_shards(costs, len(self.shards), self.assignment)
+            gained = {s for c, s in plan.items() if self.assignment.get(c) != s}
+            lost = {s for c, s in self.assignment.items() if plan.get(c) != s}
+            moved = sum(1 for c, s in plan.items() if c in self.assignment and self.assignment[c] != s)
+            self.assignment = plan
+        if moved:
+            logger.info(f"Rebalanced watcher shards: moved {moved} camera(s)")
+        for index in gained | lost:
+            self.shards[index].synced = False
+        # Release moved cameras before opening them elsewhere; many IP cameras
+        # cap concurrent RTSP sessions
+        order = sorted(self.shards, key=lambda shard: shard.index not in lost)
+        for shard in order:
+            if not shard.synced and shard.alive():
+                self._sync(shard)
+
+    def set_cameras(self, cameras: Dict[int, Tuple[Any, ...]]) -> None:
+        """``{camera_id: (source, name[, evidence_source[, regions[, backend]]])}``, as ``FaceRecognitionSystem`` takes it."""
+        with self._lock:
+            self.cameras = {camera_id: _camera_spec(*spec) for camera_id, spec in cameras.items()}
+            for camera_id in list(self.costs):
+                if camera_id not in self.cameras:
+                    del self.costs[camera_id]
+        self._rebalance()
+
+    def add_camera(self, camera_id: int, source: Any, name: Optional[str] = None,
+                   evidence_source: Optional[Any] = None, regions: Optional[Dict[str, Any]] = None,
+                   backend: Optional[Dict[str, Any]] = None) -> None:
+        spec = _camera_spec(source, name, evidence_source, regions, backend)
+        with self._lock:
+            if self.cameras.get(camera_id) != spec:
+                self.cameras[camera_id] = spec
+                shard = self.assignment.get(camera_id)
+                if shard is not None:
+                    self.shards[shard].synced = False
+        self._rebalance()
+
+    def remove_camera(self, camera_id: int) -> bool:
+        with self._lock:
+            known = self.cameras.pop(camera_id, None) is not None
+            self.costs.pop(camera_id, None)
+        self._rebalance()
+        return known
+
+    # Broadcast commands ----------------------------------------------------
+
+    def _broadcast(self, path: str) -> List[Dict[str, Any]]:
+        results = []
+        for shard in self.shards:
+            if not shard.alive():
+                continue
+            try:
+                results.append(shard.request("POST", path, timeout=300.0 if path == "/reload" else 5.0))
+            except httpx.HTTPError as e:
+                shard.synced = False
+                logger.warning(f"Watcher shard {shard.index} did not take {path}: {e}")
+        return results
+
+    def pause(self) -> None:
+        self.paused = True
+        self._broadcast("/pause")
+
+    def resume(self) -> None:
+        self.paused = False
+        self._broadcast("/resume")
+
+    def reload_watchlist(self) -> Dict[str, Any]:
+        results = [r.get("watchlist", {}) for r in self._broadcast("/reload")]
+        return results[0] if results else {}
+
+    # Status ----------------------------------------------------------------
+
+    def status(self) -> Dict[str, Any]:
+        cameras: Dict[int, Dict[str, Any]] = {}
+        shards = []
+        watchlist: Dict[str, Any] = {}
+        metrics: List[Dict[str, Any]] = []
+        cpu = 0.0
+        with self._lock:
+            costs = dict(self.costs)
+            assignment = dict(self.assignment)
+        for shard in self.shards:
+            beat = read_heartbeat(shard.heartbeat_path) if shard.alive() else None
+            if beat is not None:
+                for camera_id, camera in beat.get("cameras", {}).items():
+                    cameras[int(camera_id)] = {**camera, "shard": shard.index}
+                watchlist = watchlist or beat.get("watchlist", {})
+                cpu += beat.get("cpu_seconds", 0.0)
+                metrics.extend({**m, "labels": {**m.get("labels", {}), "shard": str(shard.index)}}
+                               for m in beat.get("metrics", []))
+            shards.append({
+                "shard": shard.index,
+                "pid": shard.pid,
+                "status": beat["status"] if beat and beat["fresh"] else ("starting" if shard.alive() else "down"),
+                "load": round(sum(costs.get(c, 1.0) for c, s in assignment.items() if s == shard.index), 3),
+                "cameras": sorted(c for c, s in assignment.items() if s == shard.index),
+                "restarts": shard.restarts,
+            })
+        # Cameras assigned to a shard that is down or not yet synced still show up
+        for camera_id, (source, name, *_) in self.cameras.items():
+            if camera_id not in cameras:
+                cameras[camera_id] = {"source": str(source), "name": name, "alive": False,
+                                      "shard": assignment.get(camera_id)}
+        return {
+            "running": self.is_running,
+            "paused": self.paused,
+            "cameras": cameras,
+            "shards": shards,
+            "watchlist": watchlist,
+            "cpu_seconds": round(cpu, 3),
+            "metrics": metrics,
+        }
+
+
+class WatchSupervisor(WatchDaemon):
+    """``WatchDaemon`` over a ``ShardedSystem``; records each camera's decode cost hints."""
+
+    def start(self, cameras: List[Dict[str, Any]]) -> Dict[str, Any]:
+        with self._lock:
+            self.system.costs = {int(c["id"]): estimate_cost(c) for c in cameras}
+        return super().start(cameras)
+
+    def put_camera(self, camera_id: int, body: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            if self.watching:
+                self.system.costs[camera_id] = estimate_cost(body)
+        return super().put_camera(camera_id, body)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Run several watcher daemons behind one control socket")
+    parser.add_argument("--socket", default=WATCH_CONTROL_SOCKET, help="Unix socket path for the control API")
+    parser.add_argument("--heartbeat", default=WATCH_HEARTBEAT_FILE, help="file the aggregated heartbeat is written to")
+    parser.add_argument("--shards", default=WATCH_SHARDS, help="number of watcher processes, or 'auto'")
+    args = parser.parse_args(argv)
+
+    system = ShardedSystem(shard_count(args.shards), args.socket, args.heartbeat, cwd=os.getcwd())
+    system.start_workers()
+    supervisor = WatchSupervisor(system)
+    serve(supervisor, args.socket, args.heartbeat)
+    system.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Known-face watchlist with an incremental encoding cache.
+
+Encodings are cached per image file, keyed by path, size and mtime, and
+persisted next to the face database. A reload only encodes images that are
+new or changed and drops ones that were deleted, so adding one photo to a
+large watchlist costs one encoding instead of re-encoding everything.
+"""
+
+import hashlib
+import io
+import os
+import threading
+import time
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FACE_DB_PATH = os.getenv("FACES_DB", "faces_db")
+WATCHLIST_CACHE = os.getenv("WATCHLIST_CACHE", "")  # default: <faces_db>/.encodings_cache.npz
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+Encoder = Callable[[str], Optional[np.ndarray]]
+Signature = Tuple[int, int]  # (mtime_ns, size)
+
+
+def encode_image_file(path: str) -> Optional[np.ndarray]:
+    """Encoding of the first face in ``path``, or None if no face is found."""
+    import face_recognition
+
+    image = face_recognition.load_image_file(path)
+    encodings = face_recognition.face_encodings(image)
+    return encodings[0] if encodings else None
+
+
+class Watchlist:
+    def __init__(self, root: str = FACE_DB_PATH, cache_path: Optional[str] = None,
+                 encoder: Encoder = encode_image_file):
+        self.root = root
+        self.cache_path = cache_path or WATCHLIST_CACHE or os.path.join(root, ".encodings_cache.npz")
+        self.encoder = encoder
+        self._lock = threading.Lock()
+        # path -> (signature, encoding or None when the image has no face)
+        self._entries: Dict[str, Tuple[Signature, Optional[np.ndarray]]] = {}
+        self._snapshot: Tuple[np.ndarray, List[str]] = (np.empty((0, 128)), [])
+        self.version = 0
+        # Content hash of the published snapshot; equal on every host with the same images
+        self.fingerprint = ""
+        self.last_reload: Dict[str, float] = {}
+        self._load_cache()
+
+    def snapshot(self) -> Tuple[np.ndarray, List[str]]:
+        """Current (encodings, names); replaced atomically on reload."""
+        return self._snapshot
+
+    def __len__(self) -> int:
+        return len(self._snapshot[1])
+
+    def _scan(self) -> Dict[str, Signature]:
+        found: Dict[str, Signature] = {}
+        if not os.path.isdir(self.root):
+            logger.error(f"Face database directory '{self.root}' not found!")
+            return found
+        for person in os.listdir(self.root):
+            person_dir = os.path.join(self.root, person)
+            if not os.path.isdir(person_dir):
+                continue
+            for image_name in os.listdir(person_dir):
+                if not image_name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                path = os.path.join(person_dir, image_name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                found[path] = (st.st_mtime_ns, st.st_size)
+        return found
+
+    def reload(self) -> Dict[str, float]:
+        """Re-scan the face database, encoding only new or changed images."""
+        with self._lock:
+            started = time.perf_counter()
+            found = self._scan()
+            entries: Dict[str, Tuple[Signature, Optional[np.ndarray]]] = {}
+            encoded = reused = failed = 0
+            for path in sorted(found):
+                signature = found[path]
+                cached = self._entries.get(path)
+                if cached is not None and cached[0] == signature:
+                    entries[path] = cached
+                    reused += 1
+                    continue
+                try:
+                    encoding = self.encoder(path)
+                except Exception as e:
+                    logger.error(f"Error loading {path}: {e}")
+                    failed += 1
+                    continue
+                if encoding is None:
+                    logger.warning(f"No face found in {path}")
+                entries[path] = (signature, encoding)
+                encoded += 1
+            removed = len(set(self._entries) - set(entries))
+            changed = bool(encoded or removed)
+            self._entries = entries
+            self._publish()
+            if changed:
+                self._save_cache()
+            self.last_reload = {
+                "faces": len(self),
+                "people": len(set(self._snapshot[1])),
+                "encoded": encoded,
+                "reused": reused,
+                "removed": removed,
+                "failed": failed,
+                "seconds": round(time.perf_counter() - started, 4),
+            }
+            logger.info(f"Watchlist loaded: {self.last_reload}")
+            return self.last_reload
+
+    def _publish(self) -> None:
+        names: List[str] = []
+        vectors: List[np.ndarray] = []
+        for path, (_, encoding) in self._entries.items():
+            if encoding is None:
+                continue
+            names.append(os.path.basename(os.path.dirname(path)))
+            vectors.append(encoding)
+        encodings = np.vstack(vectors) if vectors else np.empty((0, 128))
+        digest = hashlib.sha1()
+        for path, (signature, _) in sorted(self._entries.items()):
+            digest.update(f"{os.path.relpath(path, self.root)}:{signature[0]}:{signature[1]}\n".encode("utf-8"))
+        self._snapshot = (encodings, names)
+        self.fingerprint = digest.hexdigest()
+        self.version += 1
+
+    def export(self) -> bytes:
+        """The current snapshot as npz bytes, for edge workers."""
+        encodings, names = self._snapshot
+        buf = io.BytesIO()
+        np.savez(buf, names=np.array(names, dtype=str), encodings=encodings,
+                 fingerprint=np.array(self.fingerprint))
+        return buf.getvalue()
+
+    def load_exported(self, data: bytes) -> str:
+        """Replace the snapshot with one produced by ``export`` on another host."""
+        with np.load(io.BytesIO(data), allow_pickle=False) as snap:
+            names = [str(n) for n in snap["names"]]
+            encodings = snap["encodings"]
+            fingerprint = str(snap["fingerprint"])
+        with self._lock:
+            self._snapshot = (encodings, names)
+            self.fingerprint = fingerprint
+            self.version += 1
+        logger.info(f"Watchlist {fingerprint[:12]} loaded from server: {len(names)} faces")
+        return fingerprint
+
+    def _load_cache(self) -> None:
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with np.load(self.cache_path, allow_pickle=False) as data:
+                paths, mtimes, sizes = data["paths"], data["mtimes"], data["sizes"]
+                valid, encodings = data["valid"], data["encodings"]
+                self._entries = {
+                    str(path): ((int(mtime), int(size)), encodings[i] if valid[i] else None)
+                    for i, (path, mtime, size) in enumerate(zip(paths, mtimes, sizes))
+                }
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable encoding cache {self.cache_path}: {e}")
+            self._entries = {}
+
+    def _save_cache(self) -> None:
+        paths = list(self._entries)
+        dim = next((e.shape[0] for _, e in self._entries.values() if e is not None), 128)
+        encodings = np.zeros((len(paths), dim))
+        valid = np.zeros(len(paths), dtype=bool)
+        for i, path in enumerate(paths):
+            encoding = self._entries[path][1]
+            if encoding is not None:
+                encodings[i] = encoding
+                valid[i] = True
+        # Per-process temp name: watcher shards may save the cache concurrently
+        tmp = f"{self.cache_path}.{os.getpid()}.tmp.npz"
+        try:
+            np.savez(
+                tmp,
+                paths=np.array(paths, dtype=str),
+                mtimes=np.array([self._entries[p][0][0] for p in paths], dtype=np.int64),
+                sizes=np.array([self._entries[p][0][1] for p in paths], dtype=np.int64),
+                valid=valid,
+                encodings=encodings,
+            )
+            os.replace(tmp, self.cache_path)
+        except OSError as e:
+            logger.warning(f"Could not write encoding cache {self.cache_path}: {e}")
+
+    def stats(self) -> Dict[str, float]:
+        return {"faces": len(self), "version": self.version, "fingerprint": self.fingerprint, **{f"last_{k}": v for k, v in self.last_reload.items()}}
@@ -0,0 +1,201 @@
+"""
+Registry of edge workers and their camera leases.
+
+Sites with their own compute run ``edge_worker.py``, which registers here
+and then heartbeats every few seconds. A camera whose config carries
+``"site": "<name>"`` is leased to one live worker registered for that site;
+the local watcher leaves such cameras alone. Each heartbeat renews the
+worker's lease and returns its current cameras. A worker that misses its
+lease (``WORKER_LEASE_TTL``) is expired and its cameras go to the remaining
+workers of the site on their next heartbeat.
+
+Placement reuses the watcher supervisor's cost-based, sticky partitioning.
+State lives in the main database so every server worker sees the same
+leases.
+"""
+
+import hmac
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from regions import camera_regions
+from face_backends import camera_backend
+from watch_supervisor import COST_HINTS, camera_streams, estimate_cost, plan_shards
+from watchlist import Watchlist
+
+WORKER_TOKEN = os.getenv("WORKER_TOKEN", "")  # shared secret for edge workers; unset disables worker mode
+WORKER_LEASE_TTL = float(os.getenv("WORKER_LEASE_TTL", "15"))
+WORKER_ALERT_BATCH_MAX = int(os.getenv("WORKER_ALERT_BATCH_MAX", "500"))
+WORKER_WATCHLIST_REFRESH = float(os.getenv("WORKER_WATCHLIST_REFRESH", "30"))  # seconds between faces_db re-scans
+
+
+def check_token(token: str, expected: Optional[str] = None) -> bool:
+    expected = WORKER_TOKEN if expected is None else expected
+    return bool(expected) and hmac.compare_digest(token.encode("utf-8"), expected.encode("utf-8"))
+
+
+def camera_site(camera: models.Camera) -> Optional[str]:
+    return (camera.config or {}).get("site") or None
+
+
+def _lease(camera: models.Camera) -> Dict[str, Any]:
+    hints = {k: v for k, v in (camera.config or {}).items() if k in COST_HINTS and v is not None}
+    analysis, evidence = camera_streams(camera.source, camera.config)
+    return {"id": camera.id, "source": analysis, "name": camera.name, "evidence_source": evidence,
+            "regions": camera_regions(camera.config), "backend": camera_backend(camera.config), **hints}
+
+
+async def register(db: AsyncSession, name: str, site: str, host: Optional[str] = None,
+                   now: Optional[datetime] = None) -> models.EdgeWorker:
+    now = now or datetime.utcnow()
+    worker = models.EdgeWorker(
+        id=uuid.uuid4().hex,
+        name=name,
+        site=site,
+        host=host,
+        status="active",
+        cameras=[],
+        registered_at=now,
+        last_heartbeat=now,
+        lease_expires_at=now + timedelta(seconds=WORKER_LEASE_TTL),
+    )
+    db.add(worker)
+    await db.commit()
+    return worker
+
+
+async def heartbeat(db: AsyncSession, worker_id: str, telemetry: Optional[Dict[str, Any]] = None,
+                    watchlist_version: Optional[str] = None,
+                    now: Optional[datetime] = None) -> Optional[List[Dict[str, Any]]]:
+    """Renew the lease and return the worker's cameras, or None if the lease is gone."""
+    now = now or datetime.utcnow()
+    worker = await db.get(models.EdgeWorker, worker_id)
+    if worker is None or worker.status != "active" or worker.lease_expires_at < now:
+        return None
+    worker.last_heartbeat = now
+    worker.lease_expires_at = now + timedelta(seconds=WORKER_LEASE_TTL)
+    worker.telemetry = telemetry
+    worker.watchlist_version = watchlist_version
+    leases = await rebalance(db, worker.site, now)
+    await db.commit()
+    return leases.get(worker_id, [])
+
+
+async def is_active(db: AsyncSession, worker_id: str, now: Optional[datetime] = None) -> bool:
+    worker = await db.get(models.EdgeWorker, worker_id)
+    return worker is not None and worker.status == "active" and worker.lease_expires_at >= (now or datetime.utcnow())
+
+
+async def leave(db: AsyncSession, worker_id: str, now: Optional[datetime] = None) -> bool:
+    """Graceful exit: release the worker's cameras straight away."""
+    worker = await db.get(models.EdgeWorker, worker_id)
+    if worker is None:
+        return False
+    worker.status = "left"
+    worker.cameras = []
+    await rebalance(db, worker.site, now or datetime.utcnow())
+    await db.commit()
+    return True
+
+
+async def rebalance(db: AsyncSession, site: str, now: datetime) -> Dict[str, List[Dict[str, Any]]]:
+    """Expire stale workers of ``site`` and lease its cameras across the live ones.
+
+    Changes are left on the session for the caller to commit.
+    """
+    result = await db.execute(
+        select(models.EdgeWorker).where(models.EdgeWorker.site == site, models.EdgeWorker.status == "active")
+    )
+    live = []
+    for worker in result.scalars().all():
+        if worker.lease_expires_at < now:
+            worker.status = "expired"
+            worker.cameras = []
+        else:
+            live.append(worker)
+    if not live:
+        return {}
+    live.sort(key=lambda w: w.id)
+
+    result = await db.execute(select(models.Camera).where(models.Camera.enabled == True))  # noqa: E712
+    cameras = {c.id: c for c in result.scalars().all() if camera_site(c) == site and c.source}
+    costs = {camera_id: estimate_cost(_lease(camera)) for camera_id, camera in cameras.items()}
+    previous = {camera_id: index for index, worker in enumerate(live) for camera_id in (worker.cameras or [])}
+    plan = plan_shards(costs, len(live), previous)
+
+    leases: Dict[str, List[Dict[str, Any]]] = {}
+    for index, worker in enumerate(live):
+        assigned = sorted(camera_id for camera_id, shard in plan.items() if shard == index)
+        if assigned != (worker.cameras or []):
+            worker.cameras = assigned  # reassign so the JSON column is flagged dirty
+        leases[worker.id] = [_lease(cameras[camera_id]) for camera_id in assigned]
+    return leases
+
+
+async def list_workers(db: AsyncSession, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    now = now or datetime.utcnow()
+    result = await db.execute(select(models.EdgeWorker).order_by(models.EdgeWorker.registered_at))
+    workers = []
+    for worker in result.scalars().all():
+        status = worker.status
+        if status == "active" and worker.lease_expires_at < now:
+            status = "expired"
+        workers.append({
+            "id": worker.id,
+            "name": worker.name,
+            "site": worker.site,
+            "host": worker.host,
+            "status": status,
+            "cameras": worker.cameras or [],
+            "watchlist_version": worker.watchlist_version,
+            "last_heartbeat": worker.last_heartbeat,
+            "lease_expires_at": worker.lease_expires_at,
+            "telemetry": worker.telemetry,
+        })
+    return workers
+
+
+class WatchlistPublisher:
+    """Server-side watchlist handed to edge workers as a versioned snapshot.
+
+    The version is the watchlist's content fingerprint, so workers only
+    download when faces were added, changed or removed. ``faces_db`` is
+    re-scanned when marked dirty (person upload/delete) or every
+    ``WORKER_WATCHLIST_REFRESH`` seconds; unchanged images are never
+    re-encoded.
+    """
+
+    def __init__(self, watchlist: Watchlist, refresh: float = WORKER_WATCHLIST_REFRESH):
+        self.watchlist = watchlist
+        self.refresh = refresh
+        self._lock = threading.Lock()
+        self._dirty = True
+        self._loaded_at = 0.0
+        self._export: Tuple[str, bytes] = ("", b"")
+
+    def mark_dirty(self) -> None:
+        self._dirty = True
+
+    def current(self) -> str:
+        """Fingerprint of the up-to-date snapshot (blocking; call off the event loop)."""
+        with self._lock:
+            if self._dirty or time.monotonic() - self._loaded_at > self.refresh:
+                self._dirty = False
+                self.watchlist.reload()
+                self._loaded_at = time.monotonic()
+            return self.watchlist.fingerprint
+
+    def export(self) -> Tuple[str, bytes]:
+        fingerprint = self.current()
+        with self._lock:
+            if self._export[0] != fingerprint:
+                self._export = (fingerprint, self.watchlist.export())
+            return self._export